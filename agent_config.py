@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import re
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlmodel import Session
+
+from config import settings
+from context_budget import count_message_tokens
+from db import change_stamp, create_db_and_tables, engine, load_agents
+from helper import Appointment_Prompt, build_system_prompt
+from metrics import Gauge, register
+
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+
+def render_prompt(template: str, variables: Dict[str, str]) -> str:
+    """Fill {variable} placeholders; unknown ones are left as written"""
+    return _PLACEHOLDER.sub(lambda m: variables.get(m.group(1), m.group(0)), template)
+
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """One version of an agent's prompt, rendered and counted"""
+    agent_id: Optional[int]
+    version: int
+    name: str
+    instruction: str
+    # Tokens in the system message build_system_prompt makes of it
+    tokens: int
+
+
+def compile_prompt(agent_id: Optional[int], version: int, name: str, template: str,
+                   variables: Dict[str, str]) -> CompiledPrompt:
+    instruction = render_prompt(template, variables)
+    tokens = count_message_tokens({"role": "system", "content": build_system_prompt(instruction)})
+    return CompiledPrompt(agent_id, version, name, instruction, tokens)
+
+
+# For numbers no agent answers, and whenever the database can't be read
+DEFAULT_PROMPT = compile_prompt(None, 0, "default", Appointment_Prompt, {})
+
+
+class AgentConfigCache:
+    """Every agent's compiled prompt, and which agent answers each number.
+
+    Everything is loaded when the app starts, so /agent and /ws resolve a
+    prompt with dict lookups and no database round trip. A background task
+    polls the change stamp (latest updated_at, agent count) and re-reads
+    only the agents changed since the last load; db.save_agent bumps it, on
+    whichever worker the change was made. Prompts are only re-rendered and
+    re-counted when an agent's version changes. The whole table is re-read
+    every `ttl` seconds, and whenever the agent count changes, to catch
+    rows edited or deleted by hand.
+    """
+
+    def __init__(self, ttl: float, poll_interval: float,
+                 session_factory: Callable[[], Session] = lambda: Session(engine)):
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self._session_factory = session_factory
+        self._prompts: Dict[int, CompiledPrompt] = {}
+        self._numbers: Dict[str, int] = {}
+        self._agent_numbers: Dict[int, List[str]] = {}
+        self._stamp: Tuple[Optional[float], int] = (None, 0)
+        self._full_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self.resolved = 0
+        self.defaulted = 0
+        self.reloads = 0
+        self.compiled = 0
+
+    async def start(self):
+        try:
+            await asyncio.to_thread(create_db_and_tables)
+            await self.refresh(full=True)
+        except Exception as e:
+            # Calls still get the default prompt; the poller keeps trying
+            logger.error(f"Failed to load agent configs: {e}")
+        self._task = asyncio.get_running_loop().create_task(self._poll())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def for_number(self, number: Optional[str]) -> CompiledPrompt:
+        """The prompt for a call to or from one of our numbers"""
+        return self.get(self._numbers.get(number))
+
+    def get(self, agent_id: Optional[int]) -> CompiledPrompt:
+        prompt = self._prompts.get(agent_id) if agent_id is not None else None
+        if prompt is None:
+            self.defaulted += 1
+            return DEFAULT_PROMPT
+        self.resolved += 1
+        return prompt
+
+    async def refresh(self, full: bool = False):
+        """Re-read agents changed since the last load, or all of them"""
+        since = None if full else self._stamp[0]
+        known = {agent_id: prompt.version for agent_id, prompt in self._prompts.items()}
+        stamp, rows = await asyncio.to_thread(self._read, since, known)
+        previous = self._prompts
+        if full:
+            self._prompts, self._numbers, self._agent_numbers = {}, {}, {}
+            self._full_at = time.monotonic()
+        # Drop every changed agent's numbers first, so a number moving
+        # between two of them ends up with the right one
+        for agent_id, _, _, _ in rows:
+            for number in self._agent_numbers.pop(agent_id, ()):
+                if self._numbers.get(number) == agent_id:
+                    del self._numbers[number]
+        for agent_id, active, numbers, compiled in rows:
+            if not active:
+                self._prompts.pop(agent_id, None)
+                continue
+            prompt = compiled or previous.get(agent_id)
+            if prompt is None:
+                continue
+            self._prompts[agent_id] = prompt
+            self.compiled += compiled is not None
+            self._agent_numbers[agent_id] = numbers
+            for number in numbers:
+                self._numbers[number] = agent_id
+        self._stamp = stamp
+        self.reloads += 1
+
+    def _read(self, since: Optional[float], known: Dict[int, int]) -> tuple:
+        # Off the event loop: the query, and rendering and counting new versions
+        with self._session_factory() as session:
+            # Stamp first, so a change made while reading is seen next poll
+            stamp = tuple(change_stamp(session))
+            rows = []
+            for entry in load_agents(session, since):
+                agent = entry["agent"]
+                compiled = None
+                if agent.active and known.get(agent.id) != agent.version:
+                    compiled = compile_prompt(agent.id, agent.version, agent.name, agent.prompt, entry["variables"])
+                rows.append((agent.id, agent.active, entry["numbers"], compiled))
+        return stamp, rows
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                if time.monotonic() - self._full_at >= self.ttl:
+                    await self.refresh(full=True)
+                    continue
+                stamp = await asyncio.to_thread(self._read_stamp)
+                if stamp[1] != self._stamp[1]:
+                    await self.refresh(full=True)
+                elif stamp != self._stamp:
+                    await self.refresh()
+            except Exception as e:
+                logger.warning(f"Agent config refresh failed: {e}")
+
+    def _read_stamp(self) -> tuple:
+        with self._session_factory() as session:
+            return tuple(change_stamp(session))
+
+    def stats(self) -> dict:
+        return {
+            "agents": len(self._prompts),
+            "numbers": len(self._numbers),
+            "resolved": self.resolved,
+            "defaulted": self.defaulted,
+            "reloads": self.reloads,
+            "compiled": self.compiled,
+            "last_change": self._stamp[0],
+            "full_reload_age": round(time.monotonic() - self._full_at, 1) if self._full_at else None,
+        }
+
+
+agent_configs = AgentConfigCache(ttl=settings.AGENT_CACHE_TTL, poll_interval=settings.AGENT_CACHE_POLL_INTERVAL)
+
+register(Gauge("agent_configs_cached", "Agents with a compiled prompt in this worker's cache",
+               lambda: len(agent_configs._prompts)))
+register(Gauge("agent_config_default_total", "Calls that got the default prompt",
+               lambda: agent_configs.defaulted, type="counter"))
@@ -0,0 +1,274 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List
+
+from call_records import call_records
+from config import settings
+from metrics import Gauge, Histogram, register
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_INSTRUCTIONS = (
+    "You review phone call transcripts between a voice agent and a caller. "
+    "Answer every question from the transcript alone. Answer null when the "
+    "transcript doesn't say. Keep text answers short."
+)
+
+# Question "type" -> JSON schema for its answer; every answer may also be null
+ANSWER_TYPES = {
+    "string": {"type": ["string", "null"]},
+    "text": {"type": ["string", "null"]},
+    "number": {"type": ["number", "null"]},
+    "integer": {"type": ["integer", "null"]},
+    "boolean": {"type": ["boolean", "null"]},
+}
+
+analysis_latency = register(Histogram(
+    "call_analysis_seconds", "LLM time to answer one call's question set"))
+
+
+def question_set(questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Normalise the request's questions to key/question/type/options dicts.
+
+    Each question needs a "question" (or "text"); "key" defaults to q1, q2...
+    "type" is one of ANSWER_TYPES, or "enum"/"choice" with an "options" list.
+    Raises ValueError for anything the structured output can't express.
+    """
+    normalised = []
+    keys = set()
+    for i, q in enumerate(questions, 1):
+        text = q.get("question") or q.get("text")
+        if not text:
+            raise ValueError(f"Question {i} has no text")
+        key = str(q.get("key") or q.get("id") or f"q{i}")
+        if key in keys:
+            raise ValueError(f"Duplicate question key {key!r}")
+        keys.add(key)
+        kind = q.get("type", "string")
+        options = q.get("options")
+        if kind in ("enum", "choice"):
+            if not options:
+                raise ValueError(f"Question {key!r} needs options")
+            options = [str(o) for o in options]
+        elif kind not in ANSWER_TYPES:
+            raise ValueError(f"Question {key!r} has unknown type {kind!r}")
+        normalised.append({"key": key, "question": text, "type": kind, "options": options})
+    return normalised
+
+
+def response_schema(questions: List[Dict[str, Any]]) -> dict:
+    """Strict JSON schema with one property per question, so one request answers all"""
+    properties = {}
+    for q in questions:
+        if q["options"]:
+            answer = {"type": ["string", "null"], "enum": [*q["options"], None]}
+        else:
+            answer = dict(ANSWER_TYPES[q["type"]])
+        properties[q["key"]] = {**answer, "description": q["question"]}
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+def transcript_text(messages: List[dict]) -> str:
+    """The spoken turns of a call record, one "role: text" line each"""
+    lines = []
+    for m in messages:
+        content = m.get("content")
+        if m.get("role") == "system" or not isinstance(content, str) or not content:
+            continue
+        lines.append(f"{m['role']}: {content}")
+    return "\n".join(lines)
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CallAnalyzer:
+    """Answers a question set about many finished calls at once.
+
+    Each batch gets up to `concurrency` workers, and a semaphore shared by
+    every batch keeps the total number of LLM requests in flight under the
+    same limit, all on one AsyncOpenAI client. A call's questions are
+    answered together in a single structured-output request. Answers are
+    cached by transcript hash plus question-set hash, so re-running a batch,
+    or asking the same questions of a call twice, costs nothing; identical
+    requests already in flight are shared rather than repeated.
+    """
+
+    def __init__(self, concurrency: int, cache_size: int, model: str, max_tokens: int, client=None):
+        self.concurrency = concurrency
+        self.cache_size = cache_size
+        self.model = model
+        self.max_tokens = max_tokens
+        self._client = client
+        self._limit = asyncio.Semaphore(concurrency)
+        self._cache: OrderedDict = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.requests = 0
+        self.in_flight = 0
+        self.cache_hits = 0
+        self.failed = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import AsyncOpenAI
+
+            self._client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        return self._client
+
+    async def run(self, calls: List[dict], questions: List[Dict[str, Any]]) -> AsyncIterator[dict]:
+        """Analyse a batch, yielding progress events as calls finish.
+
+        `calls` are dicts with a call_sid and a "transcript" string or the
+        call record's "messages"; calls with neither are looked up in the
+        call records. Yields a "start" event, one "result" per call in
+        completion order, then "done".
+        """
+        start = time.perf_counter()
+        total = len(calls)
+        yield {"event": "start", "total": total, "questions": [q["key"] for q in questions]}
+
+        missing = [c["call_sid"] for c in calls if not c.get("transcript") and not c.get("messages")]
+        records = await call_records.find(missing) if missing else {}
+        set_key = _digest(json.dumps({"model": self.model, "questions": questions}, sort_keys=True))
+        schema = response_schema(questions)
+
+        pending: asyncio.Queue = asyncio.Queue()
+        for call in calls:
+            pending.put_nowait(call)
+        results: asyncio.Queue = asyncio.Queue()
+
+        async def worker():
+            while not pending.empty():
+                call = pending.get_nowait()
+                record = records.get(call["call_sid"], call)
+                await results.put(await self._analyze_call(call["call_sid"], record, questions, schema, set_key))
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.concurrency, total))]
+        counts = {"answered": 0, "cached": 0, "failed": 0}
+        try:
+            for done in range(1, total + 1):
+                result = await results.get()
+                if "error" in result:
+                    counts["failed"] += 1
+                else:
+                    counts["answered"] += 1
+                    counts["cached"] += result["cached"]
+                yield {"event": "result", "done": done, "total": total, **result}
+        finally:
+            # Also reached when the client disconnects mid-stream
+            for task in workers:
+                task.cancel()
+        yield {"event": "done", "total": total, **counts, "seconds": round(time.perf_counter() - start, 3)}
+
+    async def _analyze_call(self, call_sid: str, record: dict, questions, schema: dict, set_key: str) -> dict:
+        transcript = record.get("transcript") or transcript_text(record.get("messages") or [])
+        if not transcript:
+            return {"call_sid": call_sid, "error": "No transcript for this call"}
+        try:
+            answers, cached = await self.answer(transcript, questions, schema, set_key)
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"Analysis of {call_sid} failed: {e}")
+            return {"call_sid": call_sid, "error": str(e)}
+        return {"call_sid": call_sid, "answers": answers, "cached": cached}
+
+    async def answer(self, transcript: str, questions, schema: dict, set_key: str) -> tuple:
+        """Answers for one transcript, and whether they came from the cache"""
+        key = f"{_digest(transcript)}:{set_key}"
+        answers = self._cache.get(key)
+        if answers is not None:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return answers, True
+        shared = self._inflight.get(key)
+        if shared is not None:
+            try:
+                answers = await asyncio.shield(shared)
+            except asyncio.CancelledError:
+                if not shared.cancelled():
+                    raise
+                # The batch that started it went away; ask again
+                return await self.answer(transcript, questions, schema, set_key)
+            self.cache_hits += 1
+            return answers, True
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            answers = await self._complete(transcript, questions, schema)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Only waiters retrieve the exception; don't warn when there are none
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+        future.set_result(answers)
+        self._cache[key] = answers
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return answers, False
+
+    async def _complete(self, transcript: str, questions, schema: dict) -> dict:
+        listed = "\n".join(f"- {q['key']}: {q['question']}" for q in questions)
+        async with self._limit:
+            self.requests += 1
+            self.in_flight += 1
+            start = time.perf_counter()
+            try:
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    max_tokens=self.max_tokens,
+                    temperature=0,
+                    messages=[
+                        {"role": "system", "content": ANALYSIS_INSTRUCTIONS},
+                        {"role": "user", "content": f"Questions:\n{listed}\n\nTranscript:\n{transcript}"},
+                    ],
+                    response_format={
+                        "type": "json_schema",
+                        "json_schema": {"name": "call_analysis", "strict": True, "schema": schema},
+                    },
+                )
+            finally:
+                self.in_flight -= 1
+            analysis_latency.observe(time.perf_counter() - start)
+        return json.loads(response.choices[0].message.content)
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "cached": len(self._cache),
+            "requests": self.requests,
+            "cache_hits": self.cache_hits,
+            "failed": self.failed,
+        }
+
+
+call_analyzer = CallAnalyzer(
+    concurrency=settings.ANALYSIS_CONCURRENCY,
+    cache_size=settings.ANALYSIS_CACHE_SIZE,
+    model=settings.ANALYSIS_MODEL,
+    max_tokens=settings.ANALYSIS_MAX_TOKENS,
+)
+
+register(Gauge("call_analysis_requests_total", "LLM requests made for post-call analysis",
+               lambda: call_analyzer.requests, type="counter"))
+register(Gauge("call_analysis_cache_hits_total", "Call analyses answered from the cache",
+               lambda: call_analyzer.cache_hits, type="counter"))
+register(Gauge("call_analysis_failed_total", "Call analyses that failed",
+               lambda: call_analyzer.failed, type="counter"))
@@ -1,7 +1,8 @@
 from datetime import datetime
+import asyncio
+import gc
 import signal
 import sys
-import os
 from types import FrameType
 import json
 from fastapi.encoders import jsonable_encoder
@@ -14,29 +15,105 @@ from fastapi import (
     Request,
     WebSocketException,
     Depends,
-    Query
+    Query,
+    UploadFile,
+    File,
+    Form,
 )
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from starlette.responses import HTMLResponse
+from starlette.responses import HTMLResponse, PlainTextResponse, Response, StreamingResponse
 from bot import run_bot
-from utils.logging import logger
-from twilio.rest import Client
+from utils.logging import bind_call, bind_trace, flush as flush_logs, logger, resolve_project_id
 from dotenv import load_dotenv
-from sqlmodel import select, Session
 from contextlib import asynccontextmanager
-# from db import Agent, Hubspot, get_session
 from typing import Annotated, Any, Dict, List, Optional
-from helper import Appointment_Prompt
-import requests
 from twilio.twiml.voice_response import VoiceResponse
 from config import settings
+from pool import pipeline_pool, warm_connections
+from preconnect import preconnects
+from routing import provider_router
+from twilio_client import twilio_api
+from campaign import campaign_manager, parse_numbers
+from metrics import Gauge, register, render_prometheus
+from greeting import TWILIO_SAMPLE_RATE, greeting
+from sessions import WORKER_ID, WorkerHeartbeat, mailbox, session_registry
+from call_records import call_records
+from analysis import call_analyzer, question_set
+from transfer import transfers
+from dashboard import transcript_hub
+from agent_config import agent_configs
+from db import engine, save_agent
+from sqlmodel import Session
+from drain import Drain
+from call_resources import call_resources
+from recorder import BOT, recorder
+from fillers import fillers
+from tts_cache import tts_cache
 
 load_dotenv(override=True)
+heartbeat = WorkerHeartbeat(
+    session_registry,
+    capacity=settings.MAX_CALLS_PER_WORKER,
+    active=lambda: pipeline_pool.checked_out,
+    interval=settings.WORKER_HEARTBEAT_INTERVAL,
+)
+
+async def stop_taking_calls():
+    await heartbeat.drain()
+    # Calls they'd place would land on /agent and be turned away
+    for campaign in campaign_manager.campaigns.values():
+        campaign.pause()
+    # The platform may kill us well before the lifespan teardown runs
+    # (Cloud Run: 10s after SIGTERM), so get finished calls and logs out now
+    await call_records.flush()
+    await asyncio.to_thread(flush_logs, keep_running=True)
+
+drain = Drain(settings.DRAIN_TIMEOUT, active=lambda: pipeline_pool.checked_out, on_drain=stop_taking_calls)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # create_db_and_tables()
+    if settings.RESOURCE_ACCOUNTING:
+        # Before anything starts tasks a call could be blamed for
+        call_resources.start()
+    # Creates the tables if needed, then every agent's prompt is served from memory
+    await agent_configs.start()
+    # Resolved once, in the background; until then logs just skip trace correlation
+    asyncio.create_task(asyncio.to_thread(resolve_project_id))
+    await pipeline_pool.warm()
+    call_records.start()
+    recorder.start()
+    transcript_hub.start()
+    if settings.GREETING_MODE == "stream":
+        await greeting.load(settings.GREETING_AUDIO)
+    if settings.FILLER_ENABLED:
+        # Rendered in the background; calls that start before it's done go without
+        asyncio.create_task(fillers.load())
+    # Only advertise capacity once this worker can actually take calls;
+    # calls that beat the background service build get theirs built inline
+    await heartbeat.start()
+    # Picks up callbacks for this worker's calls that reached another worker
+    mailbox.start()
+    # SIGTERM/SIGINT now let live calls finish before uvicorn shuts down
+    drain.install()
     yield
+    drain.restore()
+    await mailbox.stop()
+    await heartbeat.stop()
+    await agent_configs.close()
+    await transcript_hub.close()
+    await session_registry.close()
+    await campaign_manager.close()
+    # Hang up agents still on hold for transfers that won't happen
+    await transfers.close()
+    await twilio_api.close()
+    # Phrases being rendered for the cache
+    await tts_cache.close()
+    # Flush transcripts still queued from calls that already ended
+    await call_records.close()
+    # Last chunks and manifests of calls cut off by the shutdown
+    await recorder.close()
+    await call_resources.close()
 app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
@@ -50,6 +127,17 @@ app.add_middleware(
 # Mount static files directory
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+@app.middleware("http")
+async def log_context(request: Request, call_next):
+    bind_trace(request.headers.get("X-Cloud-Trace-Context"))
+    return await call_next(request)
+
+@app.middleware("http")
+async def greeting_fetch_timer(request: Request, call_next):
+    if request.url.path == "/static/twiml_greeting.mp3":
+        greeting.note_play_fetch()
+    return await call_next(request)
+
 
 # @app.get("/")
 # async def hello(session: SessionDep) -> dict:
@@ -62,9 +150,48 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 async def agent(
     request: Request
     ):
+    reservation = None
     try:
         logger.debug(f"Request: {request}")
         logger.info("Handling TwiML agent request")
+        form = await request.form()
+        call_sid = form.get("CallSid")
+        bind_call(call_sid)
+        if drain.draining:
+            if request.query_params.get("redirected"):
+                return create_error_twiml(settings.BUSY_MESSAGE)
+            # Twilio fetches it again, and the load balancer sends that to a worker that isn't leaving
+            logger.info(f"Draining, redirecting call {call_sid}")
+            return create_redirect_twiml(f"https://{settings.HOST}/agent?redirected=1")
+        reservation = call_sid or f"unknown-{datetime.now().timestamp()}"
+        if not await session_registry.admit(reservation):
+            reservation = None
+            logger.info(f"All workers at capacity, shedding call {call_sid}")
+            return create_error_twiml(settings.BUSY_MESSAGE)
+        greeting.note_agent_request(call_sid)
+        # Our number is "To" on inbound calls and "From" on the ones we place
+        our_number = form.get("From") if str(form.get("Direction", "")).startswith("outbound") else form.get("To")
+        prompt = agent_configs.for_number(our_number)
+        # /ws reads it back from the stream's start message
+        stream_parameters = f'<Parameter name="agent_id" value="{prompt.agent_id or ""}"/>'
+        rerouted = bool(request.query_params.get("rerouted"))
+        if rerouted:
+            # Sent back by a full worker's /ws; the next one takes the call regardless
+            stream_parameters += '<Parameter name="rerouted" value="1"/>'
+        if settings.PRECONNECT_ENABLED:
+            # Provider handshakes happen while the greeting plays, not after /ws starts
+            preconnects.start(call_sid)
+
+        if greeting.mode == "stream" or rerouted:
+            # Greeting is pushed down the media stream by /ws (or already played), so connect straight away
+            twiml = f"""<?xml version="1.0" encoding="UTF-8"?>
+            <Response>
+                <Connect>
+                    <Stream url="wss://{settings.HOST}/ws">{stream_parameters}</Stream>
+                </Connect>
+                <Say>The bot connection has been terminated.</Say>
+            </Response>"""
+            return HTMLResponse(content=twiml, media_type="application/xml")
 
         # Play your greeting audio before connecting to agent
         greeting_url = f"https://{settings.HOST}/static/twiml_greeting.mp3"
@@ -73,13 +200,19 @@ async def agent(
             <Response>
                 <Play>{greeting_url}</Play>
                 <Connect>
-                    <Stream url="wss://{settings.HOST}/ws"></Stream>
+                    <Stream url="wss://{settings.HOST}/ws">{stream_parameters}</Stream>
                 </Connect>
                 <Say>The bot connection has been terminated.</Say>
             </Response>"""
         return HTMLResponse(content=twiml, media_type="application/xml")
     except Exception as e:
         logger.error(f"Failed to make call using agent: {e}")
+        if reservation:
+            # The call won't reach /ws, so don't hold its slot until the reservation expires
+            try:
+                await session_registry.finish(reservation)
+            except Exception as e:
+                logger.warning(f"Failed to release reservation for call {call_sid}: {e}")
         return create_error_twiml("Sorry, there was an error connecting to the agent.")
 
 @app.websocket("/ws")
@@ -92,30 +225,230 @@ async def websocket_endpoint(websocket: WebSocket):
         call_data = json.loads(await start_data.__anext__())
         call_data_start = call_data["start"]
         logger.info("WebSocket connection accepted")
-        twilio = Client(
-            call_data_start["accountSid"],
-            os.getenv("TWILIO_AUTH_TOKEN"),
-        )
         call_sid = call_data_start["callSid"]
-        twilio.calls(call_sid).recordings.create()
-        logger.info("Started recording calls")
- 
-        # the prompt that the agent will use
-        prompt = Appointment_Prompt
-
-        await run_bot(
-            websocket,
-            call_data_start["streamSid"],
-            prompt,
-        )            
+        bind_trace(websocket.headers.get("X-Cloud-Trace-Context"))
+        bind_call(call_sid, call_data_start["streamSid"])
+        agent_requested_at = greeting.note_stream_start(call_sid)
+
+        await session_registry.activate(call_sid, WORKER_ID)
+        preconnect = preconnects.claim(call_sid) if settings.PRECONNECT_ENABLED else None
+        parameters = call_data_start.get("customParameters") or {}
+        if (not preconnect and pipeline_pool.checked_out >= settings.MAX_CALLS_PER_WORKER
+                and not parameters.get("rerouted")):
+            # Admission only counts calls across all workers, and the stream can land on a full
+            # one; send the call back through /agent so it reconnects, most likely elsewhere
+            try:
+                await twilio_api.update_call(call_sid, url=f"https://{settings.HOST}/agent?rerouted=1", method="POST")
+                logger.warning(f"Worker full ({pipeline_pool.checked_out} calls), rerouting call {call_sid}")
+                await session_registry.finish(call_sid)
+                await websocket.close()
+                return
+            except Exception as e:
+                logger.error(f"Failed to reroute call {call_sid}, taking it over capacity: {e}")
+        components = preconnect.components if preconnect else pipeline_pool.checkout()
+        usage = call_resources.begin(call_sid)
+        recording = recorder.begin(call_sid) if recorder.enabled else None
+        warm_task = None
+        try:
+            if greeting.mode == "stream" and not preconnect:
+                # Open the LLM connection while the greeting plays; STT/TTS
+                # connect as soon as the pipeline starts below
+                warm_task = asyncio.create_task(warm_connections(components))
+            if greeting.mode == "stream":
+                await greeting.stream(websocket, call_data_start["streamSid"], agent_requested_at)
+                if recording:
+                    recording.add(BOT, greeting.pcm, TWILIO_SAMPLE_RATE)
+
+            if settings.RECORDING_MODE == "twilio":
+                # Recording isn't needed to start the pipeline, so don't wait for it
+                twilio_api.run_in_background(
+                    twilio_api.start_recording(call_sid, call_data_start["accountSid"]),
+                    f"start recording {call_sid}",
+                )
+                logger.info("Requested call recording")
+
+            if preconnect:
+                await preconnects.adopt(preconnect)
+
+            # the prompt that the agent will use, picked by /agent for the dialed number
+            agent_id = parameters.get("agent_id")
+            prompt = agent_configs.get(int(agent_id) if agent_id else None)
+
+            await run_bot(
+                websocket,
+                call_data_start["streamSid"],
+                prompt.instruction,
+                components,
+                call_sid=call_sid,
+                prompt_tokens=prompt.tokens,
+                recording=recording,
+            )
+        finally:
+            if warm_task:
+                # The components go back to the pool; don't leave it using them
+                warm_task.cancel()
+            pipeline_pool.release(components)
+            await session_registry.finish(call_sid)
+            call_resources.end(usage)
+            if recording:
+                recorder.end(recording)
         logger.info("Bot run completed successfully")
     except Exception as e:
         logger.error(f"Failed to make call to AI chatbot: {e}")
         await websocket.close()
 
+@app.websocket("/dashboard/ws")
+async def dashboard_websocket(websocket: WebSocket, call_sid: Optional[str] = Query(None)):
+    """Live transcripts and turn latency for one call (?call_sid=) or all calls
+    on this worker"""
+    await websocket.accept()
+    await transcript_hub.serve(websocket, call_sid)
+
+register(Gauge("pipeline_pool_hits_total", "Calls served from the warm pipeline pool",
+               lambda: pipeline_pool.hits, type="counter"))
+register(Gauge("pipeline_pool_misses_total", "Calls that had to build pipeline components inline",
+               lambda: pipeline_pool.misses, type="counter"))
+register(Gauge("calls_admitted_total", "Calls admitted by /agent on this worker",
+               lambda: session_registry.admitted, type="counter"))
+register(Gauge("calls_shed_total", "Calls turned away by /agent because every worker was full",
+               lambda: session_registry.shed, type="counter"))
+register(Gauge("live_pipelines", "run_bot pipelines currently running",
+               lambda: pipeline_pool.checked_out))
+
+@app.get("/metrics")
+async def metrics() -> PlainTextResponse:
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health")
+async def health() -> dict:
+    """Liveness; stays 200 while draining so the platform doesn't kill live calls"""
+    return drain.stats()
+
+@app.get("/ready")
+async def ready(response: Response) -> dict:
+    """Readiness; 503 once draining, so load balancers stop sending calls here"""
+    if drain.draining:
+        response.status_code = 503
+    return drain.stats()
+
+def refuse_if_draining():
+    if drain.draining:
+        raise HTTPException(status_code=503, detail="Worker is shutting down, retry on another instance")
+
+@app.get("/admin/resources")
+async def call_resource_usage(call_sid: Optional[str] = None, limit: int = 50, collect: bool = False) -> dict:
+    """Tasks, memory, CPU and sockets per call for recent and live calls, and
+    leaks found so far; collect=true runs the garbage collector and any
+    pending leak checks first"""
+    if collect:
+        gc.collect()
+        call_resources.check_leaks(force=True)
+    recent = [u for u in call_resources.recent if call_sid is None or u.call_sid == call_sid]
+    return {
+        **call_resources.stats(),
+        "live_calls": [u.to_dict() for u in call_resources.live.values()],
+        "recent": [u.to_dict() for u in recent[-limit:]] if limit > 0 else [],
+    }
+
+@app.get("/capacity")
+async def capacity() -> dict:
+    """Cluster-wide call capacity as seen by admission control"""
+    return {"worker_id": WORKER_ID, "local_active": pipeline_pool.checked_out, **await session_registry.stats()}
+
+@app.get("/call-records")
+async def call_record_stats() -> dict:
+    """Transcript persistence queue depth and throughput"""
+    return call_records.stats()
+
+@app.get("/recordings")
+async def recording_stats() -> dict:
+    """In-process call recorder: audio held in memory, chunks and segments written, audio dropped"""
+    return recorder.stats()
+
+@app.get("/pool")
+async def pool_stats() -> dict:
+    """Warm pipeline pool usage (hits, misses, availability) and pre-connects"""
+    return {**pipeline_pool.stats(), "preconnect": preconnects.stats()}
+
+@app.get("/fillers")
+async def filler_stats() -> dict:
+    """Filler clips loaded, and how often they covered a late reply"""
+    return fillers.stats()
+
+@app.get("/providers")
+async def provider_stats() -> dict:
+    """Rolling STT/TTS provider latency and error scores used for routing"""
+    return provider_router.stats()
+
+class AnalysisCall(BaseModel):
+    call_sid: str
+    # Either, or neither to use the persisted call record
+    transcript: Optional[str] = None
+    messages: Optional[List[Dict[str, Any]]] = None
+
 class AnalyzeCallRequest(BaseModel):
     questions: Optional[List[Dict[str, Any]]] = None  
     agent_id: Optional[int] = None
+    calls: List[AnalysisCall] = []
+
+@app.post("/analyze-calls")
+async def analyze_calls(request: AnalyzeCallRequest):
+    """
+    Answer a question set about a batch of calls, streamed as NDJSON progress events.
+
+    Calls given only by SID are looked up in the persisted call records. With a
+    local sink the first lookup reads every segment not yet indexed by this
+    worker; later ones only read the segments holding the calls asked for.
+    """
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="No questions to answer")
+    if not request.calls:
+        raise HTTPException(status_code=400, detail="No calls to analyze")
+    try:
+        questions = question_set(request.questions)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def events():
+        async for event in call_analyzer.run([c.model_dump() for c in request.calls], questions):
+            if request.agent_id is not None:
+                event["agent_id"] = request.agent_id
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@app.get("/analyze-calls")
+async def analysis_stats() -> dict:
+    """Post-call analysis concurrency, cache and LLM request counts"""
+    return call_analyzer.stats()
+
+class AgentConfigRequest(BaseModel):
+    name: str
+    # {variable} placeholders are filled from variables
+    prompt: str
+    variables: Dict[str, str] = {}
+    # Numbers this agent answers and calls from
+    numbers: List[str] = []
+    agent_id: Optional[int] = None
+    active: bool = True
+
+@app.post("/agents")
+async def save_agent_config(request: AgentConfigRequest) -> dict:
+    """Create or replace an agent; other workers pick it up on their next poll"""
+    def save():
+        with Session(engine) as session:
+            agent = save_agent(session, **request.model_dump())
+            return agent.id
+    agent_id = await asyncio.to_thread(save)
+    await agent_configs.refresh()
+    prompt = agent_configs.get(agent_id)
+    return {"agent_id": agent_id, "version": prompt.version, "prompt_tokens": prompt.tokens}
+
+@app.get("/agents")
+async def agent_config_stats() -> dict:
+    """Agents and numbers in this worker's prompt cache"""
+    return agent_configs.stats()
 
 class InitiateCallRequest(BaseModel):
     to_number: str
@@ -128,20 +461,14 @@ async def initiate_call(
     """
     Initiate an outbound call from your Twilio number to a target phone number.
     """
+    refuse_if_draining()
     try:
-        # Initialize Twilio client
-        twilio_client = Client(
-            settings.TWILIO_ACCOUNT_SID,
-            settings.TWILIO_AUTH_TOKEN
-        )
-        
         # Use the request host to build webhook URL
         webhook_url = f"https://{settings.HOST}/agent"
         
         # Create the outbound call
-        call = twilio_client.calls.create(
+        call = await twilio_api.create_call(
             to=request.to_number,
-            from_=settings.TWILIO_PHONE_NUMBER,
             url=webhook_url,
             method="POST"
         )
@@ -158,6 +485,94 @@ async def initiate_call(
         raise HTTPException(status_code=500, detail=f"Failed to initiate call: {str(e)}")
 
 
+class CampaignRequest(BaseModel):
+    numbers: List[str]
+    name: Optional[str] = None
+
+@app.post("/campaigns")
+async def create_campaign(request: CampaignRequest):
+    """Start dialing a list of numbers at the configured CPS and concurrency"""
+    refuse_if_draining()
+    campaign = campaign_manager.create(request.numbers, request.name)
+    return campaign.progress()
+
+@app.post("/campaigns/upload")
+async def upload_campaign(
+    file: UploadFile = File(...),
+    name: Optional[str] = Form(None),
+):
+    """Start a campaign from a CSV (number column) or JSON file of numbers"""
+    refuse_if_draining()
+    try:
+        numbers = parse_numbers(await file.read(), file.filename or "")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not read numbers: {str(e)}")
+    if not numbers:
+        raise HTTPException(status_code=400, detail="No phone numbers found in upload")
+    campaign = campaign_manager.create(numbers, name or file.filename)
+    return campaign.progress()
+
+@app.post("/campaigns/status")
+async def campaign_call_status(request: Request):
+    """Twilio status callback for campaign calls, handed to the worker running the campaign"""
+    form = await request.form()
+    await mailbox.deliver(
+        request.query_params.get("worker"),
+        "campaign_status",
+        {"call_sid": form.get("CallSid"), "status": form.get("CallStatus")},
+    )
+    return Response(status_code=204)
+
+@app.post("/transfers/status")
+async def transfer_call_status(request: Request):
+    """Twilio status callback for agent legs, handed to the worker running the caller's bot"""
+    form = await request.form()
+    await mailbox.deliver(
+        request.query_params.get("worker"),
+        "transfer_status",
+        {"call_sid": form.get("CallSid"), "status": form.get("CallStatus")},
+    )
+    return Response(status_code=204)
+
+@app.get("/transfers")
+async def transfer_stats() -> dict:
+    """Pre-dialed, warm, cold and released transfer counts"""
+    return transfers.stats()
+
+@app.get("/campaigns")
+async def list_campaigns():
+    """Campaigns running on this worker"""
+    return [c.progress() for c in campaign_manager.campaigns.values()]
+
+async def get_campaign(campaign_id: str) -> dict:
+    progress = await campaign_manager.snapshot(campaign_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return progress
+
+async def command_campaign(campaign_id: str, action: str) -> dict:
+    campaign = campaign_manager.campaigns.get(campaign_id)
+    if campaign is not None:
+        campaign_manager.handle_command(campaign_id, action)
+        return campaign.progress()
+    progress = await get_campaign(campaign_id)
+    # Another worker runs it and picks the command up from its mailbox
+    await mailbox.deliver(progress["worker_id"], "campaign_command", {"campaign_id": campaign_id, "action": action})
+    return {**progress, "requested": action}
+
+@app.get("/campaigns/{campaign_id}")
+async def campaign_progress(campaign_id: str):
+    return await get_campaign(campaign_id)
+
+@app.post("/campaigns/{campaign_id}/pause")
+async def pause_campaign(campaign_id: str):
+    return await command_campaign(campaign_id, "pause")
+
+@app.post("/campaigns/{campaign_id}/resume")
+async def resume_campaign(campaign_id: str):
+    return await command_campaign(campaign_id, "resume")
+
+
 def create_error_twiml(message: str) -> HTMLResponse:
     """Create a TwiML error response"""
     response = VoiceResponse()
@@ -165,7 +580,15 @@ def create_error_twiml(message: str) -> HTMLResponse:
     response.hangup()
     return HTMLResponse(content=str(response), media_type="application/xml")
 
+def create_redirect_twiml(url: str) -> HTMLResponse:
+    """Send Twilio to fetch the call's TwiML again from url"""
+    response = VoiceResponse()
+    response.redirect(url, method="POST")
+    return HTMLResponse(content=str(response), media_type="application/xml")
+
 def shutdown_handler(signal_int: int, frame: FrameType) -> None:
+    # Once the app is up, drain handles the signal first and uvicorn raises
+    # it again after shutting down, so by the time this runs calls are over
     logger.info(f"Caught Signal {signal.strsignal(signal_int)}")
     from utils.logging import flush
     flush()
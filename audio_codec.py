@@ -0,0 +1,199 @@
+import time
+from functools import lru_cache
+from math import gcd
+from typing import Dict, Tuple
+
+import numpy as np
+from pipecat.audio.resamplers.base_audio_resampler import BaseAudioResampler
+
+
+def _ulaw_decode_table() -> np.ndarray:
+    u = ~np.arange(256, dtype=np.uint8)
+    exponent = (u >> 4) & 0x07
+    mantissa = (u & 0x0F).astype(np.int32)
+    magnitude = (((mantissa << 3) + 0x84) << exponent) - 0x84
+    return np.where(u & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+def _ulaw_encode_table() -> np.ndarray:
+    # Same 14-bit G.711 variant as audioop.lin2ulaw, so output is byte-identical
+    pcm = np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.int32) >> 2
+    mask = np.where(pcm < 0, 0x7F, 0xFF)
+    pcm = np.minimum(np.abs(pcm), 8159) + 33
+    segment = np.searchsorted(np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF]), pcm)
+    ulaw = np.where(segment >= 8, 0x7F, (segment << 4) | ((pcm >> (segment + 1)) & 0x0F))
+    return (ulaw ^ mask).astype(np.uint8)
+
+
+# μ-law byte -> int16 sample, and int16 sample (viewed as uint16) -> μ-law byte
+ULAW_DECODE = _ulaw_decode_table()
+ULAW_ENCODE = _ulaw_encode_table()
+ULAW_DECODE_FLOAT = ULAW_DECODE.astype(np.float32)
+
+
+def ulaw_decode(ulaw: bytes) -> np.ndarray:
+    """μ-law bytes to int16 samples"""
+    return ULAW_DECODE[np.frombuffer(ulaw, dtype=np.uint8)]
+
+
+def ulaw_encode(pcm: np.ndarray) -> bytes:
+    """int16 samples to μ-law bytes"""
+    return ULAW_ENCODE[pcm.view(np.uint16)].tobytes()
+
+
+@lru_cache(maxsize=None)
+def _design(up: int, down: int, zero_crossings: int) -> np.ndarray:
+    """Kaiser-windowed low-pass, split into `up` phases of equal length"""
+    from scipy.signal import firwin
+
+    factor = max(up, down)
+    # Odd length, so the delay is a whole number of samples
+    taps = firwin(2 * zero_crossings * factor + 1, 0.92 / factor, window=("kaiser", 8.0)) * up
+    taps = np.pad(taps, (0, -len(taps) % up))
+    # Phase p, tap t multiplies input sample i - t for outputs at i*up + p
+    phases = taps.reshape(-1, up).T
+    return np.ascontiguousarray(phases, dtype=np.float32)
+
+
+class StreamResampler:
+    """Polyphase FIR resampler for one continuous mono int16 stream.
+
+    Keeps the last few input samples between calls so chunk boundaries are
+    seamless. Input is copied once into a preallocated float32 buffer, and
+    the filter reads it through cached strided window views, so a steady
+    stream of equal-sized frames costs a handful of NumPy calls and no
+    per-frame allocation. The returned array is a view that is only valid
+    until the next call. After `idle_reset` seconds without audio the
+    history is cleared, like pipecat's stream resampler, so a new utterance
+    doesn't start with the tail of the last one.
+    """
+
+    def __init__(self, in_rate: int, out_rate: int, zero_crossings: int = 8, idle_reset: float = 0.2):
+        common = gcd(in_rate, out_rate)
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.up = out_rate // common
+        self.down = in_rate // common
+        self.idle_reset = idle_reset
+        phases = _design(self.up, self.down, zero_crossings)
+        self._taps = phases.shape[1]
+        self._history = self._taps - 1
+        # Reversed so a window of ascending input samples dots straight into an output
+        self._reversed = np.ascontiguousarray(phases[:, ::-1])
+        self._reversed_t = np.ascontiguousarray(self._reversed.T)
+        self._plans: Dict[Tuple[int, int], tuple] = {}
+        self._last = 0.0
+        self._allocate(0)
+        self.reset()
+
+    def _allocate(self, frame: int):
+        self._capacity = frame
+        self._buffer = np.zeros(self._history + frame, dtype=np.float32)
+        outputs = frame * self.up // self.down + 1
+        self._mixed = np.empty(outputs, dtype=np.float32)
+        self._scratch = np.empty(outputs, dtype=np.float32)
+        self._out = np.empty(outputs, dtype=np.int16)
+        self._plans.clear()
+
+    def reset(self):
+        self._buffer[:self._history] = 0
+        # Upsampled-rate position of the next output, counted from buffer[0]
+        self._next = self._history * self.up
+
+    def _windows(self, first: int, rows: int, step: int) -> np.ndarray:
+        """rows x taps view of the buffer; row r holds the inputs for one output"""
+        item = self._buffer.itemsize
+        return np.lib.stride_tricks.as_strided(
+            self._buffer[first - self._history:], (rows, self._taps), (step * item, item), writeable=False
+        )
+
+    def _plan(self, frame: int) -> tuple:
+        """Window views and filters for a frame of this size at the current phase"""
+        key = (frame, self._next)
+        plan = self._plans.get(key)
+        if plan is not None:
+            return plan
+        up, down = self.up, self.down
+        end = (self._history + frame) * up
+        count = max(0, -(-(end - self._next) // down))
+        if down == 1 and self._next % up == 0:
+            # Every input sample yields `up` outputs, one per phase: one matrix product
+            rows = count // up
+            steps = [(self._windows(self._next // up, rows, 1), self._reversed_t, self._mixed[:count].reshape(rows, up), None)]
+        else:
+            # Outputs q, q + up, ... share a phase and step `down` inputs apart
+            steps = []
+            for q in range(min(up, count)):
+                position = self._next + q * down
+                rows = len(range(q, count, up))
+                windows = self._windows(position // up, rows, down)
+                target = self._mixed[q:count:up]
+                if up == 1:
+                    steps.append((windows, self._reversed[0], self._mixed[:count], None))
+                else:
+                    steps.append((windows, self._reversed[position % up], self._scratch[:rows], target))
+        plan = (count, steps)
+        if len(self._plans) > 64:
+            self._plans.clear()
+        self._plans[key] = plan
+        return plan
+
+    def _run(self, frame: int) -> np.ndarray:
+        count, steps = self._plan(frame)
+        for windows, taps, out, target in steps:
+            np.dot(windows, taps, out=out)
+            if target is not None:
+                target[:] = out
+        mixed = self._mixed[:count]
+        np.minimum(mixed, 32767, out=mixed)
+        np.maximum(mixed, -32768, out=mixed)
+        out = self._out[:count]
+        np.copyto(out, mixed, casting="unsafe")
+
+        # Keep the tail as history and move the origin past this frame
+        history = self._history
+        self._buffer[:history] = self._buffer[frame:frame + history]
+        self._next += count * self.down - frame * self.up
+        return out
+
+    def _prepare(self, frame: int):
+        if frame > self._capacity:
+            self._allocate(frame)
+        now = time.monotonic()
+        if now - self._last > self.idle_reset:
+            self.reset()
+        self._last = now
+
+    def process(self, pcm: np.ndarray) -> np.ndarray:
+        """Resample int16 samples"""
+        frame = len(pcm)
+        self._prepare(frame)
+        self._buffer[self._history:self._history + frame] = pcm
+        return self._run(frame)
+
+    def process_ulaw(self, ulaw: bytes) -> np.ndarray:
+        """Decode μ-law straight into the filter buffer and resample"""
+        frame = len(ulaw)
+        self._prepare(frame)
+        ULAW_DECODE_FLOAT.take(
+            np.frombuffer(ulaw, dtype=np.uint8), out=self._buffer[self._history:self._history + frame]
+        )
+        return self._run(frame)
+
+
+class NumpyStreamResampler(BaseAudioResampler):
+    """pipecat resampler interface over StreamResampler, one per rate pair"""
+
+    def __init__(self, **kwargs):
+        self._streams: Dict[Tuple[int, int], StreamResampler] = {}
+
+    def stream(self, in_rate: int, out_rate: int) -> StreamResampler:
+        stream = self._streams.get((in_rate, out_rate))
+        if stream is None:
+            stream = self._streams[(in_rate, out_rate)] = StreamResampler(in_rate, out_rate)
+        return stream
+
+    async def resample(self, audio: bytes, in_rate: int, out_rate: int) -> bytes:
+        if in_rate == out_rate:
+            return audio
+        return self.stream(in_rate, out_rate).process(np.frombuffer(audio, dtype=np.int16)).tobytes()
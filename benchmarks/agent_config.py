@@ -0,0 +1,170 @@
+"""Call-setup prompt resolution with thousands of agents, cached vs per-call queries.
+
+Fills a temporary SQLite database with --agents agents (two numbers and
+three variables each), then resolves the prompt for --calls random dialed
+numbers two ways:
+
+    per call    what /agent would do without the cache: look the number up,
+                load the agent and its variables, render and count the prompt
+    cached      agent_configs.for_number, as /agent and /ws do now
+
+Counts the SQL statements run during the cached calls (there should be none),
+times POST /agent end to end through the app, and checks that a change made
+by "another worker" (save_agent on its own session, without telling this
+cache) is served within the poll interval, including a number moving from
+one agent to another.
+
+    python -m benchmarks.agent_config --agents 5000 --calls 2000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+# Must be set before config is imported
+os.environ.setdefault("HOST", "localhost")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='agent_config_')}/agents.db"
+os.environ["AGENT_CACHE_POLL_INTERVAL"] = "0.2"
+os.environ["PRECONNECT_ENABLED"] = "false"
+os.environ["MAX_CALLS_PER_WORKER"] = "100000"
+for key in ("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN"):
+    os.environ.setdefault(key, "mock")
+
+import httpx  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from sqlmodel import Session, select  # noqa: E402
+
+import app as app_module  # noqa: E402
+from agent_config import agent_configs, compile_prompt  # noqa: E402
+from db import Agent, DynamicVariable, PhoneNumber, create_db_and_tables, engine, save_agent  # noqa: E402
+from helper import Appointment_Prompt  # noqa: E402
+
+TEMPLATE = "You are {agent_name}, calling for {company}. Offer {offer}.\n" + Appointment_Prompt
+
+
+def number(i: int, line: int) -> str:
+    return f"+614{i:06d}{line:02d}"
+
+
+def populate(agents: int):
+    create_db_and_tables()
+    with Session(engine) as session:
+        for i in range(1, agents + 1):
+            session.add(Agent(id=i, name=f"agent-{i}", prompt=TEMPLATE))
+            session.add_all([PhoneNumber(number=number(i, line), agent_id=i) for line in (0, 1)])
+            session.add_all([
+                DynamicVariable(agent_id=i, key="agent_name", value=f"Sam {i}"),
+                DynamicVariable(agent_id=i, key="company", value=f"Energy Co {i % 37}"),
+                DynamicVariable(agent_id=i, key="offer", value=f"{i % 20 + 5}% off"),
+            ])
+        session.commit()
+
+
+def per_call(dialed: str):
+    """One call's worth of queries and rendering, without the cache"""
+    with Session(engine) as session:
+        phone = session.get(PhoneNumber, dialed)
+        agent = session.get(Agent, phone.agent_id)
+        variables = {v.key: v.value for v in session.exec(
+            select(DynamicVariable).where(DynamicVariable.agent_id == agent.id))}
+        return compile_prompt(agent.id, agent.version, agent.name, agent.prompt, variables)
+
+
+def _fmt(samples: list) -> str:
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return f"p50 {statistics.median(samples) * 1e6:8.1f}us  p99 {p99 * 1e6:8.1f}us"
+
+
+async def wait_for(check, timeout: float) -> float:
+    start = time.perf_counter()
+    while not check():
+        if time.perf_counter() - start > timeout:
+            return float("inf")
+        await asyncio.sleep(0.01)
+    return time.perf_counter() - start
+
+
+async def main(args):
+    ok = True
+    random.seed(1)
+    start = time.perf_counter()
+    populate(args.agents)
+    print(f"{args.agents} agents, {args.agents * 2} numbers written in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    await agent_configs.start()
+    stats = agent_configs.stats()
+    print(f"startup load:  {time.perf_counter() - start:.2f}s for {stats['agents']} agents, "
+          f"{stats['numbers']} numbers")
+    ok &= stats["agents"] == args.agents and stats["numbers"] == args.agents * 2
+
+    dialed = [number(random.randint(1, args.agents), random.randint(0, 1)) for _ in range(args.calls)]
+    uncached = []
+    for n in dialed:
+        t = time.perf_counter()
+        per_call(n)
+        uncached.append(time.perf_counter() - t)
+    print(f"per call:      {_fmt(uncached)}")
+
+    statements = []
+    listener = lambda *a: statements.append(a[2])  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    cached = []
+    for n in dialed:
+        t = time.perf_counter()
+        prompt = agent_configs.for_number(n)
+        cached.append(time.perf_counter() - t)
+        ok &= prompt.agent_id == int(n[4:10])
+    event.remove(engine, "before_cursor_execute", listener)
+    print(f"cached:        {_fmt(cached)}  ({len(statements)} SQL statements)")
+    ok &= not statements and statistics.median(cached) * 100 < statistics.median(uncached)
+
+    # /agent only admits calls once this worker advertises capacity
+    await app_module.heartbeat.start()
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        setup = []
+        for i, n in enumerate(dialed[:args.http_calls]):
+            t = time.perf_counter()
+            response = await http.post("/agent", data={"CallSid": f"CA{i:08d}", "To": n, "Direction": "inbound"})
+            setup.append(time.perf_counter() - t)
+            ok &= f'value="{int(n[4:10])}"' in response.text
+        print(f"POST /agent:   {_fmt(setup)}  (through the app, in process)")
+
+        # Another worker edits agent 1 and moves one of agent 2's numbers to it
+        def edit():
+            with Session(engine) as session:
+                save_agent(session, "agent-1", "You are now {agent_name}. " + Appointment_Prompt,
+                           variables={"agent_name": "Alex"}, numbers=[number(1, 0), number(2, 1)], agent_id=1)
+
+        await asyncio.to_thread(edit)
+        seen = await wait_for(lambda: agent_configs.get(1).instruction.startswith("You are now Alex"), 5)
+        moved = agent_configs.for_number(number(2, 1)).agent_id
+        print(f"\nchange by another worker served after {seen * 1000:.0f}ms "
+              f"(poll every {agent_configs.poll_interval}s); moved number now answers agent {moved}, "
+              f"agent 2 version {agent_configs.get(2).version}")
+        ok &= seen <= agent_configs.poll_interval + 1 and moved == 1 and agent_configs.get(2).version == 2
+        ok &= agent_configs.for_number(number(1, 1)).agent_id is None
+
+        response = await http.post("/agents", json={
+            "name": "new", "prompt": "Hi from {who}", "variables": {"who": "Jo"}, "numbers": ["+61400000000"]})
+        created = response.json()
+        ok &= agent_configs.for_number("+61400000000").agent_id == created["agent_id"]
+        print(f"POST /agents:  {created}")
+        print(f"stats:         {(await http.get('/agents')).json()}")
+    await app_module.heartbeat.stop()
+    await agent_configs.close()
+    print("OK" if ok else "FAILED")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--agents", type=int, default=5000)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--http-calls", type=int, default=300)
+    asyncio.run(main(parser.parse_args()))
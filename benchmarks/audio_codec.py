@@ -0,0 +1,138 @@
+"""Per-frame Twilio audio conversion: pipecat's audioop + soxr vs audio_codec.
+
+Measures, on one core, frames per second for:
+  - inbound: a 20ms 8 kHz μ-law frame to 16 kHz PCM (what VAD/STT get)
+  - outbound: a 40ms 24 kHz TTS chunk to 8 kHz μ-law
+  - the whole serializer, JSON and base64 included, both directions
+and checks the μ-law tables against audioop and the resampler's streaming
+output against a one-shot run and against soxr.
+
+    python -m benchmarks.audio_codec --seconds 2
+"""
+import argparse
+import asyncio
+import audioop
+import base64
+import json
+import time
+import warnings
+
+import numpy as np
+from pipecat.audio.utils import create_stream_resampler, pcm_to_ulaw, ulaw_to_pcm
+from pipecat.frames.frames import StartFrame, TTSAudioRawFrame
+from pipecat.serializers.twilio import TwilioFrameSerializer
+
+from audio_codec import ULAW_ENCODE, StreamResampler, ulaw_decode, ulaw_encode
+from benchmarks.synthetic_speech import synthetic_speech
+from twilio_serializer import FastTwilioFrameSerializer
+
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+async def rate(fn, frames, seconds: float) -> float:
+    """Frames per second for `fn` cycling through `frames`"""
+    done, start = 0, time.process_time()
+    while time.process_time() - start < seconds:
+        for frame in frames:
+            await fn(frame)
+        done += len(frames)
+    return done / (time.process_time() - start)
+
+
+def check_codec():
+    every_byte = bytes(range(256))
+    every_sample = np.arange(65536, dtype=np.uint16).view(np.int16)
+    decode_ok = np.array_equal(ulaw_decode(every_byte), np.frombuffer(audioop.ulaw2lin(every_byte, 2), np.int16))
+    encode_ok = ulaw_encode(every_sample) == audioop.lin2ulaw(every_sample.tobytes(), 2)
+    return decode_ok, encode_ok
+
+
+def check_resampler(pcm: np.ndarray, in_rate: int, out_rate: int, chunk: int):
+    stream = StreamResampler(in_rate, out_rate, idle_reset=1e9)
+    chunked = np.concatenate([stream.process(pcm[i:i + chunk]).copy() for i in range(0, len(pcm), chunk)])
+    whole = StreamResampler(in_rate, out_rate, idle_reset=1e9).process(pcm).copy()
+
+    import soxr
+    reference = soxr.resample(pcm.astype(np.float64), in_rate, out_rate, quality="VHQ")
+    # Compare away from the edges at the best alignment (the FIR delays its output)
+    n = min(len(chunked), len(reference)) - 400
+    snr = max(
+        10 * np.log10(np.mean(reference[200:n] ** 2)
+                      / np.mean((chunked[200 + d:n + d] - reference[200:n]) ** 2))
+        for d in range(0, 64)
+    )
+    return np.array_equal(chunked, whole), snr
+
+
+async def main(args):
+    decode_ok, encode_ok = check_codec()
+    print(f"mu-law tables identical to audioop: decode {decode_ok}, encode {encode_ok}")
+
+    speech_8k = np.frombuffer(synthetic_speech(2.0, 8000), np.int16)
+    speech_24k = np.frombuffer(synthetic_speech(2.0, 24000), np.int16)
+    for pcm, in_rate, out_rate, chunk in ((speech_8k, 8000, 16000, 160), (speech_24k, 24000, 8000, 960)):
+        seamless, snr = check_resampler(pcm, in_rate, out_rate, chunk)
+        print(f"resampler {in_rate}->{out_rate}: chunked == one-shot {seamless}, SNR vs soxr VHQ {snr:.1f} dB")
+
+    ulaw_frames = [audioop.lin2ulaw(speech_8k[i:i + 160].tobytes(), 2) for i in range(0, len(speech_8k), 160)]
+    tts_chunks = [speech_24k[i:i + 960].tobytes() for i in range(0, len(speech_24k), 960)]
+
+    # Inbound: μ-law 8k -> PCM 16k
+    resampler = create_stream_resampler()
+    stream = StreamResampler(8000, 16000)
+    inbound = {
+        "pipecat": await rate(lambda f: ulaw_to_pcm(f, 8000, 16000, resampler), ulaw_frames, args.seconds),
+    }
+
+    async def fast_inbound(frame):
+        return stream.process_ulaw(frame).tobytes()
+
+    inbound["numpy"] = await rate(fast_inbound, ulaw_frames, args.seconds)
+
+    # Outbound: PCM 24k -> μ-law 8k
+    resampler = create_stream_resampler()
+    stream = StreamResampler(24000, 8000)
+    outbound = {
+        "pipecat": await rate(lambda f: pcm_to_ulaw(f, 24000, 8000, resampler), tts_chunks, args.seconds),
+    }
+
+    async def fast_outbound(chunk):
+        return ULAW_ENCODE[stream.process(np.frombuffer(chunk, np.int16)).view(np.uint16)].tobytes()
+
+    outbound["numpy"] = await rate(fast_outbound, tts_chunks, args.seconds)
+
+    # Whole serializer, both directions
+    messages = [json.dumps({"event": "media", "streamSid": "MZ1", "media": {
+        "track": "inbound", "chunk": str(i), "timestamp": str(i * 20),
+        "payload": base64.b64encode(frame).decode()}}) for i, frame in enumerate(ulaw_frames)]
+    frames = [TTSAudioRawFrame(chunk, 24000, 1) for chunk in tts_chunks]
+    serializer = {}
+    for name, cls in (("pipecat", TwilioFrameSerializer), ("numpy", FastTwilioFrameSerializer)):
+        s = cls("MZ1")
+        await s.setup(StartFrame(audio_in_sample_rate=16000))
+        serializer[name] = (
+            await rate(s.deserialize, messages, args.seconds),
+            await rate(s.serialize, frames, args.seconds),
+        )
+
+    print(f"\nframes/sec on one core      {'pipecat':>10} {'numpy':>10} {'speedup':>8}")
+    for label, (a, b) in (
+        ("inbound 20ms ulaw->16k", (inbound["pipecat"], inbound["numpy"])),
+        ("outbound 40ms 24k->ulaw", (outbound["pipecat"], outbound["numpy"])),
+        ("serializer deserialize", (serializer["pipecat"][0], serializer["numpy"][0])),
+        ("serializer serialize", (serializer["pipecat"][1], serializer["numpy"][1])),
+    ):
+        print(f"{label:<27} {a:10.0f} {b:10.0f} {b / a:7.1f}x")
+
+    # A talking call: 50 inbound frames/s, plus 25 outbound chunks/s while the bot speaks
+    for name in ("pipecat", "numpy"):
+        per_call = 50 / serializer[name][0] + 25 / serializer[name][1]
+        print(f"{name}: serializer audio work {per_call * 100:.2f}% of a core per call "
+              f"(~{1 / per_call:.0f} calls/core)")
+    print("OK" if decode_ok and encode_ok else "FAILED")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=2.0, help="CPU time per measurement")
+    asyncio.run(main(parser.parse_args()))
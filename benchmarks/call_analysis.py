@@ -0,0 +1,174 @@
+"""Batch post-call analysis against a mock structured-output LLM.
+
+Scores a batch of synthetic transcripts with a question set three ways:
+
+    by hand     one call and one question per LLM request, one at a time
+    batched     POST /analyze-calls: one request per call answering every
+                question, fanned out over the bounded worker pool
+    re-run      the same batch again, answered from the cache
+
+The mock client answers after --latency seconds (plus a little per question)
+and records how many requests it had in flight, so the run also checks the
+concurrency bound. Some calls are given no transcript and are found in a
+call-records segment written to a temporary directory, and --fail-rate of
+requests fail to show per-call errors don't stop the batch.
+
+    python -m benchmarks.call_analysis --calls 200 --concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from types import SimpleNamespace
+
+# Must be set before config is imported
+os.environ.setdefault("HOST", "localhost")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ["CALL_RECORDS_SINK"] = tempfile.mkdtemp(prefix="call_analysis_")
+
+import httpx  # noqa: E402
+
+import app as app_module  # noqa: E402
+from analysis import CallAnalyzer, call_analyzer, question_set, response_schema  # noqa: E402
+from call_records import _encode_segment, call_records  # noqa: E402
+
+QUESTIONS = [
+    {"key": "outcome", "question": "Did the caller book an appointment?", "type": "enum",
+     "options": ["booked", "declined", "callback"]},
+    {"key": "date", "question": "Which day was agreed, if any?"},
+    {"key": "party_size", "question": "How many people is the booking for?", "type": "integer"},
+    {"key": "satisfied", "question": "Did the caller sound satisfied?", "type": "boolean"},
+    {"key": "follow_up", "question": "What does the agent need to follow up on?", "type": "text"},
+]
+
+_ANSWERS = {"string": "Tuesday", "text": "Send a confirmation text", "number": 2.5, "integer": 3, "boolean": True}
+
+
+class MockCompletions:
+    def __init__(self, latency: float, fail_rate: float):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.requests = 0
+        self.in_flight = 0
+        self.peak = 0
+
+    async def create(self, messages, response_format, **kwargs):
+        schema = response_format["json_schema"]["schema"]
+        self.requests += 1
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency + 0.02 * len(schema["properties"]))
+            if random.random() < self.fail_rate:
+                raise RuntimeError("mock LLM error")
+        finally:
+            self.in_flight -= 1
+        answers = {
+            key: prop["enum"][0] if "enum" in prop else _ANSWERS[prop["type"][0]]
+            for key, prop in schema["properties"].items()
+        }
+        message = SimpleNamespace(content=json.dumps(answers))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+class MockClient:
+    """Just enough of AsyncOpenAI for CallAnalyzer"""
+
+    def __init__(self, latency: float, fail_rate: float = 0.0):
+        self.chat = SimpleNamespace(completions=MockCompletions(latency, fail_rate))
+
+
+def transcript(i: int) -> list:
+    return [
+        {"role": "system", "content": "You are a booking assistant."},
+        {"role": "assistant", "content": "Hi, thanks for calling. How can I help?"},
+        {"role": "user", "content": f"I'd like a table for {i % 6 + 1} on Tuesday, caller {i}."},
+        {"role": "assistant", "content": "Done, you're booked in. Anything else?"},
+        {"role": "user", "content": "No, that's all, thanks."},
+    ]
+
+
+async def by_hand(calls: list, latency: float) -> tuple:
+    """One question per request, one call after another"""
+    client = MockClient(latency)
+    analyzer = CallAnalyzer(concurrency=1, cache_size=0, model="mock", max_tokens=100, client=client)
+    start = time.perf_counter()
+    for call in calls:
+        for q in question_set(QUESTIONS):
+            await analyzer.answer(json.dumps(call["messages"]), [q], response_schema([q]), q["key"])
+    return time.perf_counter() - start, client.chat.completions.requests
+
+
+async def post_batch(http: httpx.AsyncClient, calls: list) -> tuple:
+    start = time.perf_counter()
+    events = []
+    async with http.stream("POST", "/analyze-calls", json={"questions": QUESTIONS, "calls": calls}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line:
+                events.append(json.loads(line))
+    return time.perf_counter() - start, events
+
+
+async def main(args):
+    ok = True
+    random.seed(1)
+    calls = [{"call_sid": f"CA{i:06d}", "messages": transcript(i)} for i in range(args.calls)]
+    # A tenth of the batch is sent by call SID alone and read back from the call records
+    stored = calls[::10]
+    await call_records.sink.write("2026/01/01/000000-0-000001.jsonl.gz", _encode_segment(stored))
+    sent = [{"call_sid": c["call_sid"]} if c in stored else c for c in calls]
+
+    hand_seconds, hand_requests = await by_hand(calls[:args.hand_sample], args.latency)
+    hand_seconds *= args.calls / args.hand_sample
+    print(f"by hand:  {hand_seconds:7.2f}s  {hand_requests * args.calls // args.hand_sample} requests "
+          f"(extrapolated from {args.hand_sample} calls)")
+
+    client = MockClient(args.latency, args.fail_rate)
+    call_analyzer._client = client
+    call_analyzer.concurrency = args.concurrency
+    call_analyzer._limit = asyncio.Semaphore(args.concurrency)
+    completions = client.chat.completions
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as http:
+        seconds, events = await post_batch(http, sent)
+        done = events[-1]
+        print(f"batched:  {seconds:7.2f}s  {completions.requests} requests, peak {completions.peak} in flight, "
+              f"{done['answered']} answered, {done['failed']} failed")
+        results = [e for e in events if e["event"] == "result"]
+        ok &= (
+            events[0]["event"] == "start" and done["event"] == "done"
+            and [e["done"] for e in results] == list(range(1, args.calls + 1))
+            and completions.peak <= args.concurrency
+            and done["answered"] + done["failed"] == args.calls
+            and all(r["answers"]["outcome"] == "booked" for r in results if "answers" in r)
+        )
+        ok &= seconds < hand_seconds / 5
+
+        before = completions.requests
+        completions.fail_rate = 0.0
+        seconds, events = await post_batch(http, sent)
+        done = events[-1]
+        print(f"re-run:   {seconds:7.2f}s  {completions.requests - before} requests, {done['cached']} cached, "
+              f"{done['failed']} failed")
+        # Only the calls that failed the first time go back to the LLM
+        ok &= done["failed"] == 0 and completions.requests - before == args.calls - done["cached"]
+
+        response = await http.post("/analyze-calls", json={"questions": [{"key": "x"}], "calls": sent[:1]})
+        ok &= response.status_code == 400
+        print(f"stats:    {(await http.get('/analyze-calls')).json()}")
+
+    print("OK" if ok else "FAILED")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.4, help="mock LLM seconds per request")
+    parser.add_argument("--fail-rate", type=float, default=0.02)
+    parser.add_argument("--hand-sample", type=int, default=5, help="calls to time by hand")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,113 @@
+"""Burst of call ends against the call-record writer with a slow, flaky sink.
+
+Submits --calls records as fast as possible, as if every call hung up at
+once, while a ticker measures event-loop lag. Reports how long submit()
+takes (this is what call teardown pays), peak queue depth, retries, and
+checks every record made it into the segments.
+
+    python -m benchmarks.call_records_burst --calls 5000
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import random
+import tempfile
+import time
+
+from call_records import CallRecordWriter, LocalSink
+
+
+class FlakySink(LocalSink):
+    """Local sink that adds upload latency and fails a fraction of writes"""
+
+    def __init__(self, directory: str, latency: float, failure_rate: float):
+        super().__init__(directory)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.names = []
+
+    async def write(self, name, data):
+        await asyncio.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise ConnectionError("simulated upload failure")
+        await super().write(name, data)
+        self.names.append(name)
+
+
+def fake_record(i: int) -> dict:
+    messages = [{"role": "system", "content": "You are a helpful assistant. " * 40}]
+    for turn in range(12):
+        messages.append({"role": "user", "content": f"user turn {turn} of call {i} " * 6})
+        messages.append({"role": "assistant", "content": f"assistant reply {turn} " * 10})
+    return {
+        "call_sid": f"CA{i:032d}",
+        "stream_sid": f"MZ{i:032d}",
+        "started_at": time.time() - 120,
+        "ended_at": time.time(),
+        "messages": messages,
+        "latency": [{"stt": 0.2, "llm_ttft": 0.4, "tts_ttfb": 0.2, "response_delay": 0.9}] * 12,
+    }
+
+
+async def loop_lag(stop: asyncio.Event, samples: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.005)
+        samples.append(time.perf_counter() - start - 0.005)
+
+
+async def main(args):
+    directory = tempfile.mkdtemp()
+    sink = FlakySink(directory, args.latency, args.failure_rate)
+    writer = CallRecordWriter(
+        sink, max_queue=args.queue, segment_records=args.segment_records,
+        segment_bytes=8 * 1024 * 1024, flush_interval=1.0, max_retries=5,
+    )
+    writer.start()
+    records = [fake_record(i) for i in range(args.calls)]
+
+    stop = asyncio.Event()
+    lag = []
+    ticker = asyncio.create_task(loop_lag(stop, lag))
+    submit_times = []
+    peak = 0
+    start = time.perf_counter()
+    for i, record in enumerate(records):
+        t = time.perf_counter()
+        writer.submit(record)
+        submit_times.append(time.perf_counter() - t)
+        peak = max(peak, writer.depth)
+        if i % 50 == 0:
+            # Hangups arrive from many websocket handlers, not one tight loop
+            await asyncio.sleep(0)
+    burst = time.perf_counter() - start
+    await writer.close()
+    drained = time.perf_counter() - start
+    stop.set()
+    await ticker
+
+    persisted = 0
+    for name in sink.names:
+        with gzip.open(f"{directory}/{name}", "rt") as f:
+            persisted += sum(1 for line in f if json.loads(line)["call_sid"])
+
+    submit_times.sort()
+    lag.sort()
+    print(f"{args.calls} call ends submitted in {burst * 1000:.1f}ms, drained in {drained:.2f}s")
+    print(f"submit(): p50 {submit_times[len(submit_times) // 2] * 1e6:.1f}us, "
+          f"max {submit_times[-1] * 1e6:.1f}us")
+    print(f"loop lag: p99 {lag[int(len(lag) * 0.99)] * 1000:.1f}ms, max {lag[-1] * 1000:.1f}ms")
+    print(f"peak queue depth {peak}, stats {writer.stats()}")
+    print(f"records persisted {persisted}/{writer.submitted} in {len(sink.names)} segments")
+    print("OK" if persisted == writer.submitted and not writer.failed_segments else "FAILED")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=5000)
+    parser.add_argument("--queue", type=int, default=10000)
+    parser.add_argument("--segment-records", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--failure-rate", type=float, default=0.2)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,97 @@
+"""Run a campaign end to end against the fake Twilio API.
+
+Checks that the dialer never exceeds the CPS limit or the concurrent-call
+cap, and that busy/no-answer numbers are redialed.
+
+    python -m benchmarks.campaign_sim --numbers 300 --cps 20 --max-calls 25
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.fake_twilio import FakeTwilioHttpClient
+from campaign import CampaignManager
+from config import settings
+from twilio_client import TwilioAPI
+
+
+async def run(args) -> int:
+    settings.CAMPAIGN_RETRY_BACKOFF = args.retry_backoff
+    rng = random.Random(1)
+
+    def outcome(to):
+        roll = rng.random()
+        return "busy" if roll < args.busy else "no-answer" if roll < 2 * args.busy else "completed"
+
+    manager = None
+    fake = FakeTwilioHttpClient(
+        latency=0.05,
+        outcome=outcome,
+        status_callback=lambda sid, status: manager.handle_status(sid, status),
+        ring_time=args.ring_time,
+        call_duration=args.call_duration,
+    )
+    manager = CampaignManager(
+        TwilioAPI(http_client=fake),
+        live_pipelines=lambda: fake.live_calls,
+        cps=args.cps,
+        max_concurrent_calls=args.max_calls,
+    )
+
+    numbers = [f"+6140{i:07d}" for i in range(args.numbers)]
+    campaign = manager.create(numbers, "sim")
+    start = time.monotonic()
+    peak = 0
+    dial_times = []
+    seen = 0
+    paused = False
+    while not campaign.task.done():
+        await asyncio.sleep(0.05)
+        peak = max(peak, manager.in_use())
+        now = time.monotonic()
+        dial_times.extend([now] * (len(fake.calls) - seen))
+        seen = len(fake.calls)
+        if args.pause_at and not paused and now - start > args.pause_at:
+            campaign.pause()
+            paused_dials = campaign.dialed
+            await asyncio.sleep(1)
+            # Only dials already past the token bucket may slip through
+            assert campaign.dialed - paused_dials <= 1, "dialed while paused"
+            campaign.resume()
+            paused = True
+
+    # The campaign finishes once nothing is left to dial; let answered calls end
+    while campaign.in_call:
+        await asyncio.sleep(0.05)
+    elapsed = time.monotonic() - start
+    busiest_second = max(
+        sum(1 for t in dial_times if s <= t < s + 1) for s in dial_times
+    )
+    print(campaign.progress())
+    print(
+        f"elapsed={elapsed:.1f}s dials={len(fake.calls)} peak_concurrent={peak} "
+        f"busiest_second={busiest_second} (cps={args.cps}, cap={args.max_calls})"
+    )
+    ok = peak <= args.max_calls and busiest_second <= args.cps + 1
+    ok = ok and sum(campaign.outcomes.values()) == args.numbers
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--numbers", type=int, default=300)
+    parser.add_argument("--cps", type=float, default=20)
+    parser.add_argument("--max-calls", type=int, default=25)
+    parser.add_argument("--busy", type=float, default=0.1)
+    parser.add_argument("--ring-time", type=float, default=0.3)
+    parser.add_argument("--call-duration", type=float, default=1.0)
+    parser.add_argument("--retry-backoff", type=float, default=0.5)
+    parser.add_argument("--pause-at", type=float, default=2.0)
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Cold-start cost: import time per package and time to the first /agent response.
+
+Each measurement runs in a fresh interpreter, the way a new Cloud Run
+instance does. Pass --ref to run the same measurements against another git
+revision (checked out into a temporary worktree) for a before/after view.
+
+    python -m benchmarks.cold_start
+    python -m benchmarks.cold_start --ref HEAD~1
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+INTEGRATIONS = (
+    "pipecat.services.deepgram.stt",
+    "pipecat.services.cartesia.stt",
+    "pipecat.services.elevenlabs.tts",
+    "pipecat.services.openai.llm",
+    "deepgram",
+    "sqlmodel",
+    "google.cloud.storage",
+    "flask",
+    "twilio.rest",
+)
+
+FIRST_REQUEST = r"""
+import time
+start = time.perf_counter()
+import asyncio, json, sys
+import app as app_module
+imported = time.perf_counter()
+
+async def first_request():
+    import httpx
+    app = app_module.app
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/agent", data={"CallSid": "CA-cold-start"})
+        answered = time.perf_counter()
+    loaded = [m for m in INTEGRATIONS if m in sys.modules]
+    return ready, answered, response.status_code, loaded
+
+ready, answered, status, loaded = asyncio.run(first_request())
+print("RESULT " + json.dumps({
+    "import": imported - start,
+    "startup": ready - imported,
+    "first_response": answered - start,
+    "status": status,
+    "loaded": loaded,
+}))
+"""
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env.setdefault("HOST", "localhost")
+    # Clients are built at startup but nothing is sent to the providers
+    for key in ("OPENAI_API_KEY", "CARTESIA_API_KEY", "ELEVENLABS_API_KEY", "DEEPGRAM_API_KEY",
+                "TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN"):
+        env.setdefault(key, "cold-start-benchmark")
+    env["SESSION_REGISTRY_URL"] = "memory://"
+    return env
+
+
+def import_profile(cwd: str) -> dict:
+    """Self/cumulative import time, grouped by top-level package"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=cwd, env=_env(), capture_output=True, text=True,
+    )
+    by_package = defaultdict(int)
+    total = 0
+    for line in proc.stderr.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if not m:
+            continue
+        self_us, cumulative_us, indent, name = int(m[1]), int(m[2]), len(m[3]), m[4]
+        by_package[name.split(".")[0]] += self_us
+        if indent == 1 and name == "app":
+            total = cumulative_us
+    return {"total": total / 1e6, "by_package": dict(by_package)}
+
+
+def first_request(cwd: str) -> dict:
+    script = f"INTEGRATIONS = {INTEGRATIONS!r}\n" + FIRST_REQUEST
+    proc = subprocess.run(
+        [sys.executable, "-c", script], cwd=cwd, env=_env(), capture_output=True, text=True,
+    )
+    for line in proc.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    raise RuntimeError(f"first request run failed:\n{proc.stderr[-2000:]}")
+
+
+def measure(cwd: str, runs: int, top: int) -> dict:
+    profile = import_profile(cwd)
+    results = [first_request(cwd) for _ in range(runs)]
+    summary = {
+        key: statistics.median(r[key] for r in results)
+        for key in ("import", "startup", "first_response")
+    }
+    summary["status"] = results[-1]["status"]
+    summary["loaded"] = results[-1]["loaded"]
+    summary["import_total"] = profile["total"]
+    summary["top_packages"] = sorted(profile["by_package"].items(), key=lambda kv: -kv[1])[:top]
+    return summary
+
+
+def report(label: str, summary: dict):
+    print(f"== {label}")
+    print(f"  import app (-X importtime):   {summary['import_total']:.2f}s")
+    print(f"  import app (median):          {summary['import']:.2f}s")
+    print(f"  lifespan startup:             {summary['startup']:.2f}s")
+    print(f"  process start -> /agent {summary['status']}: {summary['first_response']:.2f}s")
+    print(f"  integrations loaded: {', '.join(summary['loaded']) or 'none'}")
+    print("  self import time by package:")
+    for package, us in summary["top_packages"]:
+        print(f"    {package:<24} {us / 1000:8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--ref", help="also measure this git revision")
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    report("working tree", measure(root, args.runs, args.top))
+
+    if args.ref:
+        worktree = tempfile.mkdtemp()
+        subprocess.run(["git", "worktree", "add", "--detach", worktree, args.ref],
+                       cwd=root, check=True, capture_output=True)
+        try:
+            report(args.ref, measure(worktree, args.runs, args.top))
+        finally:
+            subprocess.run(["git", "worktree", "remove", "--force", worktree], cwd=root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Prompt size per turn on a long, chatty call, with and without ContextBudget.
+
+Drives the real ContextBudget processor in a pipecat pipeline with the
+production system prompt. A stand-in for the LLM appends a reply to the
+context for every request, as the assistant aggregator would, and a
+summariser with a fixed latency stands in for the summary request.
+
+TTFT is modelled as base + per-1k-token prefill cost (defaults roughly match
+gpt-4o-mini); pass the real figures from /metrics
+(call_llm_ttft_by_turn_seconds) to re-fit it.
+
+    python -m benchmarks.context_growth --turns 60
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from pipecat.frames.frames import EndFrame, Frame
+from pipecat.pipeline.pipeline import Pipeline
+from pipecat.pipeline.runner import PipelineRunner
+from pipecat.pipeline.task import PipelineParams, PipelineTask
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext, OpenAILLMContextFrame
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from context_budget import ContextBudget
+from helper import Appointment_Prompt
+from metrics import TURN_BUCKETS, turn_bucket
+
+WORDS = ("yeah so we pay about two hundred a month for power and gas with origin "
+         "I think the contract ends in march but honestly I am not sure what the rate is "
+         "we have solar on the roof too and the kids are home all day").split()
+
+
+def _sentence(rng: random.Random, low: int, high: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high))) + "."
+
+
+class FakeLLM(FrameProcessor):
+    """Answers each context frame by appending an assistant message"""
+
+    def __init__(self, rng: random.Random, **kwargs):
+        super().__init__(**kwargs)
+        self.rng = rng
+        self.answered = asyncio.Event()
+        self.sent_tokens = []
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if isinstance(frame, OpenAILLMContextFrame):
+            frame.context.add_message({"role": "assistant", "content": _sentence(self.rng, 20, 60)})
+            self.answered.set()
+            return
+        await self.push_frame(frame, direction)
+
+
+async def run_call(args, budgeted: bool) -> dict:
+    rng = random.Random(args.seed)
+    context = OpenAILLMContext(messages=[{"role": "system", "content": Appointment_Prompt}])
+
+    async def summarize(previous, messages):
+        await asyncio.sleep(args.summary_latency)
+        return _sentence(rng, 60, 100)
+
+    budget = ContextBudget(
+        context,
+        summarize=summarize if budgeted else None,
+        budget=args.budget if budgeted else 10**9,
+    )
+    enforce_times = []
+    enforce = budget._enforce
+
+    def timed_enforce():
+        start = time.perf_counter()
+        try:
+            return enforce()
+        finally:
+            enforce_times.append(time.perf_counter() - start)
+
+    budget._enforce = timed_enforce
+    llm = FakeLLM(rng)
+    task = PipelineTask(Pipeline([budget, llm]), params=PipelineParams(enable_metrics=False))
+    runner = PipelineRunner(handle_sigint=False)
+    run = asyncio.create_task(runner.run(task))
+
+    summarized_before, truncated_before = ContextBudget.summarized, ContextBudget.truncated
+    for _ in range(args.turns):
+        context.add_message({"role": "user", "content": _sentence(rng, 5, 40)})
+        llm.answered.clear()
+        await task.queue_frame(OpenAILLMContextFrame(context))
+        await llm.answered.wait()
+        await asyncio.sleep(args.turn_gap)
+    await task.queue_frame(EndFrame())
+    await run
+
+    return {
+        "tokens": budget.prompt_tokens,
+        "enforce": enforce_times,
+        "summaries": ContextBudget.summarized - summarized_before,
+        "truncations": ContextBudget.truncated - truncated_before,
+        "archived": len(budget.archived),
+        "kept": len(budget.full_messages()),
+    }
+
+
+def ttft(tokens: int, args) -> float:
+    return args.ttft_base + tokens / 1000 * args.ttft_per_1k
+
+
+async def main(args):
+    unbounded = await run_call(args, budgeted=False)
+    budgeted = await run_call(args, budgeted=True)
+
+    print(f"{args.turns} turns, budget {args.budget} tokens, summary latency {args.summary_latency}s")
+    print(f"{'turn':>6} | {'unbounded tokens':>16} {'ttft':>6} | {'budgeted tokens':>15} {'ttft':>6}")
+    for bucket in TURN_BUCKETS:
+        rows = [i for i in range(args.turns) if turn_bucket(i + 1) == bucket]
+        if not rows:
+            continue
+        a = statistics.mean(unbounded["tokens"][i] for i in rows)
+        b = statistics.mean(budgeted["tokens"][i] for i in rows)
+        print(f"{bucket:>6} | {a:16.0f} {ttft(a, args):5.2f}s | {b:15.0f} {ttft(b, args):5.2f}s")
+
+    total_a, total_b = sum(unbounded["tokens"]), sum(budgeted["tokens"])
+    print(f"prompt tokens over the call: {total_a} -> {total_b} ({(1 - total_b / total_a) * 100:.0f}% fewer)")
+    print(f"largest prompt: {max(unbounded['tokens'])} -> {max(budgeted['tokens'])}")
+    print(f"summaries {budgeted['summaries']}, hard truncations {budgeted['truncations']}, "
+          f"{budgeted['archived']} messages archived, full transcript kept "
+          f"({budgeted['kept']} == {unbounded['kept']} messages)")
+    worst = max(budgeted["enforce"])
+    print(f"budget check on the critical path: p50 {statistics.median(budgeted['enforce']) * 1e6:.0f}us, "
+          f"max {worst * 1e6:.0f}us")
+    ok = (max(budgeted["tokens"]) <= args.budget and budgeted["kept"] == unbounded["kept"]
+          and worst < 0.005)
+    print("OK" if ok else "FAILED")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--budget", type=int, default=3000)
+    parser.add_argument("--summary-latency", type=float, default=0.8)
+    parser.add_argument("--turn-gap", type=float, default=0.2, help="seconds between turns (compressed)")
+    parser.add_argument("--ttft-base", type=float, default=0.25)
+    parser.add_argument("--ttft-per-1k", type=float, default=0.08)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
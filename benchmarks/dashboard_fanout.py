@@ -0,0 +1,135 @@
+"""Hundreds of dashboard subscribers against synthetic live calls.
+
+Synthetic calls publish transcript and latency events at conversational
+rates. Subscribers watch a single call or everything. A share of them are
+slow, and some never read at all (a stalled browser tab). Reports the cost
+of publish() (the only part a live call pays), event-loop lag, delivery
+delay for healthy subscribers, and checks that stalled subscribers stay
+bounded and that nobody else is held up by them.
+
+    python -m benchmarks.dashboard_fanout --subscribers 500 --calls 50
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from dashboard import TranscriptHub
+
+
+class FakeDashboardSocket:
+    def __init__(self, send_delay: float = 0.0, stalled: bool = False):
+        self.send_delay = send_delay
+        self.stalled = stalled
+        self.delays = []
+        self.received = 0
+        self._closed = asyncio.Event()
+
+    async def send_text(self, text: str):
+        if self.stalled:
+            await self._closed.wait()
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+        now = time.time()
+        for events in json.loads(text)["calls"].values():
+            for event in events:
+                self.delays.append(now - event["published_at"])
+                self.received += 1
+
+    async def receive_text(self) -> str:
+        await self._closed.wait()
+        raise ConnectionError("closed")
+
+    def close(self):
+        self._closed.set()
+
+
+async def synthetic_call(hub: TranscriptHub, call_sid: str, duration: float, publish_times: list):
+    end = time.perf_counter() + duration
+    turn = 0
+    while time.perf_counter() < end:
+        # A user utterance every couple of seconds, interim-ish transcripts in between
+        await asyncio.sleep(random.uniform(0.2, 0.6))
+        turn += 1
+        event = {"type": "transcript", "role": "user", "text": f"words for turn {turn} " * 4,
+                 "published_at": time.time()}
+        start = time.perf_counter()
+        hub.publish(call_sid, event)
+        publish_times.append(time.perf_counter() - start)
+        if turn % 4 == 0:
+            hub.publish(call_sid, {"type": "latency", "stt": 0.2, "llm_ttft": 0.4,
+                                   "tts_ttfb": 0.2, "response_delay": 0.9,
+                                   "published_at": time.time()})
+
+
+async def loop_lag(stop: asyncio.Event, samples: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        samples.append(time.perf_counter() - start - 0.01)
+
+
+def pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else float("nan")
+
+
+async def main(args):
+    hub = TranscriptHub(set(), tick=args.tick, max_queue=args.queue)
+    hub.start()
+    call_sids = [f"CA{i:032d}" for i in range(args.calls)]
+
+    sockets, serving = [], []
+    for i in range(args.subscribers):
+        kind = random.random()
+        socket = FakeDashboardSocket(
+            stalled=kind < args.stalled,
+            send_delay=0.5 if kind < args.stalled + args.slow else 0.0,
+        )
+        watch = None if i % 5 == 0 else random.choice(call_sids)
+        sockets.append((socket, watch))
+        serving.append(asyncio.create_task(hub.serve(socket, watch)))
+
+    stop = asyncio.Event()
+    lag = []
+    ticker = asyncio.create_task(loop_lag(stop, lag))
+    publish_times = []
+    await asyncio.gather(*(synthetic_call(hub, sid, args.duration, publish_times) for sid in call_sids))
+    await asyncio.sleep(args.tick * 3)
+    stop.set()
+    await ticker
+
+    healthy = [s for s, _ in sockets if not s.stalled and not s.send_delay]
+    stalled = [s for s, _ in sockets if s.stalled]
+    healthy_delays = [d for s in healthy for d in s.delays]
+    max_outbox = max(len(sub.outbox) for sub in hub.subscribers)
+
+    print(f"{args.calls} calls, {args.subscribers} subscribers "
+          f"({len(stalled)} stalled, {sum(1 for s, _ in sockets if s.send_delay and not s.stalled)} slow)")
+    print(f"published {hub.published} events in {hub.batches} batches")
+    print(f"publish(): p50 {pct(publish_times, 0.5) * 1e6:.1f}us, p99 {pct(publish_times, 0.99) * 1e6:.1f}us")
+    print(f"loop lag: p50 {pct(lag, 0.5) * 1000:.1f}ms, p99 {pct(lag, 0.99) * 1000:.1f}ms, "
+          f"max {max(lag) * 1000:.1f}ms")
+    print(f"healthy delivery delay: p50 {pct(healthy_delays, 0.5) * 1000:.0f}ms, "
+          f"p99 {pct(healthy_delays, 0.99) * 1000:.0f}ms ({len(healthy_delays)} events)")
+    print(f"dropped batches {hub.dropped}, largest outbox {max_outbox}/{args.queue}")
+
+    ok = max_outbox <= args.queue and pct(healthy_delays, 0.99) < args.tick + 0.25
+    for socket, _ in sockets:
+        socket.close()
+    await asyncio.gather(*serving)
+    await hub.close()
+    print("OK" if ok and not hub.subscribers else "FAILED")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--subscribers", type=int, default=500)
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--tick", type=float, default=0.1)
+    parser.add_argument("--queue", type=int, default=64)
+    parser.add_argument("--stalled", type=float, default=0.05, help="share of subscribers that never read")
+    parser.add_argument("--slow", type=float, default=0.1, help="share that take 500ms per send")
+    asyncio.run(main(parser.parse_args()))
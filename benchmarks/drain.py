@@ -0,0 +1,172 @@
+"""SIGTERM during live calls: the worker drains them instead of dropping them.
+
+Starts benchmarks.mock_server, puts --calls synthetic calls on it and sends
+SIGTERM partway through. Three scenarios, each against a fresh server:
+
+    finish      calls are shorter than DRAIN_TIMEOUT, so all of them should
+                keep getting replies after the signal and end normally, with
+                the server exiting right after the last one
+    deadline    calls outlast a short DRAIN_TIMEOUT, so the server should cut
+                them and exit once it passes
+    killed      like a platform that SIGKILLs shortly after SIGTERM: the
+                records of calls that ended before the kill must already be
+                in the sink, though the lifespan teardown never ran
+
+While draining it checks that /ready is 503 and /health still 200, that
+/agent redirects Twilio (and says busy on the redirected request) and that
+/initiate-call is refused. The first two runs must exit with status 0 and
+have every call's record in the call-record sink. The sink's flush interval
+is far longer than any run, so records only get there by draining or
+shutdown flushing them.
+
+    python -m benchmarks.drain --calls 3
+"""
+import argparse
+import asyncio
+import os
+import signal
+import tempfile
+import uuid
+
+import httpx
+
+from benchmarks.load_ramp import _free_port, start_server
+from benchmarks.media_stream_client import SyntheticCall, utterances
+from call_records import LocalSink
+
+
+async def scenario(calls: int, call_seconds: float, signal_after: float, timeout: float) -> dict:
+    loop = asyncio.get_running_loop()
+    sink = tempfile.mkdtemp(prefix="drain_records_")
+    os.environ.update({
+        "DRAIN_TIMEOUT": str(timeout),
+        "CALL_RECORDS_SINK": sink,
+        # Nothing reaches the sink until shutdown flushes it
+        "CALL_RECORDS_FLUSH_INTERVAL": "600",
+    })
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    server = start_server(port)
+    checks = {}
+    try:
+        async with httpx.AsyncClient(base_url=base, timeout=10) as http:
+            clients = [SyntheticCall(base.replace("http", "ws", 1) + "/ws") for _ in range(calls)]
+            for client in clients:
+                await http.post("/agent", data={"CallSid": client.call_sid})
+            running = [asyncio.create_task(client.run(call_seconds)) for client in clients]
+            checks["ready_before"] = (await http.get("/ready")).status_code
+
+            await asyncio.sleep(signal_after)
+            server.send_signal(signal.SIGTERM)
+            signalled = loop.time()
+            await asyncio.sleep(0.5)
+
+            ready = await http.get("/ready")
+            health = await http.get("/health")
+            redirect = await http.post("/agent", data={"CallSid": "CA" + uuid.uuid4().hex})
+            busy = await http.post("/agent?redirected=1", data={"CallSid": "CA" + uuid.uuid4().hex})
+            initiate = await http.post("/initiate-call", json={"to_number": "+61400000000"})
+            checks.update(
+                ready_draining=ready.status_code,
+                health_draining=health.status_code,
+                health_state=health.json()["state"],
+                live_calls=health.json()["live_calls"],
+                agent_redirects="<Redirect" in redirect.text and "redirected=1" in redirect.text,
+                agent_busy="<Hangup" in busy.text and "<Redirect" not in busy.text,
+                initiate_call=initiate.status_code,
+            )
+        results = await asyncio.gather(*running)
+        calls_done = loop.time()
+        code = await asyncio.to_thread(server.wait, timeout + 30)
+        exited = loop.time()
+    finally:
+        if server.poll() is None:
+            server.kill()
+    records = await LocalSink(sink).find([r.call_sid for r in results])
+    return {
+        **checks,
+        "exit_code": code,
+        "exit_after_signal": exited - signalled,
+        "exit_after_calls": exited - calls_done,
+        "replies_after_signal": [sum(1 for end, _ in r.response_delays if end > signalled) for r in results],
+        "errors": [r.error for r in results if r.error],
+        "records": len(records),
+    }
+
+
+async def killed(calls: int, call_seconds: float, signal_after: float) -> dict:
+    """Half the calls end between SIGTERM and SIGKILL; only theirs can be in the sink"""
+    sink = tempfile.mkdtemp(prefix="drain_records_")
+    os.environ.update({
+        "DRAIN_TIMEOUT": str(call_seconds * 10),
+        "CALL_RECORDS_SINK": sink,
+        "CALL_RECORDS_FLUSH_INTERVAL": "600",
+    })
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    server = start_server(port)
+    try:
+        async with httpx.AsyncClient(base_url=base, timeout=10) as http:
+            clients = [SyntheticCall(base.replace("http", "ws", 1) + "/ws") for _ in range(calls * 2)]
+            for client in clients:
+                await http.post("/agent", data={"CallSid": client.call_sid})
+            short = [asyncio.create_task(client.run(signal_after + 1)) for client in clients[:calls]]
+            long = [asyncio.create_task(client.run(call_seconds * 5)) for client in clients[calls:]]
+            await asyncio.sleep(signal_after)
+            server.send_signal(signal.SIGTERM)
+            ended = await asyncio.gather(*short)
+            await asyncio.sleep(1)
+            server.kill()
+            await asyncio.to_thread(server.wait)
+            await asyncio.gather(*long)
+    finally:
+        if server.poll() is None:
+            server.kill()
+    records = await LocalSink(sink).find([r.call_sid for r in ended])
+    return {"ended_calls": len(ended), "records": len(records)}
+
+
+def _report(name: str, result: dict):
+    print(f"{name:<9} exit {result['exit_code']} after {result['exit_after_signal']:.1f}s "
+          f"({result['exit_after_calls']:.1f}s after the last call) | live at signal {result['live_calls']} | "
+          f"replies after signal {result['replies_after_signal']} | call errors {len(result['errors'])} | "
+          f"records {result['records']}")
+    print(f"          /ready {result['ready_before']} -> {result['ready_draining']}, /health "
+          f"{result['health_draining']} ({result['health_state']}), /agent redirects {result['agent_redirects']}, "
+          f"redirected /agent busy {result['agent_busy']}, /initiate-call {result['initiate_call']}", flush=True)
+
+
+def _draining_ok(result: dict, calls: int) -> bool:
+    return (result["ready_before"] == 200 and result["ready_draining"] == 503
+            and result["health_draining"] == 200 and result["health_state"] == "draining"
+            and result["live_calls"] == calls and result["agent_redirects"] and result["agent_busy"]
+            and result["initiate_call"] == 503 and result["exit_code"] == 0 and result["records"] == calls)
+
+
+async def main(args):
+    utterances()
+    finish = await scenario(args.calls, args.call_seconds, args.signal_after, timeout=args.call_seconds * 3)
+    _report("finish", finish)
+    ok = _draining_ok(finish, args.calls)
+    ok &= not finish["errors"] and all(n > 0 for n in finish["replies_after_signal"])
+    # Exits on the first drain poll after the last call, not at the deadline
+    ok &= finish["exit_after_calls"] < 3
+
+    deadline = await scenario(args.calls, args.call_seconds * 3, args.signal_after, timeout=args.short_timeout)
+    _report("deadline", deadline)
+    ok &= _draining_ok(deadline, args.calls)
+    ok &= args.short_timeout <= deadline["exit_after_signal"] < args.short_timeout + 5
+
+    result = await killed(args.calls, args.call_seconds, args.signal_after)
+    print(f"killed    records {result['records']} of {result['ended_calls']} calls that ended before SIGKILL")
+    ok &= result["records"] == result["ended_calls"]
+    print("OK" if ok else "FAILED")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=3)
+    parser.add_argument("--call-seconds", type=float, default=12.0)
+    parser.add_argument("--signal-after", type=float, default=4.0)
+    parser.add_argument("--short-timeout", type=float, default=3.0)
+    asyncio.run(main(parser.parse_args()))
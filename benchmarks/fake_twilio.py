@@ -0,0 +1,132 @@
+"""In-process stand-in for the Twilio REST API.
+
+Plugs into `twilio.rest.Client` as its http client, so code under test goes
+through the real Twilio SDK without network access. Calls whose TwiML dials
+a <Conference> join it when answered, or straight away when an update moves
+a live call in, and the time each conference first has two participants is
+kept in `bridged_at`.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import random
+import re
+import time
+from typing import Callable, Dict, Optional
+
+from twilio.http import AsyncHttpClient
+from twilio.http.response import Response
+
+
+class FakeTwilioHttpClient(AsyncHttpClient):
+    """Answers Twilio REST requests after a simulated network latency.
+
+    `outcome` maps a dialed number to the final call status (e.g. "busy",
+    "no-answer"); the default is "completed".
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.15,
+        jitter: float = 0.0,
+        outcome: Optional[Callable[[str], str]] = None,
+        blocking: bool = False,
+        status_callback: Optional[Callable[[str, str], None]] = None,
+        ring_time: float = 2.0,
+        call_duration: float = 10.0,
+    ):
+        super().__init__(logging.getLogger(__name__), is_async=True)
+        self.latency = latency
+        self.jitter = jitter
+        self.outcome = outcome or (lambda to: "completed")
+        # Simulates the old synchronous client by sleeping on the event loop
+        self.blocking = blocking
+        # Called like Twilio's status webhook: answered, then the final status
+        self.status_callback = status_callback
+        self.ring_time = ring_time
+        self.call_duration = call_duration
+        self.live_calls = 0
+        self.requests = []
+        self.calls: Dict[str, dict] = {}
+        # Conference name -> call SIDs in it, and when it first bridged two
+        self.conferences: Dict[str, set] = {}
+        self.bridged_at: Dict[str, float] = {}
+        self._sids = itertools.count(1)
+
+    async def request(self, method, uri, params=None, data=None, headers=None,
+                      auth=None, timeout=None, allow_redirects=False) -> Response:
+        delay = self.latency + random.uniform(0, self.jitter)
+        if self.blocking:
+            time.sleep(delay)
+        else:
+            await asyncio.sleep(delay)
+        self.requests.append((method, uri, data))
+
+        sid_number = next(self._sids)
+        if uri.endswith("/Recordings.json"):
+            body = {"sid": f"RE{sid_number:032d}", "status": "in-progress"}
+        elif uri.endswith("/Calls.json"):
+            sid = f"CA{sid_number:032d}"
+            to = (data or {}).get("To")
+            body = {"sid": sid, "status": "queued", "to": to}
+            self.calls[sid] = {"to": to, "status": self.outcome(to), "twiml": (data or {}).get("Twiml")}
+            if self.status_callback:
+                asyncio.get_running_loop().call_later(self.ring_time, self._ring_finished, sid)
+        elif "/Calls/" in uri:
+            sid = uri.rsplit("/", 1)[-1].removesuffix(".json")
+            if method == "POST" and data:
+                self._update(sid, data)
+            call = self.calls.get(sid, {"status": "completed"})
+            body = {"sid": sid, "status": call["status"]}
+        else:
+            return Response(404, json.dumps({"code": 20404}))
+        return Response(201, json.dumps(body))
+
+    def _ring_finished(self, sid: str):
+        status = self.calls[sid]["status"]
+        if status != "completed":
+            self.status_callback(sid, status)
+            return
+        self.live_calls += 1
+        self.calls[sid]["live"] = True
+        conference = _conference(self.calls[sid].get("twiml"))
+        if conference:
+            self._join(conference, sid)
+        self.status_callback(sid, "in-progress")
+        asyncio.get_running_loop().call_later(self.call_duration, self._hang_up, sid)
+
+    def _hang_up(self, sid: str):
+        call = self.calls[sid]
+        if not call.get("live"):
+            return
+        call["live"] = False
+        call["status"] = "completed"
+        self.live_calls -= 1
+        for members in self.conferences.values():
+            members.discard(sid)
+        self.status_callback(sid, "completed")
+
+    def _update(self, sid: str, data: dict):
+        """A live call redirected to new TwiML, or ended"""
+        if data.get("Status") == "completed":
+            if sid in self.calls:
+                self._hang_up(sid)
+            return
+        conference = _conference(data.get("Twiml"))
+        if conference:
+            self._join(conference, sid)
+
+    def _join(self, conference: str, sid: str):
+        members = self.conferences.setdefault(conference, set())
+        members.add(sid)
+        if len(members) >= 2 and conference not in self.bridged_at:
+            self.bridged_at[conference] = time.monotonic()
+
+    async def close(self):
+        pass
+
+
+def _conference(twiml: Optional[str]) -> Optional[str]:
+    match = re.search(r"<Conference[^>]*>([^<]+)</Conference>", twiml or "")
+    return match.group(1) if match else None
@@ -0,0 +1,102 @@
+"""Perceived vs true response delay with and without filler clips.
+
+Runs one benchmarks.load_ramp step against benchmarks.mock_server twice, with
+a slow mock LLM (--llm-ttft) so replies are late:
+
+    off     FILLER_ENABLED=false
+    on      filler clips (synthetic speech written to FILLER_AUDIO_DIR) play
+            once a reply is FILLER_DELAY late
+
+Per run it reports the server's response delay (user stopped to the reply's
+first audio) and perceived delay (to any bot audio, fillers included), the
+caller-side delay to first audio, and how many fillers played through and
+were cut short by the reply (half the clips are longer than the wait).
+Fillers have to bring the perceived delay down without delaying the reply
+itself.
+
+    python -m benchmarks.fillers --calls 3 --window 30
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import wave
+
+from benchmarks.load_ramp import _free_port, run_step, start_server
+from benchmarks.media_stream_client import utterances
+from benchmarks.synthetic_speech import synthetic_speech
+
+PHRASES = ("Hmm", "Um", "Right, so", "Okay", "Let me see", "Mm-hm")
+
+
+def write_clips(directory: str):
+    for i, phrase in enumerate(PHRASES):
+        with wave.open(os.path.join(directory, phrase.replace(" ", "_") + ".wav"), "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(16000)
+            # Half outlast the slow reply, so some are cut short by it
+            f.writeframes(synthetic_speech(0.6 if i % 2 else 2.4, 16000, seed=100 + i))
+
+
+async def run_mode(env: dict, args) -> dict:
+    os.environ.update(env)
+    port = _free_port()
+    server = start_server(port)
+    try:
+        return await run_step(f"http://127.0.0.1:{port}", args.calls, args.warmup, args.window)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def _ms(value) -> str:
+    return "   n/a" if value is None or value != value else f"{value * 1000:6.0f}"
+
+
+async def main(args):
+    clips = tempfile.mkdtemp(prefix="fillers_")
+    write_clips(clips)
+    os.environ.update({
+        "MOCK_LLM_TTFT": str(args.llm_ttft),
+        "FILLER_AUDIO_DIR": clips,
+        "FILLER_DELAY": str(args.delay),
+        # The reply's own timing, without speculation hiding part of the LLM wait
+        "TURN_SPECULATION": "false",
+    })
+    utterances()
+    results = {}
+    for mode, enabled in (("off", "false"), ("on", "true")):
+        step = await run_mode({"FILLER_ENABLED": enabled}, args)
+        results[mode] = step
+        server = step["server"]
+        print(f"{mode:<4} response p50 {_ms(server['response_delay']['0.5'])}ms "
+              f"p95 {_ms(server['response_delay']['0.95'])}ms | perceived p50 "
+              f"{_ms(server['perceived_delay']['0.5'])}ms p95 {_ms(server['perceived_delay']['0.95'])}ms | "
+              f"caller-side p50 {_ms(step['delay'][0.5])}ms | {step['turns']} turns, {step['missed']} missed | "
+              f"fillers {server['fillers']}", flush=True)
+        for error in step["errors"][:3]:
+            print(f"      call error: {error}")
+
+    off, on = results["off"], results["on"]
+    ok = all(not r["errors"] and r["turns"] for r in results.values())
+    ok &= off["server"]["fillers"]["played"] == 0
+    ok &= on["server"]["fillers"]["finished"] > 0 and on["server"]["fillers"]["cut"] > 0
+    # The caller hears something sooner...
+    ok &= on["server"]["perceived_delay"]["0.5"] < on["server"]["response_delay"]["0.5"] - args.min_saving
+    ok &= on["delay"][0.5] < off["delay"][0.5] - args.min_saving
+    # ...and the reply itself isn't held up behind the filler
+    ok &= on["server"]["response_delay"]["0.5"] < off["server"]["response_delay"]["0.5"] + 0.15
+    print("OK" if ok else "FAILED")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=3)
+    parser.add_argument("--warmup", type=float, default=8.0)
+    parser.add_argument("--window", type=float, default=30.0)
+    parser.add_argument("--llm-ttft", type=float, default=1.2)
+    parser.add_argument("--delay", type=float, default=0.4)
+    parser.add_argument("--min-saving", type=float, default=0.3,
+                        help="how much sooner the caller must hear something, seconds")
+    asyncio.run(main(parser.parse_args()))
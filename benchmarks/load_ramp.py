@@ -0,0 +1,171 @@
+"""Ramp concurrent synthetic calls against the app until audio underruns.
+
+Starts benchmarks.mock_server (the real app with mock STT/LLM/TTS) in a
+separate process, then for each step holds N concurrent calls from
+benchmarks.media_stream_client. After a warmup the server's counters are
+reset and a measurement window runs. Per step it reports:
+
+  - response delay p50/p95/p99 (caller side, utterance end to reply audio)
+  - server event-loop lag p99
+  - server CPU (share of one core) and RSS growth per call
+  - share of bot audio frames that underran the caller's jitter buffer
+
+The ramp stops at the first step whose underrun rate breaks the threshold,
+or whose response delay p95 has grown more than --max-delay-growth over the
+first step's; the previous step is the sustainable load.
+
+    python -m benchmarks.load_ramp --steps 1,2,4,8,16 --window 20
+    MOCK_LLM_TTFT=0.8 python -m benchmarks.load_ramp
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.media_stream_client import SyntheticCall, utterances
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else float("nan")
+
+
+def start_server(port: int) -> subprocess.Popen:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_server", "--port", str(port)],
+        cwd=root, stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("mock server exited during startup")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/bench/stats", timeout=1)
+            return server
+        except httpx.HTTPError:
+            time.sleep(0.25)
+    server.terminate()
+    raise RuntimeError("mock server did not start within 60s")
+
+
+async def run_step(base: str, calls: int, warmup: float, window: float) -> dict:
+    ws_url = base.replace("http", "ws", 1) + "/ws"
+    async with httpx.AsyncClient(base_url=base, timeout=10) as http:
+        idle = (await http.get("/bench/stats")).json()
+        clients = [SyntheticCall(ws_url) for _ in range(calls)]
+        # Twilio hits /agent first, which reserves the call in the session registry
+        for client in clients:
+            await http.post("/agent", data={"CallSid": client.call_sid})
+        loop = asyncio.get_running_loop()
+        running = []
+        for client in clients:
+            running.append(asyncio.create_task(client.run(warmup + window + 1)))
+            # Calls don't all connect in the same instant
+            await asyncio.sleep(min(0.2, 2.0 / calls))
+        await asyncio.sleep(warmup)
+        await http.get("/bench/stats", params={"reset": "true"})
+        window_start = loop.time()
+        await asyncio.sleep(window)
+        window_end = loop.time()
+        server = (await http.get("/bench/stats")).json()
+        results = await asyncio.gather(*running)
+
+    def in_window(t):
+        return window_start <= t < window_end
+
+    delays = [d for r in results for t, d in r.response_delays if in_window(t)]
+    missed = sum(1 for r in results for t in r.missed_replies if in_window(t))
+    frames = [u for r in results for t, u, _ in r.frames if in_window(t)]
+    audio = sum(d for r in results for t, _, d in r.frames if in_window(t))
+    slip = [s for r in results for s in r.send_slip]
+    return {
+        "calls": calls,
+        "errors": [r.error for r in results if r.error],
+        "turns": len(delays),
+        "missed": missed,
+        "delay": {q: _pct(delays, q) for q in (0.5, 0.95, 0.99)},
+        "server": server,
+        "underrun": sum(frames) / len(frames) if frames else float("nan"),
+        "bot_frames": len(frames),
+        "bot_audio_seconds": audio,
+        "loop_lag_p99": server["loop_lag"]["0.99"] or float("nan"),
+        "cpu_share_per_call": server["cpu_seconds"] / server["window"] / calls,
+        "rss_per_call": (server["rss_bytes"] - idle["rss_bytes"]) / calls,
+        "client_slip_p99": _pct(slip, 0.99),
+    }
+
+
+def report(step: dict):
+    delay = step["delay"]
+    print(f"{step['calls']:>5} calls | response p50 {delay[0.5]:.2f}s p95 {delay[0.95]:.2f}s "
+          f"p99 {delay[0.99]:.2f}s ({step['turns']} turns, {step['missed']} missed) | "
+          f"loop lag p99 {step['loop_lag_p99'] * 1000:.0f}ms | "
+          f"cpu/call {step['cpu_share_per_call'] * 100:.1f}% | "
+          f"rss/call {step['rss_per_call'] / 2**20:.1f}MiB | "
+          f"underrun {step['underrun'] * 100:.2f}% of {step['bot_frames']} | "
+          f"client slip p99 {step['client_slip_p99'] * 1000:.0f}ms", flush=True)
+    for error in step["errors"][:3]:
+        print(f"      call error: {error}")
+
+
+async def ramp(args):
+    port = args.port or _free_port()
+    server = start_server(port)
+    utterances()
+    base = f"http://127.0.0.1:{port}"
+    sustained = None
+    breaking = None
+    baseline = None
+    try:
+        for calls in args.steps:
+            step = await run_step(base, calls, args.warmup, args.window)
+            report(step)
+            if baseline is None:
+                baseline = step["delay"][0.95]
+            broken = (
+                step["underrun"] > args.max_underrun
+                or step["delay"][0.95] > baseline + args.max_delay_growth
+                or step["missed"] > step["turns"] * 0.1
+                or step["errors"]
+            )
+            if broken:
+                breaking = calls
+                break
+            sustained = calls
+            # Let the previous step's pipelines wind down before the next one
+            await asyncio.sleep(2)
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"thresholds: underrun <= {args.max_underrun * 100:.1f}%, "
+          f"response p95 <= {baseline + args.max_delay_growth:.2f}s")
+    if breaking is None:
+        print(f"no underrun point up to {sustained} calls")
+    else:
+        print(f"underrun point: {breaking} calls (sustained {sustained or 0})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--steps", type=lambda s: [int(x) for x in s.split(",")],
+                        default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--warmup", type=float, default=8.0)
+    parser.add_argument("--window", type=float, default=20.0)
+    parser.add_argument("--max-underrun", type=float, default=0.01)
+    parser.add_argument("--max-delay-growth", type=float, default=0.5,
+                        help="allowed response p95 increase over the first step, seconds")
+    parser.add_argument("--port", type=int)
+    asyncio.run(ramp(parser.parse_args()))
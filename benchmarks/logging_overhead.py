@@ -0,0 +1,127 @@
+"""Per-record cost of logging on the calling thread (the event loop).
+
+Compares the old setup, where structlog rendered JSON and printed it inline
+and bot.py's basicConfig StreamHandler wrote inline, against the queue-backed
+handler in utils.logging. The listener is paused while the caller side is
+timed (on a single core it would otherwise steal the GIL mid-measurement),
+then timed separately draining the backlog. --sink-latency-us makes each
+stdout write stall, as a full pipe to the log collector does.
+
+    LOG_DEBUG_SAMPLE_RATE=0.1 python -m benchmarks.logging_overhead
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+import structlog
+
+
+class SlowSink:
+    """/dev/null with an optional per-write stall"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self._null = open(os.devnull, "w")
+
+    def write(self, data):
+        if self.latency:
+            deadline = time.perf_counter() + self.latency
+            while time.perf_counter() < deadline:
+                pass
+        return self._null.write(data)
+
+    def flush(self):
+        pass
+
+
+# Rendered output goes nowhere; we're measuring the caller's side
+sys.stdout = SlowSink(0)
+
+from utils import logging as app_logging  # noqa: E402
+
+
+def per_record(fn, n: int) -> float:
+    start = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def inline_structlog():
+    """The previous utils.logging configuration, minus the Flask request check"""
+    return structlog.wrap_logger(
+        structlog.PrintLogger(sys.stdout),
+        processors=[
+            structlog.stdlib.add_log_level,
+            app_logging.field_name_modifier,
+            structlog.processors.TimeStamper("iso"),
+            structlog.processors.JSONRenderer(),
+        ],
+    )
+
+
+def inline_stdlib():
+    """The previous bot.py basicConfig handler"""
+    log = logging.Logger("inline")
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter(
+        "%(asctime)s | %(name)s | %(levelname)s | %(message)s", "%Y-%m-%d %H:%M:%S"))
+    log.addHandler(handler)
+    return log
+
+
+async def in_call(results: dict, n: int, sampled: bool):
+    call_sid = "CA" + ("0" * 32)
+    app_logging.bind_call(call_sid, "MZ" + "0" * 32)
+    app_logging._bind(debug=sampled)
+    log = logging.getLogger("bot")
+    label = "sampled" if sampled else "unsampled"
+    results["stdlib info in call"] = per_record(lambda i: log.info(f"frame {i}"), n)
+    results[f"guarded debug, {label} call"] = per_record(
+        lambda i: app_logging.call_debug_enabled() and log.debug(f"frame {i}"), n)
+    results["structlog info in call"] = per_record(
+        lambda i: app_logging.logger.info("frame", i=i), n)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", type=int, default=20000)
+    parser.add_argument("--sink-latency-us", type=float, default=0)
+    args = parser.parse_args()
+    n = args.n
+    sys.stdout.latency = args.sink_latency_us / 1e6
+
+    results = {}
+    old_struct = inline_structlog()
+    old_stdlib = inline_stdlib()
+    results["inline structlog JSON (old)"] = per_record(lambda i: old_struct.info("frame", i=i), n)
+    results["inline stdlib StreamHandler (old)"] = per_record(lambda i: old_stdlib.info(f"frame {i}"), n)
+
+    # Caller-side cost only: records pile up in the queue until restarted below
+    app_logging._listener.stop()
+    log = logging.getLogger("bot")
+    results["queued stdlib info"] = per_record(lambda i: log.info(f"frame {i}"), n)
+    results["queued structlog info"] = per_record(lambda i: app_logging.logger.info("frame", i=i), n)
+    asyncio.run(in_call(results, n, sampled=False))
+    asyncio.run(in_call(results, n, sampled=True))
+
+    queued = app_logging._listener.queue.qsize()
+    start = time.perf_counter()
+    app_logging._listener.start()
+    app_logging.flush()
+    drain = time.perf_counter() - start
+
+    sys.stdout = sys.__stdout__
+    width = max(map(len, results))
+    for name, us in results.items():
+        print(f"{name:<{width}}  {us:6.2f} us/record")
+    print(f"listener rendered {queued} queued records at {drain / max(queued, 1) * 1e6:.2f} us/record")
+    print(json.dumps({"records": n, "log_level": logging.getLevelName(logging.getLogger().level)}))
+
+
+if __name__ == "__main__":
+    main()
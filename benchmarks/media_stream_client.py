@@ -0,0 +1,190 @@
+"""A fake caller speaking the Twilio media-stream protocol to /ws.
+
+Sends `connected`, `start` and then 20ms μ-law `media` frames paced in real
+time like Twilio does (silence between utterances, never a gap in the
+stream). The caller waits for the bot to finish each reply, pauses, then
+speaks the next utterance.
+
+The bot's audio goes through a model of the phone-side jitter buffer: a talk
+spurt starts playing 60ms after its first frame arrives, and any frame that
+arrives after the buffer has run dry is an underrun (audible as a click or
+gap). Response delay is measured from the last frame of an utterance to the
+first frame of the reply, as the caller would hear it.
+"""
+import asyncio
+import audioop
+import base64
+import itertools
+import json
+import random
+import uuid
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import websockets
+
+from benchmarks.synthetic_speech import synthetic_speech
+
+FRAME = 0.02
+FRAME_BYTES = 160
+# Phone-side playout buffer before the first frame of a spurt is heard
+PREBUFFER = 0.06
+# Silence longer than this between frames starts a new talk spurt
+SPURT_GAP = 0.3
+REPLY_TIMEOUT = 10.0
+
+SILENCE = base64.b64encode(b"\xff" * FRAME_BYTES).decode("ascii")
+_utterances: List[List[str]] = []
+
+
+def utterances() -> List[List[str]]:
+    """A few pre-encoded utterances, shared by every call in the process"""
+    if not _utterances:
+        for i, seconds in enumerate((1.2, 0.9, 1.5, 1.0)):
+            ulaw = audioop.lin2ulaw(synthetic_speech(seconds, 8000, seed=i), 2)
+            _utterances.append([
+                base64.b64encode(ulaw[j:j + FRAME_BYTES].ljust(FRAME_BYTES, b"\xff")).decode("ascii")
+                for j in range(0, len(ulaw), FRAME_BYTES)
+            ])
+    return _utterances
+
+
+@dataclass
+class CallResult:
+    call_sid: str
+    # (utterance end, delay) so the driver can keep only its measurement window
+    response_delays: List[tuple] = field(default_factory=list)
+    missed_replies: List[float] = field(default_factory=list)
+    # (arrival, underran, seconds of audio) for every bot media message
+    frames: List[tuple] = field(default_factory=list)
+    stall_seconds: float = 0.0
+    send_slip: List[float] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+class SyntheticCall:
+    def __init__(self, url: str, call_sid: Optional[str] = None, pause: tuple = (0.4, 1.2)):
+        self.url = url
+        self.call_sid = call_sid or "CA" + uuid.uuid4().hex
+        self.stream_sid = "MZ" + uuid.uuid4().hex
+        self.account_sid = "AC" + "0" * 32
+        self.pause = pause
+        self.result = CallResult(self.call_sid)
+        self._speech: List[str] = []
+        self._spoken = asyncio.Event()
+        self._replied = asyncio.Event()
+        self._awaiting_reply: Optional[float] = None
+        self._play_until: Optional[float] = None
+        self._seq = itertools.count(1)
+
+    def _message(self, event: str, **body) -> str:
+        return json.dumps({"event": event, "sequenceNumber": str(next(self._seq)),
+                           "streamSid": self.stream_sid, **body})
+
+    async def run(self, duration: float):
+        loop = asyncio.get_running_loop()
+        try:
+            async with websockets.connect(self.url, max_size=None, ping_interval=None) as ws:
+                await ws.send(json.dumps({"event": "connected", "protocol": "Call", "version": "1.0.0"}))
+                await ws.send(self._message("start", start={
+                    "streamSid": self.stream_sid,
+                    "accountSid": self.account_sid,
+                    "callSid": self.call_sid,
+                    "tracks": ["inbound"],
+                    "customParameters": {},
+                    "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": 8000, "channels": 1},
+                }))
+                deadline = loop.time() + duration
+                tasks = [
+                    asyncio.create_task(self._send_media(ws, deadline)),
+                    asyncio.create_task(self._receive(ws)),
+                    asyncio.create_task(self._converse(deadline)),
+                ]
+                await tasks[0]
+                await ws.send(self._message("stop", stop={
+                    "accountSid": self.account_sid, "callSid": self.call_sid}))
+                for task in tasks[1:]:
+                    task.cancel()
+        except Exception as e:
+            self.result.error = repr(e)
+        return self.result
+
+    async def _send_media(self, ws, deadline: float):
+        """One frame every 20ms on an absolute schedule, like a phone network"""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for i in itertools.count():
+            due = start + i * FRAME
+            if due >= deadline:
+                return
+            delay = due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.result.send_slip.append(max(0.0, loop.time() - due))
+            if self._speech:
+                payload = self._speech.pop(0)
+                if not self._speech:
+                    self._spoken.set()
+            else:
+                payload = SILENCE
+            await ws.send(self._message("media", media={
+                "track": "inbound", "chunk": str(i + 1),
+                "timestamp": str(int(i * FRAME * 1000)), "payload": payload,
+            }))
+
+    async def _receive(self, ws):
+        loop = asyncio.get_running_loop()
+        async for raw in ws:
+            message = json.loads(raw)
+            event = message.get("event")
+            if event == "clear":
+                self._play_until = None
+                continue
+            if event != "media":
+                continue
+            now = loop.time()
+            duration = len(message["media"]["payload"]) * 3 // 4 / 8000
+            underran = False
+            if self._play_until is None or now > self._play_until + SPURT_GAP:
+                self._play_until = now + PREBUFFER
+                if self._awaiting_reply is not None:
+                    self.result.response_delays.append(
+                        (self._awaiting_reply, self._play_until - self._awaiting_reply))
+                    self._awaiting_reply = None
+                    self._replied.set()
+            elif now > self._play_until:
+                underran = True
+                self.result.stall_seconds += now - self._play_until
+                self._play_until = now
+            self._play_until += duration
+            self.result.frames.append((now, underran, duration))
+
+    async def _wait_bot_idle(self):
+        loop = asyncio.get_running_loop()
+        while self._play_until is None or loop.time() < self._play_until + SPURT_GAP:
+            await asyncio.sleep(0.05)
+
+    async def _converse(self, deadline: float):
+        loop = asyncio.get_running_loop()
+        # The bot opens the call
+        try:
+            await asyncio.wait_for(self._wait_bot_idle(), REPLY_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+        for turn in itertools.count():
+            await asyncio.sleep(random.uniform(*self.pause))
+            if loop.time() + 3 > deadline:
+                return
+            self._spoken.clear()
+            self._replied.clear()
+            self._speech.extend(utterances()[turn % len(utterances())])
+            await self._spoken.wait()
+            ended = loop.time()
+            self._awaiting_reply = ended
+            try:
+                await asyncio.wait_for(self._replied.wait(), REPLY_TIMEOUT)
+            except asyncio.TimeoutError:
+                self._awaiting_reply = None
+                self.result.missed_replies.append(ended)
+                continue
+            await self._wait_bot_idle()
@@ -0,0 +1,274 @@
+"""Local STT, LLM and TTS stand-ins with configurable latency, jitter and faults.
+
+Importing this module registers them in providers.py as "mock", so the app
+runs unchanged with STT_PROVIDER=mock TTS_PROVIDER=mock LLM_PROVIDER=mock.
+Latencies are drawn from a normal distribution (clipped at zero) whose mean
+and standard deviation come from the environment:
+
+    MOCK_STT_LATENCY / MOCK_STT_JITTER    user stopped -> final transcript
+    MOCK_STT_WORD_GAP                     one more word per interim transcript
+    MOCK_STT_REVISE_RATE                  finals that differ from the interims
+    MOCK_LLM_TTFT / MOCK_LLM_JITTER       context -> first token
+    MOCK_LLM_TOKENS / MOCK_LLM_TOKEN_GAP  response length, inter-token gap
+    MOCK_TTS_TTFB / MOCK_TTS_JITTER       text -> first audio
+    MOCK_STT_CONNECT / MOCK_TTS_CONNECT   session handshake when the pipeline starts
+
+MOCK_STT_STALL_RATE / MOCK_STT_ERROR_RATE (and the TTS equivalents) make
+that fraction of requests never answer, or fail with an ErrorFrame. A
+second STT and TTS, "mock_b", reads the same variables prefixed MOCK_B_, so
+failover can be exercised with e.g. STT_PROVIDER=mock STT_FALLBACKS=mock_b.
+Both can be pre-connected from /agent like the real websocket services.
+"""
+import asyncio
+import os
+import random
+
+from openai.types.chat import ChatCompletionChunk
+from openai.types.chat.chat_completion_chunk import Choice, ChoiceDelta
+from pipecat.frames.frames import (
+    ErrorFrame,
+    InterimTranscriptionFrame,
+    TranscriptionFrame,
+    TTSAudioRawFrame,
+    TTSStartedFrame,
+    TTSStoppedFrame,
+    UserStartedSpeakingFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection
+from pipecat.services.openai.llm import OpenAILLMService
+from pipecat.services.stt_service import STTService
+from pipecat.services.tts_service import TTSService
+from pipecat.utils.time import time_now_iso8601
+
+from benchmarks.synthetic_speech import synthetic_speech
+from preconnect import preconnector
+from providers import provider
+
+
+def _env(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+def _delay(mean: float, jitter: float) -> float:
+    return max(0.0, random.gauss(mean, jitter))
+
+
+def _fault(stall_rate: float, error_rate: float) -> str:
+    roll = random.random()
+    if roll < error_rate:
+        return "error"
+    return "stall" if roll < error_rate + stall_rate else ""
+
+
+class FakeSocket:
+    """Stands in for a provider websocket"""
+
+    def __init__(self):
+        self.open = True
+
+    async def close(self):
+        self.open = False
+
+
+class MockSession:
+    """Provider session with a handshake delay, opened on start like the real
+    websocket services, unless it is already open"""
+
+    connect_delay = 0.0
+    _connection = None
+
+    async def _connect(self):
+        if self._connection is None or not self._connection.open:
+            await asyncio.sleep(self.connect_delay)
+            self._connection = FakeSocket()
+
+    async def start(self, frame):
+        await super().start(frame)
+        await self._connect()
+
+
+USER_LINES = [
+    "yeah sure go ahead",
+    "we're with origin at the moment",
+    "about two hundred a month I think",
+    "sure what deals have you got",
+]
+
+
+class MockSTTService(MockSession, STTService):
+    """Emits a canned line as interim transcripts, a word at a time while the
+    user speaks, then as a final transcript a while after they stop"""
+
+    def __init__(self, latency: float, jitter: float, stall_rate: float = 0.0, error_rate: float = 0.0,
+                 connect_delay: float = 0.0, word_gap: float = 0.15, revise_rate: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.connect_delay = connect_delay
+        self.latency = latency
+        self.jitter = jitter
+        self.stall_rate = stall_rate
+        self.error_rate = error_rate
+        self.word_gap = word_gap
+        self.revise_rate = revise_rate
+        self._turn = 0
+        self._interims = None
+
+    async def run_stt(self, audio: bytes):
+        # Real services stream audio out here; the cost we care about is upstream
+        yield None
+
+    async def process_frame(self, frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        line = USER_LINES[self._turn % len(USER_LINES)]
+        if isinstance(frame, UserStartedSpeakingFrame) and self.word_gap > 0:
+            self._interims = self.create_task(self._interim(line))
+        elif isinstance(frame, UserStoppedSpeakingFrame):
+            if self._interims:
+                await self.cancel_task(self._interims)
+                self._interims = None
+            if random.random() < self.revise_rate:
+                # The final hears what the interims didn't
+                line += " mate"
+            self.create_task(self._transcribe(line))
+            self._turn += 1
+
+    async def _interim(self, text: str):
+        words = text.split()
+        for i in range(1, len(words) + 1):
+            await asyncio.sleep(self.word_gap)
+            await self.push_frame(InterimTranscriptionFrame(" ".join(words[:i]), "", time_now_iso8601()))
+
+    async def _transcribe(self, text: str):
+        fault = _fault(self.stall_rate, self.error_rate)
+        if fault == "error":
+            await self.push_error(ErrorFrame(f"{self} connection lost"))
+            return
+        if fault == "stall":
+            return
+        await asyncio.sleep(_delay(self.latency, self.jitter))
+        await self.push_frame(TranscriptionFrame(text, "", time_now_iso8601()))
+
+
+class MockLLMService(OpenAILLMService):
+    """OpenAI service whose completion stream is generated locally, so the
+    rest of the OpenAI path (and anything else calling it) runs as usual"""
+
+    def __init__(self, ttft: float, jitter: float, tokens: int, token_gap: float, **kwargs):
+        super().__init__(api_key="mock", model="mock", **kwargs)
+        self.ttft = ttft
+        self.jitter = jitter
+        self.tokens = tokens
+        self.token_gap = token_gap
+
+    async def get_chat_completions(self, context, messages):
+        return self._stream()
+
+    async def _stream(self):
+        await asyncio.sleep(_delay(self.ttft, self.jitter))
+        words = ("right so um let me see most folks are paying way more than they "
+                 "need to you know and we can have a quick look for you").split()
+        for i in range(self.tokens):
+            text = words[i % len(words)]
+            if i == self.tokens - 1:
+                text += "."
+            elif i % 12 == 11:
+                text += ","
+            yield _chunk(("" if i == 0 else " ") + text)
+            await asyncio.sleep(self.token_gap)
+
+
+def _chunk(text: str) -> ChatCompletionChunk:
+    return ChatCompletionChunk(
+        id="mock", object="chat.completion.chunk", created=0, model="mock",
+        choices=[Choice(index=0, delta=ChoiceDelta(content=text), finish_reason=None)],
+    )
+
+
+class MockTTSService(MockSession, TTSService):
+    """Returns synthetic speech, ~60ms per character, after a TTFB delay"""
+
+    def __init__(self, ttfb: float, jitter: float, stall_rate: float = 0.0, error_rate: float = 0.0,
+                 connect_delay: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.connect_delay = connect_delay
+        self.ttfb = ttfb
+        self.jitter = jitter
+        self.stall_rate = stall_rate
+        self.error_rate = error_rate
+
+    async def run_tts(self, text: str):
+        fault = _fault(self.stall_rate, self.error_rate)
+        if fault == "error":
+            yield ErrorFrame(f"{self} returned 500")
+            return
+        if fault == "stall":
+            # Hangs like a dead socket, until interrupted or cancelled
+            await asyncio.Event().wait()
+        await asyncio.sleep(_delay(self.ttfb, self.jitter))
+        yield TTSStartedFrame()
+        pcm = synthetic_speech(max(0.3, len(text) * 0.06), self.sample_rate)
+        # Stream in 100ms chunks, a little faster than real time, like the real APIs
+        chunk = self.sample_rate // 10 * 2
+        for i in range(0, len(pcm), chunk):
+            yield TTSAudioRawFrame(pcm[i:i + chunk], self.sample_rate, 1)
+            await asyncio.sleep(0.02)
+        yield TTSStoppedFrame()
+
+
+def _stt(prefix: str) -> MockSTTService:
+    return MockSTTService(
+        _env(f"{prefix}_STT_LATENCY", 0.15),
+        _env(f"{prefix}_STT_JITTER", 0.05),
+        stall_rate=_env(f"{prefix}_STT_STALL_RATE", 0),
+        error_rate=_env(f"{prefix}_STT_ERROR_RATE", 0),
+        connect_delay=_env(f"{prefix}_STT_CONNECT", 0.2),
+        word_gap=_env(f"{prefix}_STT_WORD_GAP", 0.15),
+        revise_rate=_env(f"{prefix}_STT_REVISE_RATE", 0),
+    )
+
+
+def _tts(prefix: str) -> MockTTSService:
+    return MockTTSService(
+        _env(f"{prefix}_TTS_TTFB", 0.2),
+        _env(f"{prefix}_TTS_JITTER", 0.05),
+        stall_rate=_env(f"{prefix}_TTS_STALL_RATE", 0),
+        error_rate=_env(f"{prefix}_TTS_ERROR_RATE", 0),
+        connect_delay=_env(f"{prefix}_TTS_CONNECT", 0.2),
+    )
+
+
+@provider("stt", "mock")
+def _mock_stt():
+    return _stt("MOCK")
+
+
+@provider("stt", "mock_b")
+def _mock_b_stt():
+    return _stt("MOCK_B")
+
+
+@provider("llm", "mock")
+def _mock_llm():
+    return MockLLMService(
+        _env("MOCK_LLM_TTFT", 0.35),
+        _env("MOCK_LLM_JITTER", 0.1),
+        tokens=int(_env("MOCK_LLM_TOKENS", 12)),
+        token_gap=_env("MOCK_LLM_TOKEN_GAP", 0.01),
+    )
+
+
+@provider("tts", "mock")
+def _mock_tts():
+    return _tts("MOCK")
+
+
+@provider("tts", "mock_b")
+def _mock_b_tts():
+    return _tts("MOCK_B")
+
+
+@preconnector("MockSTTService")
+@preconnector("MockTTSService")
+async def _open_mock(service):
+    await service._connect()
+    return service._connection.close
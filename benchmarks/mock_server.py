@@ -0,0 +1,135 @@
+"""The real app with mock providers and a fake Twilio API, for load tests.
+
+Everything between the media-stream websocket and the provider APIs is the
+production code path: serializer, VAD, aggregators, observers, pool, session
+registry. Adds GET /bench/stats with event-loop lag, CPU time and RSS so the
+load driver can sample the server while it runs.
+
+    python -m benchmarks.mock_server --port 8765
+"""
+import argparse
+import asyncio
+import os
+import resource
+import time
+from contextlib import asynccontextmanager
+
+# Must be set before config is imported
+os.environ.update({
+    "STT_PROVIDER": "mock",
+    "TTS_PROVIDER": "mock",
+    "LLM_PROVIDER": "mock",
+})
+os.environ.setdefault("HOST", "localhost")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("SESSION_REGISTRY_URL", "memory://")
+os.environ.setdefault("MAX_CALLS_PER_WORKER", "1000")
+os.environ.setdefault("CALL_RECORDS_SINK", "/tmp/mock_server_call_records")
+os.environ.setdefault("RECORDING_SINK", "/tmp/mock_server_recordings")
+os.environ.setdefault("DATABASE_URL", "sqlite:////tmp/mock_server_agents.db")
+for key in ("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN"):
+    os.environ.setdefault(key, "mock")
+
+import benchmarks.mock_providers  # noqa: E402,F401  registers the "mock" providers
+import uvicorn  # noqa: E402
+from benchmarks.fake_twilio import FakeTwilioHttpClient  # noqa: E402
+
+import app as app_module  # noqa: E402
+from fillers import fillers  # noqa: E402
+from metrics import perceived_delay, response_delay  # noqa: E402
+from pool import pipeline_pool  # noqa: E402
+from recorder import recorder  # noqa: E402
+from turn_taking import end_of_turn_stop_secs, speculation_counts, speculation_saved  # noqa: E402
+from twilio_client import twilio_api  # noqa: E402
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+class LoopLagMonitor:
+    """Samples how late a 10ms sleep wakes up, i.e. how long callbacks queue"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(time.perf_counter() - start - self.interval)
+
+
+def _pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else None
+
+
+def _rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+lag = LoopLagMonitor()
+_window = {"started": time.monotonic(), "cpu": time.process_time(), "delays": 0}
+app = app_module.app
+app_lifespan = app.router.lifespan_context
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Recording requests and the like go to an in-process Twilio
+    twilio_api._http_client = FakeTwilioHttpClient(latency=0.05)
+    async with app_lifespan(app):
+        lag.start()
+        yield
+        lag.stop()
+
+
+app.router.lifespan_context = lifespan
+
+
+@app.get("/bench/stats")
+async def bench_stats(reset: bool = False) -> dict:
+    """Server-side load figures since the last reset"""
+    now = time.monotonic()
+    cpu = time.process_time()
+    # Turns observed since the reset, as far back as the histogram's window goes
+    new_turns = min(response_delay._count - _window["delays"], len(response_delay._recent))
+    delays = list(response_delay._recent)[-new_turns:] if new_turns else []
+    stats = {
+        "window": now - _window["started"],
+        "cpu_seconds": cpu - _window["cpu"],
+        "rss_bytes": _rss_bytes(),
+        "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "live_calls": pipeline_pool.checked_out,
+        "loop_lag": {str(q): _pct(lag.samples, q) for q in (0.5, 0.95, 0.99)},
+        "loop_lag_max": max(lag.samples, default=None),
+        "response_delay": {str(q): _pct(delays, q) for q in (0.5, 0.95, 0.99)},
+        "turns": len(delays),
+        # Since the server started
+        "speculation": {**speculation_counts, "saved_p50": speculation_saved.percentiles()[0.5]},
+        "stop_secs_p50": end_of_turn_stop_secs.percentiles()[0.5],
+        "perceived_delay": {str(q): v for q, v in perceived_delay.percentiles().items()},
+        "fillers": fillers.stats(),
+        "recorder": recorder.stats(),
+        "twilio_requests": len(twilio_api._http_client.requests),
+    }
+    if reset:
+        lag.samples.clear()
+        _window.update(started=now, cpu=cpu, delays=response_delay._count)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning", ws="websockets")
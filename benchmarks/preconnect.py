@@ -0,0 +1,130 @@
+"""Pipeline start latency with and without sessions pre-connected from /agent.
+
+Uses the real PreconnectManager and pipeline pool with the mock providers,
+whose STT/TTS sessions take MOCK_STT_CONNECT / MOCK_TTS_CONNECT seconds to
+open. For each call it plays the /agent -> /ws sequence: start the
+pre-connect, wait while the greeting plays, claim and adopt it, then time
+the StartFrame through STT and TTS, which is when the pipeline can first
+hear the caller. The same is done with components checked out at /ws, as
+without pre-connecting. It also checks that a pre-connect nobody claims is
+closed and handed back to the pool after the TTL, and that a /ws with
+nothing pre-connected falls back to a fresh checkout.
+
+    python -m benchmarks.preconnect
+    MOCK_STT_CONNECT=0.4 python -m benchmarks.preconnect --greeting 0.5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+# Must be set before config is imported
+os.environ.update({
+    "STT_PROVIDER": "mock",
+    "TTS_PROVIDER": "mock",
+    "LLM_PROVIDER": "mock",
+})
+os.environ.setdefault("HOST", "localhost")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import benchmarks.mock_providers  # noqa: E402,F401  registers the "mock" providers
+from pipecat.frames.frames import EndFrame, Frame, StartFrame  # noqa: E402
+from pipecat.pipeline.pipeline import Pipeline  # noqa: E402
+from pipecat.pipeline.runner import PipelineRunner  # noqa: E402
+from pipecat.pipeline.task import PipelineParams, PipelineTask  # noqa: E402
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor  # noqa: E402
+
+from pool import pipeline_pool  # noqa: E402
+from preconnect import PreconnectManager, preconnect_saved  # noqa: E402
+
+
+class Started(FrameProcessor):
+    """End of the pipeline: notes when the StartFrame gets through"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.at = None
+        self.event = asyncio.Event()
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if isinstance(frame, StartFrame):
+            self.at = time.perf_counter()
+            self.event.set()
+        await self.push_frame(frame, direction)
+
+
+async def start_latency(components) -> float:
+    """Seconds from running the call's pipeline to STT and TTS both being started"""
+    started = Started()
+    task = PipelineTask(
+        Pipeline([components.stt, components.tts, started]),
+        params=PipelineParams(enable_metrics=False),
+    )
+    begin = time.perf_counter()
+    run = asyncio.create_task(PipelineRunner(handle_sigint=False).run(task))
+    await asyncio.wait_for(started.event.wait(), 10)
+    latency = started.at - begin
+    await task.queue_frame(EndFrame())
+    await asyncio.wait_for(run, 10)
+    return latency
+
+
+async def call(manager: PreconnectManager, call_sid: str, args, preconnect: bool) -> float:
+    if preconnect:
+        manager.start(call_sid)
+    # Twilio plays the greeting, then opens the media stream
+    await asyncio.sleep(args.greeting)
+    entry = manager.claim(call_sid) if preconnect else None
+    components = entry.components if entry else pipeline_pool.checkout()
+    if entry:
+        await manager.adopt(entry)
+    try:
+        return await start_latency(components)
+    finally:
+        pipeline_pool.release(components)
+
+
+def _fmt(values) -> str:
+    return f"mean {statistics.mean(values) * 1000:6.0f}ms  max {max(values) * 1000:6.0f}ms"
+
+
+async def main(args):
+    ok = True
+    await pipeline_pool.warm()
+    manager = PreconnectManager(ttl=args.ttl)
+
+    cold = [await call(manager, f"CA-cold-{i}", args, preconnect=False) for i in range(args.calls)]
+    warm = [await call(manager, f"CA-warm-{i}", args, preconnect=True) for i in range(args.calls)]
+    print(f"pipeline start, connecting at /ws:  {_fmt(cold)}")
+    print(f"pipeline start, pre-connected:      {_fmt(warm)}")
+    print(f"handshake time saved per call:      p50 {preconnect_saved.percentiles()[0.5] * 1000:.0f}ms")
+    ok &= max(warm) < min(cold) and manager.claimed == args.calls
+
+    print(f"\nunclaimed: /agent only, ttl {args.ttl}s")
+    before = pipeline_pool.checked_out
+    manager.start("CA-unclaimed")
+    await asyncio.sleep(0)
+    held = pipeline_pool.checked_out - before
+    await asyncio.sleep(args.ttl + 0.5)
+    print(f"  checked out {held} component set, {pipeline_pool.checked_out - before} after expiry, "
+          f"expired {manager.expired}")
+    ok &= held == 1 and pipeline_pool.checked_out == before and manager.expired == 1
+
+    print("\nmissed: /ws on a worker that didn't see /agent")
+    latency = await call(manager, "CA-elsewhere", args, preconnect=False)
+    missed = manager.claim("CA-elsewhere") is None
+    print(f"  claim found nothing: {missed}, pipeline start {latency * 1000:.0f}ms, missed {manager.missed}")
+    ok &= missed and manager.missed == 1
+
+    print(f"\n{manager.stats()}")
+    print("OK" if ok else "FAILED")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=5)
+    parser.add_argument("--greeting", type=float, default=1.0, help="seconds between /agent and /ws")
+    parser.add_argument("--ttl", type=float, default=1.5)
+    asyncio.run(main(parser.parse_args()))
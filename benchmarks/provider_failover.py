@@ -0,0 +1,216 @@
+"""STT/TTS routing under slow, stalling and failing providers.
+
+Runs RoutedSTTService and RoutedTTSService in a pipecat pipeline with the
+mock providers from benchmarks.mock_providers, and drives scripted turns
+through them: the user speaks and stops, then a two-sentence response is
+spoken. For each turn it records user stopped -> final transcript and first
+response text -> first audio.
+
+    learn   the configured primary is slow; first-turn hedging finds the
+            faster provider and later calls start on it
+    stall   the primary stops answering mid-call; turns fail over after the
+            stall timeout, and the next call starts on the fallback
+    error   the primary fails every request; turns fail over at once
+
+Each scenario is also run with the primary alone, as without routing.
+
+    python -m benchmarks.provider_failover
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from pipecat.frames.frames import (
+    EndFrame,
+    Frame,
+    InputAudioRawFrame,
+    LLMFullResponseEndFrame,
+    LLMFullResponseStartFrame,
+    LLMTextFrame,
+    StartFrame,
+    TranscriptionFrame,
+    TTSAudioRawFrame,
+    UserStartedSpeakingFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.pipeline.pipeline import Pipeline
+from pipecat.pipeline.runner import PipelineRunner
+from pipecat.pipeline.task import PipelineParams, PipelineTask
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from benchmarks.mock_providers import MockSTTService, MockTTSService
+from routing import ProviderRouter, RoutedSTTService, RoutedTTSService
+
+# name -> (STT latency, TTS time to first byte)
+PROFILES = {"slow": (0.35, 0.45), "fast": (0.12, 0.15)}
+SILENCE = b"\x00" * 640  # 20ms at 16 kHz
+
+
+class Collector(FrameProcessor):
+    """End of the pipeline: timestamps what the routed services emit"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.started = asyncio.Event()
+        self.transcript = asyncio.Event()
+        self.audio = asyncio.Event()
+        self.spoken = asyncio.Event()
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if isinstance(frame, StartFrame):
+            self.started.set()
+        elif isinstance(frame, TranscriptionFrame):
+            self.transcript.set()
+        elif isinstance(frame, TTSAudioRawFrame):
+            self.audio.set()
+        elif isinstance(frame, LLMFullResponseEndFrame):
+            self.spoken.set()
+        await self.push_frame(frame, direction)
+
+
+async def _wait(event: asyncio.Event, timeout: float):
+    """Seconds until the event is set, or None on timeout"""
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+    except asyncio.TimeoutError:
+        return None
+    return time.perf_counter() - start
+
+
+class Call:
+    """One pipeline whose providers can be told to misbehave mid-call"""
+
+    def __init__(self, names, router, args, hedge: bool):
+        self.stt = {n: MockSTTService(PROFILES[n.split("_")[0]][0], 0.02) for n in names}
+        self.tts = {n: MockTTSService(PROFILES[n.split("_")[0]][1], 0.02) for n in names}
+        self.routed_stt = RoutedSTTService(self.stt, stall_timeout=args.stt_stall, hedge=hedge, router=router)
+        self.routed_tts = RoutedTTSService(self.tts, stall_timeout=args.tts_stall, hedge=hedge, router=router)
+        self.collector = Collector()
+        self.task = PipelineTask(
+            Pipeline([self.routed_stt, self.routed_tts, self.collector]),
+            params=PipelineParams(enable_metrics=False),
+        )
+        self.args = args
+
+    def break_provider(self, name: str, stall: float = 0.0, error: float = 0.0):
+        for service in (self.stt[name], self.tts[name]):
+            service.stall_rate, service.error_rate = stall, error
+
+    async def turn(self) -> tuple:
+        c = self.collector
+        c.transcript.clear(), c.audio.clear(), c.spoken.clear()
+        await self.task.queue_frame(UserStartedSpeakingFrame())
+        for _ in range(25):
+            await self.task.queue_frame(InputAudioRawFrame(SILENCE, 16000, 1))
+            await asyncio.sleep(0.005)
+        await self.task.queue_frame(UserStoppedSpeakingFrame())
+        stt = await _wait(c.transcript, self.args.timeout)
+        await self.task.queue_frames([
+            LLMFullResponseStartFrame(),
+            LLMTextFrame("Right, let me have a look at that for you."),
+            LLMTextFrame(" It won't take long."),
+            LLMFullResponseEndFrame(),
+        ])
+        tts = await _wait(c.audio, self.args.timeout)
+        await _wait(c.spoken, self.args.timeout)
+        return stt, tts
+
+
+async def run_call(names, router, args, hedge=False, break_at=None, **fault) -> dict:
+    call = Call(names, router, args, hedge)
+    runner = PipelineRunner(handle_sigint=False)
+    run = asyncio.create_task(runner.run(call.task))
+    await call.collector.started.wait()
+    first = (call.routed_stt.active_provider, call.routed_tts.active_provider)
+    turns = []
+    for i in range(args.turns):
+        if i == break_at:
+            call.break_provider(names[0], **fault)
+        turns.append(await call.turn())
+    await call.task.queue_frame(EndFrame())
+    await asyncio.wait_for(run, 10)
+    return {
+        "start": first,
+        "end": (call.routed_stt.active_provider, call.routed_tts.active_provider),
+        "turns": turns,
+        "switches": call.routed_stt.switches + call.routed_tts.switches,
+    }
+
+
+def _fmt(value) -> str:
+    return "  timeout" if value is None else f"{value * 1000:7.0f}ms"
+
+
+def report(label: str, calls: list):
+    print(f"  {label}")
+    for i, call in enumerate(calls, 1):
+        stt = " ".join(_fmt(s) for s, _ in call["turns"])
+        tts = " ".join(_fmt(t) for _, t in call["turns"])
+        print(f"    call {i}: start stt={call['start'][0]} tts={call['start'][1]} "
+              f"-> end stt={call['end'][0]} tts={call['end'][1]}")
+        print(f"      stt {stt}")
+        print(f"      tts {tts}")
+        for at, old, new, reason in call["switches"]:
+            print(f"      switched {old} -> {new} at {at:.2f}s ({reason})")
+
+
+def _mean(calls: list, index: int) -> float:
+    values = [turn[index] for call in calls for turn in call["turns"] if turn[index] is not None]
+    return statistics.mean(values) if values else float("nan")
+
+
+def _answered(calls: list) -> bool:
+    return all(s is not None and t is not None for call in calls for s, t in call["turns"])
+
+
+async def main(args):
+    ok = True
+
+    print("learn: primary 'slow', fallback 'fast', first-turn hedging")
+    alone = [await run_call(["slow"], ProviderRouter(), args) for _ in range(args.calls)]
+    router = ProviderRouter()
+    routed = [await run_call(["slow", "fast"], router, args, hedge=True) for _ in range(args.calls)]
+    report("primary only", alone)
+    report("routed", routed)
+    for name, index in (("stt", 0), ("tts", 1)):
+        print(f"  mean {name}: {_mean(alone, index) * 1000:.0f}ms -> {_mean(routed, index) * 1000:.0f}ms")
+    ok &= all(call["start"] == ("fast", "fast") for call in routed[1:]) and _answered(routed)
+
+    for scenario, fault in (("stall", {"stall": 1.0}), ("error", {"error": 1.0})):
+        print(f"\n{scenario}: primary 'fast_a' starts to {scenario} at turn {args.break_at + 1}, fallback 'fast_b'")
+        alone = [await run_call(["fast_a"], ProviderRouter(), args, break_at=args.break_at, **fault)]
+        router = ProviderRouter()
+        routed = [
+            await run_call(["fast_a", "fast_b"], router, args, break_at=args.break_at, **fault),
+            await run_call(["fast_a", "fast_b"], router, args, break_at=0, **fault),
+        ]
+        report("primary only", alone)
+        report("routed", routed)
+        stt, tts = routed[0]["turns"][args.break_at]
+        limit = (args.stt_stall, args.tts_stall) if scenario == "stall" else (0, 0)
+        print(f"  turn {args.break_at + 1}: stt {_fmt(stt)} (stall timeout {args.stt_stall}s), "
+              f"tts {_fmt(tts)} (stall timeout {args.tts_stall}s)")
+        later = [turn for call in routed for turn in call["turns"][args.break_at + 1:]]
+        ok &= (
+            _answered(routed)
+            and stt < limit[0] + 0.5 and tts < limit[1] + 0.5
+            # Back to normal once switched
+            and all(s < 0.5 and t < 0.5 for s, t in later)
+            and routed[1]["start"] == ("fast_b", "fast_b")
+        )
+
+    print("OK" if ok else "FAILED")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=3)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--break-at", type=int, default=1, help="0-based turn where the primary breaks")
+    parser.add_argument("--stt-stall", type=float, default=0.6)
+    parser.add_argument("--tts-stall", type=float, default=0.8)
+    parser.add_argument("--timeout", type=float, default=3.0)
+    asyncio.run(main(parser.parse_args()))
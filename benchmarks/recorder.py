@@ -0,0 +1,257 @@
+"""In-process call recording: fidelity, memory cap and cost against Twilio's.
+
+In-process, in real time:
+
+    fidelity    one call: 3s of caller speech in 20ms frames, and 1.5s of bot
+                speech pushed at twice real time from 1s in. The caller
+                channel has to match the input, and the bot's has to land
+                where it plays, not where it was pushed
+    memory      --calls calls at once into a sink that takes --slow-sink
+                seconds per write, under a --max-memory cap: held audio
+                must stay under the cap, with what didn't fit counted
+    segments    "segments" mode keeps the last --buffer seconds and writes
+                them out only when the call is marked
+
+Macro (--calls > 0 and --window > 0): one benchmarks.load_ramp step against
+benchmarks.mock_server per RECORDING_MODE (twilio, off, full), reporting CPU
+per call, loop lag, response delay and Twilio REST requests per call, and
+checking every call left a manifest and chunks covering it.
+
+    python -m benchmarks.recorder --calls 6 --window 20
+"""
+import argparse
+import asyncio
+import audioop
+import glob
+import json
+import os
+import shutil
+import struct
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from benchmarks.load_ramp import _free_port, run_step, start_server
+from benchmarks.media_stream_client import utterances
+from benchmarks.synthetic_speech import synthetic_speech
+from call_records import LocalSink
+from recorder import BOT, CALLER, RATE, CallRecorder
+
+CALLER_FRAME = 640   # 20ms at 16 kHz, as the serializer hands it on
+BOT_FRAME = 1920     # 40ms at 24 kHz, as the output transport sends it
+
+
+class SlowSink(LocalSink):
+    def __init__(self, directory: str, delay: float):
+        super().__init__(directory)
+        self.delay = delay
+
+    async def write(self, name, data):
+        await asyncio.sleep(self.delay)
+        await super().write(name, data)
+
+
+def read_wav(path: str) -> np.ndarray:
+    """(samples, 2) int16 from a stereo μ-law WAV the recorder wrote"""
+    with open(path, "rb") as f:
+        data = f.read()
+    fmt, channels, rate = struct.unpack_from("<HHI", data, 20)
+    assert data[:4] == b"RIFF" and (fmt, channels, rate) == (7, 2, RATE), path
+    # RIFF/WAVE 12 bytes, fmt 26, fact 12, then "data" and its size
+    size = struct.unpack_from("<I", data, 54)[0]
+    body = data[58:58 + size]
+    return np.frombuffer(audioop.ulaw2lin(body, 2), dtype=np.int16).reshape(-1, 2)
+
+
+def read_call(directory: str) -> tuple:
+    manifest_path = glob.glob(os.path.join(directory, "**", "manifest.json"), recursive=True)[0]
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    chunks = [read_wav(os.path.join(directory, name)) for name in manifest["chunks"]]
+    return manifest, np.concatenate(chunks) if chunks else np.zeros((0, 2), np.int16)
+
+
+def loud(channel: np.ndarray) -> np.ndarray:
+    """Which 20ms blocks have speech in them"""
+    blocks = channel[:len(channel) // 160 * 160].reshape(-1, 160).astype(np.float64)
+    return np.sqrt((blocks ** 2).mean(axis=1)) > 300
+
+
+async def feed(recordings: list, seconds: float, bot_from: float = None, bot_seconds: float = 0.0,
+               on_tick=None) -> list:
+    """Caller frames every 20ms for each recording, and optionally bot frames
+    pushed at twice real time; returns the time each add() took"""
+    caller = synthetic_speech(seconds, 16000, seed=1)
+    bot = synthetic_speech(bot_seconds, 24000, seed=2) if bot_seconds else b""
+    costs = []
+    start = time.monotonic()
+    sent_bot = 0
+    for i in range(0, len(caller) - CALLER_FRAME + 1, CALLER_FRAME):
+        elapsed = time.monotonic() - start
+        frames = [(CALLER, caller[i:i + CALLER_FRAME], 16000)]
+        if bot_from is not None and elapsed >= bot_from:
+            # Twice real time: two 40ms frames per 40ms, i.e. one per 20ms tick
+            if sent_bot < len(bot):
+                frames.append((BOT, bot[sent_bot:sent_bot + BOT_FRAME], 24000))
+                sent_bot += BOT_FRAME
+        for recording in recordings:
+            for channel, pcm, rate in frames:
+                t = time.perf_counter()
+                recording.add(channel, pcm, rate)
+                costs.append(time.perf_counter() - t)
+        if on_tick:
+            on_tick()
+        await asyncio.sleep(max(0.0, start + (i // CALLER_FRAME + 1) * 0.02 - time.monotonic()))
+    return costs
+
+
+async def fidelity() -> bool:
+    directory = tempfile.mkdtemp(prefix="recorder_")
+    try:
+        recorder = CallRecorder(LocalSink(directory), "full", buffer_seconds=30, chunk_seconds=1.0,
+                                max_memory=64 << 20, max_retries=0)
+        recorder.start()
+        recording = recorder.begin("CA-fidelity")
+        costs = await feed([recording], 3.0, bot_from=1.0, bot_seconds=1.5)
+        recorder.end(recording)
+        await recorder.close()
+        manifest, audio = read_call(directory)
+    finally:
+        shutil.rmtree(directory)
+
+    # The caller channel against the input, resampled the same way
+    reference = np.frombuffer(audioop.ulaw2lin(audioop.lin2ulaw(
+        audioop.ratecv(synthetic_speech(3.0, 16000, seed=1), 2, 1, 16000, RATE, None)[0], 2), 2), np.int16)
+    offset = int(np.argmax(np.abs(audio[:, CALLER]) > 0))
+    recorded = audio[offset:offset + len(reference) - 16, CALLER].astype(np.float64)
+    expected = reference[:len(recorded)].astype(np.float64)
+    snr = 10 * np.log10((expected ** 2).sum() / max(((recorded - expected) ** 2).sum(), 1e-9))
+
+    def span(channel):
+        blocks = np.flatnonzero(loud(channel)) * 0.02
+        return (blocks[0], blocks[-1] - blocks[0] + 0.02) if len(blocks) else (float("nan"), 0.0)
+
+    bot_start, bot_length = span(audio[:, BOT])
+    # Where the bot's speech is loud within what it sent, as played in real time
+    sent_start, sent_length = span(np.frombuffer(
+        audioop.ratecv(synthetic_speech(1.5, 24000, seed=2), 2, 1, 24000, RATE, None)[0], np.int16))
+    tap = np.percentile(costs, 50) * 1e6, np.percentile(costs, 99) * 1e6
+    print(f"fidelity: {len(manifest['chunks'])} chunks, {manifest['seconds']:.2f}s recorded | caller SNR "
+          f"{snr:.0f}dB | bot audio at {bot_start:.2f}s for {bot_length:.2f}s (sent at {1.0 + sent_start:.2f}s for "
+          f"{sent_length:.2f}s, pushed over 0.75s) | "
+          f"tap p50 {tap[0]:.1f}us p99 {tap[1]:.1f}us")
+    return (2.9 < manifest["seconds"] < 3.2 and snr > 30 and abs(bot_start - 1.0 - sent_start) < 0.1
+            and abs(bot_length - sent_length) < 0.05 and manifest["dropped_seconds"] == 0)
+
+
+async def memory(args) -> bool:
+    directory = tempfile.mkdtemp(prefix="recorder_")
+    try:
+        recorder = CallRecorder(SlowSink(directory, args.slow_sink), "full", buffer_seconds=30,
+                                chunk_seconds=1.0, max_memory=args.max_memory, max_retries=0)
+        recorder.start()
+        recordings = [recorder.begin(f"CA-memory-{i}") for i in range(args.calls)]
+        peak = [0]
+
+        def sample():
+            peak[0] = max(peak[0], recorder.memory_bytes)
+
+        await feed(recordings, 3.0, bot_from=0.5, bot_seconds=2.0, on_tick=sample)
+        for recording in recordings:
+            recorder.end(recording)
+        await recorder.close()
+        manifests = glob.glob(os.path.join(directory, "**", "manifest.json"), recursive=True)
+        stats = recorder.stats()
+    finally:
+        shutil.rmtree(directory)
+    print(f"memory: {args.calls} calls, cap {args.max_memory / 1024:.0f}KiB, peak "
+          f"{peak[0] / 1024:.0f}KiB | {stats['chunks']} chunks, {len(manifests)} manifests | "
+          f"dropped {stats['dropped_seconds']:.1f}s of {args.calls * 5.0:.0f}s of caller and bot audio")
+    return peak[0] <= args.max_memory + BOT_FRAME and len(manifests) == args.calls and not recorder.live
+
+
+async def segments(args) -> bool:
+    directory = tempfile.mkdtemp(prefix="recorder_")
+    try:
+        recorder = CallRecorder(LocalSink(directory), "segments", buffer_seconds=args.buffer,
+                                chunk_seconds=1.0, max_memory=64 << 20, max_retries=0)
+        recorder.start()
+        recording = recorder.begin("CA-segments")
+        await feed([recording], 3.0, bot_from=1.5, bot_seconds=1.0)
+        recorder.mark("CA-segments", "transfer")
+        recorder.end(recording)
+        await recorder.close()
+        files = sorted(os.path.relpath(p, directory) for p in glob.glob(os.path.join(directory, "**", "*"),
+                                                                       recursive=True) if os.path.isfile(p))
+        audio = read_wav(os.path.join(directory, files[0])) if files else np.zeros((0, 2))
+    finally:
+        shutil.rmtree(directory)
+    seconds = len(audio) / RATE
+    print(f"segments: {files} | {seconds:.2f}s (buffer {args.buffer:.1f}s) | bot audio "
+          f"{loud(audio[:, BOT]).sum() * 0.02 if len(audio) else 0:.2f}s")
+    return len(files) == 1 and files[0].endswith("transfer-1.wav") and abs(seconds - args.buffer) < 0.1
+
+
+async def macro(args) -> bool:
+    utterances()
+    results = {}
+    print()
+    for mode in ("twilio", "off", "full"):
+        directory = tempfile.mkdtemp(prefix="recordings_")
+        os.environ.update(RECORDING_MODE=mode, RECORDING_SINK=directory, RECORDING_CHUNK_SECONDS="10")
+        port = _free_port()
+        server = start_server(port)
+        try:
+            idle = await asyncio.to_thread(lambda: httpx.get(f"http://127.0.0.1:{port}/bench/stats").json())
+            step = await run_step(f"http://127.0.0.1:{port}", args.calls, args.warmup, args.window)
+            # Ended calls get their last chunk and manifest on the writer's next pass
+            await asyncio.sleep(2.5)
+        finally:
+            server.terminate()
+            server.wait()
+        manifests = []
+        for path in glob.glob(os.path.join(directory, "**", "manifest.json"), recursive=True):
+            with open(path) as f:
+                manifests.append(json.load(f))
+        covered = [m["seconds"] for m in manifests]
+        shutil.rmtree(directory)
+        requests = (step["server"]["twilio_requests"] - idle["twilio_requests"]) / args.calls
+        results[mode] = dict(step, manifests=manifests, covered=covered, requests=requests)
+        print(f"{mode:<7} CPU {step['cpu_share_per_call'] * 100:5.1f}% of a core per call | loop lag p99 "
+              f"{step['loop_lag_p99'] * 1000:4.0f}ms | response p50 {step['delay'][0.5] * 1000:4.0f}ms | "
+              f"{requests:.1f} Twilio requests per call | {len(manifests)} recordings "
+              f"({min(covered, default=0):.1f}-{max(covered, default=0):.1f}s) | errors {len(step['errors'])}",
+              flush=True)
+
+    twilio, full = results["twilio"], results["full"]
+    call_length = args.warmup + args.window + 1
+    ok = all(not r["errors"] and r["turns"] for r in results.values())
+    ok &= twilio["requests"] >= 1 and full["requests"] == 0 and not results["off"]["manifests"]
+    ok &= len(full["manifests"]) == args.calls and all(abs(c - call_length) < 2 for c in full["covered"])
+    ok &= all(m["chunks"] and not m["dropped_seconds"] for m in full["manifests"])
+    ok &= full["delay"][0.5] < twilio["delay"][0.5] + args.max_delay
+    return ok
+
+
+async def main(args):
+    ok = await fidelity()
+    ok &= await memory(args)
+    ok &= await segments(args)
+    if args.calls and args.window:
+        ok &= await macro(args)
+    print("OK" if ok else "FAILED")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=6)
+    parser.add_argument("--warmup", type=float, default=8.0)
+    parser.add_argument("--window", type=float, default=20.0)
+    parser.add_argument("--buffer", type=float, default=1.0, help="RECORDING_BUFFER_SECONDS for the segments run")
+    parser.add_argument("--max-memory", type=int, default=256 * 1024, help="cap for the memory run, bytes")
+    parser.add_argument("--slow-sink", type=float, default=0.3, help="seconds per sink write in the memory run")
+    parser.add_argument("--max-delay", type=float, default=0.15,
+                        help="how much later replies may start than with Twilio recording, seconds (p50)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,94 @@
+"""Soak test: memory each call leaves behind, and leaked tasks and objects.
+
+Starts benchmarks.mock_server with tracemalloc on and runs --calls synthetic
+calls, --concurrency at a time. After each batch it asks /admin/resources to
+collect garbage and reports traced memory; the slope of that over calls made,
+once --warmup calls have filled pools and caches, is the memory each call
+retains. Fails if that is over --max-retained-bytes, or if any call left
+tasks running or pipeline objects alive after RESOURCE_LEAK_GRACE.
+
+    python -m benchmarks.soak --calls 40 --concurrency 2
+"""
+import argparse
+import asyncio
+import os
+import statistics
+
+import httpx
+
+from benchmarks.load_ramp import _free_port, start_server
+from benchmarks.media_stream_client import SyntheticCall, utterances
+
+
+def slope(points: list) -> float:
+    """Least-squares bytes per call"""
+    xs, ys = zip(*points)
+    mx, my = statistics.fmean(xs), statistics.fmean(ys)
+    return sum((x - mx) * (y - my) for x, y in points) / sum((x - mx) ** 2 for x in xs)
+
+
+async def main(args):
+    os.environ.update({
+        "RESOURCE_TRACEMALLOC": "true",
+        "RESOURCE_LEAK_GRACE": str(args.grace),
+        "RESOURCE_HISTORY": str(args.calls),
+        # Records are written out rather than piling up in the batch
+        "CALL_RECORDS_FLUSH_INTERVAL": "1",
+    })
+    utterances()
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    server = start_server(port)
+    try:
+        async with httpx.AsyncClient(base_url=base, timeout=30) as http:
+            points, errors, made = [], [], 0
+            while made < args.calls:
+                batch = [SyntheticCall(base.replace("http", "ws", 1) + "/ws")
+                         for _ in range(min(args.concurrency, args.calls - made))]
+                for client in batch:
+                    await http.post("/agent", data={"CallSid": client.call_sid})
+                results = await asyncio.gather(*(client.run(args.call_seconds) for client in batch))
+                errors += [r.error for r in results if r.error]
+                made += len(batch)
+                # Let the server finish tearing the calls down
+                await asyncio.sleep(0.5)
+                stats = (await http.get("/admin/resources", params={"collect": True, "limit": 0})).json()
+                if made > args.warmup:
+                    points.append((made, stats["traced_bytes"]))
+                print(f"{made:4d} calls  traced {stats['traced_bytes'] / 1e6:7.2f}MB  "
+                      f"rss {stats['rss_bytes'] / 1e6:7.1f}MB  tasks {stats['tasks']:4d}  "
+                      f"sockets {stats['open_sockets']}", flush=True)
+
+            await asyncio.sleep(args.grace + 1.5)
+            final = (await http.get("/admin/resources", params={"collect": True, "limit": args.calls})).json()
+    finally:
+        server.terminate()
+        server.wait()
+
+    calls = final["recent"]
+    retained = slope(points) if len(points) >= 2 else float("nan")
+    print(f"\nper call: tasks spawned p50 {statistics.median(c['tasks_spawned'] for c in calls):.0f}, "
+          f"CPU p50 {statistics.median(c['cpu_seconds'] for c in calls) * 1000:.0f}ms, "
+          f"allocated p50 {statistics.median(c['allocated_bytes'] for c in calls) / 1e3:.0f}KB "
+          f"(net, with {args.concurrency} concurrent), tasks left at end {sum(c['tasks_left'] for c in calls)}")
+    print(f"retained per call: {retained / 1e3:.1f}KB (limit {args.max_retained_bytes / 1e3:.0f}KB) | "
+          f"leaky calls {final['leaky_calls']}, leaked tasks {final['leaked_tasks']}, "
+          f"leaked objects {final['leaked_objects']} | call errors {len(errors)}")
+    for call in calls:
+        if call["leaked_tasks"] or call["leaked_objects"]:
+            print(f"  {call['call_sid']}: tasks {call['leaked_tasks']} objects {call['leaked_objects']}")
+            break
+    ok = not errors and retained <= args.max_retained_bytes
+    ok &= final["pending_leak_checks"] == 0 and not final["leaked_tasks"] and not final["leaked_objects"]
+    print("OK" if ok else "FAILED")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--call-seconds", type=float, default=6.0)
+    parser.add_argument("--warmup", type=int, default=6)
+    parser.add_argument("--grace", type=float, default=2.0)
+    parser.add_argument("--max-retained-bytes", type=int, default=64 * 1024)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,87 @@
+"""Response delay with and without speculative responses and adaptive VAD.
+
+Runs the same load as benchmarks.load_ramp (one step of --calls concurrent
+synthetic calls against benchmarks.mock_server) three times, restarting the
+server with different settings:
+
+    baseline      TURN_SPECULATION=false TURN_ADAPTIVE_VAD=false
+    speculation   the LLM starts on interim transcripts once they settle
+    adaptive      speculation, plus stop_secs following each caller's pauses
+
+Per run it reports the server's RESPONSE DELAY (user stopped speaking to bot
+started, what LatencyObserver logs), the caller-side delay (end of the
+utterance to reply audio, which also includes VAD's stop_secs), and how
+many speculative responses were used vs thrown away with the LLM time the
+used ones saved. --revise-rate makes that share of final transcripts differ
+from the interims, so some speculation is always wasted.
+
+    python -m benchmarks.speculative_turns --calls 4 --window 30
+"""
+import argparse
+import asyncio
+import os
+
+from benchmarks.load_ramp import _free_port, run_step, start_server
+from benchmarks.media_stream_client import utterances
+
+MODES = {
+    "baseline": {"TURN_SPECULATION": "false", "TURN_ADAPTIVE_VAD": "false"},
+    "speculation": {"TURN_SPECULATION": "true", "TURN_ADAPTIVE_VAD": "false"},
+    "adaptive": {"TURN_SPECULATION": "true", "TURN_ADAPTIVE_VAD": "true"},
+}
+
+
+async def run_mode(env: dict, args) -> dict:
+    os.environ.update(env)
+    port = _free_port()
+    server = start_server(port)
+    try:
+        return await run_step(f"http://127.0.0.1:{port}", args.calls, args.warmup, args.window)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def _ms(value) -> str:
+    return "   n/a" if value is None or value != value else f"{value * 1000:6.0f}"
+
+
+async def main(args):
+    os.environ["MOCK_STT_REVISE_RATE"] = str(args.revise_rate)
+    utterances()
+    results = {}
+    for mode, env in MODES.items():
+        step = await run_mode(env, args)
+        results[mode] = step
+        server = step["server"]
+        speculation = server["speculation"]
+        print(f"{mode:<12} RESPONSE DELAY p50 {_ms(server['response_delay']['0.5'])}ms "
+              f"p95 {_ms(server['response_delay']['0.95'])}ms | caller-side p50 {_ms(step['delay'][0.5])}ms "
+              f"p95 {_ms(step['delay'][0.95])}ms | {step['turns']} turns, {step['missed']} missed | "
+              f"speculation {speculation['committed']} used / {speculation['wasted']} wasted, "
+              f"saved p50 {_ms(speculation['saved_p50'])}ms | stop_secs p50 {server['stop_secs_p50']}",
+              flush=True)
+        for error in step["errors"][:3]:
+            print(f"      call error: {error}")
+
+    baseline, speculation, adaptive = (results[m] for m in MODES)
+    ok = all(not r["errors"] and r["turns"] for r in results.values())
+    # Speculation has to show up in RESPONSE DELAY, and adapting stop_secs in the caller's wait
+    ok &= (speculation["server"]["response_delay"]["0.5"]
+           < baseline["server"]["response_delay"]["0.5"] - args.min_saving)
+    ok &= speculation["server"]["speculation"]["committed"] > 0
+    ok &= adaptive["delay"][0.5] < speculation["delay"][0.5]
+    if args.revise_rate:
+        ok &= speculation["server"]["speculation"]["wasted"] > 0
+    print("OK" if ok else "FAILED")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=4)
+    parser.add_argument("--warmup", type=float, default=8.0)
+    parser.add_argument("--window", type=float, default=30.0)
+    parser.add_argument("--revise-rate", type=float, default=0.2)
+    parser.add_argument("--min-saving", type=float, default=0.1,
+                        help="RESPONSE DELAY p50 speculation must save, seconds")
+    asyncio.run(main(parser.parse_args()))
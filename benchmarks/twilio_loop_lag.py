@@ -0,0 +1,71 @@
+"""Event-loop lag while many calls start at once.
+
+Runs N concurrent call starts (outbound create + recording) against the fake
+Twilio API, once with a blocking client (what app.py used to do) and once
+through twilio_client.TwilioAPI, and reports loop lag percentiles.
+
+    python -m benchmarks.twilio_loop_lag --calls 50 --latency 0.1
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.fake_twilio import FakeTwilioHttpClient
+from twilio_client import TwilioAPI
+
+
+async def measure_lag(stop: asyncio.Event, interval: float = 0.005) -> list:
+    lags = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+    return lags
+
+
+async def start_calls(api: TwilioAPI, calls: int):
+    async def start_one(i):
+        call = await api.create_call(to=f"+6140000{i:04d}", url="https://example.test/agent")
+        api.run_in_background(api.start_recording(call.sid), f"recording {call.sid}")
+
+    await asyncio.gather(*(start_one(i) for i in range(calls)))
+    await api.close()
+
+
+def percentile(values: list, pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def run(calls: int, latency: float, blocking: bool) -> dict:
+    api = TwilioAPI(http_client=FakeTwilioHttpClient(latency=latency, blocking=blocking))
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_lag(stop))
+    start = time.perf_counter()
+    await start_calls(api, calls)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    lags = await lag_task
+    return {
+        "elapsed_s": elapsed,
+        "lag_p50_ms": percentile(lags, 50) * 1000,
+        "lag_p99_ms": percentile(lags, 99) * 1000,
+        "lag_max_ms": max(lags) * 1000,
+        "lag_mean_ms": statistics.mean(lags) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    for name, blocking in (("blocking", True), ("async", False)):
+        result = asyncio.run(run(args.calls, args.latency, blocking))
+        print(name, " ".join(f"{k}={v:.2f}" for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    main()
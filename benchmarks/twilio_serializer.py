@@ -0,0 +1,258 @@
+"""Twilio media frames per second per core: pipecat's serializer vs the fast path.
+
+Micro: on one core, with every outbound message written to a real socket
+(websocket framing, one send per message, drained by another thread):
+
+    pipecat     TwilioFrameSerializer: json.dumps/json.loads per message
+    envelope    TwilioMediaSerializer: precompiled outbound envelope, inbound
+                payload sliced out without json.loads, same audio conversion
+    numpy       FastTwilioFrameSerializer: envelope plus the audio_codec path
+    coalesced   numpy, with 40ms TTS chunks sent --budget seconds at a time
+
+pipecat's VHQ soxr stream only emits audio every ~140ms, so its writes are
+already batched, at the cost of latency; audio_codec's resampler emits
+every chunk, which is what coalescing is for. It checks that the envelope
+serializer's messages and frames are byte-identical to pipecat's, and that
+coalesced messages carry the same audio as per-chunk ones.
+
+Macro (--calls > 0): one benchmarks.load_ramp step against
+benchmarks.mock_server per mode, with AUDIO_CODEC, TWILIO_MEDIA_FAST_PATH
+and TWILIO_COALESCE_BUDGET set to match, reporting media frames (20ms of
+audio, in or out) handled per CPU-second, media messages per second of bot
+audio, and the callers' underruns and response delay.
+
+    python -m benchmarks.twilio_serializer --seconds 2 --calls 6 --window 20
+"""
+import argparse
+import asyncio
+import audioop
+import base64
+import binascii
+import json
+import math
+import os
+import socket
+import struct
+import threading
+import time
+import warnings
+
+import numpy as np
+from pipecat.frames.frames import StartFrame, TTSAudioRawFrame
+from pipecat.serializers.twilio import TwilioFrameSerializer
+
+from audio_codec import ULAW_ENCODE
+from benchmarks.load_ramp import _free_port, run_step, start_server
+from benchmarks.media_stream_client import utterances
+from benchmarks.synthetic_speech import synthetic_speech
+from twilio_serializer import FastTwilioFrameSerializer, TwilioMediaSerializer, media_payload
+
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+SERIALIZERS = {
+    "pipecat": TwilioFrameSerializer,
+    "envelope": TwilioMediaSerializer,
+    "numpy": FastTwilioFrameSerializer,
+}
+MODES = {
+    "pipecat": {"AUDIO_CODEC": "pipecat", "TWILIO_MEDIA_FAST_PATH": "false", "TWILIO_COALESCE_BUDGET": "0"},
+    "envelope": {"AUDIO_CODEC": "pipecat", "TWILIO_MEDIA_FAST_PATH": "true", "TWILIO_COALESCE_BUDGET": "0"},
+    "numpy": {"AUDIO_CODEC": "numpy", "TWILIO_COALESCE_BUDGET": "0"},
+    "coalesced": {"AUDIO_CODEC": "numpy"},
+}
+
+
+class SocketWebsocket:
+    """Server-side websocket text frames written straight to a socket"""
+
+    def __init__(self):
+        self.sock, reader = socket.socketpair()
+        self.writes = 0
+        threading.Thread(target=self._drain, args=(reader,), daemon=True).start()
+
+    @staticmethod
+    def _drain(reader):
+        while reader.recv(1 << 20):
+            pass
+
+    async def send_text(self, text: str):
+        data = text.encode()
+        n = len(data)
+        header = bytes((0x81, n)) if n < 126 else struct.pack("!BBH", 0x81, 126, n) if n < 65536 \
+            else struct.pack("!BBQ", 0x81, 127, n)
+        self.sock.sendall(header + data)
+        self.writes += 1
+
+    def close(self):
+        self.sock.close()
+
+
+async def serializer_for(cls, in_rate: int = 16000, out_rate: int = 24000):
+    serializer = cls("MZ" + "0" * 32)
+    await serializer.setup(StartFrame(audio_in_sample_rate=in_rate, audio_out_sample_rate=out_rate))
+    return serializer
+
+
+async def outbound_rate(serializer, ws, chunks: list, group: int, repeat: int) -> float:
+    """Chunks per CPU-second, sending `group` chunks per message"""
+    start = time.thread_time()
+    for _ in range(repeat):
+        for i in range(0, len(chunks), group):
+            audio = b"".join(chunks[i:i + group]) if group > 1 else chunks[i]
+            message = await serializer.serialize(TTSAudioRawFrame(audio, 24000, 1))
+            # The resamplers can hold back the first chunk entirely
+            if message:
+                await ws.send_text(message)
+    return repeat * len(chunks) / (time.thread_time() - start)
+
+
+async def inbound_rate(serializer, messages: list, repeat: int) -> float:
+    start = time.thread_time()
+    for _ in range(repeat):
+        for message in messages:
+            await serializer.deserialize(message)
+    return repeat * len(messages) / (time.thread_time() - start)
+
+
+async def check_equivalence(chunks: list, group: int, messages: list) -> tuple:
+    """(payload slicing matches json.loads, envelope output identical to
+    pipecat's, coalesced audio identical to per-chunk audio)"""
+    sliced = all(media_payload(m) == json.loads(m)["media"]["payload"] for m in messages)
+    spaced = [json.dumps(json.loads(m)) for m in messages[:10]]
+    sliced &= all(media_payload(m) == json.loads(m)["media"]["payload"] for m in spaced)
+    others = ('{"event":"start","start":{"streamSid":"MZ1"}}', '{"event":"mark","mark":{"name":"x"}}',
+              '{"event":"stop","stop":{}}', '{"event":"connected","protocol":"Call"}')
+    sliced &= all(media_payload(m) is None for m in others)
+
+    async def outbound(cls, size, audio=chunks, rate=24000):
+        serializer = await serializer_for(cls, rate, rate)
+        return [await serializer.serialize(TTSAudioRawFrame(b"".join(audio[i:i + size]), rate, 1))
+                for i in range(0, len(audio), size)]
+
+    async def inbound(cls):
+        # At Twilio's own rate: soxr streams don't give the same output twice
+        serializer = await serializer_for(cls, 8000, 8000)
+        return [(await serializer.deserialize(m)).audio for m in messages]
+
+    chunks_8k = [audioop.ratecv(c, 2, 1, 24000, 8000, None)[0] for c in chunks]
+    identical = (
+        [json.loads(m) for m in await outbound(TwilioFrameSerializer, 1, chunks_8k, 8000)]
+        == [json.loads(m) for m in await outbound(TwilioMediaSerializer, 1, chunks_8k, 8000)]
+        and await inbound(TwilioFrameSerializer) == await inbound(TwilioMediaSerializer)
+    )
+
+    def audio(payloads):
+        return b"".join(base64.b64decode(json.loads(p)["media"]["payload"]) for p in payloads if p)
+
+    # audio_codec's resampler gives the same output however the input is chunked
+    same_audio = (audio(await outbound(FastTwilioFrameSerializer, 1))
+                  == audio(await outbound(FastTwilioFrameSerializer, group)))
+    return sliced, identical, same_audio
+
+
+async def micro(args) -> bool:
+    speech_8k = np.frombuffer(synthetic_speech(2.0, 8000), np.int16)
+    speech_24k = synthetic_speech(2.0, 24000)
+    # 40ms at 24 kHz, what the output transport writes per chunk
+    chunks = [speech_24k[i:i + 1920] for i in range(0, len(speech_24k) - 1919, 1920)]
+    group = max(1, math.ceil(args.budget / 0.04))
+    # As Twilio sends them: compact JSON, event first
+    messages = [json.dumps({
+        "event": "media", "sequenceNumber": str(i + 2), "media": {
+            "track": "inbound", "chunk": str(i + 1), "timestamp": str(i * 20),
+            "payload": binascii.b2a_base64(ULAW_ENCODE[speech_8k[j:j + 160].view(np.uint16)],
+                                           newline=False).decode()},
+        "streamSid": "MZ" + "0" * 32,
+    }, separators=(",", ":")) for i, j in enumerate(range(0, len(speech_8k) - 159, 160))]
+
+    sliced, identical, same_audio = await check_equivalence(chunks, group, messages)
+    print(f"payload slicing matches json.loads {sliced}; envelope output identical to pipecat's {identical}; "
+          f"coalesced audio identical {same_audio}")
+
+    # Modes take turns in short rounds and keep their best, so a noisy
+    # stretch on the box doesn't land on one of them
+    modes = {mode: (cls, 1) for mode, cls in SERIALIZERS.items()}
+    modes["coalesced"] = (FastTwilioFrameSerializer, group)
+    inbound = {mode: 0.0 for mode in modes}
+    outbound = {mode: 0.0 for mode in modes}
+    sockets = {mode: SocketWebsocket() for mode in modes}
+    serializers = {mode: (await serializer_for(cls), await serializer_for(cls)) for mode, (cls, _) in modes.items()}
+    rounds, deadline = 0, time.thread_time() + args.seconds * len(modes)
+    while time.thread_time() < deadline:
+        rounds += 1
+        for mode, (_, size) in modes.items():
+            decoder, encoder = serializers[mode]
+            inbound[mode] = max(inbound[mode], await inbound_rate(decoder, messages, 5))
+            outbound[mode] = max(outbound[mode], await outbound_rate(encoder, sockets[mode], chunks, size, 5))
+    sent = {mode: sockets[mode].writes for mode in modes}
+    for ws in sockets.values():
+        ws.close()
+    results = {mode: (inbound[mode], outbound[mode], sent[mode] / (rounds * 5 * len(chunks))) for mode in modes}
+
+    base_in, base_out, _ = results["pipecat"]
+    print(f"\n{'one core':<10} {'inbound 20ms/s':>15} {'outbound 40ms/s':>16} {'writes/chunk':>13}")
+    for mode, (inbound, outbound, writes) in results.items():
+        print(f"{mode:<10} {inbound:9.0f} ({inbound / base_in:3.1f}x) {outbound:9.0f} ({outbound / base_out:3.1f}x) "
+              f"{writes:13.2f}")
+    # A talking call: 50 inbound frames/s, plus 25 outbound chunks/s while the bot speaks
+    for mode, (inbound, outbound, _) in results.items():
+        per_call = 50 / inbound + 25 / outbound
+        print(f"{mode}: {per_call * 100:.3f}% of a core per call")
+    envelope, numpy, coalesced = results["envelope"], results["numpy"], results["coalesced"]
+    return (sliced and identical and same_audio and envelope[0] > base_in and envelope[1] > base_out
+            and coalesced[1] > numpy[1] and coalesced[2] < numpy[2] / 1.5)
+
+
+async def macro(args) -> bool:
+    utterances()
+    results = {}
+    print()
+    for mode, env in MODES.items():
+        os.environ.update({"TWILIO_COALESCE_BUDGET": str(args.budget), **env})
+        port = _free_port()
+        server = start_server(port)
+        try:
+            step = await run_step(f"http://127.0.0.1:{port}", args.calls, args.warmup, args.window)
+        finally:
+            server.terminate()
+            server.wait()
+        cpu = step["server"]["cpu_seconds"]
+        frames = args.calls * step["server"]["window"] / 0.02 + step["bot_audio_seconds"] / 0.02
+        step.update(
+            frames_per_cpu_second=frames / cpu,
+            messages_per_audio_second=step["bot_frames"] / max(step["bot_audio_seconds"], 1e-9),
+        )
+        results[mode] = step
+        print(f"{mode:<10} {step['frames_per_cpu_second']:8.0f} frames/CPU-s ({cpu:.2f}s) | CPU {step['cpu_share_per_call'] * 100:5.1f}% "
+              f"of a core per call | {step['messages_per_audio_second']:5.1f} msgs per bot-audio second | "
+              f"underrun {step['underrun'] * 100:4.1f}% | response p50 {step['delay'][0.5] * 1000:4.0f}ms | "
+              f"errors {len(step['errors'])}", flush=True)
+
+    numpy, coalesced = results["numpy"], results["coalesced"]
+    ok = all(not r["errors"] and r["turns"] for r in results.values())
+    # Serializing and writing media are a sliver of a call's CPU next to
+    # moving frames through the pipeline, so frames/CPU-s is reported, not
+    # checked: end to end it moves with run-to-run noise
+    ok &= coalesced["messages_per_audio_second"] < numpy["messages_per_audio_second"] / 1.5
+    ok &= coalesced["underrun"] <= numpy["underrun"] + 0.005
+    ok &= coalesced["delay"][0.5] < numpy["delay"][0.5] + args.max_delay
+    return ok
+
+
+async def main(args):
+    ok = await micro(args)
+    if args.calls:
+        ok &= await macro(args)
+    print("OK" if ok else "FAILED")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=2.0, help="CPU time per micro measurement")
+    parser.add_argument("--budget", type=float, default=0.08, help="TWILIO_COALESCE_BUDGET, seconds")
+    parser.add_argument("--calls", type=int, default=6, help="concurrent calls for the macro run; 0 skips it")
+    parser.add_argument("--warmup", type=float, default=8.0)
+    parser.add_argument("--window", type=float, default=20.0)
+    parser.add_argument("--max-delay", type=float, default=0.15,
+                        help="how much later coalesced replies may start, seconds (p50, run-to-run noise included)")
+    asyncio.run(main(parser.parse_args()))
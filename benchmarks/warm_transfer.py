@@ -0,0 +1,145 @@
+"""Transfer gap for transfer_call, with and without pre-dialing the agent.
+
+Drives the real TransferProcessor, transfer_call handler and TransferManager
+against benchmarks.fake_twilio, whose agent line takes --ring seconds to
+answer. Each simulated call says something that sounds interested, carries
+on for --lead seconds, then the model calls transfer_call. The gap is from
+transfer_call to the fake Twilio seeing caller and agent in one conference.
+
+    warm    interest pre-dials the agent into the call's conference
+    cold    no pre-dial (TRANSFER_PREDIAL=false): the agent is dialed at
+            transfer_call, like a plain REST redirect to <Dial>
+
+It also checks that a pre-dialed agent is hung up when the caller leaves
+without a transfer, and that a caller whose agent never answers is told so.
+
+    python -m benchmarks.warm_transfer --calls 10 --ring 6
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+# Must be set before config is imported
+os.environ.setdefault("HOST", "localhost")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("TRANSFER_NUMBER", "+61200000000")
+for key in ("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN"):
+    os.environ.setdefault(key, "mock")
+
+from pipecat.frames.frames import EndFrame, LLMFullResponseStartFrame  # noqa: E402
+from pipecat.pipeline.pipeline import Pipeline  # noqa: E402
+from pipecat.pipeline.runner import PipelineRunner  # noqa: E402
+from pipecat.pipeline.task import PipelineParams, PipelineTask  # noqa: E402
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext  # noqa: E402
+from pipecat.services.llm_service import FunctionCallParams  # noqa: E402
+
+from benchmarks.fake_twilio import FakeTwilioHttpClient  # noqa: E402
+from transfer import (  # noqa: E402
+    TRANSFER_TOOLS,
+    TransferProcessor,
+    transfer_call_handler,
+    transfer_interest,
+    transfers,
+)
+from twilio_client import twilio_api  # noqa: E402
+
+MESSAGES = [
+    {"role": "system", "content": "You are a calling assistant for Utility Club."},
+    {"role": "assistant", "content": "Have you had a look at your energy bill lately?"},
+    {"role": "user", "content": "Not really, can you see if I'm overpaying?"},
+]
+
+
+async def run_call(call_sid: str, args, predial: bool, transfer: bool = True) -> dict:
+    context = OpenAILLMContext(messages=list(MESSAGES), tools=TRANSFER_TOOLS)
+    processor = TransferProcessor(call_sid, context, transfers, transfer_interest if predial else None)
+    task = PipelineTask(Pipeline([processor]), params=PipelineParams(enable_metrics=False))
+    run = asyncio.create_task(PipelineRunner(handle_sigint=False).run(task))
+
+    # The bot starts answering the interested caller, and the conversation goes on
+    await task.queue_frame(LLMFullResponseStartFrame())
+    await asyncio.sleep(args.lead)
+
+    requested = time.monotonic()
+    if transfer:
+        async def result_callback(result, properties=None):
+            pass
+
+        handler = transfer_call_handler(call_sid, processor, transfers, context.get_messages)
+        await handler(FunctionCallParams(
+            function_name="transfer_call", tool_call_id="call_1", arguments={"reason": "Wants to compare rates"},
+            llm=None, context=context, result_callback=result_callback,
+        ))
+    # The media stream closes once the caller is redirected, or hangs up
+    summary = transfers.end(call_sid)
+    await task.queue_frame(EndFrame())
+    await run
+    return {"requested": requested, "summary": summary}
+
+
+async def scenario(fake: FakeTwilioHttpClient, args, predial: bool, label: str) -> list:
+    calls = [f"CA{label}{i:04d}" for i in range(args.calls)]
+    results = await asyncio.gather(*(run_call(sid, args, predial) for sid in calls))
+    # Cold transfers bridge when the agent answers, after the handler returns
+    await asyncio.sleep(args.ring + 1)
+    gaps = []
+    for sid, result in zip(calls, results):
+        bridged = fake.bridged_at.get(f"transfer-{sid}")
+        gaps.append(None if bridged is None else bridged - result["requested"])
+    return gaps
+
+
+def _fmt(gaps: list) -> str:
+    done = [g for g in gaps if g is not None]
+    if not done:
+        return "none bridged"
+    return (f"p50 {statistics.median(done) * 1000:6.0f}ms  max {max(done) * 1000:6.0f}ms  "
+            f"bridged {len(done)}/{len(gaps)}")
+
+
+async def main(args):
+    ok = True
+    fake = FakeTwilioHttpClient(
+        latency=args.latency, jitter=args.jitter, ring_time=args.ring, call_duration=3600,
+        status_callback=transfers.handle_status,
+    )
+    twilio_api._http_client = fake
+
+    cold = await scenario(fake, args, predial=False, label="cold")
+    warm = await scenario(fake, args, predial=True, label="warm")
+    print(f"agent rings {args.ring}s, REST latency {args.latency * 1000:.0f}ms, transfer_call {args.lead}s after interest")
+    print(f"  cold (dial at transfer_call): {_fmt(cold)}")
+    print(f"  warm (pre-dialed):            {_fmt(warm)}")
+    print(f"  {transfers.stats()}")
+    ok &= None not in cold and None not in warm
+    ok &= max(warm) < args.latency + args.jitter + 0.1 and min(cold) > args.ring
+
+    # Interested, but hangs up before transfer_call
+    released = transfers.released
+    await run_call("CAleaves", args, predial=True, transfer=False)
+    await asyncio.sleep(args.latency + args.jitter + 0.1)
+    agent = next(sid for sid, call in fake.calls.items() if call.get("twiml") and "CAleaves" in call["twiml"])
+    print(f"\nno transfer: agent leg {fake.calls[agent]['status']}, released {transfers.released - released}")
+    ok &= fake.calls[agent]["status"] == "completed" and transfers.released == released + 1
+
+    # The agent line is busy, so the caller waits in the conference for nobody
+    fake.outcome = lambda to: "busy"
+    await run_call("CAbusy", args, predial=True)
+    await asyncio.sleep(args.ring + 1)
+    told = any("CAbusy" in uri and "<Say>" in (data or {}).get("Twiml", "") for _, uri, data in fake.requests)
+    print(f"agent busy: caller told and hung up {told}, failed {transfers.failed}")
+    ok &= told and transfers.stats()["pending"] == 0
+
+    print("OK" if ok else "FAILED")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=10)
+    parser.add_argument("--ring", type=float, default=6.0, help="seconds for the agent to answer")
+    parser.add_argument("--lead", type=float, default=8.0, help="seconds from interest to transfer_call")
+    parser.add_argument("--latency", type=float, default=0.15)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,159 @@
+"""Calls per core as workers are added, plus admission control under overload.
+
+Each worker process runs N synthetic calls that do the per-frame audio work
+of a live call every 20ms: μ-law decode, 8→16 kHz resample and Silero VAD on
+the way in, 24→8 kHz resample, μ-law encode and the Twilio JSON envelope on
+the way out. A worker is "at capacity" once p99 frame lateness passes the
+budget (by default a whole frame, i.e. audio would underrun). With W workers on W cores, total capacity should be ~W x the
+single-worker figure.
+
+Then W workers register with a SQLite session registry and the script
+offers more calls than they advertise to check the surplus is shed.
+
+    python -m benchmarks.worker_scaling --max-workers 4
+"""
+import argparse
+import asyncio
+import audioop
+import base64
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+import uuid
+
+FRAME_SECONDS = 0.02
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0.0
+
+
+async def _call(analyzer, duration: float, lateness: list):
+    inbound = audioop.lin2ulaw(os.urandom(320), 2)
+    outbound_pcm = os.urandom(960)
+    in_state = out_state = None
+    next_tick = time.perf_counter()
+    end = next_tick + duration
+    while next_tick < end:
+        pcm, in_state = audioop.ratecv(audioop.ulaw2lin(inbound, 2), 2, 1, 8000, 16000, in_state)
+        if analyzer:
+            analyzer.analyze_audio(pcm)
+        out, out_state = audioop.ratecv(outbound_pcm, 2, 1, 24000, 8000, out_state)
+        payload = base64.b64encode(audioop.lin2ulaw(out, 2)).decode()
+        json.dumps({"event": "media", "streamSid": "MZ", "media": {"payload": payload}})
+
+        next_tick += FRAME_SECONDS
+        await asyncio.sleep(max(0.0, next_tick - time.perf_counter()))
+        lateness.append(max(0.0, time.perf_counter() - next_tick))
+
+
+async def _run_calls(calls: int, duration: float) -> dict:
+    from pool import PipelinePool, _load_silero_session
+
+    pool = PipelinePool(size=0)
+    pool._vad_session = await asyncio.to_thread(_load_silero_session)
+    analyzers = [pool._build_vad_analyzer() for _ in range(calls)]
+    for analyzer in analyzers:
+        analyzer.set_sample_rate(16000)
+        # First inference pays ONNX Runtime's one-off setup
+        analyzer.analyze_audio(bytes(1024))
+    lateness = []
+    if not calls:
+        await _call(None, duration, lateness)
+    cpu_start = time.process_time()
+    await asyncio.gather(*(_call(a, duration, lateness) for a in analyzers))
+    return {
+        "calls": calls,
+        "p99_late_ms": _percentile(lateness, 99) * 1000,
+        "cpu_s": time.process_time() - cpu_start,
+        "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def _worker(calls: int, duration: float, results):
+    # pipecat logs every VAD analyzer it configures
+    from loguru import logger
+
+    logger.remove()
+    results.put(asyncio.run(_run_calls(calls, duration)))
+
+
+def run_workers(workers: int, calls_per_worker: int, duration: float) -> list:
+    results = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(target=_worker, args=(calls_per_worker, duration, results))
+        for _ in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    out = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return out
+
+
+def find_capacity(budget_ms: float, duration: float, step: int) -> int:
+    calls = step
+    capacity = 0
+    while True:
+        result = run_workers(1, calls, duration)[0]
+        print(f"  1 worker, {calls:4d} calls: p99 late {result['p99_late_ms']:.1f}ms")
+        if result["p99_late_ms"] > budget_ms:
+            return capacity
+        capacity = calls
+        calls += step
+
+
+async def check_admission(workers: int, capacity: int) -> dict:
+    from sessions import SQLiteSessionRegistry
+
+    path = os.path.join(tempfile.mkdtemp(), "sessions.db")
+    registry = SQLiteSessionRegistry(path, worker_ttl=15, reservation_ttl=30)
+    for w in range(workers):
+        await registry.register_worker(f"worker-{w}", capacity)
+    offered = workers * capacity + capacity
+    start = time.perf_counter()
+    admitted = [await registry.admit(uuid.uuid4().hex) for _ in range(offered)]
+    return {
+        "offered": offered,
+        "admitted": sum(admitted),
+        "shed": registry.shed,
+        "admit_ms": (time.perf_counter() - start) / offered * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--budget-ms", type=float, default=FRAME_SECONDS * 1000)
+    parser.add_argument("--step", type=int, default=4)
+    args = parser.parse_args()
+
+    idle = run_workers(1, 0, args.duration)[0]
+    print(f"Idle timer jitter: p99 late {idle['p99_late_ms']:.1f}ms")
+    print("Finding single-worker capacity...")
+    capacity = find_capacity(args.budget_ms, args.duration, args.step)
+    print(f"Single worker sustains {capacity} calls within {args.budget_ms}ms p99 lateness")
+    if not capacity:
+        return
+
+    for workers in range(1, args.max_workers + 1):
+        results = run_workers(workers, capacity, args.duration)
+        total = sum(r["calls"] for r in results)
+        worst = max(r["p99_late_ms"] for r in results)
+        cpu = sum(r["cpu_s"] for r in results) / args.duration
+        print(
+            f"{workers} workers: {total} calls, worst p99 late {worst:.1f}ms, "
+            f"{cpu:.2f} cores busy, {total / max(cpu, 1e-9):.0f} calls/core"
+        )
+
+    print("Admission:", asyncio.run(check_admission(args.max_workers, capacity)))
+
+
+if __name__ == "__main__":
+    main()
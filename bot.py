@@ -7,184 +7,171 @@ from pipecat.frames.frames import EndFrame, LLMMessagesFrame
 from pipecat.pipeline.pipeline import Pipeline
 from pipecat.pipeline.runner import PipelineRunner
 from pipecat.pipeline.task import PipelineParams, PipelineTask
-from pipecat.services.openai.llm import OpenAILLMService
-from pipecat.services.deepgram.stt import DeepgramSTTService
 from pipecat.transports.network.fastapi_websocket import (
     FastAPIWebsocketTransport,
     FastAPIWebsocketParams,
 )
-from pipecat.audio.vad.silero import SileroVADAnalyzer
-from pipecat.audio.vad.vad_analyzer import VADParams
 from pipecat.serializers.twilio import TwilioFrameSerializer
-from pipecat.services.elevenlabs.tts import ElevenLabsTTSService
+from pipecat.processors.aggregators.llm_response import LLMFullResponseAggregator
 from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext
-from pipecat.services.cartesia.stt import CartesiaSTTService
 from pipecat.frames.frames import TextFrame, LLMTextFrame, TTSAudioRawFrame
 from dotenv import load_dotenv
 from config import settings
+from pool import build_components
+from helper import build_system_prompt
+from metrics import LatencyObserver
+from tts_cache import TTSCacheProcessor, tts_cache
+from call_records import call_records
+from call_resources import call_resources
+from fillers import FillerProcessor, fillers
+from recorder import RecorderTap
+from context_budget import ContextBudget, openai_summarizer
+from twilio_serializer import FastTwilioFrameSerializer, TwilioMediaSerializer
+from twilio_transport import CoalescingWebsocketTransport
+from dashboard import transcript_hub
+from routing import RoutedService, candidates
+from transfer import TRANSFER_TOOLS, TransferProcessor, transfer_call_handler, transfer_interest, transfers
+from turn_taking import AdaptiveVADAnalyzer, SpeculativeTurns
+from utils.logging import call_debug_enabled
 # import sys
 
 load_dotenv(override=True)
 
-# Configure logging for bot
+# Handlers are set up by utils.logging, shared with the rest of the app
 logger = logging.getLogger(__name__)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s | %(name)s | %(levelname)s | %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
 
 # only use it for debugging
 # logger.add(sys.stderr, level="DEBUG")
 
-async def run_bot(websocket_client, stream_sid, system_instruction):
+async def run_bot(websocket_client, stream_sid, system_instruction, components=None, call_sid=None,
+                  prompt_tokens=None, recording=None):
     try:
         logger.info("Bot starting up...")
         bot_start_time = time.time()
         
-        # Timing tracker for latency measurement
-        timing_tracker = {
-            'user_stopped_speaking': None,
-            'bot_started_speaking': None,
-            'user_speech_end': None,
-            'llm_start': None,
-            'llm_end': None,
-            'tts_start': None,
-            'audio_start': None
-        }
+        if components is None:
+            components = build_components()
+        llm = components.llm
+        stt = components.stt
+        tts = components.tts
 
         # Optimize transport for low latency
-        transport = FastAPIWebsocketTransport(
-            websocket=websocket_client,
-            params=FastAPIWebsocketParams(
-                audio_out_enabled=True,
-                add_wav_header=False,
-                vad_enabled=True,  
-                vad_analyzer=SileroVADAnalyzer(
-                    sample_rate=16000,  # Explicit sample rate
-                    params=VADParams(
-                        confidence_threshold=0.6,   
-                        speech_pad_ms=200,           
-                        silence_pad_ms=100          
-                    )
-                ),
-                vad_audio_passthrough=True,
-                serializer=TwilioFrameSerializer(stream_sid),
+        transport_params = FastAPIWebsocketParams(
+            audio_out_enabled=True,
+            add_wav_header=False,
+            vad_enabled=True,  
+            vad_analyzer=components.vad_analyzer,
+            vad_audio_passthrough=True,
+            serializer=(
+                FastTwilioFrameSerializer(stream_sid)
+                if settings.AUDIO_CODEC == "numpy"
+                else TwilioMediaSerializer(stream_sid)
+                if settings.TWILIO_MEDIA_FAST_PATH
+                else TwilioFrameSerializer(stream_sid)
             ),
         )
-
-        # Use faster model for lower latency
-        llm = OpenAILLMService(
-            api_key=settings.OPENAI_API_KEY,
-            model="gpt-4o-mini"  
-        )
-
-        # Initialize STT service with optimized settings
-        # stt = DeepgramSTTService(
-        #     api_key=os.getenv("DEEPGRAM_API_KEY"),
-        #     model="nova-3",
-        #     detect_language=True
-        # )
-        
-        # Optimize STT for lower latency
-        stt = CartesiaSTTService(
-            api_key=settings.CARTESIA_API_KEY,
-            language="en",  # Specify language for faster processing
-            model="sonic"   # Fastest Cartesia model
-        )
-
-        # Initialize TTS service optimized for speed and low latency
-        tts = ElevenLabsTTSService(
-            api_key=settings.ELEVENLABS_API_KEY, 
-            voice_id="IKne3meq5aSn9XLyUdCD",
-            model="eleven_turbo_v2",
-            params=ElevenLabsTTSService.InputParams(
-                stability=0.8,       
-                similarity_boost=0.8, 
-                use_speaker_boost=False,  
-                speed=0.95,          
-                style=0.0,          
-                optimize_streaming_latency=3  
-            )
+        transport = (
+            CoalescingWebsocketTransport(websocket_client, transport_params, budget=settings.TWILIO_COALESCE_BUDGET)
+            if settings.TWILIO_COALESCE_BUDGET > 0
+            else FastAPIWebsocketTransport(websocket=websocket_client, params=transport_params)
         )
 
+        # Without clips (no ElevenLabs key, or rendering failed) the model keeps its own "hmm"s
+        use_fillers = settings.FILLER_ENABLED and fillers.loaded
         # Optimized system prompt for faster processing (shorter = faster)
-        system_prompt = system_instruction + """
-            VOICE: Sound natural with Australian expressions. Use "hmm", "um", "well" naturally. Keep responses conversational and genuine.
-            ALWAYS sound like a real Aussie having a genuine conversation.
-        """
+        system_prompt = build_system_prompt(system_instruction, use_fillers)
         
         messages = [{"role": "system", "content": system_prompt}]
 
-        context = OpenAILLMContext(messages=messages)
+        context = OpenAILLMContext(messages=messages, tools=TRANSFER_TOOLS)
         context_aggregator = llm.create_context_aggregator(context)
 
         tma_in = context_aggregator.user()
         tma_out = context_aggregator.assistant()
 
-        pipeline = Pipeline(
-            [
-                transport.input(), 
-                stt,  
-                tma_in, 
-                llm, 
-                tts,  
-                transport.output(),  
-                tma_out, 
-            ]
+        # Keeps the prompt under budget; older turns get summarised off the critical path
+        context_budget = ContextBudget(
+            context,
+            summarize=openai_summarizer(
+                llm._client, settings.CONTEXT_SUMMARY_MODEL, settings.CONTEXT_SUMMARY_MAX_TOKENS
+            ) if hasattr(llm, "_client") else None,
+        )
+        if prompt_tokens is not None and use_fillers == settings.FILLER_ENABLED:
+            # Counted once per agent version by the prompt cache, for the usual voice instructions
+            context_budget.note_tokens(messages[0], prompt_tokens)
+
+        # Pre-dials the human agent once the caller sounds interested, so
+        # transfer_call only has to move the caller into the waiting conference
+        transfer = TransferProcessor(call_sid, context, transfers, transfer_interest)
+        llm.register_function(
+            "transfer_call",
+            transfer_call_handler(call_sid, transfer, transfers, context_budget.full_messages),
+            cancel_on_interruption=False,
+        )
+
+        # Starts the LLM on interim transcripts while VAD is still waiting out
+        # the caller's pause; used only if the final transcript says the same
+        speculative = (
+            SpeculativeTurns(llm, context, settings.TURN_SPECULATION_SETTLE)
+            if settings.TURN_SPECULATION and hasattr(llm, "get_chat_completions") else None
         )
 
+        # Each reply as the LLM wrote it, for the dashboard
+        assistant_transcript = LLMFullResponseAggregator()
+
+        processors = [
+            transport.input(), 
+            stt,  
+            tma_in, 
+            context_budget,
+            llm, 
+            transfer,
+            assistant_transcript,
+            tts,  
+            transport.output(),  
+            tma_out, 
+        ]
+        if speculative:
+            processors.insert(processors.index(stt) + 1, speculative.watcher)
+            processors.insert(processors.index(llm), speculative.gate)
+        if settings.TTS_CACHE_ENABLED and candidates("tts") == ["elevenlabs"]:
+            # Cached phrases skip the ElevenLabs round trip; with TTS fallbacks
+            # a cached phrase could come out in a different voice, so it's off
+            processors.insert(processors.index(tts), TTSCacheProcessor(tts_cache, tts))
+        if use_fillers:
+            # Plays a pre-rendered "hmm" when the reply's first audio is late
+            processors.insert(
+                processors.index(transport.output()), FillerProcessor(fillers, settings.FILLER_DELAY)
+            )
+
+        if recording:
+            # Both the caller's audio and the bot's, as sent, pass right after the output
+            processors.insert(processors.index(transport.output()) + 1, RecorderTap(recording))
+
+        pipeline = Pipeline(processors)
+
         logger.info("Pipeline setup completed")
 
+        # Frame-timestamp based latency tracking (STT, LLM TTFT, TTS TTFB, response delay)
+        latency_observer = LatencyObserver(
+            on_turn=lambda turn: transcript_hub.publish(call_sid, {"type": "latency", **turn})
+        )
+
         # Optimize pipeline task for low latency
         task = PipelineTask(
             pipeline, params=PipelineParams(
                 allow_interruptions=True,
-                enable_metrics=False,          # Disable metrics for speed
+                enable_metrics=False,          # LatencyObserver covers what we need
                 enable_usage_metrics=False,    # Disable usage metrics
                 send_initial_empty_metrics=False  # Skip initial metrics
-            )
+            ),
+            observers=[latency_observer],
+        )
+        # Reported as leaked if anything still holds them after the call
+        call_resources.watch(
+            task=task, transport=transport, context=context, llm=llm, stt=stt, tts=tts,
+            context_budget=context_budget, latency_observer=latency_observer,
         )
-        
-        # Add simple timing using existing debug patterns
-        import logging
-        import sys
-        
-        # Create a custom logger to intercept debug messages
-        class TimingLogHandler(logging.Handler):
-            def __init__(self, timing_tracker):
-                super().__init__()
-                self.timing_tracker = timing_tracker
-                
-            def emit(self, record):
-                message = record.getMessage()
-                current_time = time.time()
-                
-                # Detect user stopped speaking from debug logs
-                if "User stopped speaking" in message:
-                    self.timing_tracker['user_stopped_speaking'] = current_time
-                    logger.debug(f"User stopped speaking at {current_time:.3f}")
-                    
-                # Detect bot started speaking from debug logs  
-                elif "Bot started speaking" in message:
-                    self.timing_tracker['bot_started_speaking'] = current_time
-                    logger.debug(f"Bot started speaking at {current_time:.3f}")
-                    
-                    # Calculate delay
-                    if self.timing_tracker.get('user_stopped_speaking'):
-                        delay = current_time - self.timing_tracker['user_stopped_speaking']
-                        logger.info(f"RESPONSE DELAY: {delay:.3f}s (User stopped → Bot started)")
-                        logger.info(f"{'EXCELLENT' if delay < 0.5 else 'GOOD' if delay < 1.0 else 'ACCEPTABLE' if delay < 1.5 else 'NEEDS IMPROVEMENT'} - Target: <1.0s")
-                        logger.info("=" * 60)
-                        
-                        # Reset for next interaction
-                        self.timing_tracker['user_stopped_speaking'] = None
-                        self.timing_tracker['bot_started_speaking'] = None
-        
-        # Add our timing handler to the pipecat logger
-        pipecat_logger = logging.getLogger('pipecat')
-        timing_handler = TimingLogHandler(timing_tracker)
-        pipecat_logger.addHandler(timing_handler)
         
         # Simple frame handler for transcripts
         task.set_reached_upstream_filter((TextFrame,))
@@ -192,20 +179,33 @@ async def run_bot(websocket_client, stream_sid, system_instruction):
         @task.event_handler("on_frame_reached_upstream") 
         async def _on_user_transcript(task, frame):
             if isinstance(frame, TextFrame) and frame.role == "user":
-                logger.debug(f"User said: '{frame.text}'")
+                if call_debug_enabled():
+                    logger.debug(f"User said: '{frame.text}'")
                 
-                # Send transcript to client
-                payload = {
-                    "type": "transcript", 
+                # Dashboards get it via the hub; the Twilio socket carries media only
+                transcript_hub.publish(call_sid, {
+                    "type": "transcript",
+                    "role": "user",
                     "text": frame.text,
                     "timestamp": getattr(frame, "timestamp", None),
-                }
-                await websocket_client.send_text(json.dumps(payload))
+                })
+
+        @assistant_transcript.event_handler("on_completion")
+        async def _on_assistant_transcript(aggregator, completion, completed):
+            # Tool-call turns have no text; an interrupted reply is cut where the caller spoke
+            if completion.strip():
+                transcript_hub.publish(call_sid, {
+                    "type": "transcript",
+                    "role": "assistant",
+                    "text": completion.strip(),
+                    "interrupted": not completed,
+                })
 
         @transport.event_handler("on_client_connected")
         async def on_client_connected(transport, client):
             connection_time = time.time() - bot_start_time
             logger.info(f"Client connected in {connection_time:.3f}s - Starting conversation...")
+            transcript_hub.publish(call_sid, {"type": "call_started", "stream_sid": stream_sid})
             try:
                 await task.queue_frames([LLMMessagesFrame(messages)])
             except Exception as e:
@@ -214,11 +214,35 @@ async def run_bot(websocket_client, stream_sid, system_instruction):
         @transport.event_handler("on_client_disconnected")
         async def on_client_disconnected(transport, client):
             logger.info("Client disconnected")
+            transcript_hub.publish(call_sid, {"type": "call_ended"})
             try:
-                messages_to_upload = tma_out.messages
-                if len(tma_in.messages) > len(tma_out.messages):
-                    messages_to_upload = tma_in.messages
-                # the transcriptions are in messages_to_upload
+                # Persisted in the background so teardown never waits on storage
+                call_records.submit({
+                    "call_sid": call_sid,
+                    "stream_sid": stream_sid,
+                    "started_at": bot_start_time,
+                    "ended_at": time.time(),
+                    # Includes turns that were summarised out of the LLM context
+                    "messages": context_budget.full_messages(),
+                    "latency": list(latency_observer.turns),
+                    "prompt_tokens": list(context_budget.prompt_tokens),
+                    # Which provider ended up serving the call, and any mid-call failovers
+                    "providers": {
+                        kind: {"active": service.active_provider, "switches": service.switches}
+                        for kind, service in (("stt", stt), ("tts", tts))
+                        if isinstance(service, RoutedService)
+                    },
+                    # Pre-dial and transfer_call timings; None if the call was never a transfer candidate
+                    "transfer": transfers.end(call_sid),
+                    # Speculative responses used and thrown away, and the end-of-turn silence per turn
+                    "turn_taking": {
+                        "speculation": speculative.stats() if speculative else None,
+                        "vad": (
+                            components.vad_analyzer.stats()
+                            if isinstance(components.vad_analyzer, AdaptiveVADAnalyzer) else None
+                        ),
+                    },
+                })
                 await task.queue_frames([EndFrame()])
             except Exception as e:
                 logger.error(f"Error in client disconnect: {e}")
@@ -0,0 +1,285 @@
+import asyncio
+import glob
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+from config import settings
+from metrics import Gauge, register
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class Sink(ABC):
+    """Destination for finished call-record segments"""
+
+    @abstractmethod
+    async def write(self, name: str, data: bytes):
+        """Store `data` under `name`"""
+
+    async def find(self, call_sids: Iterable[str]) -> Dict[str, dict]:
+        """Latest persisted record per call; sinks that can't be searched find nothing"""
+        return {}
+
+
+class LocalSink(Sink):
+    def __init__(self, directory: str):
+        self.directory = directory
+        # call_sid -> newest segment holding it, over the segments this process
+        # has written or already searched, so each is only read once
+        self._index: Dict[str, str] = {}
+        self._indexed = set()
+        self._lock = threading.Lock()
+
+    async def write(self, name, data):
+        await asyncio.to_thread(self._write, name, data)
+
+    def _write(self, name, data):
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so readers never see a half-written segment
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+        if name.endswith(".jsonl.gz"):
+            self._index_segment(path, gzip.decompress(data).decode("utf-8").splitlines())
+
+    async def find(self, call_sids):
+        return await asyncio.to_thread(self._find, set(call_sids))
+
+    def _find(self, call_sids):
+        # Only segments this process hasn't seen yet are read in full
+        for path in glob.glob(os.path.join(self.directory, "**", "*.jsonl.gz"), recursive=True):
+            if path not in self._indexed:
+                self._index_segment(path, self._read_lines(path))
+        wanted: Dict[str, set] = {}
+        with self._lock:
+            for call_sid in call_sids:
+                if call_sid in self._index:
+                    wanted.setdefault(self._index[call_sid], set()).add(call_sid)
+        found = {}
+        for path, sids in wanted.items():
+            for line in self._read_lines(path):
+                record = json.loads(line)
+                call_sid = record.get("call_sid")
+                if call_sid in sids and call_sid not in found:
+                    found[call_sid] = record
+        return found
+
+    @staticmethod
+    def _read_lines(path: str) -> List[str]:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return f.read().splitlines()
+
+    def _index_segment(self, path: str, lines: List[str]):
+        sids = {json.loads(line).get("call_sid") for line in lines if line}
+        with self._lock:
+            self._indexed.add(path)
+            for call_sid in sids:
+                # Segment names sort by time; keep the newest
+                if call_sid and self._index.get(call_sid, "") < path:
+                    self._index[call_sid] = path
+
+
+class GCSSink(Sink):
+    def __init__(self, bucket: str, prefix: str = ""):
+        self.bucket_name = bucket
+        self.prefix = prefix.strip("/")
+        self._bucket = None
+
+    async def write(self, name, data):
+        await asyncio.to_thread(self._write, name, data)
+
+    def _write(self, name, data):
+        if self._bucket is None:
+            from google.cloud import storage
+
+            self._bucket = storage.Client().bucket(self.bucket_name)
+        from google.api_core.exceptions import PreconditionFailed
+
+        blob = self._bucket.blob(f"{self.prefix}/{name}" if self.prefix else name)
+        try:
+            blob.upload_from_string(data, content_type="application/gzip", if_generation_match=0)
+        except PreconditionFailed:
+            # An earlier attempt landed but its response was lost
+            pass
+
+
+def create_sink(url: str) -> Sink:
+    """gs://bucket/prefix for Cloud Storage, anything else is a local directory"""
+    if url.startswith("gs://"):
+        bucket, _, prefix = url[len("gs://"):].partition("/")
+        return GCSSink(bucket, prefix)
+    return LocalSink(url[len("file://"):] if url.startswith("file://") else url)
+
+
+class CallRecordWriter:
+    """Background persistence for finished calls.
+
+    `submit` never blocks: records go onto a bounded queue (and are counted
+    as dropped if it is full). A single writer task batches them into
+    gzipped JSONL segments, flushed when a segment reaches `segment_records`
+    or `segment_bytes`, or `flush_interval` seconds after its first record,
+    and uploads each segment with exponential-backoff retries.
+    """
+
+    def __init__(self, sink: Sink, max_queue: int, segment_records: int,
+                 segment_bytes: int, flush_interval: float, max_retries: int):
+        self.sink = sink
+        self.segment_records = segment_records
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self._sequence = 0
+        self.submitted = 0
+        self.dropped = 0
+        self.written = 0
+        self.segments = 0
+        self.retries = 0
+        self.failed_segments = 0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, record: dict) -> bool:
+        """Queue a finished call for persistence without waiting"""
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.error(f"Call record queue full, dropping record for {record.get('call_sid')}")
+            return False
+        self.submitted += 1
+        return True
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        """Flush whatever is queued and stop the writer"""
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def flush(self):
+        """Write what's queued now, and from then on each record as it arrives.
+
+        For draining: the platform may kill the worker soon after SIGTERM,
+        well before the lifespan teardown gets to close().
+        """
+        self.flush_interval = 0
+        if self._task is None:
+            return
+        written = asyncio.get_running_loop().create_future()
+        await self._queue.put(written)
+        await written
+
+    async def find(self, call_sids: Iterable[str]) -> Dict[str, dict]:
+        """Persisted records for these calls, by call_sid"""
+        return await self.sink.find(call_sids)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.depth,
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "written": self.written,
+            "segments": self.segments,
+            "retries": self.retries,
+            "failed_segments": self.failed_segments,
+        }
+
+    async def _run(self):
+        batch: List[dict] = []
+        size = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                record = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                record = None
+            stopping = record is _STOP
+            flushing = isinstance(record, asyncio.Future)
+
+            if record is not None and not stopping and not flushing:
+                batch.append(record)
+                # Transcript size dominates; a rough estimate is enough to cap segments
+                size += sum(len(str(m.get("content", ""))) for m in record.get("messages", ())) + 512
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            full = len(batch) >= self.segment_records or size >= self.segment_bytes
+            if batch and (record is None or stopping or flushing or full):
+                await self._flush(batch)
+                batch, size, deadline = [], 0, None
+            if flushing:
+                record.set_result(None)
+            if stopping:
+                return
+
+    async def _flush(self, batch: List[dict]):
+        try:
+            data = await asyncio.to_thread(_encode_segment, batch)
+        except Exception as e:
+            self.failed_segments += 1
+            logger.error(f"Failed to encode {len(batch)} call records: {e}")
+            return
+
+        self._sequence += 1
+        now = datetime.now(timezone.utc)
+        name = f"{now:%Y/%m/%d}/{now:%H%M%S}-{os.getpid()}-{self._sequence:06d}.jsonl.gz"
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.sink.write(name, data)
+                self.written += len(batch)
+                self.segments += 1
+                logger.info(f"Wrote {len(batch)} call records to {name} ({len(data)} bytes)")
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed_segments += 1
+                    logger.error(f"Giving up on call record segment {name}: {e}")
+                    return
+                self.retries += 1
+                delay = min(30.0, 0.5 * 2 ** attempt)
+                logger.warning(f"Call record upload failed, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+
+
+def _encode_segment(batch: List[dict]) -> bytes:
+    lines = "".join(json.dumps(record, default=str) + "\n" for record in batch)
+    return gzip.compress(lines.encode("utf-8"), compresslevel=6)
+
+
+call_records = CallRecordWriter(
+    create_sink(settings.CALL_RECORDS_SINK),
+    max_queue=settings.CALL_RECORDS_QUEUE_SIZE,
+    segment_records=settings.CALL_RECORDS_SEGMENT_RECORDS,
+    segment_bytes=settings.CALL_RECORDS_SEGMENT_BYTES,
+    flush_interval=settings.CALL_RECORDS_FLUSH_INTERVAL,
+    max_retries=settings.CALL_RECORDS_MAX_RETRIES,
+)
+
+register(Gauge("call_records_queue_depth", "Finished calls waiting to be persisted",
+               lambda: call_records.depth))
+register(Gauge("call_records_dropped_total", "Call records dropped because the queue was full",
+               lambda: call_records.dropped, type="counter"))
+register(Gauge("call_records_written_total", "Call records persisted to the sink",
+               lambda: call_records.written, type="counter"))
+register(Gauge("call_records_failed_segments_total", "Segments given up on after retries",
+               lambda: call_records.failed_segments, type="counter"))
@@ -0,0 +1,270 @@
+import asyncio
+import gc
+import logging
+import os
+import time
+import tracemalloc
+import weakref
+from collections import deque
+from contextvars import ContextVar
+from typing import Deque, Dict, List, Optional
+
+from config import settings
+from metrics import Gauge, register
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+# Outside soak runs, how many grace periods to wait for the interpreter's own
+# full collection before objects still alive count as leaked
+FULL_GC_WAIT = 6
+
+# Set for the duration of a call; tasks inherit it, so the task factory
+# knows which call spawned them
+_current: ContextVar[Optional["CallUsage"]] = ContextVar("call_usage", default=None)
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return None
+
+
+def _open_sockets() -> Optional[int]:
+    try:
+        entries = list(os.scandir("/proc/self/fd"))
+    except OSError:
+        return None
+    count = 0
+    for entry in entries:
+        try:
+            count += os.readlink(entry.path).startswith("socket:")
+        except OSError:
+            # Closed since the listing
+            pass
+    return count
+
+
+def _sample() -> dict:
+    return {
+        "cpu": time.process_time(),
+        "traced": tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None,
+        "rss": _rss_bytes(),
+        "sockets": _open_sockets(),
+    }
+
+
+def _delta(start: dict, end: dict, key: str):
+    if start[key] is None or end[key] is None:
+        return None
+    return end[key] - start[key]
+
+
+def _full_collections() -> int:
+    return gc.get_stats()[2]["collections"]
+
+
+def _task_name(task: asyncio.Task) -> str:
+    coro = task.get_coro()
+    return getattr(coro, "__qualname__", None) or task.get_name()
+
+
+class CallUsage:
+    """What one call used, from its media stream starting to it ending.
+
+    CPU, memory and socket figures are process-wide deltas, so they include
+    whatever calls ran alongside; `concurrent` says how many did. Tasks are
+    the call's own: every task created while the call's context is current,
+    including tasks those tasks create.
+    """
+
+    def __init__(self, call_sid: Optional[str]):
+        self.call_sid = call_sid
+        self.started_at = time.time()
+        self.ended_at: Optional[float] = None
+        self.concurrent = 1
+        self.tasks: weakref.WeakSet = weakref.WeakSet()
+        self.tasks_spawned = 0
+        self.tasks_left: Optional[int] = None
+        self.objects: Dict[str, weakref.ref] = {}
+        # None until the leak check has run
+        self.leaked_tasks: Optional[List[str]] = None
+        self.leaked_objects: Optional[List[str]] = None
+        self._start = _sample()
+        self._end: Optional[dict] = None
+        self._full_collections: Optional[int] = None
+        self._token = None
+
+    def to_dict(self) -> dict:
+        end = self._end or _sample()
+        return {
+            "call_sid": self.call_sid,
+            "started_at": self.started_at,
+            "duration": (self.ended_at or time.time()) - self.started_at,
+            "concurrent": self.concurrent,
+            "tasks_spawned": self.tasks_spawned,
+            "tasks_left": self.tasks_left,
+            "cpu_seconds": _delta(self._start, end, "cpu"),
+            "allocated_bytes": _delta(self._start, end, "traced"),
+            "rss_delta_bytes": _delta(self._start, end, "rss"),
+            "sockets_delta": _delta(self._start, end, "sockets"),
+            "leaked_tasks": self.leaked_tasks,
+            "leaked_objects": self.leaked_objects,
+        }
+
+
+class CallResourceAccounting:
+    """Per-call tasks, memory, CPU and sockets, for the last `history` calls.
+
+    start() puts a task factory on the event loop that attributes each new
+    task to the call it was created for. A call's usage is sampled when its
+    media stream starts and ends; `grace` seconds after it ends, any of its
+    tasks still running and any object registered with watch() still alive
+    count as leaked. Pipeline objects sit in reference cycles, so one that's
+    still alive isn't called a leak until a full garbage collection has run
+    since the call ended. With `trace_memory` (soak runs) the check forces
+    one, at most every `grace` seconds across all calls; otherwise it only
+    runs a young collection and waits up to FULL_GC_WAIT grace periods for
+    the interpreter's own, as a forced one stalls audio on every call.
+    """
+
+    def __init__(self, history: int, grace: float, trace_memory: bool = False):
+        self.grace = grace
+        self.trace_memory = trace_memory
+        self.recent: Deque[CallUsage] = deque(maxlen=history)
+        self.live: Dict[int, CallUsage] = {}
+        self._pending: Deque[CallUsage] = deque()
+        self._previous_factory = None
+        self._checker: Optional[asyncio.Task] = None
+        self._last_gc = 0.0
+        self.calls = 0
+        self.leaked_tasks = 0
+        self.leaked_objects = 0
+        self.leaky_calls = 0
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        loop = asyncio.get_running_loop()
+        self._previous_factory = loop.get_task_factory()
+        loop.set_task_factory(self._task_factory)
+        self._checker = loop.create_task(self._check_leaks())
+
+    async def close(self):
+        if self._checker:
+            self._checker.cancel()
+            self._checker = None
+            asyncio.get_running_loop().set_task_factory(self._previous_factory)
+
+    def _task_factory(self, loop, coro, context=None):
+        if self._previous_factory is not None:
+            task = (self._previous_factory(loop, coro) if context is None
+                    else self._previous_factory(loop, coro, context=context))
+        else:
+            # Python 3.10's Task has no context argument, and its loop never passes one
+            task = asyncio.Task(coro, loop=loop, **({"context": context} if context is not None else {}))
+        usage = context.get(_current) if context is not None else _current.get()
+        if usage is not None:
+            usage.tasks_spawned += 1
+            usage.tasks.add(task)
+        return task
+
+    def begin(self, call_sid: Optional[str]) -> CallUsage:
+        """Start accounting for the call running in the current context"""
+        usage = CallUsage(call_sid)
+        self.live[id(usage)] = usage
+        for other in self.live.values():
+            other.concurrent = max(other.concurrent, len(self.live))
+        usage._token = _current.set(usage)
+        return usage
+
+    def end(self, usage: CallUsage):
+        _current.reset(usage._token)
+        self.live.pop(id(usage), None)
+        usage.ended_at = time.time()
+        usage._end = _sample()
+        usage._full_collections = _full_collections()
+        usage.tasks_left = sum(1 for task in usage.tasks if not task.done())
+        self.recent.append(usage)
+        self._pending.append(usage)
+        self.calls += 1
+
+    def watch(self, **objects):
+        """Objects that should be gone once the current call has ended"""
+        usage = _current.get()
+        if usage is None:
+            return
+        for name, obj in objects.items():
+            try:
+                usage.objects[name] = weakref.ref(obj)
+            except TypeError:
+                pass
+
+    async def _check_leaks(self):
+        while True:
+            await asyncio.sleep(1)
+            try:
+                self.check_leaks()
+            except Exception as e:
+                logger.warning(f"Resource leak check failed: {e}")
+
+    def check_leaks(self, force: bool = False):
+        """Check calls that ended at least `grace` seconds ago, or all ended calls if forced"""
+        now = time.time()
+        while self._pending and (force or now - self._pending[0].ended_at >= self.grace):
+            usage = self._pending[0]
+            alive = [name for name, ref in usage.objects.items() if ref() is not None]
+            if alive and (force or self.trace_memory):
+                if not force and time.monotonic() - self._last_gc < self.grace:
+                    # Wait for the next collection we're allowed
+                    return
+                gc.collect()
+                self._last_gc = time.monotonic()
+                alive = [name for name, ref in usage.objects.items() if ref() is not None]
+            elif alive and _full_collections() == usage._full_collections:
+                gc.collect(1)
+                alive = [name for name, ref in usage.objects.items() if ref() is not None]
+                if alive and now - usage.ended_at < self.grace * FULL_GC_WAIT:
+                    # Whatever is left may only be in a cycle; wait for a full collection
+                    return
+            self._pending.popleft()
+            usage.leaked_objects = alive
+            usage.leaked_tasks = [_task_name(task) for task in usage.tasks if not task.done()]
+            usage.objects = {}
+            if usage.leaked_objects or usage.leaked_tasks:
+                self.leaky_calls += 1
+                self.leaked_objects += len(usage.leaked_objects)
+                self.leaked_tasks += len(usage.leaked_tasks)
+                logger.warning(f"Call {usage.call_sid} left {usage.leaked_tasks} tasks and "
+                               f"{usage.leaked_objects} objects alive {now - usage.ended_at:.0f}s after it ended")
+
+    def stats(self) -> dict:
+        traced, traced_peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (None, None)
+        return {
+            "calls": self.calls,
+            "live": len(self.live),
+            "leaky_calls": self.leaky_calls,
+            "leaked_tasks": self.leaked_tasks,
+            "leaked_objects": self.leaked_objects,
+            "pending_leak_checks": len(self._pending),
+            "tasks": len(asyncio.all_tasks()),
+            "open_sockets": _open_sockets(),
+            "rss_bytes": _rss_bytes(),
+            "traced_bytes": traced,
+            "traced_peak_bytes": traced_peak,
+        }
+
+
+call_resources = CallResourceAccounting(
+    history=settings.RESOURCE_HISTORY,
+    grace=settings.RESOURCE_LEAK_GRACE,
+    trace_memory=settings.RESOURCE_TRACEMALLOC,
+)
+
+register(Gauge("call_leaked_tasks_total", "Tasks still running after the call that spawned them ended",
+               lambda: call_resources.leaked_tasks, type="counter"))
+register(Gauge("call_leaked_objects_total", "Pipeline objects still alive after their call ended",
+               lambda: call_resources.leaked_objects, type="counter"))
+register(Gauge("open_sockets", "Sockets this worker has open", lambda: _open_sockets() or 0))
@@ -0,0 +1,358 @@
+import asyncio
+import csv
+import heapq
+import io
+import itertools
+import json
+import logging
+import time
+import uuid
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional
+
+from config import settings
+from pool import pipeline_pool
+from sessions import WORKER_ID, callback_url, mailbox, session_registry
+from twilio_client import TwilioAPI, twilio_api
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {"busy", "no-answer"}
+FINAL_STATUSES = {"completed", "busy", "no-answer", "failed", "canceled"}
+NUMBER_COLUMNS = ("to_number", "phone", "phone_number", "number", "to")
+# How often changed campaign progress is shared with the other workers
+PUBLISH_INTERVAL = 1
+
+
+class TokenBucket:
+    """Async token bucket used to stay under Twilio's calls-per-second limit"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class Campaign:
+    def __init__(self, numbers: Iterable[str], name: Optional[str] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name or self.id
+        self.created_at = time.time()
+        self.finished_at = None
+        self.state = "running"
+        self.total = 0
+        self._pending = deque()
+        for number in numbers:
+            self._pending.append((number, 1))
+            self.total += 1
+        # (ready_at, seq, number, attempt) for busy/no-answer redials
+        self._retries = []
+        self._seq = itertools.count()
+        self.ringing: Dict[str, tuple] = {}
+        # call_sid -> answered_at (monotonic)
+        self.in_call: Dict[str, float] = {}
+        self.dialed = 0
+        self.outcomes: Dict[str, int] = {}
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+        self.task: Optional[asyncio.Task] = None
+
+    def pause(self):
+        if self.state == "running":
+            self.state = "paused"
+            self._resumed.clear()
+
+    def resume(self):
+        if self.state == "paused":
+            self.state = "running"
+            self._resumed.set()
+
+    @property
+    def done(self) -> bool:
+        # Answered calls still report their outcome when they hang up
+        return not self._pending and not self._retries and not self.ringing and not self.in_call
+
+    def progress(self) -> dict:
+        finished = sum(self.outcomes.values())
+        return {
+            "id": self.id,
+            "name": self.name,
+            "state": self.state,
+            "total": self.total,
+            "pending": len(self._pending),
+            "retry_scheduled": len(self._retries),
+            "ringing": len(self.ringing),
+            "in_call": len(self.in_call),
+            "dialed": self.dialed,
+            "finished": finished,
+            "outcomes": dict(self.outcomes),
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "worker_id": WORKER_ID,
+        }
+
+    def _next_ready(self):
+        """Next (number, attempt) to dial, or the seconds to wait for a retry"""
+        if self._retries and self._retries[0][0] <= time.monotonic():
+            _, _, number, attempt = heapq.heappop(self._retries)
+            return number, attempt
+        if self._pending:
+            return self._pending.popleft()
+        if self._retries:
+            return self._retries[0][0] - time.monotonic()
+        return None
+
+    def _schedule_retry(self, number: str, attempt: int):
+        delay = settings.CAMPAIGN_RETRY_BACKOFF * (2 ** (attempt - 1))
+        heapq.heappush(self._retries, (time.monotonic() + delay, next(self._seq), number, attempt + 1))
+
+
+class CampaignManager:
+    """Schedules campaign dials across every campaign on this worker.
+
+    All campaigns share one token bucket (Twilio's CPS limit is per account)
+    and one concurrency cap, counted as live run_bot pipelines plus campaign
+    calls still ringing.
+
+    A campaign lives on the worker that created it. Its calls' status
+    callbacks are routed back there through the worker mailbox, and its
+    progress is published to the session registry so any worker can report
+    it or forward a pause/resume.
+    """
+
+    def __init__(
+        self,
+        twilio: TwilioAPI,
+        live_pipelines: Callable[[], int],
+        cps: float,
+        max_concurrent_calls: int,
+    ):
+        self.twilio = twilio
+        self.live_pipelines = live_pipelines
+        self.max_concurrent_calls = max_concurrent_calls
+        self.bucket = TokenBucket(cps)
+        self.campaigns: Dict[str, Campaign] = {}
+        self._calls: Dict[str, Campaign] = {}
+        self._capacity_changed = asyncio.Event()
+        self._published: Dict[str, tuple] = {}
+        self._publisher: Optional[asyncio.Task] = None
+
+    def create(self, numbers: Iterable[str], name: Optional[str] = None) -> Campaign:
+        campaign = Campaign(numbers, name)
+        self.campaigns[campaign.id] = campaign
+        campaign.task = asyncio.get_running_loop().create_task(self._run(campaign))
+        if self._publisher is None or self._publisher.done():
+            self._publisher = asyncio.get_running_loop().create_task(self._publish())
+        logger.info(f"Campaign {campaign.id} created with {campaign.total} numbers")
+        return campaign
+
+    def in_use(self) -> int:
+        ringing = sum(len(c.ringing) for c in self.campaigns.values())
+        return self.live_pipelines() + ringing
+
+    def handle_status(self, call_sid: str, status: str):
+        """Twilio status callback for a campaign call"""
+        campaign = self._calls.get(call_sid)
+        if campaign is None:
+            return
+        if status == "in-progress":
+            # Answered; the call now counts as a live pipeline instead
+            campaign.ringing.pop(call_sid, None)
+            campaign.in_call[call_sid] = time.monotonic()
+        elif status in FINAL_STATUSES:
+            self._calls.pop(call_sid, None)
+            campaign.in_call.pop(call_sid, None)
+            number, attempt, _ = campaign.ringing.pop(call_sid, (None, None, None))
+            if number is not None and status in RETRY_STATUSES and attempt < settings.CAMPAIGN_MAX_ATTEMPTS:
+                campaign._schedule_retry(number, attempt)
+            else:
+                campaign.outcomes[status] = campaign.outcomes.get(status, 0) + 1
+        self._capacity_changed.set()
+
+    def handle_command(self, campaign_id: str, action: str):
+        """Pause or resume a campaign on behalf of another worker"""
+        campaign = self.campaigns.get(campaign_id)
+        if campaign is None:
+            logger.warning(f"{action} for unknown campaign {campaign_id}")
+        elif action == "pause":
+            campaign.pause()
+        elif action == "resume":
+            campaign.resume()
+
+    async def snapshot(self, campaign_id: str) -> Optional[dict]:
+        """Progress of a campaign on any worker, as last published"""
+        campaign = self.campaigns.get(campaign_id)
+        if campaign is not None:
+            return campaign.progress()
+        return await session_registry.lookup(f"campaign:{campaign_id}")
+
+    async def close(self):
+        for campaign in self.campaigns.values():
+            if campaign.task and not campaign.task.done():
+                campaign.task.cancel()
+        if self._publisher:
+            self._publisher.cancel()
+
+    async def _publish(self):
+        while True:
+            await asyncio.sleep(PUBLISH_INTERVAL)
+            self._evict_finished()
+            now = time.monotonic()
+            for campaign in list(self.campaigns.values()):
+                progress = campaign.progress()
+                last, published_at = self._published.get(campaign.id, (None, 0))
+                # Republish unchanged progress before its TTL runs out
+                if progress == last and now - published_at < settings.CAMPAIGN_RETENTION / 2:
+                    continue
+                try:
+                    await session_registry.publish(f"campaign:{campaign.id}", progress, settings.CAMPAIGN_RETENTION)
+                    self._published[campaign.id] = (progress, now)
+                except Exception as e:
+                    logger.error(f"Failed to publish campaign {campaign.id} progress: {e}")
+
+    async def _wait_for_capacity(self):
+        while self.in_use() >= self.max_concurrent_calls:
+            self._expire_calls()
+            self._capacity_changed.clear()
+            try:
+                # Pipelines ending don't signal us, so poll as a fallback
+                await asyncio.wait_for(self._capacity_changed.wait(), timeout=0.5)
+            except asyncio.TimeoutError:
+                pass
+
+    def _expire_calls(self):
+        """Forget calls whose status callback never arrived"""
+        now = time.monotonic()
+        for campaign in self.campaigns.values():
+            for call_sid, (_, _, dialed_at) in list(campaign.ringing.items()):
+                if dialed_at < now - settings.CAMPAIGN_RING_TIMEOUT:
+                    self.handle_status(call_sid, "failed")
+            for call_sid, answered_at in list(campaign.in_call.items()):
+                if answered_at < now - settings.CAMPAIGN_MAX_CALL_DURATION:
+                    logger.warning(f"Campaign {campaign.id} never heard how call {call_sid} ended")
+                    self._calls.pop(call_sid, None)
+                    del campaign.in_call[call_sid]
+                    campaign.outcomes["expired"] = campaign.outcomes.get("expired", 0) + 1
+
+    def _evict_finished(self):
+        """Drop campaigns that ended more than CAMPAIGN_RETENTION ago"""
+        cutoff = time.time() - settings.CAMPAIGN_RETENTION
+        for campaign in list(self.campaigns.values()):
+            if campaign.finished_at is not None and campaign.finished_at < cutoff:
+                del self.campaigns[campaign.id]
+                self._published.pop(campaign.id, None)
+                for call_sid in list(campaign.ringing) + list(campaign.in_call):
+                    self._calls.pop(call_sid, None)
+
+    async def _run(self, campaign: Campaign):
+        try:
+            while not campaign.done:
+                await campaign._resumed.wait()
+                item = campaign._next_ready()
+                if item is None:
+                    # Only ringing or answered calls left; wait for their outcome
+                    self._capacity_changed.clear()
+                    try:
+                        await asyncio.wait_for(self._capacity_changed.wait(), timeout=1)
+                    except asyncio.TimeoutError:
+                        self._expire_calls()
+                    continue
+                if isinstance(item, float):
+                    await asyncio.sleep(min(item, 1))
+                    continue
+
+                number, attempt = item
+                await self._wait_for_capacity()
+                await self.bucket.acquire()
+                if campaign.state == "paused":
+                    campaign._pending.appendleft(item)
+                    continue
+                await self._dial(campaign, number, attempt)
+
+            campaign.state = "finished"
+            campaign.finished_at = time.time()
+            logger.info(f"Campaign {campaign.id} finished: {campaign.outcomes}")
+        except asyncio.CancelledError:
+            campaign.state = "cancelled"
+            campaign.finished_at = time.time()
+            raise
+        except Exception as e:
+            campaign.state = "failed"
+            campaign.finished_at = time.time()
+            logger.error(f"Campaign {campaign.id} failed: {e}")
+
+    async def _dial(self, campaign: Campaign, number: str, attempt: int):
+        campaign.dialed += 1
+        try:
+            call = await self.twilio.create_call(
+                to=number,
+                url=f"https://{settings.HOST}/agent",
+                method="POST",
+                status_callback=callback_url("/campaigns/status"),
+                status_callback_event=["answered", "completed"],
+                status_callback_method="POST",
+            )
+        except Exception as e:
+            logger.error(f"Campaign {campaign.id} failed to dial {number}: {e}")
+            if attempt < settings.CAMPAIGN_MAX_ATTEMPTS:
+                campaign._schedule_retry(number, attempt)
+            else:
+                campaign.outcomes["failed"] = campaign.outcomes.get("failed", 0) + 1
+            return
+        campaign.ringing[call.sid] = (number, attempt, time.monotonic())
+        self._calls[call.sid] = campaign
+
+
+def parse_numbers(data: bytes, filename: str = "") -> List[str]:
+    """Read phone numbers from a CSV (first/number column) or JSON upload"""
+    text = data.decode("utf-8-sig")
+    if filename.endswith(".json") or text.lstrip().startswith(("[", "{")):
+        payload = json.loads(text)
+        if isinstance(payload, dict):
+            payload = payload.get("numbers", [])
+        return [_clean(n) for n in payload if _clean(n)]
+
+    rows = csv.reader(io.StringIO(text))
+    column = 0
+    numbers = []
+    for i, row in enumerate(rows):
+        if not row:
+            continue
+        if i == 0:
+            header = [c.strip().lower() for c in row]
+            matches = [header.index(c) for c in NUMBER_COLUMNS if c in header]
+            if matches:
+                column = matches[0]
+                continue
+        if column < len(row) and _clean(row[column]):
+            numbers.append(_clean(row[column]))
+    return numbers
+
+
+def _clean(number) -> str:
+    if isinstance(number, dict):
+        number = next((number[c] for c in NUMBER_COLUMNS if c in number), "")
+    return "".join(ch for ch in str(number) if ch.isdigit() or ch == "+")
+
+
+campaign_manager = CampaignManager(
+    twilio_api,
+    live_pipelines=lambda: pipeline_pool.checked_out,
+    cps=settings.CAMPAIGN_CPS,
+    max_concurrent_calls=settings.CAMPAIGN_MAX_CONCURRENT_CALLS,
+)
+mailbox.on("campaign_status", lambda m: campaign_manager.handle_status(m["call_sid"], m["status"]))
+mailbox.on("campaign_command", lambda m: campaign_manager.handle_command(m["campaign_id"], m["action"]))
@@ -14,4 +14,206 @@ class Settings:
     CARTESIA_API_KEY: str = os.getenv("CARTESIA_API_KEY")
     HOST: str = os.getenv("HOST")
 
+    # Pipeline backends, see providers.py; only the selected ones are imported
+    STT_PROVIDER: str = os.getenv("STT_PROVIDER", "cartesia")
+    TTS_PROVIDER: str = os.getenv("TTS_PROVIDER", "elevenlabs")
+    LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "openai")
+    # Comma-separated providers to fall back to, after STT_PROVIDER/TTS_PROVIDER.
+    # With any set, calls start on whichever has the best rolling latency and
+    # error score and switch mid-call when it stalls or errors; see routing.py
+    STT_FALLBACKS: str = os.getenv("STT_FALLBACKS", "")
+    TTS_FALLBACKS: str = os.getenv("TTS_FALLBACKS", "")
+    # No final transcript this long after the user stopped / no audio this
+    # long after the first text of a response counts as a stall
+    STT_STALL_TIMEOUT: float = float(os.getenv("STT_STALL_TIMEOUT", "1.5"))
+    TTS_STALL_TIMEOUT: float = float(os.getenv("TTS_STALL_TIMEOUT", "2.0"))
+    # "stt", "tts" or "stt,tts": race the two best providers on a call's first
+    # turn and keep whichever answers first
+    PROVIDER_HEDGE_FIRST_TURN: str = os.getenv("PROVIDER_HEDGE_FIRST_TURN", "")
+    # Consecutive failures before a provider is skipped for the cooldown
+    PROVIDER_BREAKER_FAILURES: int = int(os.getenv("PROVIDER_BREAKER_FAILURES", "3"))
+    PROVIDER_BREAKER_COOLDOWN: float = float(os.getenv("PROVIDER_BREAKER_COOLDOWN", "30"))
+
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    # Fraction of calls that log at DEBUG regardless of LOG_LEVEL (0.0-1.0)
+    LOG_DEBUG_SAMPLE_RATE: float = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0"))
+
+    # Number of pre-built pipeline component sets kept warm per worker
+    PIPELINE_POOL_SIZE: int = int(os.getenv("PIPELINE_POOL_SIZE", "4"))
+
+    # Concurrent run_bot pipelines one worker advertises; /agent sheds calls
+    # once every live worker is at capacity, and a stream that lands on a
+    # full worker is sent back through /agent once
+    MAX_CALLS_PER_WORKER: int = int(os.getenv("MAX_CALLS_PER_WORKER", "8"))
+    # memory:// (single worker), sqlite:///path (workers on one host) or redis://.
+    # Pre-connects, greeting timing and the supervisor dashboard stay per
+    # process: with more workers (WEB_CONCURRENCY) a call's pre-connect may
+    # sit on a worker its stream never reaches, and a dashboard only sees
+    # its own worker's calls
+    SESSION_REGISTRY_URL: str = os.getenv("SESSION_REGISTRY_URL", "memory://")
+    WORKER_HEARTBEAT_INTERVAL: float = float(os.getenv("WORKER_HEARTBEAT_INTERVAL", "5"))
+    WORKER_HEARTBEAT_TTL: float = float(os.getenv("WORKER_HEARTBEAT_TTL", "15"))
+    # How often a worker collects Twilio callbacks other workers received for its calls
+    MAILBOX_POLL_INTERVAL: float = float(os.getenv("MAILBOX_POLL_INTERVAL", "0.25"))
+    # How long an admitted call may take to open its media stream
+    CALL_RESERVATION_TTL: float = float(os.getenv("CALL_RESERVATION_TTL", "30"))
+    # On SIGTERM/SIGINT, how long live calls get to finish before the worker
+    # exits anyway. It must end inside the platform's termination window:
+    # Cloud Run kills the container 10s after SIGTERM, so only raise it where
+    # the grace period (Kubernetes terminationGracePeriodSeconds, gunicorn
+    # --graceful-timeout) is raised to match, plus a few seconds for teardown
+    DRAIN_TIMEOUT: float = float(os.getenv("DRAIN_TIMEOUT", "8"))
+    # Open the call's STT/TTS sessions and warm the LLM connection from /agent,
+    # while the greeting plays; /ws adopts them. Unclaimed ones close after the TTL
+    PRECONNECT_ENABLED: bool = os.getenv("PRECONNECT_ENABLED", "true").lower() == "true"
+    PRECONNECT_TTL: float = float(os.getenv("PRECONNECT_TTL", "30"))
+    # Multiplex every call's LLM requests over HTTP/2 when the h2 package is installed
+    LLM_HTTP2: bool = os.getenv("LLM_HTTP2", "true").lower() == "true"
+    BUSY_MESSAGE: str = os.getenv(
+        "BUSY_MESSAGE",
+        "Sorry, all our lines are busy right now. Please hold on, we'll call you back shortly.",
+    )
+
+    # Agents, their prompts and numbers. Every worker keeps all of them in
+    # memory: changes are picked up by polling every AGENT_CACHE_POLL_INTERVAL,
+    # and everything is re-read every AGENT_CACHE_TTL in case one was missed
+    DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///agents.db")
+    AGENT_CACHE_TTL: float = float(os.getenv("AGENT_CACHE_TTL", "300"))
+    AGENT_CACHE_POLL_INTERVAL: float = float(os.getenv("AGENT_CACHE_POLL_INTERVAL", "5"))
+
+    # End of turn: VAD waits VAD_STOP_SECS of silence before the caller's turn
+    # is over. With TURN_ADAPTIVE_VAD that follows each caller's own pauses,
+    # between TURN_MIN_STOP_SECS and TURN_MAX_STOP_SECS
+    VAD_STOP_SECS: float = float(os.getenv("VAD_STOP_SECS", "0.8"))
+    TURN_ADAPTIVE_VAD: bool = os.getenv("TURN_ADAPTIVE_VAD", "true").lower() == "true"
+    TURN_MIN_STOP_SECS: float = float(os.getenv("TURN_MIN_STOP_SECS", "0.4"))
+    TURN_MAX_STOP_SECS: float = float(os.getenv("TURN_MAX_STOP_SECS", "1.2"))
+    # Start the LLM on interim transcripts that have been unchanged this long,
+    # and use the response if the final transcript says the same
+    TURN_SPECULATION: bool = os.getenv("TURN_SPECULATION", "true").lower() == "true"
+    TURN_SPECULATION_SETTLE: float = float(os.getenv("TURN_SPECULATION_SETTLE", "0.25"))
+
+    # Warm transfer to a human agent (transfer_call). Once the caller's words
+    # match TRANSFER_INTEREST_PATTERN the agent is dialed into a conference
+    # and held there, so the transfer itself only has to move the caller in
+    TRANSFER_NUMBER: str = os.getenv("TRANSFER_NUMBER")
+    TRANSFER_PREDIAL: bool = os.getenv("TRANSFER_PREDIAL", "true").lower() == "true"
+    TRANSFER_INTEREST_PATTERN: str = os.getenv(
+        "TRANSFER_INTEREST_PATTERN",
+        r"\b(compar\w*|sav(e|ing)|deals?|cheaper|overpay\w*|better (rate|deal|price|plan))\b",
+    )
+    # Hang up a pre-dialed agent the call hasn't needed after this long
+    TRANSFER_HOLD_TIMEOUT: float = float(os.getenv("TRANSFER_HOLD_TIMEOUT", "120"))
+    # Longest the bot's last line may hold up the transfer
+    TRANSFER_SPEECH_WAIT: float = float(os.getenv("TRANSFER_SPEECH_WAIT", "8"))
+    # Optional URL that gets the reason and transcript as JSON when a transfer starts
+    TRANSFER_HANDOFF_URL: str = os.getenv("TRANSFER_HANDOFF_URL")
+    TRANSFER_UNAVAILABLE_MESSAGE: str = os.getenv(
+        "TRANSFER_UNAVAILABLE_MESSAGE",
+        "Sorry, our specialists are all busy right now. We'll give you a call back shortly.",
+    )
+
+    # Shared keep-alive connection pool for the Twilio REST API
+    TWILIO_HTTP_POOL_SIZE: int = int(os.getenv("TWILIO_HTTP_POOL_SIZE", "20"))
+    TWILIO_HTTP_KEEPALIVE: float = float(os.getenv("TWILIO_HTTP_KEEPALIVE", "60"))
+    TWILIO_HTTP_TIMEOUT: float = float(os.getenv("TWILIO_HTTP_TIMEOUT", "10"))
+
+    # Outbound campaign dialer
+    CAMPAIGN_CPS: float = float(os.getenv("CAMPAIGN_CPS", "1"))
+    CAMPAIGN_MAX_CONCURRENT_CALLS: int = int(os.getenv("CAMPAIGN_MAX_CONCURRENT_CALLS", "8"))
+    CAMPAIGN_MAX_ATTEMPTS: int = int(os.getenv("CAMPAIGN_MAX_ATTEMPTS", "3"))
+    CAMPAIGN_RETRY_BACKOFF: float = float(os.getenv("CAMPAIGN_RETRY_BACKOFF", "120"))
+    CAMPAIGN_RING_TIMEOUT: float = float(os.getenv("CAMPAIGN_RING_TIMEOUT", "90"))
+    # Answered calls whose completed callback never arrives count as "expired" after this
+    CAMPAIGN_MAX_CALL_DURATION: float = float(os.getenv("CAMPAIGN_MAX_CALL_DURATION", "3600"))
+    # How long a finished campaign's progress can still be queried, from any worker
+    CAMPAIGN_RETENTION: float = float(os.getenv("CAMPAIGN_RETENTION", "3600"))
+
+    # Pre-rendered TTS phrase cache
+    TTS_CACHE_ENABLED: bool = os.getenv("TTS_CACHE_ENABLED", "true").lower() == "true"
+    TTS_CACHE_DIR: str = os.getenv("TTS_CACHE_DIR", ".tts_cache")
+    TTS_CACHE_MEMORY_BYTES: int = int(os.getenv("TTS_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024)))
+    # Render a phrase into the cache after this many misses
+    TTS_CACHE_FILL_AFTER: int = int(os.getenv("TTS_CACHE_FILL_AFTER", "2"))
+
+    # Short clips ("hmm", "right, so...") played when the reply's first audio
+    # is late, rendered once in the ElevenLabs voice or read from
+    # FILLER_AUDIO_DIR (one .wav/.mp3 per clip, named after its text)
+    FILLER_ENABLED: bool = os.getenv("FILLER_ENABLED", "true").lower() == "true"
+    # Seconds after the user stops speaking with no reply audio before a filler plays
+    FILLER_DELAY: float = float(os.getenv("FILLER_DELAY", "0.4"))
+    FILLER_PHRASES: str = os.getenv("FILLER_PHRASES", "Hmm.|Um,|Right, so...|Okay.|Let me see.|Mm-hm.|Ah, right.")
+    FILLER_AUDIO_DIR: str = os.getenv("FILLER_AUDIO_DIR", "")
+
+    # Finished-call transcripts and latency stats: a local directory or gs://bucket/prefix
+    CALL_RECORDS_SINK: str = os.getenv("CALL_RECORDS_SINK", "call_records")
+    CALL_RECORDS_QUEUE_SIZE: int = int(os.getenv("CALL_RECORDS_QUEUE_SIZE", "10000"))
+    # A segment is flushed at whichever limit it hits first
+    CALL_RECORDS_SEGMENT_RECORDS: int = int(os.getenv("CALL_RECORDS_SEGMENT_RECORDS", "500"))
+    CALL_RECORDS_SEGMENT_BYTES: int = int(os.getenv("CALL_RECORDS_SEGMENT_BYTES", str(8 * 1024 * 1024)))
+    CALL_RECORDS_FLUSH_INTERVAL: float = float(os.getenv("CALL_RECORDS_FLUSH_INTERVAL", "30"))
+    CALL_RECORDS_MAX_RETRIES: int = int(os.getenv("CALL_RECORDS_MAX_RETRIES", "5"))
+
+    # Call audio: "full" records every call in-process as stereo (caller,
+    # bot) 8 kHz μ-law WAV chunks, "segments" only keeps the last
+    # RECORDING_BUFFER_SECONDS and writes them out at marked moments (a
+    # transfer), "twilio" asks Twilio to record instead, "off" records nothing.
+    # Twilio keeps recordings durably; only switch once RECORDING_SINK is too
+    RECORDING_MODE: str = os.getenv("RECORDING_MODE", "twilio")
+    # A local directory or gs://bucket/prefix; local disk on Cloud Run is lost on scale-in
+    RECORDING_SINK: str = os.getenv("RECORDING_SINK", "recordings")
+    RECORDING_CHUNK_SECONDS: float = float(os.getenv("RECORDING_CHUNK_SECONDS", "30"))
+    RECORDING_BUFFER_SECONDS: float = float(os.getenv("RECORDING_BUFFER_SECONDS", "30"))
+    # Across all calls on the worker; past it calls lose their oldest unwritten audio
+    RECORDING_MAX_MEMORY: int = int(os.getenv("RECORDING_MAX_MEMORY", str(128 * 1024 * 1024)))
+    RECORDING_MAX_RETRIES: int = int(os.getenv("RECORDING_MAX_RETRIES", "5"))
+
+    # Per-call accounting of tasks, memory, CPU and sockets, kept for the last
+    # RESOURCE_HISTORY calls at /admin/resources
+    RESOURCE_ACCOUNTING: bool = os.getenv("RESOURCE_ACCOUNTING", "true").lower() == "true"
+    RESOURCE_HISTORY: int = int(os.getenv("RESOURCE_HISTORY", "500"))
+    # tracemalloc slows every allocation down; turn it on for soak tests and leak hunts
+    RESOURCE_TRACEMALLOC: bool = os.getenv("RESOURCE_TRACEMALLOC", "false").lower() == "true"
+    # A call's tasks and pipeline objects still alive this long after it ends count as leaked
+    RESOURCE_LEAK_GRACE: float = float(os.getenv("RESOURCE_LEAK_GRACE", "10"))
+
+    # Post-call analysis (POST /analyze-calls): LLM requests in flight across
+    # all batches, and how many answered question sets to keep cached
+    ANALYSIS_MODEL: str = os.getenv("ANALYSIS_MODEL", "gpt-4o-mini")
+    ANALYSIS_CONCURRENCY: int = int(os.getenv("ANALYSIS_CONCURRENCY", "16"))
+    ANALYSIS_CACHE_SIZE: int = int(os.getenv("ANALYSIS_CACHE_SIZE", "10000"))
+    ANALYSIS_MAX_TOKENS: int = int(os.getenv("ANALYSIS_MAX_TOKENS", "500"))
+
+    # Live dashboard fan-out: events are batched per tick, and each client
+    # keeps at most DASHBOARD_QUEUE_SIZE batches before the oldest are dropped
+    DASHBOARD_TICK: float = float(os.getenv("DASHBOARD_TICK", "0.1"))
+    DASHBOARD_QUEUE_SIZE: int = int(os.getenv("DASHBOARD_QUEUE_SIZE", "64"))
+
+    # Per-frame μ-law/resampling for the Twilio media stream: "pipecat"
+    # (audioop + soxr) or "numpy" (audio_codec lookup tables + polyphase
+    # resampler, no audioop); see benchmarks/audio_codec.py
+    AUDIO_CODEC: str = os.getenv("AUDIO_CODEC", "pipecat")
+    # Build outbound media messages from a precompiled envelope and slice
+    # inbound payloads out without json.loads (AUDIO_CODEC=numpy always
+    # does); see benchmarks/twilio_serializer.py
+    TWILIO_MEDIA_FAST_PATH: bool = os.getenv("TWILIO_MEDIA_FAST_PATH", "true").lower() == "true"
+    # Outbound audio is held up to this many seconds and sent as fewer,
+    # larger media messages, with Twilio kept twice this much ahead of
+    # playout; 0 sends every chunk as it's played
+    TWILIO_COALESCE_BUDGET: float = float(os.getenv("TWILIO_COALESCE_BUDGET", "0.08"))
+
+    # Hard cap on tokens sent to the LLM per request, system prompt included.
+    # Past CONTEXT_SUMMARIZE_AT of it, older turns are summarised in the
+    # background; the last CONTEXT_KEEP_RECENT_MESSAGES always stay verbatim
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+    CONTEXT_SUMMARIZE_AT: float = float(os.getenv("CONTEXT_SUMMARIZE_AT", "0.7"))
+    CONTEXT_KEEP_RECENT_MESSAGES: int = int(os.getenv("CONTEXT_KEEP_RECENT_MESSAGES", "6"))
+    CONTEXT_SUMMARY_MODEL: str = os.getenv("CONTEXT_SUMMARY_MODEL", "gpt-4o-mini")
+    CONTEXT_SUMMARY_MAX_TOKENS: int = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "200"))
+
+    # "play" has Twilio fetch the greeting with <Play>; "stream" decodes it once
+    # at startup and sends it down the media stream as soon as /ws starts
+    GREETING_MODE: str = os.getenv("GREETING_MODE", "play")
+    GREETING_AUDIO: str = os.getenv("GREETING_AUDIO", "static/twiml_greeting.mp3")
+
 settings = Settings()
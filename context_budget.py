@@ -0,0 +1,232 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pipecat.frames.frames import Frame
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext, OpenAILLMContextFrame
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+from config import settings
+from metrics import Gauge, prompt_tokens_by_turn, register, turn_bucket
+from utils.logging import call_debug_enabled
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREFIX = "Summary of the conversation so far:\n"
+SUMMARY_INSTRUCTIONS = (
+    "You condense phone call transcripts for a voice agent. Merge the previous summary "
+    "and the new turns into one short summary. Keep names, numbers, what the caller "
+    "agreed to or declined, open questions and the agent's last commitments. "
+    "Plain sentences, no more than 120 words."
+)
+
+# Chat format overhead per message (role, separators), as OpenAI counts it
+MESSAGE_OVERHEAD = 4
+
+try:
+    # Optional; without it token counts are estimated from the text length
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding("o200k_base")
+
+    def count_text_tokens(text: str) -> int:
+        return len(_encoding.encode(text, disallowed_special=()))
+except ImportError:
+    def count_text_tokens(text: str) -> int:
+        return len(text) // 4 + 1
+
+
+def count_message_tokens(message: dict) -> int:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    tokens = MESSAGE_OVERHEAD + count_text_tokens(content)
+    for call in message.get("tool_calls") or ():
+        tokens += count_text_tokens(str(call.get("function", "")))
+    return tokens
+
+
+Summarizer = Callable[[str, List[dict]], Awaitable[str]]
+
+
+def openai_summarizer(client, model: str, max_tokens: int) -> Summarizer:
+    """Summarise with the call's own AsyncOpenAI client (same keep-alive pool)"""
+
+    async def summarize(previous: str, messages: List[dict]) -> str:
+        transcript = "\n".join(
+            f"{m['role']}: {m.get('content') or ''}" for m in messages if m.get("content")
+        )
+        response = await client.chat.completions.create(
+            model=model,
+            max_tokens=max_tokens,
+            temperature=0,
+            messages=[
+                {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                {"role": "user", "content": f"Previous summary:\n{previous or '(none)'}\n\nNew turns:\n{transcript}"},
+            ],
+        )
+        return response.choices[0].message.content.strip()
+
+    return summarize
+
+
+class ContextBudget(FrameProcessor):
+    """Keeps a call's LLM context under a hard token budget.
+
+    Sits between the user context aggregator and the LLM. The system prompt
+    always stays first and unchanged, so providers can cache it as a prefix;
+    older turns are folded into a single summary message right after it.
+
+    Messages are counted once, when they first show up. Past
+    `summarize_at` tokens the oldest turns are summarised in the background
+    and swapped in on a later turn, so a request never waits on it. If the
+    context is still over `budget` when a request goes out, the oldest turns
+    are dropped instead. Everything that leaves the context is kept in
+    `archived` so the full transcript can still be saved.
+    """
+
+    # Process-wide counters for /metrics
+    summarized = 0
+    truncated = 0
+
+    def __init__(
+        self,
+        context: OpenAILLMContext,
+        summarize: Optional[Summarizer] = None,
+        budget: int = settings.CONTEXT_TOKEN_BUDGET,
+        summarize_at: float = settings.CONTEXT_SUMMARIZE_AT,
+        keep_recent: int = settings.CONTEXT_KEEP_RECENT_MESSAGES,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self._context = context
+        self._summarize = summarize
+        self.budget = budget
+        self.summarize_at = int(budget * summarize_at)
+        self.keep_recent = keep_recent
+        self.archived: List[dict] = []
+        self.prompt_tokens: List[int] = []
+        self._summary_message: Optional[dict] = None
+        # id(message) -> (message, tokens); holding the message keeps its id unique
+        self._counts: Dict[int, Tuple[dict, int]] = {}
+        self._summary_task: Optional[asyncio.Task] = None
+        self._summary_result: Optional[Tuple[List[dict], str]] = None
+
+    def note_tokens(self, message: dict, tokens: int):
+        """Use a count made earlier, e.g. a precompiled system prompt's"""
+        self._counts[id(message)] = (message, tokens)
+
+    def _tokens(self, message: dict) -> int:
+        entry = self._counts.get(id(message))
+        if entry is None or entry[0] is not message:
+            entry = (message, count_message_tokens(message))
+            self._counts[id(message)] = entry
+        return entry[1]
+
+    def _split(self, messages: List[dict]) -> Tuple[List[dict], List[dict]]:
+        """(system prefix incl. summary, conversation turns)"""
+        prefix = 0
+        while prefix < len(messages) and messages[prefix].get("role") == "system":
+            prefix += 1
+        return messages[:prefix], messages[prefix:]
+
+    def full_messages(self) -> List[dict]:
+        """The whole conversation, including turns no longer sent to the LLM"""
+        prefix, history = self._split(self._context.get_messages())
+        prefix = [m for m in prefix if m is not self._summary_message]
+        return prefix + self.archived + history
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if isinstance(frame, OpenAILLMContextFrame) and frame.context is self._context:
+            tokens = self._enforce()
+            self.prompt_tokens.append(tokens)
+            prompt_tokens_by_turn[turn_bucket(len(self.prompt_tokens))].observe(tokens)
+        await self.push_frame(frame, direction)
+
+    def _enforce(self) -> int:
+        self._apply_summary()
+        messages = self._context.get_messages()
+        total = sum(self._tokens(m) for m in messages)
+        if total > self.summarize_at and self._summarize and self._summary_task is None:
+            self._start_summary()
+        if total > self.budget:
+            total = self._truncate(total)
+        # Forget counts for messages that have left the context
+        if len(self._counts) > len(messages):
+            live = {id(m) for m in messages}
+            self._counts = {k: v for k, v in self._counts.items() if k in live}
+        return total
+
+    def _start_summary(self):
+        _, history = self._split(self._context.get_messages())
+        # Cut at a user message so a question and its answer stay together
+        cut = len(history) - self.keep_recent
+        while cut > 0 and history[cut].get("role") != "user":
+            cut -= 1
+        if cut <= 0:
+            return
+        older = history[:cut]
+        previous = self._summary_message["content"][len(SUMMARY_PREFIX):] if self._summary_message else ""
+        self._summary_task = self.create_task(self._run_summary(previous, older))
+
+    async def _run_summary(self, previous: str, older: List[dict]):
+        try:
+            text = await self._summarize(previous, older)
+            self._summary_result = (older, text)
+        except Exception as e:
+            logger.error(f"Failed to summarise call context: {e}")
+        finally:
+            self._summary_task = None
+
+    def _apply_summary(self):
+        if self._summary_result is None:
+            return
+        older, text = self._summary_result
+        self._summary_result = None
+        covered = {id(m) for m in older}
+        messages = self._context.get_messages()
+        prefix, history = self._split(messages)
+        start = 0
+        while start < len(history) and id(history[start]) in covered:
+            start += 1
+        self.archived.extend(history[:start])
+        summary = {"role": "system", "content": SUMMARY_PREFIX + text}
+        prefix = [m for m in prefix if m is not self._summary_message] + [summary]
+        self._summary_message = summary
+        self._context.set_messages(prefix + history[start:])
+        ContextBudget.summarized += 1
+        if call_debug_enabled():
+            logger.debug(f"Folded {start} messages into the context summary")
+
+    def _truncate(self, total: int) -> int:
+        prefix, history = self._split(self._context.get_messages())
+        dropped = 0
+        # Always keep the turn being answered
+        while total > self.budget and dropped < len(history) - 1:
+            total -= self._tokens(history[dropped])
+            dropped += 1
+        # Cut at a user message, as summaries do: the API rejects a tool
+        # reply whose call was dropped, or a call whose reply was
+        cut = dropped
+        while 0 < cut < len(history) and history[cut].get("role") != "user":
+            cut += 1
+        if cut == len(history):
+            # No user message left to cut at; keep the tool calls being answered
+            cut = dropped
+            while cut > 0 and history[cut].get("role") == "tool":
+                cut -= 1
+        total -= sum(self._tokens(m) for m in history[dropped:cut])
+        total += sum(self._tokens(m) for m in history[cut:dropped])
+        dropped = cut
+        if dropped:
+            self.archived.extend(history[:dropped])
+            self._context.set_messages(prefix + history[dropped:])
+            ContextBudget.truncated += 1
+            logger.warning(f"Context over {self.budget} tokens, dropped {dropped} oldest messages")
+        return total
+
+
+register(Gauge("context_summaries_total", "Older turns folded into a call's context summary",
+               lambda: ContextBudget.summarized, type="counter"))
+register(Gauge("context_truncations_total", "LLM requests that had to drop turns to fit the token budget",
+               lambda: ContextBudget.truncated, type="counter"))
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict, deque
+from typing import Dict, List, Optional, Set
+
+from config import settings
+from metrics import Gauge, register
+from state import frontend_clients
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """One dashboard connection with its own bounded outbox.
+
+    When the browser can't keep up the oldest batches are dropped, so the
+    hub never waits on a slow client and memory per client stays bounded.
+    """
+
+    def __init__(self, websocket, call_sid: Optional[str], max_queue: int):
+        self.websocket = websocket
+        self.call_sid = call_sid
+        self.outbox = deque(maxlen=max_queue)
+        self.dropped = 0
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def offer(self, message: str) -> bool:
+        """Queue a batch, returning False if an older one had to be dropped"""
+        full = len(self.outbox) == self.outbox.maxlen
+        if full:
+            self.dropped += 1
+        self.outbox.append(message)
+        self._ready.set()
+        return not full
+
+    async def _send_loop(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            while self.outbox:
+                await self.websocket.send_text(self.outbox.popleft())
+
+
+class TranscriptHub:
+    """Fans live call events out to dashboard subscribers.
+
+    Live calls `publish` events, which only appends to a list. Once per `tick`
+    the hub groups pending events by call, serialises each group once, and
+    hands the result to the outbox of every subscriber watching that call
+    (or all calls).
+
+    Both sides live in this process: a dashboard only sees calls running on
+    the worker its websocket reached, so with more than one worker
+    (WEB_CONCURRENCY) a supervisor sees only part of the traffic. Run a
+    single worker where the dashboard has to show every call.
+    """
+
+    def __init__(self, subscribers: Set[Subscriber], tick: float, max_queue: int):
+        self.subscribers = subscribers
+        self.tick = tick
+        self.max_queue = max_queue
+        self._pending: List[tuple] = []
+        self._task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.batches = 0
+        self.dropped = 0
+
+    def publish(self, call_sid: str, event: dict):
+        """Queue an event for the next tick; safe to call from the pipeline"""
+        self._pending.append((call_sid, event))
+        self.published += 1
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        for subscriber in list(self.subscribers):
+            if subscriber._task:
+                subscriber._task.cancel()
+
+    async def serve(self, websocket, call_sid: Optional[str] = None):
+        """Stream events to a dashboard websocket until it disconnects.
+
+        The client may switch what it watches by sending
+        {"call_sid": "CA..."} or {"call_sid": null} for every call.
+        """
+        subscriber = Subscriber(websocket, call_sid, self.max_queue)
+        subscriber._task = asyncio.get_running_loop().create_task(subscriber._send_loop())
+        self.subscribers.add(subscriber)
+        try:
+            while True:
+                message = json.loads(await websocket.receive_text())
+                if isinstance(message, dict) and "call_sid" in message:
+                    subscriber.call_sid = message["call_sid"]
+        except Exception as e:
+            logger.info(f"Dashboard client disconnected: {e!r}")
+        finally:
+            self.subscribers.discard(subscriber)
+            subscriber._task.cancel()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            if not self._pending:
+                continue
+            try:
+                self._flush()
+            except Exception as e:
+                logger.error(f"Failed to fan out dashboard events: {e}")
+
+    def _flush(self):
+        pending, self._pending = self._pending, []
+        by_call: Dict[str, List[dict]] = defaultdict(list)
+        for call_sid, event in pending:
+            by_call[call_sid].append(event)
+        sent_at = time.time()
+        per_call: Dict[str, str] = {}
+        everything = None
+        for subscriber in list(self.subscribers):
+            if subscriber.call_sid is None:
+                if everything is None:
+                    everything = json.dumps({"type": "batch", "sent_at": sent_at, "calls": by_call})
+                message = everything
+            elif subscriber.call_sid in by_call:
+                call_sid = subscriber.call_sid
+                if call_sid not in per_call:
+                    per_call[call_sid] = json.dumps(
+                        {"type": "batch", "sent_at": sent_at, "calls": {call_sid: by_call[call_sid]}}
+                    )
+                message = per_call[call_sid]
+            else:
+                continue
+            if not subscriber.offer(message):
+                self.dropped += 1
+        self.batches += 1
+
+
+transcript_hub = TranscriptHub(
+    frontend_clients,
+    tick=settings.DASHBOARD_TICK,
+    max_queue=settings.DASHBOARD_QUEUE_SIZE,
+)
+
+register(Gauge("dashboard_subscribers", "Connected dashboard websocket clients",
+               lambda: len(transcript_hub.subscribers)))
+register(Gauge("dashboard_dropped_total", "Event batches dropped for slow dashboard clients",
+               lambda: transcript_hub.dropped, type="counter"))
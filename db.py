@@ -0,0 +1,118 @@
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlmodel import Field, Session, SQLModel, create_engine, select
+from config import settings
+
+
+class Agent(SQLModel, table=True):
+    """A voice agent: its prompt template and the numbers it answers"""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str
+    # {variable} placeholders are filled from the agent's DynamicVariables
+    prompt: str
+    # Bumped on every change to the agent, its variables or its numbers
+    version: int = 1
+    updated_at: float = Field(default_factory=time.time, index=True)
+    active: bool = True
+
+
+class PhoneNumber(SQLModel, table=True):
+    number: str = Field(primary_key=True)
+    agent_id: int = Field(foreign_key="agent.id", index=True)
+
+
+class DynamicVariable(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    agent_id: int = Field(foreign_key="agent.id", index=True)
+    key: str
+    value: str
+
+
+engine = create_engine(
+    settings.DATABASE_URL,
+    # The cache reads from a worker thread
+    connect_args={"check_same_thread": False} if settings.DATABASE_URL.startswith("sqlite") else {},
+)
+
+
+def create_db_and_tables():
+    SQLModel.metadata.create_all(engine)
+
+
+def get_session() -> Iterator[Session]:
+    with Session(engine) as session:
+        yield session
+
+
+def save_agent(
+    session: Session,
+    name: str,
+    prompt: str,
+    variables: Optional[Dict[str, str]] = None,
+    numbers: Optional[List[str]] = None,
+    agent_id: Optional[int] = None,
+    active: bool = True,
+) -> Agent:
+    """Create or replace an agent with its variables and numbers, bumping its
+    version so every worker's cache picks the change up"""
+    agent = session.get(Agent, agent_id) if agent_id is not None else None
+    if agent is None:
+        agent = Agent(id=agent_id, name=name, prompt=prompt, active=active)
+        session.add(agent)
+        session.flush()
+    else:
+        agent.name, agent.prompt, agent.active = name, prompt, active
+        agent.version += 1
+        agent.updated_at = time.time()
+        for variable in session.exec(select(DynamicVariable).where(DynamicVariable.agent_id == agent.id)):
+            session.delete(variable)
+        for number in session.exec(select(PhoneNumber).where(PhoneNumber.agent_id == agent.id)):
+            session.delete(number)
+        session.flush()
+    for key, value in (variables or {}).items():
+        session.add(DynamicVariable(agent_id=agent.id, key=key, value=value))
+    for number in numbers or ():
+        # A number answers for one agent; moving it is a change to both
+        existing = session.get(PhoneNumber, number)
+        if existing is not None:
+            previous = session.get(Agent, existing.agent_id)
+            previous.version += 1
+            previous.updated_at = time.time()
+            existing.agent_id = agent.id
+        else:
+            session.add(PhoneNumber(number=number, agent_id=agent.id))
+    session.commit()
+    session.refresh(agent)
+    return agent
+
+
+def change_stamp(session: Session) -> Tuple[Optional[float], int]:
+    """Latest agent change and agent count; cheap enough to poll"""
+    return session.exec(select(func.max(Agent.updated_at), func.count(Agent.id))).one()
+
+
+def load_agents(session: Session, since: Optional[float] = None) -> List[dict]:
+    """Agents changed at or after `since` (all when None), with their
+    variables and numbers"""
+    query = select(Agent)
+    if since is not None:
+        query = query.where(Agent.updated_at >= since)
+    agents = {a.id: {"agent": a, "variables": {}, "numbers": []} for a in session.exec(query)}
+    if not agents:
+        return []
+    # A handful of changed agents is the usual case; past that, read everything
+    ids = list(agents) if since is not None and len(agents) <= 500 else None
+    variables = select(DynamicVariable)
+    numbers = select(PhoneNumber)
+    if ids is not None:
+        variables = variables.where(DynamicVariable.agent_id.in_(ids))
+        numbers = numbers.where(PhoneNumber.agent_id.in_(ids))
+    for variable in session.exec(variables):
+        if variable.agent_id in agents:
+            agents[variable.agent_id]["variables"][variable.key] = variable.value
+    for number in session.exec(numbers):
+        if number.agent_id in agents:
+            agents[number.agent_id]["numbers"].append(number.number)
+    return list(agents.values())
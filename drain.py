@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import signal
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Drain:
+    """Finishes live calls before the worker exits on SIGTERM/SIGINT.
+
+    install() takes both signals over from the server (call it from the
+    lifespan startup, after uvicorn has set its own handlers). On the first
+    one the worker stops taking calls: `on_drain` runs (the heartbeat stops
+    advertising capacity, campaigns stop dialing, call records and logs are
+    flushed), /ready fails and /agent and /initiate-call turn calls away.
+    Live calls carry on until they end or `timeout` passes, then the signal
+    is handed to the handler installed before ours; for uvicorn that starts
+    its shutdown, which closes any calls left and runs the lifespan teardown.
+    A second signal skips the wait. `timeout` has to end before the
+    platform's own kill deadline, or nothing after it gets to run.
+    """
+
+    SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+    def __init__(self, timeout: float, active: Callable[[], int],
+                 on_drain: Optional[Callable[[], Awaitable]] = None, poll_interval: float = 0.5):
+        self.timeout = timeout
+        self.active = active
+        self.on_drain = on_drain
+        self.poll_interval = poll_interval
+        self.state = "serving"
+        self.started_at: Optional[float] = None
+        # Calls still live when the deadline passed
+        self.cut = 0
+        self._signum = signal.SIGTERM
+        self._previous: Dict[int, object] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def draining(self) -> bool:
+        return self.state != "serving"
+
+    def install(self):
+        self._loop = asyncio.get_running_loop()
+        if threading.current_thread() is not threading.main_thread():
+            # signal.signal only works there; the server's own handling applies
+            return
+        for sig in self.SIGNALS:
+            self._previous[sig] = signal.signal(sig, self._handle)
+
+    def restore(self):
+        for sig, previous in self._previous.items():
+            signal.signal(sig, previous)
+        self._previous = {}
+
+    def _handle(self, signum: int, frame):
+        if self.draining:
+            logger.warning(f"Caught {signal.strsignal(signum)} again, exiting without waiting for calls")
+            self._loop.call_soon_threadsafe(self._exit, signum)
+        else:
+            self._loop.call_soon_threadsafe(self.begin, signum)
+
+    def begin(self, signum: int = signal.SIGTERM):
+        if self.draining:
+            return
+        self.state = "draining"
+        self.started_at = time.monotonic()
+        self._signum = signum
+        logger.info(f"Caught {signal.strsignal(signum)}, draining {self.active()} live calls "
+                    f"(up to {self.timeout:.0f}s)")
+        self._task = asyncio.get_running_loop().create_task(self._drain())
+
+    async def _drain(self):
+        if self.on_drain:
+            try:
+                await self.on_drain()
+            except Exception as e:
+                # Turning calls away at /agent doesn't depend on it
+                logger.error(f"Drain hook failed: {e}")
+        deadline = self.started_at + self.timeout
+        while self.active() > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+        self.cut = self.active()
+        elapsed = time.monotonic() - self.started_at
+        if self.cut:
+            logger.warning(f"Drain deadline passed after {elapsed:.1f}s with {self.cut} calls still live")
+        else:
+            logger.info(f"Drained in {elapsed:.1f}s")
+        self._exit(self._signum)
+
+    def _exit(self, signum: int):
+        if self.state == "drained":
+            return
+        self.state = "drained"
+        if self._task and self._task is not asyncio.current_task():
+            self._task.cancel()
+        previous = self._previous.get(signum)
+        self.restore()
+        if callable(previous):
+            previous(signum, None)
+        else:
+            signal.raise_signal(signum)
+
+    def stats(self) -> dict:
+        draining_for = time.monotonic() - self.started_at if self.started_at else None
+        return {
+            "state": self.state,
+            "live_calls": self.active(),
+            "draining_for": round(draining_for, 1) if draining_for is not None else None,
+            "deadline_in": round(max(0.0, self.timeout - draining_for), 1) if draining_for is not None else None,
+            "cut_calls": self.cut,
+        }
@@ -0,0 +1,230 @@
+import asyncio
+import audioop
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+import numpy as np
+from pipecat.frames.frames import (
+    BotStartedSpeakingFrame,
+    BotStoppedSpeakingFrame,
+    Frame,
+    StartInterruptionFrame,
+    TTSAudioRawFrame,
+    UserStartedSpeakingFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from config import settings
+from greeting import decode_to_ulaw
+from metrics import FillerAudioRawFrame, Gauge, register
+from tts_cache import cache_key, cache_namespace, synthesize_ulaw, tts_cache, tts_params_for
+
+logger = logging.getLogger(__name__)
+
+ULAW_SAMPLE_RATE = 8000
+# 20ms of 8 kHz μ-law
+FRAME_BYTES = 160
+FRAME_SECONDS = FRAME_BYTES / ULAW_SAMPLE_RATE
+# Filler audio kept queued ahead of playout: all of it the caller still
+# hears once the reply is ready, besides the fade
+LEAD_SECONDS = 0.06
+FADE_FRAMES = 2
+# Quieter edges are trimmed, so a clip is audible the moment it's played
+SILENCE_LEVEL = 300
+# Fillers a call won't repeat until it has played others
+HISTORY = 3
+
+
+def trim_silence(ulaw: bytes) -> bytes:
+    samples = np.frombuffer(audioop.ulaw2lin(ulaw, 2), dtype=np.int16)
+    loud = np.flatnonzero(np.abs(samples.astype(np.int32)) > SILENCE_LEVEL)
+    if not len(loud):
+        return b""
+    return ulaw[loud[0]:loud[-1] + 1]
+
+
+def fade_out(pcm: bytes) -> bytes:
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    return (samples * np.linspace(1.0, 0.0, len(samples))).astype(np.int16).tobytes()
+
+
+class FillerLibrary:
+    """Filler clips held in memory as 20ms μ-law frames, loaded once per worker.
+
+    Clips come from FILLER_AUDIO_DIR when it's set, otherwise each phrase is
+    rendered in the ElevenLabs voice calls use, through the TTS cache so a
+    restart doesn't render them again.
+    """
+
+    def __init__(self, phrases: List[str], audio_dir: Optional[str] = None):
+        self.phrases = phrases
+        self.audio_dir = audio_dir
+        self.clips: Dict[str, List[bytes]] = {}
+        self.played = 0
+        self.cut = 0
+        self.finished = 0
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self.clips)
+
+    async def load(self):
+        start = time.perf_counter()
+        try:
+            if self.audio_dir:
+                clips = await asyncio.to_thread(self._read_dir)
+            elif settings.TTS_PROVIDER == "elevenlabs" and settings.ELEVENLABS_API_KEY:
+                clips = await self._render()
+            else:
+                logger.info("No filler clips: set FILLER_AUDIO_DIR or use ElevenLabs")
+                return
+        except Exception as e:
+            logger.error(f"Failed to load filler clips: {e}")
+            return
+        for text, ulaw in clips.items():
+            ulaw = trim_silence(ulaw)
+            if ulaw:
+                self.clips[text] = [
+                    ulaw[i:i + FRAME_BYTES].ljust(FRAME_BYTES, b"\xff") for i in range(0, len(ulaw), FRAME_BYTES)
+                ]
+        logger.info(f"Loaded {len(self.clips)} filler clips in {time.perf_counter() - start:.2f}s")
+
+    def _read_dir(self) -> Dict[str, bytes]:
+        clips = {}
+        for name in sorted(os.listdir(self.audio_dir)):
+            stem, ext = os.path.splitext(name)
+            if ext.lower() in (".wav", ".mp3"):
+                clips[stem.replace("_", " ")] = decode_to_ulaw(os.path.join(self.audio_dir, name))
+        return clips
+
+    async def _render(self) -> Dict[str, bytes]:
+        from providers import build
+
+        params = tts_params_for(build("tts", "elevenlabs"))
+        namespace = cache_namespace(params["voice_id"], params["model"], params["voice_settings"])
+
+        async def _clip(text):
+            key = cache_key(text, namespace)
+            audio = await tts_cache.get(key)
+            if audio is None:
+                audio = await synthesize_ulaw(text, **params)
+                await tts_cache.put(key, audio)
+            return audio
+
+        results = await asyncio.gather(*(_clip(p) for p in self.phrases), return_exceptions=True)
+        clips = {}
+        for text, result in zip(self.phrases, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to render filler '{text}': {result}")
+            else:
+                clips[text] = result
+        return clips
+
+    def pick(self, recent: Deque[str]) -> str:
+        fresh = [text for text in self.clips if text not in recent]
+        return random.choice(fresh or list(self.clips))
+
+    def stats(self) -> dict:
+        return {
+            "clips": len(self.clips),
+            "played": self.played,
+            "cut": self.cut,
+            "finished": self.finished,
+        }
+
+
+class FillerProcessor(FrameProcessor):
+    """Sits in front of the output transport and covers late replies.
+
+    When the user stops speaking and no reply audio has come through
+    `delay` seconds later, a filler clip starts playing. It's paced in real
+    time, only LEAD_SECONDS ahead of playout, so when the reply's first
+    audio arrives the rest of the clip is dropped after a short fade rather
+    than queued in front of it.
+    """
+
+    def __init__(self, library: FillerLibrary, delay: float, **kwargs):
+        super().__init__(**kwargs)
+        self._library = library
+        self._delay = delay
+        self._recent: Deque[str] = deque(maxlen=min(HISTORY, len(library.clips) - 1) or None)
+        self._task: Optional[asyncio.Task] = None
+        self._clip: Optional[List[bytes]] = None
+        self._position = 0
+        self._bot_speaking = False
+        self._replied = True
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, UserStoppedSpeakingFrame):
+            await self._stop()
+            self._replied = False
+            if not self._bot_speaking:
+                self._task = self.create_task(self._cover())
+        elif isinstance(frame, (UserStartedSpeakingFrame, StartInterruptionFrame)):
+            # Interruptions clear queued audio, so nothing to fade
+            self._replied = True
+            await self._stop()
+        elif isinstance(frame, TTSAudioRawFrame) and not isinstance(frame, FillerAudioRawFrame):
+            if not self._replied:
+                self._replied = True
+                await self._stop(fade=True)
+        elif isinstance(frame, BotStartedSpeakingFrame):
+            self._bot_speaking = True
+        elif isinstance(frame, BotStoppedSpeakingFrame):
+            self._bot_speaking = False
+
+        await self.push_frame(frame, direction)
+
+    async def _cover(self):
+        await asyncio.sleep(self._delay)
+        if self._replied:
+            return
+        text = self._library.pick(self._recent)
+        if self._recent.maxlen:
+            self._recent.append(text)
+        self._library.played += 1
+        self._clip, self._position = self._library.clips[text], 0
+        start = time.monotonic()
+        while self._position < len(self._clip):
+            ulaw = self._clip[self._position]
+            self._position += 1
+            await self.push_frame(FillerAudioRawFrame(audioop.ulaw2lin(ulaw, 2), ULAW_SAMPLE_RATE, 1))
+            ahead = start + self._position * FRAME_SECONDS - LEAD_SECONDS - time.monotonic()
+            if ahead > 0:
+                await asyncio.sleep(ahead)
+        self._library.finished += 1
+        self._clip = None
+
+    async def _stop(self, fade: bool = False):
+        if self._task:
+            await self.cancel_task(self._task)
+            self._task = None
+        if self._clip is not None:
+            tail = self._clip[self._position:self._position + FADE_FRAMES]
+            if fade and tail:
+                self._library.cut += 1
+                pcm = fade_out(audioop.ulaw2lin(b"".join(tail), 2))
+                await self.push_frame(FillerAudioRawFrame(pcm, ULAW_SAMPLE_RATE, 1))
+            self._clip = None
+
+    async def cleanup(self):
+        await self._stop()
+        await super().cleanup()
+
+
+fillers = FillerLibrary(
+    [phrase.strip() for phrase in settings.FILLER_PHRASES.split("|") if phrase.strip()],
+    settings.FILLER_AUDIO_DIR or None,
+)
+
+register(Gauge("filler_played_total", "Filler clips started because a reply was late",
+               lambda: fillers.played, type="counter"))
+register(Gauge("filler_cut_total", "Filler clips faded out early because the reply was ready",
+               lambda: fillers.cut, type="counter"))
@@ -0,0 +1,132 @@
+import asyncio
+import audioop
+import base64
+import logging
+import time
+import wave
+from collections import OrderedDict
+from typing import List, Optional
+
+from config import settings
+from metrics import Histogram, register
+
+logger = logging.getLogger(__name__)
+
+TWILIO_SAMPLE_RATE = 8000
+# 20ms of 8 kHz μ-law, the frame size Twilio itself sends
+FRAME_BYTES = 160
+GREETING_MARK = "greeting_end"
+
+first_audio = {
+    mode: register(Histogram(
+        "greeting_first_audio_seconds",
+        "/agent webhook to first greeting audio leaving our side",
+        labels={"mode": mode},
+    ))
+    for mode in ("play", "stream")
+}
+stream_start = {
+    mode: register(Histogram(
+        "call_stream_start_seconds",
+        "/agent webhook to the media stream start message",
+        labels={"mode": mode},
+    ))
+    for mode in ("play", "stream")
+}
+
+
+def decode_to_ulaw(path: str) -> bytes:
+    """Decode an audio file to mono 8 kHz μ-law"""
+    if path.endswith(".wav"):
+        with wave.open(path, "rb") as f:
+            channels, width, rate = f.getnchannels(), f.getsampwidth(), f.getframerate()
+            pcm = f.readframes(f.getnframes())
+        if width != 2:
+            pcm = audioop.lin2lin(pcm, width, 2)
+        if channels == 2:
+            pcm = audioop.tomono(pcm, 2, 0.5, 0.5)
+    else:
+        # MP3 and friends need ffmpeg through pydub
+        from pydub import AudioSegment
+
+        segment = AudioSegment.from_file(path).set_channels(1).set_sample_width(2)
+        pcm, rate = segment.raw_data, segment.frame_rate
+    if rate != TWILIO_SAMPLE_RATE:
+        pcm, _ = audioop.ratecv(pcm, 2, 1, rate, TWILIO_SAMPLE_RATE, None)
+    return audioop.lin2ulaw(pcm, 2)
+
+
+class Greeting:
+    """Greeting audio held in memory as base64 μ-law frames ready for Twilio"""
+
+    def __init__(self):
+        self.payloads: List[str] = []
+        # The same audio as 8 kHz PCM, for call recordings
+        self.pcm = b""
+        self.duration = 0.0
+        self._agent_requests = OrderedDict()
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self.payloads)
+
+    async def load(self, path: str):
+        start = time.perf_counter()
+        try:
+            ulaw = await asyncio.to_thread(decode_to_ulaw, path)
+        except Exception as e:
+            logger.error(f"Failed to decode greeting {path}, falling back to <Play>: {e}")
+            return
+        self.payloads = [
+            base64.b64encode(ulaw[i:i + FRAME_BYTES]).decode("ascii")
+            for i in range(0, len(ulaw), FRAME_BYTES)
+        ]
+        self.pcm = audioop.ulaw2lin(ulaw, 2)
+        self.duration = len(ulaw) / TWILIO_SAMPLE_RATE
+        logger.info(
+            f"Greeting decoded: {self.duration:.2f}s in {len(self.payloads)} frames "
+            f"({time.perf_counter() - start:.3f}s)"
+        )
+
+    @property
+    def mode(self) -> str:
+        return "stream" if settings.GREETING_MODE == "stream" and self.loaded else "play"
+
+    def note_agent_request(self, call_sid: Optional[str]):
+        """Remember when Twilio hit /agent so setup delays can be measured"""
+        now = time.monotonic()
+        while self._agent_requests and next(iter(self._agent_requests.values())) < now - 120:
+            self._agent_requests.popitem(last=False)
+        self._agent_requests[call_sid or f"unknown-{now}"] = now
+
+    def note_play_fetch(self):
+        """Twilio fetching the <Play> file is as close as we get to its first audio"""
+        if self._agent_requests:
+            # Fetches carry no CallSid; attribute to the oldest call still waiting
+            requested = next(iter(self._agent_requests.values()))
+            first_audio["play"].observe(time.monotonic() - requested)
+
+    def note_stream_start(self, call_sid: str):
+        requested = self._agent_requests.pop(call_sid, None)
+        if requested is not None:
+            stream_start[self.mode].observe(time.monotonic() - requested)
+        return requested
+
+    async def stream(self, websocket, stream_sid: str, requested_at: Optional[float] = None):
+        """Send the whole greeting down the media stream.
+
+        Twilio buffers media and plays it in order, so nothing is paced here;
+        a VAD interruption makes the pipeline send `clear`, which drops
+        whatever is still buffered.
+        """
+        prefix = f'{{"event":"media","streamSid":"{stream_sid}","media":{{"payload":"'
+        for i, payload in enumerate(self.payloads):
+            await websocket.send_text(prefix + payload + '"}}')
+            if i == 0 and requested_at is not None:
+                first_audio["stream"].observe(time.monotonic() - requested_at)
+        await websocket.send_text(
+            f'{{"event":"mark","streamSid":"{stream_sid}","mark":{{"name":"{GREETING_MARK}"}}}}'
+        )
+
+
+greeting = Greeting()
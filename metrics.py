@@ -0,0 +1,275 @@
+import bisect
+import logging
+import threading
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from pipecat.frames.frames import (
+    BotStartedSpeakingFrame,
+    LLMTextFrame,
+    TranscriptionFrame,
+    TTSAudioRawFrame,
+    TTSStartedFrame,
+    UserStartedSpeakingFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.observers.base_observer import BaseObserver, FramePushed
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContextFrame
+from utils.logging import call_debug_enabled
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram that also keeps a bounded window
+    of recent samples so p50/p95/p99 can be reported exactly"""
+
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS, window: int = 2048,
+                 labels: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labels = "".join(f',{k}="{v}"' for k, v in (labels or {}).items())
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sum += value
+            self._count += 1
+            self._recent.append(value)
+
+    def percentiles(self, quantiles=QUANTILES) -> Dict[float, Optional[float]]:
+        with self._lock:
+            values = sorted(self._recent)
+        if not values:
+            return {q: None for q in quantiles}
+        return {q: values[min(len(values) - 1, int(q * len(values)))] for q in quantiles}
+
+    def render(self) -> List[str]:
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        labels = self.labels
+        plain = f"{{{labels[1:]}}}" if labels else ""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{self.name}_bucket{{le="{bound}"{labels}}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"{labels}}} {count}')
+        lines.append(f"{self.name}_sum{plain} {total}")
+        lines.append(f"{self.name}_count{plain} {count}")
+
+        summary = f"{self.name}_recent"
+        lines.append(f"# HELP {summary} {self.help} (last {self._recent.maxlen} samples)")
+        lines.append(f"# TYPE {summary} summary")
+        for q, value in self.percentiles().items():
+            lines.append(f'{summary}{{quantile="{q}"{labels}}} {"NaN" if value is None else value}')
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time"""
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float], type: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.type = type
+
+    def render(self) -> List[str]:
+        try:
+            value = self.fn()
+        except Exception as e:
+            logger.error(f"Failed to collect metric {self.name}: {e}")
+            return []
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.type}",
+            f"{self.name} {'NaN' if value is None else value}",
+        ]
+
+
+REGISTRY: List = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+def render_prometheus() -> str:
+    lines = []
+    described = set()
+    for metric in REGISTRY:
+        for line in metric.render():
+            # Labelled series of one family share a single HELP/TYPE header
+            if line.startswith("# "):
+                if line in described:
+                    continue
+                described.add(line)
+            lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+stt_latency = register(Histogram(
+    "call_stt_latency_seconds", "User stopped speaking to final transcription"))
+llm_ttft = register(Histogram(
+    "call_llm_ttft_seconds", "LLM context pushed to first LLM token"))
+tts_ttfb = register(Histogram(
+    "call_tts_ttfb_seconds", "TTS request started to first audio byte"))
+response_delay = register(Histogram(
+    "call_response_delay_seconds", "User stopped speaking to bot started speaking the reply"))
+perceived_delay = register(Histogram(
+    "call_perceived_delay_seconds", "User stopped speaking to the first bot audio, fillers included"))
+
+
+class FillerAudioRawFrame(TTSAudioRawFrame):
+    """Filler audio played while the reply is late; not the reply itself"""
+
+# Per-turn views show whether a call slows down as its context grows
+TURN_BUCKETS = ("1", "2", "3", "4-5", "6-10", "11-20", "21+")
+PROMPT_TOKEN_BUCKETS = (250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 16000)
+
+
+def turn_bucket(index: int) -> str:
+    """Label for the 1-based LLM request number within a call"""
+    if index <= 3:
+        return str(index)
+    if index <= 5:
+        return "4-5"
+    if index <= 10:
+        return "6-10"
+    return "11-20" if index <= 20 else "21+"
+
+
+llm_ttft_by_turn = {
+    bucket: register(Histogram(
+        "call_llm_ttft_by_turn_seconds", "LLM context pushed to first LLM token, by turn index",
+        labels={"turn": bucket},
+    ))
+    for bucket in TURN_BUCKETS
+}
+prompt_tokens_by_turn = {
+    bucket: register(Histogram(
+        "call_llm_prompt_tokens", "Tokens sent to the LLM per request, by turn index",
+        buckets=PROMPT_TOKEN_BUCKETS, labels={"turn": bucket},
+    ))
+    for bucket in TURN_BUCKETS
+}
+
+
+class LatencyObserver(BaseObserver):
+    """Timestamps frames as they move through a call's pipeline and records
+    per-turn STT, LLM, TTS and end-to-end latency. When a filler covers a
+    late reply, the caller's perceived delay ends at the filler and the
+    response delay at the reply's first audio.
+
+    Frames are seen once per hop, so each stage only keeps the first sighting
+    per turn. Everything else returns after a single set lookup.
+    """
+
+    WATCHED = {
+        UserStartedSpeakingFrame,
+        UserStoppedSpeakingFrame,
+        TranscriptionFrame,
+        OpenAILLMContextFrame,
+        LLMTextFrame,
+        TTSStartedFrame,
+        TTSAudioRawFrame,
+        FillerAudioRawFrame,
+        BotStartedSpeakingFrame,
+    }
+
+    def __init__(self, on_turn: Optional[Callable[[dict], None]] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.on_turn = on_turn
+        self.turns: List[dict] = []
+        self._seen_ids = deque(maxlen=32)
+        self._llm_requests = 0
+        self._reset_turn()
+
+    def _reset_turn(self):
+        self._user_stopped = None
+        self._transcribed = None
+        self._llm_start = None
+        self._tts_start = None
+        self._filler_at = None
+        self._turn = {}
+
+    async def on_push_frame(self, data: FramePushed):
+        frame = data.frame
+        frame_type = type(frame)
+        if frame_type not in self.WATCHED:
+            return
+        if frame.id in self._seen_ids:
+            return
+        self._seen_ids.append(frame.id)
+        now = data.timestamp / 1e9
+
+        if frame_type is UserStartedSpeakingFrame:
+            self._reset_turn()
+        elif frame_type is UserStoppedSpeakingFrame:
+            self._user_stopped = now
+            if call_debug_enabled():
+                logger.debug(f"User stopped speaking at {now:.3f}")
+        elif frame_type is TranscriptionFrame:
+            self._transcribed = now
+        elif frame_type is OpenAILLMContextFrame:
+            self._llm_start = now
+            self._llm_requests += 1
+            self._turn["turn"] = self._llm_requests
+            if self._user_stopped is not None and self._transcribed is not None:
+                self._record("stt", stt_latency, max(0.0, self._transcribed - self._user_stopped))
+        elif frame_type is LLMTextFrame:
+            if self._llm_start is not None:
+                self._record("llm_ttft", llm_ttft, now - self._llm_start)
+                llm_ttft_by_turn[turn_bucket(self._llm_requests)].observe(now - self._llm_start)
+                self._llm_start = None
+        elif frame_type is TTSStartedFrame:
+            self._tts_start = now
+        elif frame_type is TTSAudioRawFrame:
+            if self._tts_start is not None:
+                self._record("tts_ttfb", tts_ttfb, now - self._tts_start)
+                self._tts_start = None
+            if self._filler_at is not None and self._user_stopped is not None:
+                # Bot started speaking with the filler; the reply starts here
+                self._end_turn(now)
+        elif frame_type is FillerAudioRawFrame:
+            if self._user_stopped is not None and self._filler_at is None:
+                self._filler_at = now
+        elif frame_type is BotStartedSpeakingFrame:
+            if self._user_stopped is not None:
+                if "perceived_delay" not in self._turn:
+                    self._record("perceived_delay", perceived_delay, now - self._user_stopped)
+                if self._filler_at is None:
+                    self._end_turn(now)
+
+    def _end_turn(self, now: float):
+        delay = now - self._user_stopped
+        self._record("response_delay", response_delay, delay)
+        logger.info(f"RESPONSE DELAY: {delay:.3f}s (User stopped → Bot started)")
+        logger.info(f"{'EXCELLENT' if delay < 0.5 else 'GOOD' if delay < 1.0 else 'ACCEPTABLE' if delay < 1.5 else 'NEEDS IMPROVEMENT'} - Target: <1.0s")
+        if self._filler_at is not None:
+            if "perceived_delay" not in self._turn:
+                self._record("perceived_delay", perceived_delay, self._filler_at - self._user_stopped)
+            self._turn["filler"] = True
+            logger.info(f"PERCEIVED DELAY: {self._turn['perceived_delay']:.3f}s (filler covered the rest)")
+        self.turns.append(self._turn)
+        if self.on_turn:
+            self.on_turn(self._turn)
+        self._user_stopped = None
+        self._filler_at = None
+        self._turn = {}
+
+    def _record(self, stage: str, histogram: Histogram, value: float):
+        histogram.observe(value)
+        self._turn[stage] = value
@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from pipecat.audio.vad.silero import SileroOnnxModel, SileroVADAnalyzer
+from pipecat.audio.vad.vad_analyzer import VADAnalyzer, VADParams
+from pipecat.services.llm_service import LLMService
+from pipecat.services.stt_service import STTService
+from pipecat.services.tts_service import TTSService
+from config import settings
+from routing import RoutedSTTService, RoutedTTSService
+from providers import build_llm, build_stt, build_tts, preload_providers
+from turn_taking import AdaptiveVADAnalyzer
+
+logger = logging.getLogger(__name__)
+
+try:
+    # Optional; without it the shared LLM client speaks HTTP/1.1 keep-alive
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+@dataclass
+class PipelineComponents:
+    """Everything run_bot needs that is expensive to build per call"""
+    vad_analyzer: VADAnalyzer
+    llm: LLMService
+    stt: STTService | RoutedSTTService
+    tts: TTSService | RoutedTTSService
+    pooled: bool = False
+
+
+class PipelinePool:
+    """Process-wide warm pool of VAD analyzers and pipeline services.
+
+    VAD analyzers share a single Silero ONNX session and are reset and reused
+    across calls. Services are pipecat processors and can't be reused once a
+    pipeline has ended, so the pool keeps `size` pre-built sets ready and
+    refills in the background after each checkout.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._vad_session = None
+        self._vad_analyzers = deque()
+        self._services = deque()
+        self._llm_client = None
+        self._refill_task = None
+        self._warmed = False
+        self.hits = 0
+        self.misses = 0
+        self.vad_reused = 0
+        self.checked_out = 0
+
+    async def warm(self):
+        """Load the shared model session and VAD analyzers, then pre-build
+        `size` service sets in the background so startup isn't held up by
+        provider imports"""
+        start = time.perf_counter()
+        self._vad_session = await asyncio.to_thread(_load_silero_session)
+        for _ in range(self.size):
+            self._vad_analyzers.append(self._build_vad_analyzer())
+        self._warmed = True
+        self._schedule_refill()
+        logger.info(f"Pipeline pool VAD ready in {time.perf_counter() - start:.3f}s, building services")
+
+    def checkout(self) -> PipelineComponents:
+        """Take a ready component set, building one inline if the pool is empty"""
+        if self._vad_analyzers:
+            vad_analyzer = self._vad_analyzers.popleft()
+            self.vad_reused += 1
+        else:
+            vad_analyzer = self._build_vad_analyzer()
+
+        if self._services:
+            llm, stt, tts = self._services.popleft()
+            self.hits += 1
+            pooled = True
+        else:
+            llm, stt, tts = self._build_services()
+            self.misses += 1
+            pooled = False
+
+        self.checked_out += 1
+        self._schedule_refill()
+        return PipelineComponents(vad_analyzer=vad_analyzer, llm=llm, stt=stt, tts=tts, pooled=pooled)
+
+    def release(self, components: PipelineComponents):
+        """Return reusable parts after the call ends; services are discarded"""
+        self.checked_out -= 1
+        if len(self._vad_analyzers) < self.size:
+            _reset_vad_analyzer(components.vad_analyzer)
+            self._vad_analyzers.append(components.vad_analyzer)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": self.size,
+            "warmed": self._warmed,
+            "available": len(self._services),
+            "vad_available": len(self._vad_analyzers),
+            "checked_out": self.checked_out,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else None,
+            "vad_reused": self.vad_reused,
+        }
+
+    def _schedule_refill(self):
+        if not self._warmed or (self._refill_task and not self._refill_task.done()):
+            return
+        self._refill_task = asyncio.get_running_loop().create_task(self._refill())
+
+    async def _refill(self):
+        try:
+            # Imports are the slow part of the first build; keep them off the loop
+            await asyncio.to_thread(preload_providers)
+            while len(self._services) < self.size:
+                # Let the call that triggered the refill get going first
+                await asyncio.sleep(0)
+                self._services.append(self._build_services())
+        except Exception as e:
+            logger.error(f"Failed to refill pipeline pool: {e}")
+
+    def _build_vad_analyzer(self) -> VADAnalyzer:
+        if self._vad_session is None:
+            return build_vad_analyzer()
+        # Bypass SileroVADAnalyzer.__init__ so we don't load the ONNX model
+        # again; inference state lives in the wrapper, not the session.
+        model = SileroOnnxModel.__new__(SileroOnnxModel)
+        model.session = self._vad_session
+        model.reset_states()
+        model.sample_rates = [8000, 16000]
+
+        cls = AdaptiveVADAnalyzer if settings.TURN_ADAPTIVE_VAD else SileroVADAnalyzer
+        analyzer = cls.__new__(cls)
+        VADAnalyzer.__init__(analyzer, sample_rate=16000, params=VAD_PARAMS)
+        analyzer._model = model
+        analyzer._last_reset_time = 0
+        if isinstance(analyzer, AdaptiveVADAnalyzer):
+            analyzer.reset_turn_stats(VAD_PARAMS)
+        return analyzer
+
+    def _build_services(self):
+        llm = build_llm()
+        # Share one AsyncOpenAI client (and its keep-alive connections)
+        if hasattr(llm, "_client"):
+            if self._llm_client is None:
+                self._llm_client = _shared_llm_client(llm._client)
+                llm._client = self._llm_client
+            else:
+                llm._client = self._llm_client
+        return llm, build_stt(), build_tts()
+
+
+VAD_PARAMS = VADParams(
+    confidence=0.6,
+    start_secs=0.2,
+    stop_secs=settings.VAD_STOP_SECS,
+)
+
+
+def _shared_llm_client(client):
+    """The client every call's LLM service shares, over HTTP/2 where possible"""
+    if not (settings.LLM_HTTP2 and HTTP2_AVAILABLE):
+        return client
+    import httpx
+    from openai import DefaultAsyncHttpxClient
+
+    return client.with_options(http_client=DefaultAsyncHttpxClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=100, max_connections=1000, keepalive_expiry=None),
+    ))
+
+
+def build_vad_analyzer() -> VADAnalyzer:
+    cls = AdaptiveVADAnalyzer if settings.TURN_ADAPTIVE_VAD else SileroVADAnalyzer
+    return cls(
+        sample_rate=16000,  # Explicit sample rate
+        params=VAD_PARAMS
+    )
+
+
+def build_components() -> PipelineComponents:
+    """Build a fresh, unpooled component set"""
+    return PipelineComponents(
+        vad_analyzer=build_vad_analyzer(),
+        llm=build_llm(),
+        stt=build_stt(),
+        tts=build_tts(),
+    )
+
+
+async def warm_connections(components: PipelineComponents):
+    """Open the LLM's keep-alive connection ahead of the first completion"""
+    try:
+        await components.llm._client.models.retrieve(components.llm.model_name)
+    except Exception as e:
+        logger.debug(f"LLM connection warm-up failed: {e}")
+
+
+def _load_silero_session():
+    return build_vad_analyzer()._model.session
+
+
+def _reset_vad_analyzer(analyzer: VADAnalyzer):
+    analyzer._vad_buffer = b""
+    analyzer._prev_volume = 0
+    if isinstance(analyzer, SileroVADAnalyzer):
+        analyzer._model.reset_states()
+        analyzer._last_reset_time = 0
+    if isinstance(analyzer, AdaptiveVADAnalyzer):
+        # The next caller starts from the defaults, not this one's silences
+        analyzer.reset_turn_stats(VAD_PARAMS)
+        analyzer._params = VAD_PARAMS
+    if analyzer.sample_rate:
+        analyzer.set_params(analyzer.params)
+
+
+pipeline_pool = PipelinePool(size=settings.PIPELINE_POOL_SIZE)
@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pipecat.pipeline.task import PipelineParams
+from config import settings
+from metrics import Gauge, Histogram, register
+from pool import PipelineComponents, pipeline_pool, warm_connections
+from routing import RoutedService
+
+logger = logging.getLogger(__name__)
+
+# Same rates the call's PipelineTask will hand the services in its StartFrame
+_PARAMS = PipelineParams()
+
+preconnect_saved = register(Histogram(
+    "preconnect_saved_seconds", "STT/TTS handshake time moved from the media stream start to /agent"))
+preconnect_handshake = {
+    kind: register(Histogram(
+        "preconnect_handshake_seconds", "Provider connection set up ahead of the media stream",
+        labels={"kind": kind},
+    ))
+    for kind in ("stt", "tts", "llm")
+}
+
+Closer = Callable[[], Awaitable[None]]
+# Service class name -> coroutine that connects a built service early and
+# returns how to close it again, or None if it couldn't connect
+OPENERS: Dict[str, Callable[[object], Awaitable[Optional[Closer]]]] = {}
+
+
+def preconnector(class_name: str):
+    """Register how to open a service's session before its pipeline starts.
+
+    The opener must leave the service so that its own start() finds the
+    session already open and adopts it instead of connecting again.
+    """
+    def decorator(fn):
+        OPENERS[class_name] = fn
+        return fn
+    return decorator
+
+
+@dataclass
+class Preconnect:
+    call_sid: str
+    components: PipelineComponents
+    # Handshake seconds per session opened so far, with the check that it's still usable
+    sessions: List[tuple] = field(default_factory=list)
+    closers: List[Closer] = field(default_factory=list)
+    task: Optional[asyncio.Task] = None
+    expiry: Optional[asyncio.TimerHandle] = None
+
+
+class PreconnectManager:
+    """Opens a call's provider sessions while Twilio is still playing the greeting.
+
+    /agent checks out a pipeline component set for the CallSid and starts
+    the STT/TTS handshakes and an LLM keep-alive request in the background;
+    /ws claims the set when the media stream starts, so run_bot starts with
+    its sockets already open. Twilio may send /ws to another worker, or the
+    caller may hang up during the greeting, so a set nobody claims within
+    `ttl` seconds is closed and given back to the pool.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._calls: Dict[str, Preconnect] = {}
+        self.started = 0
+        self.claimed = 0
+        self.expired = 0
+        self.missed = 0
+
+    def start(self, call_sid: Optional[str]):
+        if not call_sid or call_sid in self._calls:
+            return
+        loop = asyncio.get_running_loop()
+        entry = Preconnect(call_sid, pipeline_pool.checkout())
+        entry.task = loop.create_task(self._connect(entry))
+        entry.expiry = loop.call_later(self.ttl, lambda: loop.create_task(self._expire(call_sid)))
+        self._calls[call_sid] = entry
+        self.started += 1
+
+    def claim(self, call_sid: str) -> Optional[Preconnect]:
+        """Take the call's pre-connect, or None to build components as usual"""
+        entry = self._calls.pop(call_sid, None)
+        if entry is None:
+            self.missed += 1
+            return None
+        entry.expiry.cancel()
+        self.claimed += 1
+        return entry
+
+    async def adopt(self, entry: Preconnect) -> float:
+        """Wait out any handshake still running, right before the pipeline starts"""
+        # Usually long done; if not, finishing it beats starting over
+        await asyncio.shield(entry.task)
+        saved = sum(seconds for seconds, is_open in entry.sessions if is_open())
+        preconnect_saved.observe(saved)
+        logger.info(f"Adopted pre-connected sessions, {saved:.3f}s of handshakes already done")
+        return saved
+
+    async def _connect(self, entry: Preconnect):
+        services = [("stt", s) for s in _services(entry.components.stt)]
+        services += [("tts", s) for s in _services(entry.components.tts)]
+        await asyncio.gather(
+            *(self._open(entry, kind, service) for kind, service in services),
+            self._warm_llm(entry),
+        )
+
+    async def _open(self, entry: Preconnect, kind: str, service):
+        opener = OPENERS.get(type(service).__name__)
+        if opener is None:
+            return
+        start = time.perf_counter()
+        try:
+            closer = await opener(service)
+        except Exception as e:
+            logger.warning(f"Failed to pre-connect {type(service).__name__}: {e}")
+            return
+        if closer is None:
+            return
+        seconds = time.perf_counter() - start
+        preconnect_handshake[kind].observe(seconds)
+        entry.sessions.append((seconds, lambda: _is_open(service)))
+        entry.closers.append(closer)
+
+    async def _warm_llm(self, entry: Preconnect):
+        start = time.perf_counter()
+        await warm_connections(entry.components)
+        preconnect_handshake["llm"].observe(time.perf_counter() - start)
+
+    async def _expire(self, call_sid: str):
+        entry = self._calls.pop(call_sid, None)
+        if entry is None:
+            return
+        self.expired += 1
+        logger.info(f"Pre-connected sessions for {call_sid} unclaimed after {self.ttl}s, closing")
+        if not entry.task.done():
+            await entry.task
+        for close in entry.closers:
+            try:
+                await close()
+            except Exception as e:
+                logger.debug(f"Failed to close pre-connected session: {e}")
+        pipeline_pool.release(entry.components)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._calls),
+            "started": self.started,
+            "claimed": self.claimed,
+            "expired": self.expired,
+            "missed": self.missed,
+        }
+
+
+def _services(service) -> list:
+    """The provider services a pipeline will start for this STT/TTS slot"""
+    return service.preferred() if isinstance(service, RoutedService) else [service]
+
+
+def _is_open(service) -> bool:
+    for attr in ("_websocket", "_connection"):
+        socket = getattr(service, attr, None)
+        if socket is not None:
+            return bool(getattr(socket, "open", False))
+    return False
+
+
+@preconnector("ElevenLabsTTSService")
+async def _elevenlabs(service) -> Optional[Closer]:
+    from pipecat.services.elevenlabs.tts import output_format_from_sample_rate
+
+    # start() sets these from the StartFrame; the websocket URL needs them now
+    service._sample_rate = service._init_sample_rate or _PARAMS.audio_out_sample_rate
+    service._output_format = output_format_from_sample_rate(service.sample_rate)
+    # _connect_websocket() returns early while this socket is open
+    await service._connect_websocket()
+    if not service._websocket:
+        return None
+    return service._websocket.close
+
+
+@preconnector("CartesiaSTTService")
+async def _cartesia_stt(service) -> Optional[Closer]:
+    connect = service._connect
+    await connect()
+    if not service._connection:
+        return None
+
+    async def adopt():
+        # start() calls _connect() unconditionally; keep the socket we have
+        if not service._connection or service._connection.closed:
+            await connect()
+
+    service._connect = adopt
+
+    async def close():
+        if service._receiver_task:
+            service._receiver_task.cancel()
+        await service._connection.close()
+
+    return close
+
+
+preconnects = PreconnectManager(ttl=settings.PRECONNECT_TTL)
+
+register(Gauge("preconnects_claimed_total", "Calls whose /ws adopted sessions opened during /agent",
+               lambda: preconnects.claimed, type="counter"))
+register(Gauge("preconnects_expired_total", "Pre-connected sessions closed because no /ws claimed them",
+               lambda: preconnects.expired, type="counter"))
+register(Gauge("preconnects_missed_total", "Media streams with nothing pre-connected on this worker",
+               lambda: preconnects.missed, type="counter"))
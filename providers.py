@@ -0,0 +1,132 @@
+import importlib
+import logging
+from typing import Callable, Dict, Optional, Tuple
+
+from pipecat.services.llm_service import LLMService
+from pipecat.services.stt_service import STTService
+from pipecat.services.tts_service import TTSService
+from config import settings
+from routing import RoutedSTTService, RoutedTTSService, candidates
+
+logger = logging.getLogger(__name__)
+
+# kind -> provider name -> (builder, modules it imports). Builders import
+# their integration themselves, so only the providers selected in Settings
+# are ever loaded.
+PROVIDERS: Dict[str, Dict[str, Tuple[Callable, Tuple[str, ...]]]] = {"stt": {}, "tts": {}, "llm": {}}
+
+
+def provider(kind: str, name: str, modules: Tuple[str, ...] = ()):
+    """Register a builder for an STT, TTS or LLM backend"""
+    def decorator(fn):
+        PROVIDERS[kind][name] = (fn, modules)
+        return fn
+    return decorator
+
+
+def selected(kind: str) -> str:
+    return getattr(settings, f"{kind.upper()}_PROVIDER").lower()
+
+
+def _lookup(kind: str, name: Optional[str] = None):
+    name = name or selected(kind)
+    try:
+        return PROVIDERS[kind][name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown {kind} provider '{name}', expected one of {sorted(PROVIDERS[kind])}"
+        ) from None
+
+
+def build(kind: str, name: Optional[str] = None):
+    """Build the service Settings selects for `kind`, or the named one"""
+    builder, _ = _lookup(kind, name)
+    return builder()
+
+
+def preload_providers():
+    """Import the selected integrations, e.g. from a worker thread at startup"""
+    for kind in PROVIDERS:
+        for name in candidates(kind) if kind in ROUTED else [None]:
+            _, modules = _lookup(kind, name)
+            for module in modules:
+                importlib.import_module(module)
+
+
+# Kinds that can fail over between providers, see routing.py
+ROUTED = {"stt": RoutedSTTService, "tts": RoutedTTSService}
+
+
+def build_routed(kind: str):
+    """The selected service, or a router over it and its fallbacks"""
+    names = candidates(kind)
+    if len(names) == 1:
+        return build(kind, names[0])
+    return ROUTED[kind]({name: build(kind, name) for name in names})
+
+
+def build_llm() -> LLMService:
+    return build("llm")
+
+
+def build_stt() -> STTService | RoutedSTTService:
+    return build_routed("stt")
+
+
+def build_tts() -> TTSService | RoutedTTSService:
+    return build_routed("tts")
+
+
+@provider("llm", "openai", modules=("pipecat.services.openai.llm",))
+def _openai_llm():
+    from pipecat.services.openai.llm import OpenAILLMService
+
+    # Use faster model for lower latency
+    return OpenAILLMService(
+        api_key=settings.OPENAI_API_KEY,
+        model="gpt-4o-mini"
+    )
+
+
+@provider("stt", "cartesia", modules=("pipecat.services.cartesia.stt",))
+def _cartesia_stt():
+    from pipecat.services.cartesia.stt import CartesiaSTTService
+
+    # Optimize STT for lower latency
+    return CartesiaSTTService(
+        api_key=settings.CARTESIA_API_KEY,
+        language="en",  # Specify language for faster processing
+        model="sonic"   # Fastest Cartesia model
+    )
+
+
+@provider("stt", "deepgram", modules=("deepgram", "pipecat.services.deepgram.stt"))
+def _deepgram_stt():
+    from deepgram import LiveOptions
+    from pipecat.services.deepgram.stt import DeepgramSTTService
+
+    return DeepgramSTTService(
+        api_key=settings.DEEPGRAM_API_KEY,
+        # Streaming has no detect_language; nova-3's "multi" is the live equivalent
+        live_options=LiveOptions(model="nova-3", language="multi"),
+    )
+
+
+@provider("tts", "elevenlabs", modules=("pipecat.services.elevenlabs.tts",))
+def _elevenlabs_tts():
+    from pipecat.services.elevenlabs.tts import ElevenLabsTTSService
+
+    # Initialize TTS service optimized for speed and low latency
+    return ElevenLabsTTSService(
+        api_key=settings.ELEVENLABS_API_KEY,
+        voice_id="IKne3meq5aSn9XLyUdCD",
+        model="eleven_turbo_v2",
+        params=ElevenLabsTTSService.InputParams(
+            stability=0.8,
+            similarity_boost=0.8,
+            use_speaker_boost=False,
+            speed=0.95,
+            style=0.0,
+            optimize_streaming_latency=3
+        )
+    )
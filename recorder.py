@@ -0,0 +1,384 @@
+import asyncio
+import audioop
+import json
+import logging
+import struct
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+from pipecat.frames.frames import (
+    Frame,
+    InputAudioRawFrame,
+    OutputAudioRawFrame,
+    StartInterruptionFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from audio_codec import ULAW_ENCODE
+from call_records import LocalSink, Sink, create_sink
+from config import settings
+from metrics import Gauge, register
+
+logger = logging.getLogger(__name__)
+
+# Recordings are 8 kHz μ-law, like the call itself: caller left, bot right
+RATE = 8000
+CALLER, BOT = 0, 1
+ULAW_SILENCE = 0xFF
+# How far the caller's stream may fall behind the clock (a stalled
+# websocket) before the gap is recorded as silence
+RESYNC_SAMPLES = RATE // 5
+# How often the writer looks for chunks to flush
+TICK = 1.0
+
+# (channel, first sample at 8 kHz, the frame's own PCM, its sample rate)
+Entry = Tuple[int, int, bytes, int]
+
+
+def wav_header(frames: int) -> bytes:
+    """Header of a stereo 8 kHz μ-law WAV holding `frames` sample pairs"""
+    data = frames * 2
+    return (
+        b"RIFF" + struct.pack("<I", 4 + 26 + 12 + 8 + data) + b"WAVE"
+        # WAVE_FORMAT_MULAW needs the extended fmt chunk and a fact chunk
+        + b"fmt " + struct.pack("<IHHIIHHH", 18, 7, 2, RATE, RATE * 2, 2, 8, 0)
+        + b"fact" + struct.pack("<II", 4, frames)
+        + b"data" + struct.pack("<I", data)
+    )
+
+
+class Track:
+    """Stereo μ-law audio from `start` (in 8 kHz samples since the call began),
+    rendered by the writer from ring entries"""
+
+    def __init__(self, start: int):
+        self.start = start
+        self.audio = np.full((0, 2), ULAW_SILENCE, dtype=np.uint8)
+        # audioop.ratecv state per channel, so frames resample seamlessly
+        self._state = [None, None]
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.audio)
+
+    def render(self, entries: List[Entry]):
+        for channel, start, pcm, sample_rate in entries:
+            if sample_rate != RATE:
+                pcm, self._state[channel] = audioop.ratecv(pcm, 2, 1, sample_rate, RATE, self._state[channel])
+            ulaw = ULAW_ENCODE[np.frombuffer(pcm, dtype=np.int16).view(np.uint16)]
+            offset = start - self.start
+            if offset < 0:
+                # Already written out; only a late tail can land here
+                ulaw, offset = ulaw[-offset:], 0
+            end = offset + len(ulaw)
+            if end > len(self.audio):
+                grown = np.full((end, 2), ULAW_SILENCE, dtype=np.uint8)
+                grown[:len(self.audio)] = self.audio
+                self.audio = grown
+            self.audio[offset:end, channel] = ulaw
+
+    def take(self, samples: int) -> bytes:
+        """WAV file of the first `samples` sample pairs, which are then dropped"""
+        head, self.audio = self.audio[:samples], self.audio[samples:].copy()
+        self.start += len(head)
+        return wav_header(len(head)) + head.tobytes()
+
+
+class CallRecording:
+    """One call's audio on its way to the recorder's writer.
+
+    The tap only appends references to the pipeline's own frames to a ring
+    covering the last `buffer_seconds` of the call; resampling, μ-law
+    encoding and interleaving happen on the writer's thread.
+    """
+
+    def __init__(self, call_sid: str, recorder: "CallRecorder"):
+        self.call_sid = call_sid
+        self.recorder = recorder
+        self.started = time.monotonic()
+        self.started_at = datetime.now(timezone.utc)
+        self.ring: Deque[Entry] = deque()
+        self.bytes = 0
+        self.ended = False
+        # Where each channel's next frame starts, in 8 kHz samples
+        self._caller_next = 0
+        self._bot_next = 0
+        # Writer-side state
+        self.track: Optional[Track] = None
+        self.chunks: List[str] = []
+        self.segments: List[str] = []
+        self.marks: List[dict] = []
+        self.dropped = 0
+
+    @property
+    def prefix(self) -> str:
+        return f"{self.started_at:%Y/%m/%d}/{self.call_sid}"
+
+    def now(self) -> int:
+        return round((time.monotonic() - self.started) * RATE)
+
+    def add(self, channel: int, pcm: bytes, sample_rate: int):
+        now = self.now()
+        samples = len(pcm) // 2 * RATE // sample_rate
+        if channel == CALLER:
+            # Twilio sends the caller in real time, so count samples rather
+            # than trust arrival times
+            start = max(self._caller_next, now - RESYNC_SAMPLES)
+            self._caller_next = start + samples
+        else:
+            # Bot audio is written out ahead of playout; place it where the
+            # caller hears it
+            start = max(self._bot_next, now)
+            self._bot_next = start + samples
+        self.ring.append((channel, start, pcm, sample_rate))
+        self.bytes += len(pcm)
+        self.recorder.memory_bytes += len(pcm)
+        horizon = now - self.recorder.buffer_samples
+        while self.ring and (self.ring[0][1] < horizon or self.recorder.memory_bytes > self.recorder.max_memory):
+            self._evict()
+
+    def interrupted(self):
+        # Twilio clears whatever bot audio it had queued
+        self._bot_next = self.now()
+
+    def drain(self) -> List[Entry]:
+        entries = list(self.ring)
+        self.ring.clear()
+        self.recorder.memory_bytes -= self.bytes
+        self.bytes = 0
+        return entries
+
+    def _evict(self):
+        _, _, pcm, sample_rate = self.ring.popleft()
+        self.bytes -= len(pcm)
+        self.recorder.memory_bytes -= len(pcm)
+        if self.recorder.mode == "full":
+            # Never reached the writer
+            samples = len(pcm) // 2 * RATE // sample_rate
+            self.dropped += samples
+            self.recorder.dropped += samples
+
+
+class RecorderTap(FrameProcessor):
+    """Sits right after the output transport, where the caller's audio and
+    the bot's, as it's sent, both pass, and hands them to a CallRecording"""
+
+    def __init__(self, recording: CallRecording, **kwargs):
+        super().__init__(**kwargs)
+        self._recording = recording
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if isinstance(frame, InputAudioRawFrame):
+            self._recording.add(CALLER, frame.audio, frame.sample_rate)
+        elif isinstance(frame, OutputAudioRawFrame):
+            self._recording.add(BOT, frame.audio, frame.sample_rate)
+        elif isinstance(frame, StartInterruptionFrame):
+            self._recording.interrupted()
+        await self.push_frame(frame, direction)
+
+
+class CallRecorder:
+    """Records calls in-process instead of asking Twilio to.
+
+    In "full" mode a single writer task renders each call into stereo μ-law
+    WAV chunks of `chunk_seconds` and uploads them to the sink, with a
+    manifest once the call ends. In "segments" mode nothing is written
+    unless `mark` is called, which saves the last `buffer_seconds` (e.g.
+    the turn before a transfer). Audio held across the worker's calls is
+    capped at `max_memory` bytes: past half of it chunks are written early,
+    and past all of it each call loses its oldest audio.
+    """
+
+    def __init__(self, sink: Sink, mode: str, buffer_seconds: float, chunk_seconds: float,
+                 max_memory: int, max_retries: int):
+        self.sink = sink
+        self.mode = mode
+        self.buffer_samples = round(buffer_seconds * RATE)
+        self.chunk_samples = round(chunk_seconds * RATE)
+        self.max_memory = max_memory
+        self.max_retries = max_retries
+        self.live: Dict[str, CallRecording] = {}
+        self.memory_bytes = 0
+        # 8 kHz samples lost before they were written
+        self.dropped = 0
+        self._segments: asyncio.Queue = asyncio.Queue()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.recorded = 0
+        self.chunks = 0
+        self.segments = 0
+        self.bytes_written = 0
+        self.retries = 0
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("full", "segments")
+
+    def begin(self, call_sid: str) -> CallRecording:
+        recording = self.live[call_sid] = CallRecording(call_sid, self)
+        self.recorded += 1
+        return recording
+
+    def end(self, recording: CallRecording):
+        """The call is over; the writer flushes what's left and lets it go"""
+        recording.ended = True
+        if self.mode != "full":
+            self._release(recording)
+        self._wake.set()
+
+    def mark(self, call_sid: Optional[str], label: str):
+        """Note a moment worth keeping; in "segments" mode, save the audio leading up to it"""
+        recording = self.live.get(call_sid)
+        if recording is None:
+            return
+        seconds = recording.now() / RATE
+        recording.marks.append({"label": label, "at": round(seconds, 3)})
+        if self.mode == "segments":
+            name = f"{recording.prefix}/{label}-{len(recording.marks)}.wav"
+            # References only; the ring keeps going while it's written
+            start = recording.now() - self.buffer_samples
+            self._segments.put_nowait((recording, name, list(recording.ring), start))
+            self._wake.set()
+
+    def start(self):
+        if self.enabled and self._task is None:
+            if isinstance(self.sink, LocalSink):
+                logger.warning(f"Recording calls to local directory {self.sink.directory}; "
+                               f"set RECORDING_SINK to gs://... unless this disk outlives the instance")
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        """Flush every live call and stop the writer"""
+        if self._task is None:
+            return
+        for recording in list(self.live.values()):
+            self.end(recording)
+        self._closing = True
+        self._wake.set()
+        await self._task
+        self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "live_calls": len(self.live),
+            "memory_bytes": self.memory_bytes,
+            "recorded": self.recorded,
+            "chunks": self.chunks,
+            "segments": self.segments,
+            "bytes_written": self.bytes_written,
+            "dropped_seconds": self.dropped / RATE,
+            "retries": self.retries,
+            "failed": self.failed,
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), TICK)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            while not self._segments.empty():
+                recording, name, entries, start = self._segments.get_nowait()
+                await self._write_segment(recording, name, entries, start)
+            if self.mode == "full":
+                for recording in list(self.live.values()):
+                    await self._flush(recording)
+            if self._closing and self._segments.empty() and not self.live:
+                return
+
+    async def _flush(self, recording: CallRecording):
+        entries = recording.drain()
+        if recording.track is None:
+            recording.track = Track(0)
+        track = recording.track
+        held = track.audio.nbytes
+        if entries:
+            await asyncio.to_thread(track.render, entries)
+        # Bot audio can be queued a little ahead of the clock; only write what has played
+        ready = track.end if recording.ended else min(track.end, recording.now() - RESYNC_SAMPLES)
+        # Short on memory: write out whatever has played rather than wait for a full chunk
+        early = recording.ended or self.memory_bytes > self.max_memory / 2
+        while ready - track.start >= self.chunk_samples or (early and ready > track.start):
+            samples = min(self.chunk_samples, ready - track.start)
+            name = f"{recording.prefix}/{len(recording.chunks):04d}.wav"
+            if await self._write(name, await asyncio.to_thread(track.take, samples)):
+                recording.chunks.append(name)
+                self.chunks += 1
+        self.memory_bytes += track.audio.nbytes - held
+        if recording.ended:
+            manifest = {
+                "call_sid": recording.call_sid,
+                "started_at": recording.started_at.isoformat(),
+                "seconds": track.end / RATE,
+                "format": "audio/x-wav; codec=mulaw; rate=8000; channels=2 (caller, bot)",
+                "chunks": recording.chunks,
+                "marks": recording.marks,
+                "dropped_seconds": recording.dropped / RATE,
+            }
+            await self._write(f"{recording.prefix}/manifest.json", json.dumps(manifest, indent=1).encode())
+            self._release(recording)
+
+    async def _write_segment(self, recording: CallRecording, name: str, entries: List[Entry], start: int):
+        if not entries:
+            return
+
+        def _render():
+            # The ring is in arrival order, so bot audio queued ahead can
+            # hold older caller frames in it; those are cut off here
+            track = Track(max(start, min(entry[1] for entry in entries)))
+            track.render(sorted(entries, key=lambda entry: entry[1]))
+            return track.take(len(track.audio))
+
+        if await self._write(name, await asyncio.to_thread(_render)):
+            recording.segments.append(name)
+            self.segments += 1
+
+    async def _write(self, name: str, data: bytes) -> bool:
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.sink.write(name, data)
+                self.bytes_written += len(data)
+                return True
+            except Exception as e:
+                if attempt == self.max_retries or self._closing:
+                    self.failed += 1
+                    logger.error(f"Giving up on recording {name}: {e}")
+                    return False
+                self.retries += 1
+                delay = min(30.0, 0.5 * 2 ** attempt)
+                logger.warning(f"Recording upload failed, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+        return False
+
+    def _release(self, recording: CallRecording):
+        recording.drain()
+        if recording.track is not None:
+            self.memory_bytes -= recording.track.audio.nbytes
+            recording.track = None
+        if self.live.get(recording.call_sid) is recording:
+            del self.live[recording.call_sid]
+
+
+recorder = CallRecorder(
+    create_sink(settings.RECORDING_SINK),
+    mode=settings.RECORDING_MODE,
+    buffer_seconds=settings.RECORDING_BUFFER_SECONDS,
+    chunk_seconds=settings.RECORDING_CHUNK_SECONDS,
+    max_memory=settings.RECORDING_MAX_MEMORY,
+    max_retries=settings.RECORDING_MAX_RETRIES,
+)
+
+register(Gauge("recorder_memory_bytes", "Call audio held in memory for the recorder",
+               lambda: recorder.memory_bytes))
+register(Gauge("recorder_dropped_seconds_total", "Call audio dropped before it was written, in seconds",
+               lambda: recorder.dropped / RATE, type="counter"))
+register(Gauge("recorder_failed_writes_total", "Recording chunks and segments given up on after retries",
+               lambda: recorder.failed, type="counter"))
@@ -0,0 +1,625 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from functools import partial
+from typing import Dict, List, Optional, Set, Tuple
+
+from pipecat.frames.frames import (
+    CancelFrame,
+    EndFrame,
+    ErrorFrame,
+    Frame,
+    InputAudioRawFrame,
+    InterimTranscriptionFrame,
+    LLMFullResponseEndFrame,
+    LLMFullResponseStartFrame,
+    LLMTextFrame,
+    StartFrame,
+    StartInterruptionFrame,
+    StopFrame,
+    SystemFrame,
+    TextFrame,
+    TranscriptionFrame,
+    TTSAudioRawFrame,
+    TTSSpeakFrame,
+    TTSStoppedFrame,
+    UserStartedSpeakingFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.pipeline.base_pipeline import BasePipeline
+from pipecat.pipeline.pipeline import PipelineSink, PipelineSource
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor, FrameProcessorSetup
+from config import settings
+from metrics import Gauge, Histogram, register
+
+logger = logging.getLogger(__name__)
+
+# Assumed latency of a provider we have no samples for yet; equal priors keep
+# the configured preference order until there is data
+PRIOR_LATENCY = {"stt": 0.3, "tts": 0.3}
+# Weight of each new latency sample in the rolling average
+LATENCY_ALPHA = 0.2
+# Weight of each success/failure in the rolling error rate
+ERROR_ALPHA = 0.2
+# Score = latency * (1 + ERROR_PENALTY * error rate)
+ERROR_PENALTY = 4.0
+# Old failures count for less, so a provider that recovered gets picked again
+ERROR_HALF_LIFE = 60.0
+WATCH_INTERVAL = 0.1
+# Audio kept from before VAD fires, replayed on STT failover with the utterance
+REPLAY_PREROLL = 0.5
+# 30s of 20ms frames; an utterance longer than that is replayed from its tail
+REPLAY_MAX_FRAMES = 1500
+
+
+def candidates(kind: str) -> List[str]:
+    """Provider names for `kind`: the selected one, then its fallbacks"""
+    names = [getattr(settings, f"{kind.upper()}_PROVIDER")]
+    names += getattr(settings, f"{kind.upper()}_FALLBACKS", "").split(",")
+    result = []
+    for name in names:
+        name = name.strip().lower()
+        if name and name not in result:
+            result.append(name)
+    return result
+
+
+def hedged(kind: str) -> bool:
+    """Whether a call's first turn goes to the two best `kind` providers"""
+    return kind in {k.strip().lower() for k in settings.PROVIDER_HEDGE_FIRST_TURN.split(",")}
+
+
+provider_latency = {
+    (kind, name): register(Histogram(
+        "provider_latency_seconds",
+        "STT: user stopped to final transcript; TTS: first text to first audio, by provider",
+        labels={"kind": kind, "provider": name},
+    ))
+    for kind in ("stt", "tts")
+    for name in candidates(kind)
+}
+
+
+class ProviderHealth:
+    """Rolling latency and error rate of one provider, with a circuit breaker"""
+
+    def __init__(self, prior: float):
+        self.latency = prior
+        self.error_rate = 0.0
+        self.samples = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_failure = 0.0
+        self.open_until = 0.0
+
+    def observe(self, latency: float):
+        # The first real sample replaces the prior outright
+        self.latency = latency if not self.samples else self.latency + LATENCY_ALPHA * (latency - self.latency)
+        self.error_rate -= ERROR_ALPHA * self.error_rate
+        self.samples += 1
+        self.consecutive_failures = 0
+
+    def fail(self, now: float, breaker_failures: int, breaker_cooldown: float):
+        self.error_rate = self._errors(now) + ERROR_ALPHA * (1 - self._errors(now))
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_failure = now
+        if self.consecutive_failures >= breaker_failures:
+            self.open_until = now + breaker_cooldown
+
+    def _errors(self, now: float) -> float:
+        return self.error_rate * 0.5 ** ((now - self.last_failure) / ERROR_HALF_LIFE)
+
+    def is_open(self, now: float) -> bool:
+        return now < self.open_until
+
+    def score(self, now: float) -> float:
+        return self.latency * (1 + ERROR_PENALTY * self._errors(now))
+
+
+class ProviderRouter:
+    """Process-wide health scores for STT and TTS providers.
+
+    Every routed service reports how long each provider took to answer and
+    when it failed or stalled. New calls start on the best-scoring provider
+    whose circuit breaker is closed; a provider that fails
+    `breaker_failures` times in a row is skipped for `breaker_cooldown`
+    seconds unless nothing else is left.
+    """
+
+    def __init__(
+        self,
+        breaker_failures: int = settings.PROVIDER_BREAKER_FAILURES,
+        breaker_cooldown: float = settings.PROVIDER_BREAKER_COOLDOWN,
+    ):
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self._health: Dict[Tuple[str, str], ProviderHealth] = {}
+        self.failovers = 0
+        self.hedged_calls = 0
+
+    def health(self, kind: str, name: str) -> ProviderHealth:
+        health = self._health.get((kind, name))
+        if health is None:
+            health = self._health[(kind, name)] = ProviderHealth(PRIOR_LATENCY[kind])
+        return health
+
+    def rank(self, kind: str, names: List[str]) -> List[str]:
+        """`names` best first; ties keep their given order"""
+        now = time.monotonic()
+        return sorted(names, key=lambda name: (
+            self.health(kind, name).is_open(now), self.health(kind, name).score(now)
+        ))
+
+    def observe(self, kind: str, name: str, latency: float):
+        self.health(kind, name).observe(latency)
+        histogram = provider_latency.get((kind, name))
+        if histogram is not None:
+            histogram.observe(latency)
+
+    def fail(self, kind: str, name: str):
+        self.health(kind, name).fail(time.monotonic(), self.breaker_failures, self.breaker_cooldown)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        providers = {}
+        for (kind, name), health in sorted(self._health.items()):
+            providers.setdefault(kind, {})[name] = {
+                "latency": round(health.latency, 4),
+                "error_rate": round(health._errors(now), 4),
+                "score": round(health.score(now), 4),
+                "samples": health.samples,
+                "failures": health.failures,
+                "breaker_open": health.is_open(now),
+            }
+        return {"providers": providers, "failovers": self.failovers, "hedged_calls": self.hedged_calls}
+
+
+class _Branch:
+    """One provider inside a routed service, wired between its own source and sink"""
+
+    def __init__(self, name: str, service: FrameProcessor, owner: "RoutedService"):
+        self.name = name
+        self.service = service
+        self.source = PipelineSource(partial(owner._from_branch, self))
+        self.sink = PipelineSink(partial(owner._from_branch, self))
+        self.source.link(service)
+        service.link(self.sink)
+        for processor in (self.source, service, self.sink):
+            processor.set_parent(owner)
+        self.started = False
+        # Cancelled after losing a race or being failed over from; not reused this call
+        self.retired = False
+        # Output held back while this branch races another one
+        self.held: List[Tuple[Frame, FrameDirection]] = []
+        # When the current request was handed over, until it is answered
+        self.waiting_since: Optional[float] = None
+        # STT: a final transcript arrived for the current utterance
+        self.heard = False
+
+
+class RoutedService(BasePipeline):
+    """Stands in for one STT or TTS service and routes to the best provider.
+
+    Every configured provider is built up front, but only the active one is
+    started and fed; the rest are started the first time they're needed.
+    With hedging on, the call's first turn is sent to the two best providers
+    and whichever answers first becomes active. A watchdog fails over when
+    the active provider hasn't answered within `stall_timeout`, and any
+    ErrorFrame it raises fails over straight away. Lifecycle and other
+    system frames reach every started provider, and copies coming back out
+    are deduplicated by frame id.
+    """
+
+    kind = ""
+
+    def __init__(
+        self,
+        services: Dict[str, FrameProcessor],
+        stall_timeout: float,
+        hedge: bool = False,
+        router: Optional[ProviderRouter] = None,
+    ):
+        super().__init__()
+        self._router = router or provider_router
+        self._branches = {name: _Branch(name, service, self) for name, service in services.items()}
+        self.stall_timeout = stall_timeout
+        self._hedge = hedge and len(services) > 1
+        self._hedging = False
+        self._active: Optional[_Branch] = None
+        self._open: List[_Branch] = []
+        self._start_frame: Optional[StartFrame] = None
+        # frame id -> [copies still to come, copies sent, forward the last copy only]
+        self._copies: Dict[int, list] = {}
+        # Frames we injected ourselves; their output never leaves this service
+        self._internal: Set[int] = set()
+        self._switching = False
+        self._watchdog: Optional[asyncio.Task] = None
+        # (seconds into the call, from, to, reason) for the call record
+        self.switches: List[Tuple[float, str, str, str]] = []
+        self._started_at = 0.0
+        # Providers picked ahead of the StartFrame, e.g. to pre-connect them
+        self._pinned: Optional[List[str]] = None
+
+    @property
+    def active_provider(self) -> Optional[str]:
+        return self._active.name if self._active else None
+
+    def preferred(self) -> List[FrameProcessor]:
+        """The services the StartFrame will go to; the choice is fixed from here on"""
+        if self._pinned is None:
+            self._pinned = self._router.rank(self.kind, list(self._branches))[:2 if self._hedge else 1]
+        return [self._branches[name].service for name in self._pinned]
+
+    def processors_with_metrics(self) -> List[FrameProcessor]:
+        return [b.service for b in self._branches.values() if b.service.can_generate_metrics()]
+
+    async def setup(self, setup: FrameProcessorSetup):
+        await super().setup(setup)
+        for branch in self._branches.values():
+            for processor in (branch.source, branch.service, branch.sink):
+                await processor.setup(setup)
+
+    async def cleanup(self):
+        await super().cleanup()
+        await self._stop_watchdog()
+        for branch in self._branches.values():
+            for processor in (branch.source, branch.service, branch.sink):
+                await processor.cleanup()
+
+    def _started(self) -> List[_Branch]:
+        return [b for b in self._branches.values() if b.started]
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if direction == FrameDirection.UPSTREAM:
+            if isinstance(frame, ErrorFrame):
+                # Raised further down the pipeline; not ours to fail over on
+                await self.push_frame(frame, direction)
+            else:
+                # e.g. BotStoppedSpeakingFrame, which resumes a paused TTS service
+                await self._send(frame, direction, self._started())
+            return
+        if isinstance(frame, StartFrame):
+            await self._begin(frame)
+            return
+        if isinstance(frame, (EndFrame, CancelFrame)):
+            await self._stop_watchdog()
+        if not await self._on_input(frame):
+            return
+        if isinstance(frame, (SystemFrame, EndFrame, StopFrame)) and not isinstance(frame, InputAudioRawFrame):
+            await self._send(frame, direction, self._started())
+        else:
+            await self._send(frame, direction, self._open)
+
+    async def _begin(self, frame: StartFrame):
+        self._start_frame = frame
+        self._started_at = time.monotonic()
+        self.preferred()
+        first = [self._branches[name] for name in self._pinned]
+        self._hedging = len(first) > 1
+        if self._hedging:
+            self._router.hedged_calls += 1
+        for branch in first:
+            branch.started = True
+        self._active, self._open = first[0], first
+        await self._send(frame, FrameDirection.DOWNSTREAM, first)
+        self._watchdog = self.create_task(self._watch())
+
+    async def _send(self, frame: Frame, direction: FrameDirection, branches: List[_Branch]):
+        if len(branches) > 1:
+            if len(self._copies) > 1024:
+                self._copies.pop(next(iter(self._copies)))
+            self._copies[frame.id] = [len(branches), len(branches), isinstance(frame, (EndFrame, StopFrame))]
+            await asyncio.gather(*[self._send_to(b, frame, direction) for b in branches])
+        elif branches:
+            await self._send_to(branches[0], frame, direction)
+
+    async def _send_to(self, branch: _Branch, frame: Frame, direction: FrameDirection):
+        if direction == FrameDirection.DOWNSTREAM:
+            await branch.source.queue_frame(frame, direction)
+        else:
+            await branch.sink.queue_frame(frame, direction)
+
+    async def _inject(self, branch: _Branch, frame: Frame):
+        """Send a frame of our own to one branch and swallow it on the way out"""
+        if len(self._internal) > 4096:
+            self._internal.clear()
+        self._internal.add(frame.id)
+        await branch.source.queue_frame(frame, FrameDirection.DOWNSTREAM)
+
+    async def _from_branch(self, branch: _Branch, frame: Frame, direction: FrameDirection):
+        if frame.id in self._internal:
+            self._internal.discard(frame.id)
+            return
+        if isinstance(frame, ErrorFrame):
+            await self._on_error(branch, frame)
+            return
+        if direction == FrameDirection.DOWNSTREAM:
+            await self._on_output(branch, frame)
+
+        copies = self._copies.get(frame.id)
+        if copies is not None:
+            copies[0] -= 1
+            if copies[0] <= 0:
+                del self._copies[frame.id]
+            # End/Stop wait for every provider to flush; anything else goes on the first copy
+            if copies[0] == (0 if copies[2] else copies[1] - 1):
+                await self.push_frame(frame, direction)
+        elif branch is self._active and not branch.retired:
+            await self.push_frame(frame, direction)
+        elif self._hedging and branch in self._open and len(branch.held) < 256:
+            branch.held.append((frame, direction))
+
+    async def _claim(self, branch: _Branch):
+        """End the race: `branch` becomes active and its held output is released"""
+        self._hedging = False
+        self._active, self._open = branch, [branch]
+        held, branch.held = branch.held, []
+        for other in self._branches.values():
+            other.held = []
+            if other.started and other is not branch:
+                await self._retire(other)
+        for frame, direction in held:
+            await self.push_frame(frame, direction)
+
+    async def _retire(self, branch: _Branch):
+        """Cancel a provider we've moved away from, closing its connection"""
+        branch.started = False
+        branch.retired = True
+        branch.waiting_since = None
+        await self._inject(branch, CancelFrame())
+
+    async def _on_error(self, branch: _Branch, frame: ErrorFrame):
+        logger.warning(f"{self.kind.upper()} provider {branch.name} failed: {frame.error}")
+        self._router.fail(self.kind, branch.name)
+        branch.waiting_since = None
+        if branch.retired:
+            return
+        if branch is not self._active:
+            if branch in self._open:
+                self._open.remove(branch)
+        elif (self._hedging and len(self._open) > 1) or self._fallbacks(branch):
+            # Drop its output from now on. The switch runs in its own task
+            # because retiring the branch cancels the one we're running in
+            branch.retired = True
+            self.create_task(self._failover(branch, "error"))
+        else:
+            await self.push_frame(frame, FrameDirection.UPSTREAM)
+
+    def _fallbacks(self, branch: _Branch) -> List[str]:
+        return self._router.rank(
+            self.kind, [n for n, b in self._branches.items() if b is not branch and not b.retired]
+        )
+
+    async def _failover(self, branch: _Branch, reason: str) -> bool:
+        if self._switching or branch is not self._active:
+            return True
+        if self._hedging and len(self._open) > 1:
+            # The other half of the race is still going; let it win
+            self._open.remove(branch)
+            await self._claim(self._open[0])
+            new = self._open[0]
+        else:
+            names = self._fallbacks(branch)
+            if not names:
+                return False
+            new = self._branches[names[0]]
+            self._switching = True
+            try:
+                await self._switch(branch, new)
+            finally:
+                self._switching = False
+        self._router.failovers += 1
+        self.switches.append((round(time.monotonic() - self._started_at, 3), branch.name, new.name, reason))
+        logger.warning(f"{self.kind.upper()} failed over from {branch.name} to {new.name} ({reason})")
+        return True
+
+    async def _activate(self, branch: _Branch):
+        if not branch.started:
+            branch.started = True
+            # Connects the provider; the StartFrame already went downstream
+            await self._inject(branch, self._start_frame)
+        self._active, self._open = branch, [branch]
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(WATCH_INTERVAL)
+            now = time.monotonic()
+            for branch in list(self._open):
+                if branch.waiting_since is None or now - branch.waiting_since < self.stall_timeout:
+                    continue
+                branch.waiting_since = None
+                if not self._stalled(branch):
+                    continue
+                logger.warning(f"{self.kind.upper()} provider {branch.name} stalled for {self.stall_timeout}s")
+                self._router.fail(self.kind, branch.name)
+                if branch is self._active:
+                    await self._failover(branch, "stall")
+                elif branch in self._open:
+                    self._open.remove(branch)
+
+    async def _stop_watchdog(self):
+        if self._watchdog:
+            await self.cancel_task(self._watchdog)
+            self._watchdog = None
+
+    def _answered(self, branch: _Branch):
+        if branch.waiting_since is not None:
+            self._router.observe(self.kind, branch.name, time.monotonic() - branch.waiting_since)
+            branch.waiting_since = None
+
+    async def _on_input(self, frame: Frame) -> bool:
+        """Track a frame on its way in; False keeps it from the providers"""
+        return True
+
+    async def _on_output(self, branch: _Branch, frame: Frame):
+        pass
+
+    def _stalled(self, branch: _Branch) -> bool:
+        return True
+
+    async def _switch(self, old: _Branch, new: _Branch):
+        await self._activate(new)
+        await self._retire(old)
+
+
+class RoutedSTTService(RoutedService):
+    """Speech-to-text across providers.
+
+    A request starts when the user stops speaking and is answered by the
+    next final transcript. The current utterance's audio is kept (plus a
+    little from before VAD fired) so a fallback provider can be given the
+    whole utterance again when the active one stalls or errors.
+    """
+
+    kind = "stt"
+
+    def __init__(self, services: Dict[str, FrameProcessor], stall_timeout: float = settings.STT_STALL_TIMEOUT,
+                 hedge: bool = hedged("stt"), **kwargs):
+        super().__init__(services, stall_timeout, hedge, **kwargs)
+        self._audio: deque = deque(maxlen=REPLAY_MAX_FRAMES)
+        self._speaking = False
+        self._replaying = False
+        self._backlog: List[Frame] = []
+
+    async def _on_input(self, frame: Frame) -> bool:
+        if isinstance(frame, InputAudioRawFrame):
+            now = time.monotonic()
+            self._audio.append((now, frame))
+            if not self._speaking and self._active.waiting_since is None:
+                while self._audio and self._audio[0][0] < now - REPLAY_PREROLL:
+                    self._audio.popleft()
+            if self._replaying:
+                self._backlog.append(frame)
+                return False
+        elif isinstance(frame, UserStartedSpeakingFrame):
+            self._speaking = True
+            for branch in self._open:
+                branch.heard = False
+                branch.waiting_since = None
+        elif isinstance(frame, UserStoppedSpeakingFrame):
+            self._speaking = False
+            now = time.monotonic()
+            for branch in self._open:
+                branch.waiting_since = now
+        return True
+
+    async def _on_output(self, branch: _Branch, frame: Frame):
+        if isinstance(frame, TranscriptionFrame):
+            self._answered(branch)
+            branch.heard = True
+            if self._hedging and branch in self._open:
+                await self._claim(branch)
+
+    def _stalled(self, branch: _Branch) -> bool:
+        # A final that came in while the user was still talking counts as an answer
+        return not branch.heard
+
+    async def _switch(self, old: _Branch, new: _Branch):
+        self._replaying = True
+        try:
+            utterance = [frame for _, frame in self._audio]
+            await self._activate(new)
+            await self._retire(old)
+            await self._inject(new, UserStartedSpeakingFrame())
+            for frame in utterance:
+                await self._inject(new, InputAudioRawFrame(frame.audio, frame.sample_rate, frame.num_channels))
+            new.heard = False
+            if not self._speaking:
+                await self._inject(new, UserStoppedSpeakingFrame())
+                new.waiting_since = time.monotonic()
+            # Audio that arrived while the new provider was connecting
+            while self._backlog:
+                await new.source.queue_frame(self._backlog.pop(0), FrameDirection.DOWNSTREAM)
+        finally:
+            self._replaying = False
+            self._backlog = []
+
+
+def _speakable(frame: Frame) -> bool:
+    return isinstance(frame, TTSSpeakFrame) or (
+        isinstance(frame, TextFrame) and not isinstance(frame, (TranscriptionFrame, InterimTranscriptionFrame))
+    )
+
+
+class RoutedTTSService(RoutedService):
+    """Text-to-speech across providers.
+
+    A request starts with the first text of a response and is answered by
+    the first audio. Until the active provider has produced audio for the
+    response its text is kept, so a fallback can speak the whole response
+    if the active one stalls or errors. Once audio is flowing a provider is
+    only replaced for later responses.
+    """
+
+    kind = "tts"
+
+    def __init__(self, services: Dict[str, FrameProcessor], stall_timeout: float = settings.TTS_STALL_TIMEOUT,
+                 hedge: bool = hedged("tts"), **kwargs):
+        super().__init__(services, stall_timeout, hedge, **kwargs)
+        # Text of the current response not yet voiced by the active provider
+        self._pending: List[Frame] = []
+        self._ended = False
+        self._responding = False
+        self._voiced = False
+
+    def _reset(self):
+        self._pending = []
+        self._ended = False
+        self._responding = False
+        self._voiced = False
+
+    async def _on_input(self, frame: Frame) -> bool:
+        if isinstance(frame, StartInterruptionFrame):
+            self._reset()
+            for branch in self._branches.values():
+                branch.waiting_since = None
+        elif isinstance(frame, LLMFullResponseStartFrame):
+            self._reset()
+        elif isinstance(frame, LLMFullResponseEndFrame):
+            self._ended = True
+        elif _speakable(frame):
+            if not self._voiced and len(self._pending) < 1024:
+                self._pending.append(frame)
+            if not self._responding:
+                self._responding = True
+                now = time.monotonic()
+                for branch in self._open:
+                    branch.waiting_since = now
+        return True
+
+    async def _on_output(self, branch: _Branch, frame: Frame):
+        if isinstance(frame, TTSAudioRawFrame):
+            self._answered(branch)
+            if self._hedging and branch in self._open:
+                await self._claim(branch)
+            if branch is self._active and not self._voiced:
+                self._voiced = True
+                self._pending = []
+        elif isinstance(frame, TTSStoppedFrame) and branch is self._active:
+            self._responding = False
+
+    async def _switch(self, old: _Branch, new: _Branch):
+        await self._activate(new)
+        await self._retire(old)
+        for frame in self._pending:
+            if isinstance(frame, TTSSpeakFrame):
+                await new.source.queue_frame(TTSSpeakFrame(frame.text))
+            else:
+                await new.source.queue_frame(LLMTextFrame(frame.text))
+        if self._ended:
+            # The old provider never got to pass the end of the response on
+            await new.source.queue_frame(LLMFullResponseEndFrame())
+        if self._pending:
+            new.waiting_since = time.monotonic()
+
+
+provider_router = ProviderRouter()
+
+register(Gauge("provider_failovers_total", "Mid-call switches to another STT/TTS provider",
+               lambda: provider_router.failovers, type="counter"))
+register(Gauge("provider_hedged_calls_total", "Routed services that raced two providers on the first turn",
+               lambda: provider_router.hedged_calls, type="counter"))
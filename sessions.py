@@ -0,0 +1,530 @@
+import asyncio
+import inspect
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import quote
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
+
+
+class SessionRegistry(ABC):
+    """Live call state shared by every worker serving this app.
+
+    Workers advertise how many concurrent pipelines they can take and
+    heartbeat their load; /agent admits a call only while the live workers
+    have a free slot. Admitted calls hold their slot until /ws ends them, or
+    until `reservation_ttl` if the media stream never shows up. It also
+    carries messages between workers and small pieces of state every
+    worker can read, such as a campaign's progress.
+    """
+
+    def __init__(self, worker_ttl: float, reservation_ttl: float):
+        self.worker_ttl = worker_ttl
+        self.reservation_ttl = reservation_ttl
+        self.admitted = 0
+        self.shed = 0
+
+    async def admit(self, call_sid: str) -> bool:
+        """Reserve a slot for a new call, counting admissions and sheds"""
+        if await self.try_admit(call_sid):
+            self.admitted += 1
+            return True
+        self.shed += 1
+        return False
+
+    @abstractmethod
+    async def register_worker(self, worker_id: str, capacity: int, active: int = 0):
+        """Advertise (or refresh) a worker's capacity and current load"""
+
+    @abstractmethod
+    async def remove_worker(self, worker_id: str):
+        """Forget a worker and the calls it was running"""
+
+    @abstractmethod
+    async def try_admit(self, call_sid: str) -> bool:
+        """Reserve a slot for the call if the live workers have one free"""
+
+    @abstractmethod
+    async def activate(self, call_sid: str, worker_id: str):
+        """Mark an admitted call as running on `worker_id`"""
+
+    @abstractmethod
+    async def finish(self, call_sid: str):
+        """Release the call's slot"""
+
+    @abstractmethod
+    async def stats(self) -> dict:
+        """Workers, capacity and calls across the cluster"""
+
+    @abstractmethod
+    async def send(self, worker_id: str, message: dict):
+        """Queue a message for one worker, e.g. a Twilio callback meant for it"""
+
+    @abstractmethod
+    async def receive(self, worker_id: str) -> List[dict]:
+        """Take the messages queued for a worker, oldest first"""
+
+    @abstractmethod
+    async def publish(self, key: str, value: dict, ttl: float):
+        """Share `value` with every worker for `ttl` seconds"""
+
+    @abstractmethod
+    async def lookup(self, key: str) -> Optional[dict]:
+        """What was last published under `key`, unless it has expired"""
+
+    async def close(self):
+        pass
+
+
+class MemorySessionRegistry(SessionRegistry):
+    """Single-process registry, for one worker or for local testing"""
+
+    def __init__(self, worker_ttl: float, reservation_ttl: float):
+        super().__init__(worker_ttl, reservation_ttl)
+        self._workers = {}
+        self._calls = {}
+        self._inboxes: Dict[str, deque] = {}
+        self._shared: Dict[str, tuple] = {}
+
+    async def register_worker(self, worker_id, capacity, active=0):
+        self._workers[worker_id] = (capacity, active, time.time())
+
+    async def remove_worker(self, worker_id):
+        self._workers.pop(worker_id, None)
+        self._inboxes.pop(worker_id, None)
+        for call_sid, call in list(self._calls.items()):
+            if call["worker_id"] == worker_id:
+                del self._calls[call_sid]
+
+    async def try_admit(self, call_sid):
+        self._expire(time.time())
+        if len(self._calls) >= self._capacity():
+            return False
+        self._calls[call_sid] = {"state": "admitted", "worker_id": None, "updated": time.time()}
+        return True
+
+    async def activate(self, call_sid, worker_id):
+        self._calls[call_sid] = {"state": "active", "worker_id": worker_id, "updated": time.time()}
+
+    async def finish(self, call_sid):
+        self._calls.pop(call_sid, None)
+
+    async def stats(self):
+        self._expire(time.time())
+        return _stats(self._capacity(), self._calls.values(), len(self._workers))
+
+    async def send(self, worker_id, message):
+        self._inboxes.setdefault(worker_id, deque()).append(message)
+
+    async def receive(self, worker_id):
+        inbox = self._inboxes.pop(worker_id, None)
+        return list(inbox) if inbox else []
+
+    async def publish(self, key, value, ttl):
+        self._shared[key] = (value, time.time() + ttl)
+
+    async def lookup(self, key):
+        value, expires = self._shared.get(key, (None, 0))
+        if expires < time.time():
+            self._shared.pop(key, None)
+            return None
+        return value
+
+    def _capacity(self) -> int:
+        return sum(capacity for capacity, _, _ in self._workers.values())
+
+    def _expire(self, now: float):
+        for worker_id, (_, _, heartbeat) in list(self._workers.items()):
+            if heartbeat < now - self.worker_ttl:
+                del self._workers[worker_id]
+        for call_sid, call in list(self._calls.items()):
+            stale_reservation = call["state"] == "admitted" and call["updated"] < now - self.reservation_ttl
+            if stale_reservation or (call["worker_id"] and call["worker_id"] not in self._workers):
+                del self._calls[call_sid]
+
+
+class SQLiteSessionRegistry(SessionRegistry):
+    """Registry in a local SQLite file, shared by workers on the same host"""
+
+    def __init__(self, path: str, worker_ttl: float, reservation_ttl: float):
+        super().__init__(worker_ttl, reservation_ttl)
+        self.path = path
+        db = self._connect()
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS workers ("
+                "worker_id TEXT PRIMARY KEY, capacity INTEGER, active INTEGER, heartbeat REAL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS calls ("
+                "call_sid TEXT PRIMARY KEY, state TEXT, worker_id TEXT, updated REAL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, worker_id TEXT, body TEXT, created REAL)"
+            )
+            db.execute("CREATE TABLE IF NOT EXISTS shared (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+        finally:
+            db.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    async def _run(self, fn, *args):
+        return await asyncio.to_thread(self._transaction, fn, *args)
+
+    def _transaction(self, fn, *args):
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            result = fn(db, time.time(), *args)
+            db.execute("COMMIT")
+            return result
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+
+    def _expire(self, db: sqlite3.Connection, now: float):
+        db.execute("DELETE FROM workers WHERE heartbeat < ?", (now - self.worker_ttl,))
+        db.execute(
+            "DELETE FROM calls WHERE (state = 'admitted' AND updated < ?) "
+            "OR (worker_id IS NOT NULL AND worker_id NOT IN (SELECT worker_id FROM workers))",
+            (now - self.reservation_ttl,),
+        )
+
+    async def register_worker(self, worker_id, capacity, active=0):
+        def _register(db, now):
+            db.execute(
+                "INSERT OR REPLACE INTO workers VALUES (?, ?, ?, ?)",
+                (worker_id, capacity, active, now),
+            )
+        await self._run(_register)
+
+    async def remove_worker(self, worker_id):
+        def _remove(db, now):
+            db.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+            db.execute("DELETE FROM calls WHERE worker_id = ?", (worker_id,))
+            db.execute("DELETE FROM messages WHERE worker_id = ?", (worker_id,))
+        await self._run(_remove)
+
+    async def try_admit(self, call_sid):
+        def _admit(db, now):
+            self._expire(db, now)
+            capacity = db.execute("SELECT COALESCE(SUM(capacity), 0) FROM workers").fetchone()[0]
+            in_use = db.execute("SELECT COUNT(*) FROM calls").fetchone()[0]
+            if in_use >= capacity:
+                return False
+            db.execute(
+                "INSERT OR REPLACE INTO calls VALUES (?, 'admitted', NULL, ?)", (call_sid, now)
+            )
+            return True
+        return await self._run(_admit)
+
+    async def activate(self, call_sid, worker_id):
+        def _activate(db, now):
+            db.execute(
+                "INSERT OR REPLACE INTO calls VALUES (?, 'active', ?, ?)", (call_sid, worker_id, now)
+            )
+        await self._run(_activate)
+
+    async def finish(self, call_sid):
+        def _finish(db, now):
+            db.execute("DELETE FROM calls WHERE call_sid = ?", (call_sid,))
+        await self._run(_finish)
+
+    async def stats(self):
+        def _stats_query(db, now):
+            self._expire(db, now)
+            capacity, workers = db.execute(
+                "SELECT COALESCE(SUM(capacity), 0), COUNT(*) FROM workers"
+            ).fetchone()
+            calls = [{"state": state} for (state,) in db.execute("SELECT state FROM calls")]
+            return _stats(capacity, calls, workers)
+        return await self._run(_stats_query)
+
+    async def send(self, worker_id, message):
+        def _send(db, now):
+            # Nobody has picked these up within a heartbeat TTL; their worker is gone
+            db.execute("DELETE FROM messages WHERE created < ?", (now - self.worker_ttl,))
+            db.execute(
+                "INSERT INTO messages (worker_id, body, created) VALUES (?, ?, ?)",
+                (worker_id, json.dumps(message), now),
+            )
+        await self._run(_send)
+
+    async def receive(self, worker_id):
+        def _receive(db, now):
+            rows = db.execute(
+                "SELECT id, body FROM messages WHERE worker_id = ? ORDER BY id", (worker_id,)
+            ).fetchall()
+            if rows:
+                db.execute("DELETE FROM messages WHERE worker_id = ? AND id <= ?", (worker_id, rows[-1][0]))
+            return [json.loads(body) for _, body in rows]
+        return await self._run(_receive)
+
+    async def publish(self, key, value, ttl):
+        def _publish(db, now):
+            db.execute("DELETE FROM shared WHERE expires < ?", (now,))
+            db.execute("INSERT OR REPLACE INTO shared VALUES (?, ?, ?)", (key, json.dumps(value), now + ttl))
+        await self._run(_publish)
+
+    async def lookup(self, key):
+        def _lookup(db, now):
+            row = db.execute("SELECT value FROM shared WHERE key = ? AND expires >= ?", (key, now)).fetchone()
+            return json.loads(row[0]) if row else None
+        return await self._run(_lookup)
+
+
+_REDIS_ADMIT = """
+local now = tonumber(ARGV[2])
+local capacity = 0
+local live = {}
+local workers = redis.call('HGETALL', KEYS[1])
+for i = 1, #workers, 2 do
+    local worker = cjson.decode(workers[i + 1])
+    if worker.heartbeat >= now - tonumber(ARGV[3]) then
+        capacity = capacity + worker.capacity
+        live[workers[i]] = true
+    else
+        redis.call('HDEL', KEYS[1], workers[i])
+    end
+end
+local calls = redis.call('HGETALL', KEYS[2])
+local in_use = 0
+for i = 1, #calls, 2 do
+    local call = cjson.decode(calls[i + 1])
+    local stale = (call.state == 'admitted' and call.updated < now - tonumber(ARGV[4]))
+        or (call.worker_id and not live[call.worker_id])
+    if stale then
+        redis.call('HDEL', KEYS[2], calls[i])
+    else
+        in_use = in_use + 1
+    end
+end
+if in_use >= capacity then
+    return 0
+end
+redis.call('HSET', KEYS[2], ARGV[1], cjson.encode({state = 'admitted', updated = now}))
+return 1
+"""
+
+
+class RedisSessionRegistry(SessionRegistry):
+    """Registry in Redis (or anything speaking its protocol) for multi-host setups"""
+
+    def __init__(self, url: str, worker_ttl: float, reservation_ttl: float, prefix: str = "tma"):
+        super().__init__(worker_ttl, reservation_ttl)
+        # Optional dependency, only needed when SESSION_REGISTRY_URL is redis://
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(url)
+        self._prefix = prefix
+        self._workers_key = f"{prefix}:workers"
+        self._calls_key = f"{prefix}:calls"
+        self._admit = self._redis.register_script(_REDIS_ADMIT)
+
+    async def register_worker(self, worker_id, capacity, active=0):
+        await self._redis.hset(self._workers_key, worker_id, json.dumps(
+            {"capacity": capacity, "active": active, "heartbeat": time.time()}
+        ))
+
+    async def remove_worker(self, worker_id):
+        await self._redis.hdel(self._workers_key, worker_id)
+        await self._redis.delete(f"{self._prefix}:inbox:{worker_id}")
+
+    async def try_admit(self, call_sid):
+        admitted = await self._admit(
+            keys=[self._workers_key, self._calls_key],
+            args=[call_sid, time.time(), self.worker_ttl, self.reservation_ttl],
+        )
+        return bool(admitted)
+
+    async def activate(self, call_sid, worker_id):
+        await self._redis.hset(self._calls_key, call_sid, json.dumps(
+            {"state": "active", "worker_id": worker_id, "updated": time.time()}
+        ))
+
+    async def finish(self, call_sid):
+        await self._redis.hdel(self._calls_key, call_sid)
+
+    async def stats(self):
+        now = time.time()
+        workers = [json.loads(w) for w in (await self._redis.hgetall(self._workers_key)).values()]
+        live = [w for w in workers if w["heartbeat"] >= now - self.worker_ttl]
+        calls = [json.loads(c) for c in (await self._redis.hgetall(self._calls_key)).values()]
+        return _stats(sum(w["capacity"] for w in live), calls, len(live))
+
+    async def send(self, worker_id, message):
+        key = f"{self._prefix}:inbox:{worker_id}"
+        async with self._redis.pipeline(transaction=True) as pipe:
+            # Refreshed by every message; an inbox nobody reads within a heartbeat TTL is dropped
+            pipe.rpush(key, json.dumps(message))
+            pipe.expire(key, max(1, int(self.worker_ttl)))
+            await pipe.execute()
+
+    async def receive(self, worker_id):
+        key = f"{self._prefix}:inbox:{worker_id}"
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.lrange(key, 0, -1)
+            pipe.delete(key)
+            messages, _ = await pipe.execute()
+        return [json.loads(m) for m in messages]
+
+    async def publish(self, key, value, ttl):
+        await self._redis.set(f"{self._prefix}:shared:{key}", json.dumps(value), ex=max(1, int(ttl)))
+
+    async def lookup(self, key):
+        value = await self._redis.get(f"{self._prefix}:shared:{key}")
+        return json.loads(value) if value else None
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+def _stats(capacity: int, calls, workers: int) -> dict:
+    calls = list(calls)
+    active = sum(1 for c in calls if c["state"] == "active")
+    return {
+        "workers": workers,
+        "capacity": capacity,
+        "active": active,
+        "admitted": len(calls) - active,
+        "available": max(0, capacity - len(calls)),
+    }
+
+
+def create_registry(url: str) -> SessionRegistry:
+    kwargs = dict(
+        worker_ttl=settings.WORKER_HEARTBEAT_TTL,
+        reservation_ttl=settings.CALL_RESERVATION_TTL,
+    )
+    if url.startswith(("redis://", "rediss://")):
+        return RedisSessionRegistry(url, **kwargs)
+    if url.startswith("sqlite:///"):
+        return SQLiteSessionRegistry(url[len("sqlite:///"):], **kwargs)
+    return MemorySessionRegistry(**kwargs)
+
+
+class WorkerHeartbeat:
+    """Advertises this worker's capacity and load to the registry"""
+
+    def __init__(self, registry: SessionRegistry, capacity: int, active, interval: float):
+        self.registry = registry
+        self.capacity = capacity
+        self.active = active
+        self.interval = interval
+        self.draining = False
+        self._task: Optional[asyncio.Task] = None
+
+    def _capacity(self) -> int:
+        # A draining worker keeps the slots its live calls hold and offers no more
+        return self.active() if self.draining else self.capacity
+
+    async def start(self):
+        await self.registry.register_worker(WORKER_ID, self.capacity, self.active())
+        self._task = asyncio.get_running_loop().create_task(self._beat())
+        logger.info(f"Worker {WORKER_ID} advertising {self.capacity} concurrent calls")
+
+    async def drain(self):
+        """Stop advertising spare capacity, without waiting for the next beat"""
+        self.draining = True
+        await self.registry.register_worker(WORKER_ID, self._capacity(), self.active())
+        logger.info(f"Worker {WORKER_ID} draining, no longer taking calls")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        await self.registry.remove_worker(WORKER_ID)
+
+    async def _beat(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.registry.register_worker(WORKER_ID, self._capacity(), self.active())
+            except Exception as e:
+                logger.error(f"Worker heartbeat failed: {e}")
+
+
+def callback_url(path: str) -> str:
+    """Public URL for a Twilio status callback that should reach this worker"""
+    return f"https://{settings.HOST}{path}?worker={quote(WORKER_ID)}"
+
+
+class WorkerMailbox:
+    """Gets Twilio callbacks and commands to the worker whose state they concern.
+
+    Callback URLs name the worker that placed the call (callback_url). The
+    worker a callback lands on handles it if that's itself, or no worker is
+    named, and otherwise queues it in the registry, where the owner picks
+    it up within `interval` seconds.
+    """
+
+    def __init__(self, registry: SessionRegistry, interval: float):
+        self.registry = registry
+        self.interval = interval
+        self._handlers: Dict[str, Callable[[dict], Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.forwarded = 0
+        self.received = 0
+
+    def on(self, kind: str, handler: Callable[[dict], Any]):
+        self._handlers[kind] = handler
+
+    async def deliver(self, worker_id: Optional[str], kind: str, payload: dict) -> bool:
+        """Handle `payload` here, or pass it on to `worker_id`; True if it was handled here"""
+        if not worker_id or worker_id == WORKER_ID:
+            await self._dispatch(kind, payload)
+            return True
+        await self.registry.send(worker_id, {"kind": kind, "payload": payload})
+        self.forwarded += 1
+        return False
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._poll())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _dispatch(self, kind: str, payload: dict):
+        handler = self._handlers.get(kind)
+        if handler is None:
+            logger.warning(f"No handler for {kind} message")
+            return
+        result = handler(payload)
+        if inspect.isawaitable(result):
+            await result
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                messages = await self.registry.receive(WORKER_ID)
+            except Exception as e:
+                logger.error(f"Failed to fetch messages for this worker: {e}")
+                continue
+            for message in messages:
+                self.received += 1
+                try:
+                    await self._dispatch(message["kind"], message["payload"])
+                except Exception as e:
+                    logger.error(f"Failed to handle forwarded {message['kind']} message: {e}")
+
+
+session_registry = create_registry(settings.SESSION_REGISTRY_URL)
+mailbox = WorkerMailbox(session_registry, settings.MAILBOX_POLL_INTERVAL)
@@ -0,0 +1,406 @@
+import asyncio
+import logging
+import re
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+from xml.sax.saxutils import escape
+
+from pipecat.adapters.schemas.function_schema import FunctionSchema
+from pipecat.adapters.schemas.tools_schema import ToolsSchema
+from pipecat.frames.frames import (
+    BotStartedSpeakingFrame,
+    BotStoppedSpeakingFrame,
+    Frame,
+    FunctionCallResultProperties,
+    LLMFullResponseStartFrame,
+    LLMTextFrame,
+    StartInterruptionFrame,
+)
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+from pipecat.services.llm_service import FunctionCallParams
+from config import settings
+from dashboard import transcript_hub
+from metrics import Gauge, Histogram, register
+from recorder import recorder
+from sessions import callback_url, mailbox
+from twilio_client import twilio_api
+
+logger = logging.getLogger(__name__)
+
+TRANSFER_TOOLS = ToolsSchema(standard_tools=[FunctionSchema(
+    name="transfer_call",
+    description="Put the caller through to a human energy specialist once they've shown qualified interest",
+    properties={"reason": {"type": "string", "description": "Short summary of what the caller is interested in"}},
+    required=["reason"],
+)])
+
+FINAL_STATUSES = {"completed", "busy", "no-answer", "failed", "canceled"}
+
+# "warm": the agent was already waiting in the conference; "cold": still ringing
+transfer_gap = {
+    mode: register(Histogram(
+        "transfer_gap_seconds", "transfer_call to the caller being bridged with a human agent",
+        labels={"mode": mode},
+    ))
+    for mode in ("warm", "cold")
+}
+
+
+def conference_twiml(name: str, start: bool) -> str:
+    """Join the call's transfer conference. The agent leg starts it; the caller
+    hears hold music until the agent is there, and either leaving ends it"""
+    return (
+        '<Response><Dial><Conference beep="false" endConferenceOnExit="true" '
+        f'startConferenceOnEnter="{"true" if start else "false"}">{escape(name)}</Conference></Dial></Response>'
+    )
+
+
+@dataclass
+class Transfer:
+    call_sid: str
+    conference: str
+    dialed_at: float
+    agent_sid: Optional[str] = None
+    answered_at: Optional[float] = None
+    requested_at: Optional[float] = None
+    # When the caller's redirect into the conference went through
+    joined_at: Optional[float] = None
+    bridged_at: Optional[float] = None
+    # The agent leg ended before it was bridged
+    failed: bool = False
+    # The bot's side of the call is over
+    ended: bool = False
+    reason: str = ""
+    hold: Optional[asyncio.TimerHandle] = None
+
+    def summary(self) -> dict:
+        return {
+            "conference": self.conference,
+            "requested": self.requested_at is not None,
+            "reason": self.reason,
+            "predialed_for": (
+                round(self.requested_at - self.dialed_at, 3)
+                if self.requested_at is not None and self.dialed_at < self.requested_at else None
+            ),
+            "gap": round(self.bridged_at - self.requested_at, 3) if self.bridged_at else None,
+        }
+
+
+class TransferManager:
+    """Warm transfers from the bot to a human agent through a Twilio conference.
+
+    As soon as a caller sounds interested, `prepare` dials the agent line
+    into a conference named after the call, where the agent waits. When the
+    model calls transfer_call, `transfer` redirects the caller into that
+    conference, so the bridge takes one REST request instead of the caller
+    sitting through a fresh outbound call ringing. A transfer nobody
+    prepared dials the agent at that point, with the caller on hold music.
+    The reason and transcript so far go to the dashboard and to
+    `handoff_url` in the background. A pre-dialed agent that isn't needed
+    within `hold_timeout`, or whose caller hangs up first, is released.
+    Transfers live on the worker running the caller's bot; `status_url`
+    names that worker so agent leg callbacks are handed back to it.
+    """
+
+    def __init__(self, number: Optional[str], status_url: str, hold_timeout: float,
+                 handoff_url: Optional[str] = None, unavailable_message: str = ""):
+        self.number = number
+        self.status_url = status_url
+        self.hold_timeout = hold_timeout
+        self.handoff_url = handoff_url
+        self.unavailable_message = unavailable_message
+        # By the caller's CallSid, and by the agent leg's
+        self._transfers: Dict[str, Transfer] = {}
+        self._agents: Dict[str, Transfer] = {}
+        self._tasks = set()
+        self._http = None
+        self.predialed = 0
+        self.warm = 0
+        self.cold = 0
+        self.released = 0
+        self.failed = 0
+
+    @property
+    def available(self) -> bool:
+        return bool(self.number)
+
+    def prepare(self, call_sid: Optional[str]) -> Optional[Transfer]:
+        """Dial the agent into the call's conference ahead of a likely transfer"""
+        if not self.available or not call_sid:
+            return None
+        transfer = self._transfers.get(call_sid)
+        if transfer is not None and not transfer.failed:
+            return transfer
+        self.predialed += 1
+        transfer = self._start(call_sid)
+        transfer.hold = asyncio.get_running_loop().call_later(self.hold_timeout, self._hold_expired, transfer)
+        return transfer
+
+    async def transfer(self, call_sid: str, reason: str, messages: List[dict]) -> bool:
+        """Bridge the caller to the agent, dialing now if nobody was pre-dialed"""
+        if not self.available:
+            return False
+        transfer = self._transfers.get(call_sid)
+        if transfer is not None and transfer.requested_at is not None and not transfer.failed:
+            return True
+        if transfer is None or transfer.failed:
+            transfer = self._start(call_sid)
+        if transfer.hold:
+            transfer.hold.cancel()
+        transfer.requested_at = time.monotonic()
+        transfer.reason = reason
+        self._handoff(transfer, messages)
+        try:
+            await twilio_api.update_call(call_sid, twiml=conference_twiml(transfer.conference, start=False))
+        except Exception as e:
+            logger.error(f"Failed to move {call_sid} into its transfer conference: {e}")
+            self._release(transfer)
+            return False
+        transfer.joined_at = time.monotonic()
+        logger.info(f"Transferring {call_sid} ({reason!r}), agent {'waiting' if transfer.answered_at else 'ringing'}")
+        self._check_bridged(transfer)
+        return True
+
+    def handle_status(self, agent_sid: Optional[str], status: Optional[str]):
+        """Status callback for agent legs"""
+        transfer = self._agents.get(agent_sid)
+        if transfer is None:
+            return
+        if status == "in-progress":
+            transfer.answered_at = time.monotonic()
+            self._check_bridged(transfer)
+        elif status in FINAL_STATUSES:
+            self._agents.pop(agent_sid, None)
+            if transfer.bridged_at is not None:
+                return
+            transfer.failed = True
+            self.failed += 1
+            logger.warning(f"Agent leg for {transfer.call_sid} ended unbridged ({status})")
+            if transfer.joined_at is not None:
+                # The caller is on hold for an agent who isn't coming
+                self._background(self._apologise(transfer), f"apologise to {transfer.call_sid}")
+            if transfer.ended:
+                self._forget(transfer)
+
+    def end(self, call_sid: Optional[str]) -> Optional[dict]:
+        """The bot's side of the call is over; release an agent it never used"""
+        transfer = self._transfers.get(call_sid)
+        if transfer is None:
+            return None
+        transfer.ended = True
+        if transfer.requested_at is None:
+            self._release(transfer)
+        elif transfer.bridged_at is not None:
+            self._forget(transfer)
+        else:
+            # Keep listening for the agent to answer, but not forever
+            transfer.hold = asyncio.get_running_loop().call_later(self.hold_timeout, self._forget, transfer)
+        return transfer.summary()
+
+    async def close(self):
+        for transfer in list(self._transfers.values()):
+            if transfer.requested_at is None:
+                self._release(transfer)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def stats(self) -> dict:
+        return {
+            "available": self.available,
+            "pending": len(self._transfers),
+            "predialed": self.predialed,
+            "warm": self.warm,
+            "cold": self.cold,
+            "released": self.released,
+            "failed": self.failed,
+        }
+
+    def _start(self, call_sid: str) -> Transfer:
+        transfer = Transfer(call_sid, f"transfer-{call_sid}", time.monotonic())
+        self._transfers[call_sid] = transfer
+        self._background(self._dial(transfer), f"dial agent for {call_sid}")
+        return transfer
+
+    async def _dial(self, transfer: Transfer):
+        try:
+            call = await twilio_api.dial(
+                self.number, conference_twiml(transfer.conference, start=True), status_callback=self.status_url
+            )
+        except Exception as e:
+            logger.error(f"Failed to dial transfer agent for {transfer.call_sid}: {e}")
+            transfer.failed = True
+            self.failed += 1
+            return
+        transfer.agent_sid = call.sid
+        self._agents[call.sid] = transfer
+        if self._transfers.get(transfer.call_sid) is not transfer:
+            # Released while the dial was in flight
+            await self._hang_up(call.sid)
+
+    def _check_bridged(self, transfer: Transfer):
+        if transfer.bridged_at is not None or transfer.joined_at is None or transfer.answered_at is None:
+            return
+        transfer.bridged_at = max(transfer.joined_at, transfer.answered_at)
+        mode = "warm" if transfer.answered_at <= transfer.requested_at else "cold"
+        setattr(self, mode, getattr(self, mode) + 1)
+        gap = transfer.bridged_at - transfer.requested_at
+        transfer_gap[mode].observe(gap)
+        logger.info(f"Bridged {transfer.call_sid} to an agent {gap:.3f}s after transfer_call ({mode})")
+        if transfer.ended:
+            self._forget(transfer)
+
+    def _hold_expired(self, transfer: Transfer):
+        if transfer.requested_at is None:
+            logger.info(f"Pre-dialed agent for {transfer.call_sid} not needed after {self.hold_timeout}s")
+            self._release(transfer)
+
+    def _release(self, transfer: Transfer):
+        """Drop a transfer that won't happen and free its agent"""
+        self._forget(transfer)
+        if transfer.agent_sid and transfer.bridged_at is None and not transfer.failed:
+            self.released += 1
+            self._agents.pop(transfer.agent_sid, None)
+            self._background(self._hang_up(transfer.agent_sid), f"release agent for {transfer.call_sid}")
+
+    def _forget(self, transfer: Transfer):
+        if transfer.hold:
+            transfer.hold.cancel()
+        if self._transfers.get(transfer.call_sid) is transfer:
+            del self._transfers[transfer.call_sid]
+
+    async def _hang_up(self, call_sid: str):
+        await twilio_api.update_call(call_sid, status="completed")
+
+    async def _apologise(self, transfer: Transfer):
+        twiml = f"<Response><Say>{escape(self.unavailable_message)}</Say><Hangup/></Response>"
+        await twilio_api.update_call(transfer.call_sid, twiml=twiml)
+
+    def _handoff(self, transfer: Transfer, messages: List[dict]):
+        """Give the agent the reason and transcript without holding up the bridge"""
+        handoff = {
+            "call_sid": transfer.call_sid,
+            "conference": transfer.conference,
+            "reason": transfer.reason,
+            "transcript": [
+                {"role": m["role"], "content": m["content"]}
+                for m in messages
+                if m.get("role") in ("user", "assistant") and isinstance(m.get("content"), str)
+            ],
+        }
+        transcript_hub.publish(transfer.call_sid, {"type": "transfer", **handoff})
+        if self.handoff_url:
+            self._background(self._post_handoff(handoff), f"hand off {transfer.call_sid}")
+
+    async def _post_handoff(self, handoff: dict):
+        if self._http is None:
+            import httpx
+
+            self._http = httpx.AsyncClient(timeout=10)
+        response = await self._http.post(self.handoff_url, json=handoff)
+        response.raise_for_status()
+
+    def _background(self, coro, description: str):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+
+        def _done(t: asyncio.Task):
+            self._tasks.discard(t)
+            if not t.cancelled() and t.exception():
+                logger.error(f"Transfer task failed ({description}): {t.exception()}")
+
+        task.add_done_callback(_done)
+
+
+class TransferProcessor(FrameProcessor):
+    """Sits right after the LLM and watches for a transfer coming.
+
+    At the start of each response it checks the caller's last message
+    against `interest` and, on a match, has the manager pre-dial the agent.
+    It also follows the bot's speech, so transfer_call can let the bot
+    finish its hand-off line before the caller is redirected.
+    """
+
+    def __init__(self, call_sid: Optional[str], context: OpenAILLMContext, manager: TransferManager,
+                 interest: Optional[re.Pattern] = None, **kwargs):
+        super().__init__(**kwargs)
+        self._call_sid = call_sid
+        self._context = context
+        self._manager = manager
+        self._interest = interest
+        self._quiet = asyncio.Event()
+        self._quiet.set()
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if isinstance(frame, LLMFullResponseStartFrame):
+            self._check_interest()
+        elif isinstance(frame, (LLMTextFrame, BotStartedSpeakingFrame)):
+            # Text on its way to TTS, or being spoken
+            self._quiet.clear()
+        elif isinstance(frame, (BotStoppedSpeakingFrame, StartInterruptionFrame)):
+            self._quiet.set()
+        await self.push_frame(frame, direction)
+
+    async def bot_quiet(self, timeout: float):
+        """Wait for the bot to finish what it's saying, up to `timeout` seconds"""
+        try:
+            await asyncio.wait_for(self._quiet.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _check_interest(self):
+        if self._interest is None or not self._manager.available:
+            return
+        for message in reversed(self._context.get_messages()):
+            if message.get("role") == "user":
+                content = message.get("content")
+                if isinstance(content, str) and self._interest.search(content):
+                    self._manager.prepare(self._call_sid)
+                return
+
+
+def transfer_call_handler(call_sid: Optional[str], processor: TransferProcessor, manager: TransferManager,
+                          messages: Callable[[], List[dict]]):
+    """The transfer_call function for a call's LLM service"""
+
+    async def transfer_call(params: FunctionCallParams):
+        reason = str(params.arguments.get("reason") or "")
+        if not manager.available or not call_sid:
+            await params.result_callback({
+                "status": "unavailable",
+                "detail": "Nobody can take a transfer right now; offer to have a specialist call back",
+            })
+            return
+        # The call leaves the pipeline now; nothing more for the model to say
+        await params.result_callback(
+            {"status": "transferring"}, properties=FunctionCallResultProperties(run_llm=False)
+        )
+        await processor.bot_quiet(settings.TRANSFER_SPEECH_WAIT)
+        # The turn that led here, hand-off line included
+        recorder.mark(call_sid, "transfer")
+        await manager.transfer(call_sid, reason, messages())
+
+    return transfer_call
+
+
+transfers = TransferManager(
+    number=settings.TRANSFER_NUMBER,
+    status_url=callback_url("/transfers/status"),
+    hold_timeout=settings.TRANSFER_HOLD_TIMEOUT,
+    handoff_url=settings.TRANSFER_HANDOFF_URL,
+    unavailable_message=settings.TRANSFER_UNAVAILABLE_MESSAGE,
+)
+mailbox.on("transfer_status", lambda m: transfers.handle_status(m["call_sid"], m["status"]))
+transfer_interest = re.compile(settings.TRANSFER_INTEREST_PATTERN, re.IGNORECASE) if settings.TRANSFER_PREDIAL else None
+
+register(Gauge("transfers_predialed_total", "Agent legs dialed into a conference ahead of a transfer",
+               lambda: transfers.predialed, type="counter"))
+register(Gauge("transfers_released_total", "Pre-dialed agent legs hung up unused",
+               lambda: transfers.released, type="counter"))
+register(Gauge("transfers_failed_total", "Agent legs that ended before they were bridged",
+               lambda: transfers.failed, type="counter"))
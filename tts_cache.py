@@ -0,0 +1,355 @@
+import argparse
+import asyncio
+import audioop
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import aiohttp
+from pipecat.frames.frames import (
+    Frame,
+    LLMFullResponseEndFrame,
+    LLMFullResponseStartFrame,
+    LLMTextFrame,
+    StartInterruptionFrame,
+    TTSAudioRawFrame,
+    TTSSpeakFrame,
+    TTSStartedFrame,
+    TTSStoppedFrame,
+    TTSTextFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+from pipecat.utils.string import match_endofsentence
+from config import settings
+from metrics import Gauge, register
+from utils.logging import call_debug_enabled
+
+logger = logging.getLogger(__name__)
+
+ULAW_SAMPLE_RATE = 8000
+# 100ms of 8 kHz μ-law per pushed audio frame
+CHUNK_BYTES = ULAW_SAMPLE_RATE // 10
+
+
+def normalize_text(text: str) -> str:
+    text = text.replace("’", "'").replace("‘", "'")
+    text = text.replace("“", '"').replace("”", '"')
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def cache_namespace(voice_id: str, model: str, voice_settings: dict) -> str:
+    """Everything besides the text that changes the rendered audio"""
+    return json.dumps(
+        {"voice_id": voice_id, "model": model, "settings": voice_settings},
+        sort_keys=True,
+    )
+
+
+def cache_key(text: str, namespace: str) -> str:
+    return hashlib.sha256(f"{namespace}\n{normalize_text(text)}".encode()).hexdigest()
+
+
+class TTSCache:
+    """Two-tier cache of rendered phrases as 8 kHz μ-law bytes.
+
+    The memory tier is an LRU bounded by total bytes; the disk tier is one
+    file per phrase under `directory` and is promoted into memory on read.
+    """
+
+    def __init__(self, directory: Optional[str], max_memory_bytes: int):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self._memory = OrderedDict()
+        self.memory_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._miss_counts = {}
+        self._filling = set()
+        self._tasks = set()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        audio = self._memory.get(key)
+        if audio is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return audio
+        if self.directory:
+            audio = await asyncio.to_thread(self._read_file, key)
+            if audio is not None:
+                self.disk_hits += 1
+                self._remember(key, audio)
+                return audio
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, audio: bytes):
+        self._remember(key, audio)
+        if self.directory:
+            await asyncio.to_thread(self._write_file, key, audio)
+
+    def note_miss(self, key: str) -> int:
+        """Count misses per phrase so only repeated lines get filled"""
+        if len(self._miss_counts) > 10000:
+            self._miss_counts.clear()
+        self._miss_counts[key] = self._miss_counts.get(key, 0) + 1
+        return self._miss_counts[key]
+
+    def fill_in_background(self, key: str, text: str, tts_params: dict):
+        if key in self._filling:
+            return
+        self._filling.add(key)
+
+        async def _fill():
+            try:
+                await self.put(key, await synthesize_ulaw(text, **tts_params))
+                self._miss_counts.pop(key, None)
+                if call_debug_enabled():
+                    logger.debug(f"Cached TTS phrase: '{text}'")
+            except Exception as e:
+                logger.error(f"Failed to cache TTS phrase '{text}': {e}")
+            finally:
+                self._filling.discard(key)
+
+        task = asyncio.get_running_loop().create_task(_fill())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def close(self):
+        """Let phrases still rendering finish and land in the cache"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self.memory_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else None,
+        }
+
+    def _remember(self, key: str, audio: bytes):
+        if len(audio) > self.max_memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self.memory_bytes -= len(previous)
+        self._memory[key] = audio
+        self.memory_bytes += len(audio)
+        while self.memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.ulaw")
+
+    def _read_file(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_file(self, key: str, audio: bytes):
+        tmp = f"{self._path(key)}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(audio)
+        os.replace(tmp, self._path(key))
+
+
+async def synthesize_ulaw(
+    text: str,
+    voice_id: str,
+    model: str,
+    voice_settings: dict,
+    api_key: str,
+    session: Optional[aiohttp.ClientSession] = None,
+) -> bytes:
+    """Render a phrase with the ElevenLabs HTTP API straight to 8 kHz μ-law"""
+    url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}?output_format=ulaw_8000"
+    payload = {"text": text, "model_id": model}
+    if voice_settings:
+        payload["voice_settings"] = voice_settings
+    owns_session = session is None
+    session = session or aiohttp.ClientSession()
+    try:
+        async with session.post(url, json=payload, headers={"xi-api-key": api_key}) as response:
+            if response.status != 200:
+                raise RuntimeError(f"ElevenLabs returned {response.status}: {await response.text()}")
+            return await response.read()
+    finally:
+        if owns_session:
+            await session.close()
+
+
+def tts_params_for(tts) -> dict:
+    """Voice parameters of an ElevenLabsTTSService, as used by the cache"""
+    return {
+        "voice_id": tts._voice_id,
+        "model": tts.model_name,
+        "voice_settings": tts._voice_settings or {},
+        "api_key": settings.ELEVENLABS_API_KEY,
+    }
+
+
+class TTSCacheProcessor(FrameProcessor):
+    """Sits in front of the TTS service and answers cached sentences itself.
+
+    LLM text is split into sentences. Leading sentences that are cached are
+    played from the cache; at the first miss the rest of the response is
+    handed to the TTS service untouched, so audio order is preserved.
+    Phrases that keep missing are rendered in the background for next time.
+    """
+
+    def __init__(self, cache: "TTSCache", tts, **kwargs):
+        super().__init__(**kwargs)
+        self._cache = cache
+        self._tts_params = tts_params_for(tts)
+        self._namespace = cache_namespace(
+            self._tts_params["voice_id"], self._tts_params["model"], self._tts_params["voice_settings"]
+        )
+        self._reset()
+
+    def _reset(self):
+        self._text = ""
+        self._passthrough = False
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, LLMFullResponseStartFrame):
+            self._reset()
+            await self.push_frame(frame, direction)
+        elif isinstance(frame, LLMTextFrame) and not self._passthrough:
+            self._text += frame.text
+            await self._play_cached_sentences()
+        elif isinstance(frame, LLMFullResponseEndFrame):
+            if self._text.strip() and not self._passthrough:
+                if not await self._play_cached(self._text):
+                    await self.push_frame(LLMTextFrame(self._text))
+            self._reset()
+            await self.push_frame(frame, direction)
+        elif isinstance(frame, TTSSpeakFrame):
+            if not await self._play_cached(frame.text):
+                await self.push_frame(frame, direction)
+        elif isinstance(frame, StartInterruptionFrame):
+            self._reset()
+            await self.push_frame(frame, direction)
+        else:
+            await self.push_frame(frame, direction)
+
+    async def _play_cached_sentences(self):
+        while not self._passthrough:
+            end = match_endofsentence(self._text)
+            if not end:
+                return
+            sentence, rest = self._text[:end], self._text[end:]
+            if await self._play_cached(sentence):
+                self._text = rest
+            else:
+                # Hand this and everything after it to the TTS service
+                self._passthrough = True
+                self._text = ""
+                await self.push_frame(LLMTextFrame(sentence + rest))
+
+    async def _play_cached(self, text: str) -> bool:
+        key = cache_key(text, self._namespace)
+        audio = await self._cache.get(key)
+        if audio is None:
+            if self._cache.note_miss(key) >= settings.TTS_CACHE_FILL_AFTER:
+                self._cache.fill_in_background(key, text.strip(), self._tts_params)
+            return False
+
+        await self.push_frame(TTSStartedFrame())
+        for i in range(0, len(audio), CHUNK_BYTES):
+            pcm = audioop.ulaw2lin(audio[i:i + CHUNK_BYTES], 2)
+            await self.push_frame(TTSAudioRawFrame(pcm, ULAW_SAMPLE_RATE, 1))
+        await self.push_frame(TTSTextFrame(text.strip()))
+        await self.push_frame(TTSStoppedFrame())
+        return True
+
+
+tts_cache = TTSCache(settings.TTS_CACHE_DIR, settings.TTS_CACHE_MEMORY_BYTES)
+
+register(Gauge("tts_cache_hits_total", "TTS phrase cache hits (memory and disk)",
+               lambda: tts_cache.memory_hits + tts_cache.disk_hits, type="counter"))
+register(Gauge("tts_cache_misses_total", "TTS phrase cache misses",
+               lambda: tts_cache.misses, type="counter"))
+register(Gauge("tts_cache_hit_rate", "TTS phrase cache hit rate since start",
+               lambda: tts_cache.stats()["hit_rate"]))
+register(Gauge("tts_cache_memory_bytes", "Bytes held in the in-memory TTS cache tier",
+               lambda: tts_cache.memory_bytes))
+
+
+def _prompt_phrases() -> list:
+    """Quoted bot lines from the appointment prompt"""
+    from helper import Appointment_Prompt
+
+    lines = []
+    for line in Appointment_Prompt.splitlines():
+        line = line.strip()
+        if line.startswith("- User:") or line.startswith("Action:"):
+            continue
+        lines.extend(re.findall(r'"([^"]{20,})"', line))
+    return lines
+
+
+async def warm(phrases: list, concurrency: int = 4):
+    from providers import build
+
+    if settings.TTS_PROVIDER != "elevenlabs":
+        logger.error(f"The TTS cache only supports ElevenLabs, not {settings.TTS_PROVIDER}")
+        return
+    params = tts_params_for(build("tts", "elevenlabs"))
+    namespace = cache_namespace(params["voice_id"], params["model"], params["voice_settings"])
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with aiohttp.ClientSession() as session:
+        async def _warm_one(text):
+            key = cache_key(text, namespace)
+            if await tts_cache.get(key) is not None:
+                return "cached"
+            async with semaphore:
+                try:
+                    await tts_cache.put(key, await synthesize_ulaw(text, session=session, **params))
+                    return "rendered"
+                except Exception as e:
+                    logger.error(f"Failed to render '{text}': {e}")
+                    return "failed"
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(_warm_one(p) for p in phrases))
+    counts = {r: results.count(r) for r in set(results)}
+    print(f"{len(phrases)} phrases in {time.perf_counter() - start:.1f}s: {counts}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-render bot phrases into the TTS cache")
+    parser.add_argument("phrases", nargs="?", help="text file with one phrase per line")
+    parser.add_argument("--from-prompt", action="store_true", help="also warm quoted lines from Appointment_Prompt")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    phrases = []
+    if args.phrases:
+        with open(args.phrases) as f:
+            phrases.extend(line.strip() for line in f if line.strip())
+    if args.from_prompt:
+        phrases.extend(_prompt_phrases())
+    if not phrases:
+        parser.error("no phrases given")
+    asyncio.run(warm(list(dict.fromkeys(phrases)), args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from collections import deque
+from typing import List, Optional
+
+from pipecat.audio.vad.silero import SileroVADAnalyzer
+from pipecat.audio.vad.vad_analyzer import VADParams, VADState
+from pipecat.frames.frames import (
+    Frame,
+    FunctionCallFromLLM,
+    InterimTranscriptionFrame,
+    LLMFullResponseEndFrame,
+    LLMFullResponseStartFrame,
+    LLMTextFrame,
+    TranscriptionFrame,
+)
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext, OpenAILLMContextFrame
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+from config import settings
+from metrics import Gauge, Histogram, register
+
+logger = logging.getLogger(__name__)
+
+# Mid-turn pauses remembered per call, and how many turns before stop_secs adapts
+PAUSE_HISTORY = 50
+MIN_TURNS = 2
+# stop_secs sits this far above the caller's 90th percentile pause
+STOP_MARGIN = 0.15
+# The caller talking again this soon after a turn ended means they were cut off
+RESUME_WINDOW = 0.6
+# min_volume stays this far above the line's noise floor, up to MAX_MIN_VOLUME
+NOISE_MARGIN = 0.15
+MAX_MIN_VOLUME = 0.85
+NOISE_SMOOTHING = 0.05
+
+end_of_turn_stop_secs = register(Histogram(
+    "end_of_turn_stop_secs", "VAD silence applied after each caller turn"))
+speculation_saved = register(Histogram(
+    "speculation_saved_seconds", "LLM time a committed speculative response saved"))
+
+speculation_counts = {"started": 0, "committed": 0, "wasted": 0}
+
+
+def _normalise(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s']", " ", text.lower()).split())
+
+
+class AdaptiveVADAnalyzer(SileroVADAnalyzer):
+    """Silero VAD whose end-of-turn silence follows the caller.
+
+    Pauses the caller takes inside a turn (speech resumes before stop_secs
+    runs out) are kept per call, and after each turn stop_secs is set just
+    above their 90th percentile, within the TURN_MIN/MAX_STOP_SECS bounds.
+    Someone who talks in one breath is answered sooner; a turn that ended
+    only for the caller to carry on straight away counts as a long pause,
+    so a slow talker isn't cut off twice. The volume heard between turns is
+    tracked as the line's noise floor and min_volume kept above it, so a
+    noisy line doesn't hold the turn open.
+    """
+
+    min_stop_secs = settings.TURN_MIN_STOP_SECS
+    max_stop_secs = settings.TURN_MAX_STOP_SECS
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.reset_turn_stats(self.params)
+
+    def reset_turn_stats(self, base: VADParams):
+        """Forget the last caller; `base` is what the next call starts with"""
+        self._base_params = base
+        self._pauses = deque(maxlen=PAUSE_HISTORY)
+        self._noise = None
+        self._audio_time = 0.0
+        self._stopping_at = None
+        self._turn_ended_at = None
+        self.turns = 0
+        # stop_secs in force after each turn
+        self.adaptations: List[float] = []
+
+    def analyze_audio(self, buffer) -> VADState:
+        previous = self._vad_state
+        state = super().analyze_audio(buffer)
+        self._audio_time += len(buffer) / (2 * self.sample_rate)
+        if state == VADState.QUIET and previous == VADState.QUIET:
+            volume = self._prev_volume
+            self._noise = volume if self._noise is None else (
+                self._noise + NOISE_SMOOTHING * (volume - self._noise))
+        elif state != previous:
+            self._transition(previous, state)
+        return state
+
+    def _transition(self, previous: VADState, state: VADState):
+        if state == VADState.STOPPING:
+            self._stopping_at = self._audio_time
+        elif state == VADState.SPEAKING and previous == VADState.STOPPING:
+            self._pauses.append(self._audio_time - self._stopping_at)
+        elif state == VADState.SPEAKING and self._turn_ended_at is not None:
+            gap = self._audio_time - self._params.start_secs - self._turn_ended_at
+            if gap < self._params.stop_secs + RESUME_WINDOW:
+                self._pauses.append(gap)
+            self._turn_ended_at = None
+        elif state == VADState.QUIET and previous == VADState.STOPPING:
+            self._turn_ended_at = self._stopping_at
+            self.turns += 1
+            self._adapt()
+
+    def _adapt(self):
+        base = self._base_params
+        stop = base.stop_secs
+        if self.turns >= MIN_TURNS:
+            pauses = sorted(self._pauses)
+            stop = (pauses[int(len(pauses) * 0.9)] if pauses else 0.0) + STOP_MARGIN
+        stop = round(min(max(stop, self.min_stop_secs), self.max_stop_secs), 2)
+        min_volume = base.min_volume
+        if self._noise is not None:
+            min_volume = round(min(max(min_volume, self._noise + NOISE_MARGIN), MAX_MIN_VOLUME), 2)
+        params = VADParams(
+            confidence=base.confidence, start_secs=base.start_secs, stop_secs=stop, min_volume=min_volume)
+        if params != self._params:
+            # Also resets the state machine, which is QUIET here anyway
+            self.set_params(params)
+        self.adaptations.append(stop)
+        end_of_turn_stop_secs.observe(stop)
+
+    def stats(self) -> dict:
+        return {
+            "stop_secs": self.adaptations,
+            "min_volume": self._params.min_volume,
+            "noise_floor": None if self._noise is None else round(self._noise, 3),
+        }
+
+
+class Speculation:
+    """A completion started on the words heard so far"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.key = _normalise(text)
+        self.started = time.monotonic()
+        self.first_token: Optional[float] = None
+        self.tokens: List[str] = []
+        self.tool_calls: List[list] = []
+        self.done = False
+        self.failed = False
+        self.updated = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+
+class SpeculativeTurns:
+    """Starts the LLM on the caller's words before their turn is over.
+
+    `watcher` sits after STT. Once interim transcripts have stopped changing
+    for `settle` seconds the caller has most likely paused, and a completion
+    for the context plus those words is started on the call's LLM service,
+    outside the pipeline, while VAD is still waiting out stop_secs. `gate`
+    sits in front of the LLM: if the turn's context arrives ending in the
+    words that were speculated on, the context is held back and the
+    speculative response pushed in its place, tokens already received all
+    at once. New words, or a final transcript that differs, cancel it and
+    the turn goes to the LLM as usual.
+    """
+
+    def __init__(self, llm, context: OpenAILLMContext, settle: float):
+        self.llm = llm
+        self.context = context
+        self.settle = settle
+        self.watcher = _SpeculationWatcher(self)
+        self.gate = _SpeculationGate(self)
+        self._finals: List[str] = []
+        self._interim = ""
+        self._heard = ""
+        self._settle_task: Optional[asyncio.Task] = None
+        self._speculation: Optional[Speculation] = None
+        self.started = 0
+        self.committed = 0
+        self.wasted = 0
+        self.saved = 0.0
+
+    async def heard(self, frame: Frame):
+        if isinstance(frame, TranscriptionFrame):
+            self._finals.append(frame.text)
+            self._interim = ""
+        else:
+            self._interim = frame.text
+        text = " ".join(t for t in (*self._finals, self._interim) if t.strip())
+        if _normalise(text) == _normalise(self._heard):
+            return
+        self._heard = text
+        if self._speculation and self._speculation.key != _normalise(text):
+            await self._cancel()
+        if self._settle_task:
+            await self.watcher.cancel_task(self._settle_task)
+        self._settle_task = self.watcher.create_task(self._settled(text))
+
+    async def _settled(self, text: str):
+        await asyncio.sleep(self.settle)
+        self._settle_task = None
+        if self._speculation is None and _normalise(text):
+            self._start(text)
+
+    def _start(self, text: str):
+        speculation = Speculation(text)
+        messages = [*self.context.get_messages(), {"role": "user", "content": text}]
+        context = OpenAILLMContext(messages, tools=self.context._tools, tool_choice=self.context._tool_choice)
+        context.set_llm_adapter(self.llm.get_llm_adapter())
+        speculation.task = self.watcher.create_task(self._generate(speculation, context))
+        self._speculation = speculation
+        self.started += 1
+        speculation_counts["started"] += 1
+
+    async def _generate(self, speculation: Speculation, context: OpenAILLMContext):
+        try:
+            chunks = await self.llm.get_chat_completions(context, context.get_messages())
+            async for chunk in chunks:
+                if not chunk.choices or not chunk.choices[0].delta:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.tool_calls:
+                    call = delta.tool_calls[0]
+                    if call.index >= len(speculation.tool_calls):
+                        speculation.tool_calls.append([call.id, "", ""])
+                    if call.function and call.function.name:
+                        speculation.tool_calls[call.index][1] += call.function.name
+                    if call.function and call.function.arguments:
+                        speculation.tool_calls[call.index][2] += call.function.arguments
+                elif delta.content:
+                    if speculation.first_token is None:
+                        speculation.first_token = time.monotonic()
+                    speculation.tokens.append(delta.content)
+                    speculation.updated.set()
+        except Exception as e:
+            logger.warning(f"Speculative completion failed: {e}")
+            speculation.failed = True
+        finally:
+            speculation.done = True
+            speculation.updated.set()
+
+    async def take(self, context: OpenAILLMContext) -> Optional[Speculation]:
+        """The speculation to answer this turn with, if it guessed the caller's words"""
+        speculation, self._speculation = self._speculation, None
+        self._finals, self._interim, self._heard = [], "", ""
+        if self._settle_task:
+            await self.watcher.cancel_task(self._settle_task)
+            self._settle_task = None
+        if speculation is None:
+            return None
+        messages = context.get_messages()
+        said = messages[-1].get("content") if messages and messages[-1].get("role") == "user" else None
+        if not isinstance(said, str) or _normalise(said) != speculation.key or speculation.failed:
+            await self._discard(speculation)
+            return None
+        now = time.monotonic()
+        saved = min(speculation.first_token or now, now) - speculation.started
+        self.committed += 1
+        self.saved += saved
+        speculation_counts["committed"] += 1
+        speculation_saved.observe(saved)
+        return speculation
+
+    async def _cancel(self):
+        speculation, self._speculation = self._speculation, None
+        if speculation is not None:
+            await self._discard(speculation)
+
+    async def _discard(self, speculation: Speculation):
+        if not speculation.done:
+            await self.watcher.cancel_task(speculation.task)
+        self.wasted += 1
+        speculation_counts["wasted"] += 1
+
+    async def close(self):
+        await self._cancel()
+        if self._settle_task:
+            await self.watcher.cancel_task(self._settle_task)
+            self._settle_task = None
+
+    def stats(self) -> dict:
+        return {
+            "started": self.started,
+            "committed": self.committed,
+            "wasted": self.wasted,
+            "saved_ms": round(self.saved * 1000),
+        }
+
+
+class _SpeculationWatcher(FrameProcessor):
+    """Follows the caller's words between STT and the user aggregator"""
+
+    def __init__(self, turns: SpeculativeTurns, **kwargs):
+        super().__init__(**kwargs)
+        self._turns = turns
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if direction == FrameDirection.DOWNSTREAM and isinstance(
+            frame, (InterimTranscriptionFrame, TranscriptionFrame)
+        ):
+            await self._turns.heard(frame)
+        await self.push_frame(frame, direction)
+
+    async def cleanup(self):
+        await self._turns.close()
+        await super().cleanup()
+
+
+class _SpeculationGate(FrameProcessor):
+    """Answers a turn from its speculation instead of passing it to the LLM"""
+
+    def __init__(self, turns: SpeculativeTurns, **kwargs):
+        super().__init__(**kwargs)
+        self._turns = turns
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if direction == FrameDirection.DOWNSTREAM and isinstance(frame, OpenAILLMContextFrame):
+            speculation = await self._turns.take(frame.context)
+            if speculation is not None:
+                await self._commit(speculation, frame.context)
+                return
+        await self.push_frame(frame, direction)
+
+    async def _commit(self, speculation: Speculation, context: OpenAILLMContext):
+        # Same frames the LLM service would push; an interruption cancels
+        # this like it would the LLM's own response
+        try:
+            await self.push_frame(LLMFullResponseStartFrame())
+            sent = 0
+            while True:
+                speculation.updated.clear()
+                while sent < len(speculation.tokens):
+                    await self.push_frame(LLMTextFrame(speculation.tokens[sent]))
+                    sent += 1
+                if speculation.done:
+                    break
+                await speculation.updated.wait()
+            calls = [
+                FunctionCallFromLLM(
+                    context=context, tool_call_id=call_id, function_name=name,
+                    arguments=json.loads(arguments or "{}"),
+                )
+                for call_id, name, arguments in speculation.tool_calls
+                if name
+            ]
+            if calls:
+                await self._turns.llm.run_function_calls(calls)
+            await self.push_frame(LLMFullResponseEndFrame())
+        finally:
+            if not speculation.done:
+                await self._turns.watcher.cancel_task(speculation.task)
+
+
+register(Gauge("speculation_started_total", "Speculative LLM responses started on interim transcripts",
+               lambda: speculation_counts["started"], type="counter"))
+register(Gauge("speculation_committed_total", "Speculative responses used to answer the turn",
+               lambda: speculation_counts["committed"], type="counter"))
+register(Gauge("speculation_wasted_total", "Speculative responses thrown away",
+               lambda: speculation_counts["wasted"], type="counter"))
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+from typing import Optional
+
+from aiohttp import ClientSession, TCPConnector
+from twilio.http import AsyncHttpClient
+from twilio.http.async_http_client import AsyncTwilioHttpClient
+from twilio.rest import Client
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedTwilioHttpClient(AsyncTwilioHttpClient):
+    """AsyncTwilioHttpClient that applies its `timeout` to every request.
+
+    The SDK always passes timeout=None, which aiohttp takes as "no limit"
+    rather than falling back to the session's timeout.
+    """
+
+    async def request(self, *args, timeout: Optional[float] = None, **kwargs):
+        return await super().request(*args, timeout=self.timeout if timeout is None else timeout, **kwargs)
+
+
+class TwilioAPI:
+    """Async Twilio REST access shared by every request on this worker.
+
+    A single Twilio `Client` is backed by one keep-alive aiohttp session, so
+    calls reuse warm TLS connections and never block the event loop.
+    """
+
+    def __init__(self, http_client: Optional[AsyncHttpClient] = None):
+        self._http_client = http_client
+        self._client = None
+        self._background_tasks = set()
+
+    @property
+    def client(self) -> Client:
+        if self._client is None:
+            if self._http_client is None:
+                # Needs a running loop, so the session is created on first use
+                self._http_client = BoundedTwilioHttpClient(
+                    pool_connections=False, timeout=settings.TWILIO_HTTP_TIMEOUT
+                )
+                self._http_client.session = ClientSession(
+                    connector=TCPConnector(
+                        limit=settings.TWILIO_HTTP_POOL_SIZE,
+                        keepalive_timeout=settings.TWILIO_HTTP_KEEPALIVE,
+                    ),
+                )
+            self._client = Client(
+                settings.TWILIO_ACCOUNT_SID,
+                settings.TWILIO_AUTH_TOKEN,
+                http_client=self._http_client,
+            )
+        return self._client
+
+    async def create_call(self, to: str, url: str, method: str = "POST", **kwargs):
+        """Place an outbound call from our Twilio number"""
+        return await self.client.calls.create_async(
+            to=to,
+            from_=settings.TWILIO_PHONE_NUMBER,
+            url=url,
+            method=method,
+            **kwargs,
+        )
+
+    async def dial(self, to: str, twiml: str, status_callback: Optional[str] = None):
+        """Place an outbound call that runs inline TwiML, e.g. to wait in a conference"""
+        kwargs = {}
+        if status_callback:
+            kwargs.update(status_callback=status_callback, status_callback_event=["answered", "completed"])
+        return await self.client.calls.create_async(
+            to=to,
+            from_=settings.TWILIO_PHONE_NUMBER,
+            twiml=twiml,
+            **kwargs,
+        )
+
+    async def update_call(self, call_sid: str, **kwargs):
+        """Redirect a live call to new TwiML, or end it with status="completed\""""
+        return await self.client.calls(call_sid).update_async(**kwargs)
+
+    async def start_recording(self, call_sid: str, account_sid: Optional[str] = None):
+        account = self.client.api.v2010.accounts(account_sid or settings.TWILIO_ACCOUNT_SID)
+        return await account.calls(call_sid).recordings.create_async()
+
+    def run_in_background(self, coro, description: str) -> asyncio.Task:
+        """Fire-and-forget a non-critical REST call; failures are only logged"""
+        task = asyncio.get_running_loop().create_task(coro)
+        self._background_tasks.add(task)
+
+        def _done(t: asyncio.Task):
+            self._background_tasks.discard(t)
+            if not t.cancelled() and t.exception():
+                logger.error(f"Twilio background call failed ({description}): {t.exception()}")
+
+        task.add_done_callback(_done)
+        return task
+
+    async def close(self):
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        if self._http_client is not None:
+            await self._http_client.close()
+        self._client = None
+        self._http_client = None
+
+
+twilio_api = TwilioAPI()
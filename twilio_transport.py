@@ -0,0 +1,114 @@
+import asyncio
+import time
+from typing import List, Optional
+
+from pipecat.frames.frames import Frame, OutputAudioRawFrame, StartInterruptionFrame
+from pipecat.transports.network.fastapi_websocket import (
+    FastAPIWebsocketOutputTransport,
+    FastAPIWebsocketTransport,
+)
+
+from metrics import Gauge, register
+
+# Across all calls on this worker
+media_counts = {"chunks": 0, "writes": 0}
+
+
+class CoalescingOutputTransport(FastAPIWebsocketOutputTransport):
+    """Sends outbound audio in fewer, larger media messages.
+
+    pipecat writes every 40ms chunk as its own websocket message, paced in
+    real time. Here the first two budgets' worth of a reply go out unpaced,
+    so Twilio holds that much audio ahead of playout from the start. From
+    then on chunks are held and sent together, when `budget` seconds of
+    audio have built up or `budget` seconds after the first was held, which
+    Twilio's lead covers. First audio goes out no later than before, and
+    interruptions drop whatever is held along with what Twilio is told to
+    clear.
+    """
+
+    def __init__(self, *args, budget: float, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._budget = budget
+        self._held: List[bytes] = []
+        self._held_bytes = 0
+        # When Twilio runs out of the audio sent so far
+        self._playout_until = 0.0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._send_lock = asyncio.Lock()
+
+    def _seconds(self, nbytes: int) -> float:
+        return nbytes / (self.sample_rate * 2 * self._params.audio_out_channels)
+
+    async def write_audio_frame(self, frame: OutputAudioRawFrame):
+        if self._client.is_closing:
+            return
+        if not self._client.is_connected:
+            await self._write_audio_sleep()
+            return
+        self._held.append(frame.audio)
+        self._held_bytes += len(frame.audio)
+        media_counts["chunks"] += 1
+        if self._playout_until - time.monotonic() < 2 * self._budget:
+            # Building up Twilio's lead: send at once, without pacing
+            await self._flush()
+            return
+        if self._seconds(self._held_bytes) >= self._budget:
+            await self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self._budget, self._flush_later)
+        await self._write_audio_sleep()
+
+    def _flush_later(self):
+        # The reply ended before a full budget of audio built up
+        self._flush_handle = None
+        self.create_task(self._flush())
+
+    async def _flush(self):
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._held:
+            return
+        audio = b"".join(self._held)
+        self._held.clear()
+        self._held_bytes = 0
+        self._playout_until = max(time.monotonic(), self._playout_until) + self._seconds(len(audio))
+        media_counts["writes"] += 1
+        async with self._send_lock:
+            await super()._write_frame(
+                OutputAudioRawFrame(audio, sample_rate=self.sample_rate, num_channels=self._params.audio_out_channels)
+            )
+
+    async def _write_frame(self, frame: Frame):
+        if isinstance(frame, StartInterruptionFrame):
+            self._held.clear()
+            self._held_bytes = 0
+            self._playout_until = 0.0
+        else:
+            # Anything else (marks, the end of the call) goes after held audio
+            await self._flush()
+        async with self._send_lock:
+            await super()._write_frame(frame)
+
+    async def cleanup(self):
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        await super().cleanup()
+
+
+class CoalescingWebsocketTransport(FastAPIWebsocketTransport):
+    """FastAPIWebsocketTransport with a CoalescingOutputTransport as its output"""
+
+    def __init__(self, websocket, params, budget: float, **kwargs):
+        super().__init__(websocket, params, **kwargs)
+        self._output = CoalescingOutputTransport(
+            self, self._client, self._params, budget=budget, name=self._output_name
+        )
+
+
+register(Gauge("twilio_audio_chunks_total", "Outbound audio chunks produced by the pipeline",
+               lambda: media_counts["chunks"], type="counter"))
+register(Gauge("twilio_media_writes_total", "Outbound media messages written after coalescing",
+               lambda: media_counts["writes"], type="counter"))
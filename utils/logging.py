@@ -12,13 +12,98 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import Dict
+import atexit
+import logging
+import queue
+import sys
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
 
-from flask import request
 import structlog
 
+from config import settings
 from utils import metadata
 
+# Fields merged into every record logged from the current request or call.
+# One immutable dict per context keeps the per-record lookup a single get().
+_log_context: ContextVar[Dict[str, Any]] = ContextVar("log_context", default={})
+
+_project_id: Optional[str] = None
+_listener: Optional[QueueListener] = None
+
+DEBUG_ENABLED = settings.LOG_LEVEL.upper() == "DEBUG"
+
+
+def resolve_project_id() -> None:
+    """Look up the GCP project once, off the request path, for trace correlation"""
+    global _project_id
+    try:
+        _project_id = metadata.get_project_id() or ""
+    except Exception:
+        _project_id = ""
+
+
+def bind_trace(trace_header: Optional[str]) -> None:
+    """Correlate logs from this request with its Cloud Trace
+    https://cloud.google.com/run/docs/logging#correlate-logs
+    """
+    # Until the project is known we just skip correlation rather than resolve it here
+    if trace_header and _project_id:
+        trace = trace_header.split("/")[0]
+        _bind(**{"logging.googleapis.com/trace": f"projects/{_project_id}/traces/{trace}"})
+
+
+def bind_call(call_sid: Optional[str], stream_sid: Optional[str] = None) -> None:
+    """Tag every log line from this call, and decide whether it logs at DEBUG"""
+    fields = {"call_sid": call_sid, "debug": DEBUG_ENABLED or _sampled(call_sid)}
+    if stream_sid:
+        fields["stream_sid"] = stream_sid
+    _bind(**fields)
+
+
+def call_debug_enabled() -> bool:
+    """Whether DEBUG records from the current call will be kept.
+
+    Check this before building debug messages on per-frame paths.
+    """
+    return _log_context.get().get("debug", DEBUG_ENABLED)
+
+
+def _bind(**fields) -> None:
+    _log_context.set({**_log_context.get(), **fields})
+
+
+def _sampled(call_sid: Optional[str]) -> bool:
+    # Hash rather than random so every worker makes the same call for a call
+    rate = settings.LOG_DEBUG_SAMPLE_RATE
+    return bool(call_sid) and rate > 0 and zlib.crc32(call_sid.encode()) % 10000 < rate * 10000
+
+
+class CallSamplingFilter(logging.Filter):
+    """Drops DEBUG records from calls that weren't sampled"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.INFO or call_debug_enabled()
+
+
+class ContextQueueHandler(QueueHandler):
+    """Hands records to the background listener with as little work as possible.
+
+    Only what must happen on the logging thread happens here: capturing the
+    call context and resolving %-args while they still hold their values.
+    JSON rendering and the write to stdout happen on the listener thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.context = _log_context.get()
+        if record.args and not isinstance(record.msg, dict):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
 
 def field_name_modifier(
     logger: structlog.PrintLogger, log_method: str, event_dict: Dict
@@ -39,51 +124,109 @@ def field_name_modifier(
     return event_dict
 
 
-def trace_modifier(
-    logger: structlog.PrintLogger, log_method: str, event_dict: Dict
+def record_context_modifier(
+    logger: logging.Logger, log_method: str, event_dict: Dict
 ) -> Dict:
-    """Adds Tracing correlation
-    https://cloud.google.com/run/docs/logging#correlate-logs
-    """
-    # Only attempt to get the context if in a request
-    if request:
-
-        trace_header = request.headers.get("X-Cloud-Trace-Context")
-        # Only append the trace if it exists in the request
-        if trace_header:
-            trace = trace_header.split("/")
-            project = metadata.get_project_id()
-            event_dict["logging.googleapis.com/trace"] = (
-                f"projects/{project}/traces/{trace[0]}"
-            )
+    """Adds the call/trace context and timestamp captured when the record was made"""
+    record = event_dict["_record"]
+    for key, value in getattr(record, "context", {}).items():
+        if key != "debug":
+            event_dict.setdefault(key, value)
+    event_dict["timestamp"] = datetime.fromtimestamp(record.created, timezone.utc).isoformat()
     return event_dict
 
 
+def _resolve_exc_info(
+    logger: logging.Logger, log_method: str, event_dict: Dict
+) -> Dict:
+    # The traceback has to be captured before the record leaves this thread
+    if event_dict.get("exc_info") is True or log_method == "exception":
+        event_dict["exc_info"] = sys.exc_info()
+    return event_dict
+
+
+def _loguru_sink(message) -> None:
+    """Forwards pipecat's loguru output into the same queue"""
+    record = message.record
+    std_logger = logging.getLogger(record["name"])
+    levelno = record["level"].no
+    if not std_logger.isEnabledFor(levelno):
+        return
+    exception = record["exception"]
+    std_logger.handle(std_logger.makeRecord(
+        record["name"], levelno, record["file"].path, record["line"], record["message"], None,
+        (exception.type, exception.value, exception.traceback) if exception else None,
+        func=record["function"],
+    ))
+
+
+def flush(keep_running: bool = False) -> None:
+    """Write out everything still queued; the listener stops afterwards
+    unless `keep_running`"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        if keep_running:
+            _listener.start()
+        else:
+            _listener = None
+
+
 def getJSONLogger() -> structlog._config.BoundLoggerLazyProxy:
-    """Create a JSON logger using the field name and trace modifiers created above"""
-    # extend using https://www.structlog.org/en/stable/processors.html
-    structlog.configure(
+    """Route structlog, stdlib logging and loguru through one queue-backed
+    JSON handler, and return a structlog logger"""
+    global _listener
+    if _listener is not None:
+        return structlog.get_logger()
+
+    formatter = structlog.stdlib.ProcessorFormatter(
         processors=[
             structlog.stdlib.add_log_level,
-            structlog.stdlib.PositionalArgumentsFormatter(),
+            record_context_modifier,
+            structlog.stdlib.add_logger_name,
             field_name_modifier,
-            trace_modifier,
-            structlog.processors.TimeStamper("iso"),
+            structlog.processors.format_exc_info,
+            structlog.stdlib.ProcessorFormatter.remove_processors_meta,
             structlog.processors.JSONRenderer(),
         ],
+    )
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    handler = ContextQueueHandler(log_queue)
+    handler.addFilter(CallSamplingFilter())
+    _listener = QueueListener(log_queue, output)
+    _listener.start()
+    atexit.register(flush)
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    # Sampled calls need DEBUG records to reach the filter
+    debug_possible = DEBUG_ENABLED or settings.LOG_DEBUG_SAMPLE_RATE > 0
+    root.setLevel(logging.DEBUG if debug_possible else settings.LOG_LEVEL.upper())
+
+    try:
+        from loguru import logger as loguru_logger
+
+        loguru_logger.remove()
+        loguru_logger.add(_loguru_sink, level=logging.getLevelName(root.level), format="{message}")
+    except ImportError:
+        pass
+
+    # extend using https://www.structlog.org/en/stable/processors.html
+    structlog.configure(
+        processors=[
+            structlog.stdlib.filter_by_level,
+            structlog.stdlib.PositionalArgumentsFormatter(),
+            _resolve_exc_info,
+            structlog.stdlib.ProcessorFormatter.wrap_for_formatter,
+        ],
+        logger_factory=structlog.stdlib.LoggerFactory(),
         wrapper_class=structlog.stdlib.BoundLogger,
+        cache_logger_on_first_use=True,
     )
     return structlog.get_logger()
 
 
 logger = getJSONLogger()
-
-
-def flush() -> None:
-    # Setting PYTHONUNBUFFERED in Dockerfile/Buildpack ensured no buffering
-
-    # https://docs.python.org/3/library/logging.html#logging.shutdown
-    # When the logging module is imported, it registers this
-    # function as an exit handler (see atexit), so normally
-    # there’s no need to do that manually.
-    pass
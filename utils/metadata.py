@@ -12,15 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import google.auth
-import requests
+import functools
 
 METADATA_URI = "http://metadata.google.internal/computeMetadata/v1/"
 
 
+@functools.lru_cache(maxsize=None)
 def get_project_id() -> str:
     """Use the 'google-auth-library' to make a request to the metadata server or
-    default to Application Default Credentials in your local environment."""
+    default to Application Default Credentials in your local environment.
+    Cached, since credential discovery can hit the network."""
+    import google.auth
+
     _, project = google.auth.default()
     return project
 
@@ -28,6 +31,8 @@ def get_project_id() -> str:
 def get_service_region() -> str:
     """Get region from local metadata server
     Region in format: projects/PROJECT_NUMBER/regions/REGION"""
+    import requests
+
     slug = "instance/region"
     data = requests.get(
         METADATA_URI + slug, headers={"Metadata-Flavor": "Google"}
@@ -39,6 +44,9 @@ def authenticated_request(url: str, method: str) -> str:
     """Make a request with an ID token to a protected service
     https://cloud.google.com/functions/docs/securing/authenticating#functions-bearer-token-example-python
     """
+    import google.auth.transport.requests
+    import google.oauth2.id_token
+    import requests
 
     auth_req = google.auth.transport.requests.Request()
     id_token = google.oauth2.id_token.fetch_id_token(auth_req, url)